@@ -1,20 +1,29 @@
 # app.py - Complete Flask API with Timezone Support
 from flask import Flask, request, jsonify, render_template_string, render_template, session, send_from_directory
 from datetime import datetime
-import pytz
-import sqlite3
 import json
 import os
 from functools import wraps
 import sys
 import logging
 
+# Shared storage engine lives in docker/app/storage (next to app.py inside containers)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'docker', 'app'))
+from storage import Reading, hours_ago, open_storage
+from derived import fill_reading
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
 
 # Configuration
 DATABASE_PATH = os.environ.get('DATABASE_PATH', '/app/data/lora_sensors.db')
 CONFIG_PATH = os.environ.get('CONFIG_PATH', '/app/config/settings.json')
+DEBUG_LOG_PATH = os.environ.get('DEBUG_LOG_PATH', '/app/debug.log')
+
+# Optional Parquet cold tier written by the docker app or tools/tier_cold.py; history reads merge it
+COLD_STORAGE_PATH = os.environ.get('COLD_STORAGE_PATH', '')
+
+storage = open_storage(DATABASE_PATH, schema='sensor_data', cold_path=COLD_STORAGE_PATH or None)
 
 # Default settings
 DEFAULT_SETTINGS = {
@@ -58,6 +67,8 @@ def get_user_timezone():
 
 def format_timestamp_for_user(utc_timestamp, timezone_str=None):
     """Convert UTC timestamp to user's timezone"""
+    # Imported on first use: nothing at startup needs pytz
+    import pytz
     if timezone_str is None:
         timezone_str = get_user_timezone()
 
@@ -96,37 +107,8 @@ def init_database():
     """Initialize SQLite database"""
     try:
         os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        # Create sensor_data table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sensor_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                node_id TEXT NOT NULL,
-                temperature REAL,
-                humidity REAL,
-                pressure REAL,
-                battery_voltage REAL,
-                rssi INTEGER,
-                snr REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Create settings table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        conn.commit()
-        conn.close()
-        print("Database initialized successfully")
+        version = storage.initialize()
+        print(f"Database initialized successfully (schema version {version})")
     except Exception as e:
         print(f"Database initialization error: {e}")
 
@@ -173,6 +155,7 @@ def update_settings():
         # Handle timezone settings (existing functionality)
         if 'timezone' in data:
             timezone_str = data.get('timezone', 'UTC')
+            import pytz
             try:
                 pytz.timezone(timezone_str)
                 settings['timezone'] = timezone_str
@@ -258,7 +241,7 @@ def receive_sensor_data():
         app.logger.info(f"lastUpdate field: {gateway_timestamp}")
 
         # Write to file for debugging
-        with open('/app/debug.log', 'a') as f:
+        with open(DEBUG_LOG_PATH, 'a') as f:
             f.write(f"=== {datetime.utcnow()} ===\n")
             f.write(f"Gateway lastUpdate: {gateway_timestamp}\n")
 
@@ -268,51 +251,26 @@ def receive_sensor_data():
         print(f"Gateway lastUpdate: {gateway_timestamp}")
 
         # Extract sensor data
-        node_id = data.get('node_id')
         temperature = data.get('temperature_f')
-        humidity = data.get('humidity')
-        pressure = data.get('pressure_hpa')
-        battery_voltage = data.get('battery_voltage')
-        rssi = data.get('rssi')
-        snr = data.get('snr')
 
         # Convert F to C for database storage
         if temperature:
             temperature = (temperature - 32) * 5/9
 
-        # Store in database with original timestamp
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        if gateway_timestamp:
-            # Convert gateway timestamp format to SQLite format
-            try:
-                dt = datetime.strptime(gateway_timestamp, "%Y-%m-%d  %H:%M:%S")
-                sqlite_timestamp = dt.strftime("%Y-%m-%d  %H:%M:%S")
-            except:
-                sqlite_timestamp = gateway_timestamp
-
-            cursor.execute('''
-                INSERT INTO sensor_data
-                (node_id, temperature, humidity, pressure, battery_voltage, rssi, snr, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (node_id, temperature, humidity, pressure, battery_voltage, rssi, snr, sqlite_timestamp))
-        else:
+        if not gateway_timestamp:
             print("No gateway timestamp, using server time")
-            cursor.execute('''
-                INSERT INTO sensor_data
-                (node_id, temperature, humidity, pressure, battery_voltage, rssi, snr)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (node_id, temperature, humidity, pressure, battery_voltage, rssi, snr))
 
-        conn.commit()
-
-        # Verify what was actually stored
-        cursor.execute('SELECT timestamp FROM sensor_data WHERE id = last_insert_rowid()')
-        stored_timestamp = cursor.fetchone()[0]
-        print(f"Actually stored in DB: {stored_timestamp}")
-
-        conn.close()
+        # Storage normalizes the gateway timestamp; missing ones get server time
+        storage.insert_readings([fill_reading(Reading(
+            node_id=data.get('node_id'),
+            timestamp=gateway_timestamp,
+            temperature_c=temperature,
+            humidity=data.get('humidity'),
+            pressure_hpa=data.get('pressure_hpa'),
+            battery_voltage=data.get('battery_voltage'),
+            rssi=data.get('rssi'),
+            snr=data.get('snr')
+        ))])
 
         return jsonify({
             'success': True,
@@ -332,48 +290,28 @@ def get_latest_sensor_data():
     try:
         user_tz = get_user_timezone()
 
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        # Get latest data for each node
-        cursor.execute('''
-            SELECT s1.* FROM sensor_data s1
-            INNER JOIN (
-                SELECT node_id, MAX(timestamp) as max_timestamp
-                FROM sensor_data
-                GROUP BY node_id
-            ) s2 ON s1.node_id = s2.node_id AND s1.timestamp = s2.max_timestamp
-            ORDER BY s1.timestamp DESC
-        ''')
-
-        rows = cursor.fetchall()
         latest_data = []
 
-        for row in rows:
-            # Don't use format_timestamp_for_user - it's causing the malformed output
-            # Just clean up the double space and use the stored timestamp directly
-            clean_timestamp = row['timestamp'].replace('  ', ' ')  # Remove double space
-
+        # Latest reading for each node
+        for row in storage.latest():
             # Convert temperature back to Fahrenheit for display
             temp_f = None
-            if row['temperature']:
-                temp_f = (row['temperature'] * 9/5) + 32
+            if row['temperature_c']:
+                temp_f = (row['temperature_c'] * 9/5) + 32
 
             latest_data.append({
                 'id': row['id'],
                 'node_id': row['node_id'],
-                'temperature': row['temperature'],
+                'temperature': row['temperature_c'],
                 'temperature_f': round(temp_f, 1) if temp_f else None,
                 'humidity': row['humidity'],
-                'pressure': row['pressure'],
+                'pressure': row['pressure_hpa'],
                 'battery_voltage': row['battery_voltage'],
                 'rssi': row['rssi'],
                 'snr': row['snr'],
-                'timestamp': clean_timestamp  # Use clean timestamp directly
+                'timestamp': row['timestamp']
             })
 
-        conn.close()
         return jsonify({
             'success': True,
             'data': latest_data,
@@ -396,45 +334,34 @@ def get_sensor_history():
 
         user_tz = get_user_timezone()
 
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        query = '''
-            SELECT * FROM sensor_data
-            WHERE timestamp >= datetime('now', '-{} hours')
-        '''.format(hours)
-
-        if limit and limit > 0:
-            query += f' LIMIT {limit}'
-            print(f"DEBUG: Final query: {query}")  # ADD THIS LINE
-
-        if node_id:
-            query += ' AND node_id = ?'
-            cursor.execute(query + ' ORDER BY timestamp DESC', (node_id,))
-        else:
-            cursor.execute(query + ' ORDER BY timestamp DESC')
-
-        rows = cursor.fetchall()
+        batch = storage.range_batch(
+            node_id=node_id or None,
+            t0=hours_ago(hours),
+            limit=limit if limit and limit > 0 else None
+        )
 
+        # Serialize straight from the result columns; no per-row reading objects.
+        # Nodes share cycle timestamps, so each one is formatted once per response
         history = []
-        for row in rows:
-            timestamp_info = format_timestamp_for_user(row['timestamp'], user_tz)
-
+        formatted = {}
+        for reading_id, node, timestamp, temperature, humidity, pressure, battery, rssi, snr in batch.rows(
+                'id', 'node_id', 'timestamp', 'temperature_c', 'humidity', 'pressure_hpa',
+                'battery_voltage', 'rssi', 'snr'):
+            timestamp_info = formatted.get(timestamp)
+            if timestamp_info is None:
+                timestamp_info = formatted[timestamp] = format_timestamp_for_user(timestamp, user_tz)
             history.append({
-                'id': row['id'],
-                'node_id': row['node_id'],
-                'temperature': row['temperature'],
-                'humidity': row['humidity'],
-                'pressure': row['pressure'],
-                'battery_voltage': row['battery_voltage'],
-                'rssi': row['rssi'],
-                'snr': row['snr'],
+                'id': reading_id,
+                'node_id': node,
+                'temperature': temperature,
+                'humidity': humidity,
+                'pressure': pressure,
+                'battery_voltage': battery,
+                'rssi': rssi,
+                'snr': snr,
                 'timestamp': timestamp_info
             })
 
-        conn.close()
-
         return jsonify({
             'success': True,
             'data': history,
@@ -452,37 +379,11 @@ def get_network_stats():
     try:
         user_tz = get_user_timezone()
 
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        # Total messages
-        cursor.execute('SELECT COUNT(*) as total FROM sensor_data')
-        total_messages = cursor.fetchone()[0]
-
-        # Active nodes (nodes that sent data in last hour)
-        cursor.execute('''
-            SELECT COUNT(DISTINCT node_id) as active
-            FROM sensor_data
-            WHERE timestamp >= datetime('now', '-1 hour')
-        ''')
-        active_nodes = cursor.fetchone()[0]
-
-        # Average RSSI
-        cursor.execute('''
-            SELECT AVG(rssi) as avg_rssi
-            FROM sensor_data
-            WHERE timestamp >= datetime('now', '-24 hours')
-        ''')
-        avg_rssi = cursor.fetchone()[0] or 0
-
-        # Last update
-        cursor.execute('''
-            SELECT MAX(timestamp) as last_update
-            FROM sensor_data
-        ''')
-        last_update = cursor.fetchone()[0]
-
-        conn.close()
+        stats = storage.stats(active_hours=1, rssi_hours=24)
+        total_messages = stats['total_readings']
+        active_nodes = stats['active_nodes']
+        avg_rssi = stats['avg_rssi'] or 0
+        last_update = stats['last_update']
 
         # Format last update timestamp
         last_update_info = None
@@ -508,6 +409,7 @@ def get_network_stats():
 @app.route('/api/timezone/validate', methods=['POST'])
 def validate_timezone():
     """Validate a timezone string"""
+    import pytz
     try:
         data = request.get_json()
         timezone_str = data.get('timezone', '')
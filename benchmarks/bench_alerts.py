@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Alert rule engine benchmark (docker/app/alerts.py)
+Loads thousands of per-node rules (thresholds, rates, low battery) plus a
+few all-node rules and feeds readings through AlertEngine.process() one
+at a time, the way the ingest endpoints call it. For comparison, the same
+rules are also evaluated by a linear scan over every rule, which is what
+checking rules without the (node, metric) index costs.
+
+Examples:
+    python benchmarks/bench_alerts.py
+    python benchmarks/bench_alerts.py --rules 1000 5000 20000 --nodes 1000 --json alerts.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from storage import Reading
+from recent_cache import from_epoch
+from alerts import DERIVED_METRICS, AlertEngine, Rule
+
+# Per-node rule templates: (kind, metric, spec)
+TEMPLATES = [
+    ('threshold', 'temperature_f', {'above': 95, 'hysteresis': 1}),
+    ('threshold', 'temperature_f', {'below': 20, 'hysteresis': 1}),
+    ('threshold', 'humidity', {'above': 85, 'hysteresis': 2}),
+    ('threshold', 'pressure_hpa', {'below': 980, 'hysteresis': 1}),
+    ('rate', 'temperature_c', {'per_hour': 8, 'hysteresis': 1}),
+    ('rate', 'humidity', {'per_hour': 30, 'hysteresis': 5}),
+    ('low_battery', None, {}),
+]
+
+
+def build_rules(count, nodes):
+    rules = [
+        Rule.from_dict({'id': 'all-temp-high', 'kind': 'threshold', 'metric': 'temperature_f', 'above': 80}),
+        Rule.from_dict({'id': 'all-humidity-high', 'kind': 'threshold', 'metric': 'humidity', 'above': 70}),
+        Rule.from_dict({'id': 'all-stale', 'kind': 'stale', 'minutes': 60}),
+    ]
+    i = 0
+    while len(rules) < count:
+        node_id = 'node-%04d' % (i % nodes)
+        kind, metric, spec = TEMPLATES[(i // nodes) % len(TEMPLATES)]
+        spec = dict(spec, id='r%d' % i, kind=kind, node_id=node_id)
+        if metric:
+            spec['metric'] = metric
+        # Vary thresholds so rules don't all flip together
+        for key in ('above', 'below', 'per_hour'):
+            if key in spec:
+                spec[key] += (i % 7) * 0.5
+        rules.append(Rule.from_dict(spec))
+        i += 1
+    return rules
+
+
+def build_readings(count, nodes, seed=1):
+    rng = random.Random(seed)
+    start = int(time.time()) - count
+    readings = []
+    for i in range(count):
+        readings.append(Reading(
+            id=i + 1,
+            node_id='node-%04d' % rng.randrange(nodes),
+            timestamp=from_epoch(start + i),
+            temperature_c=rng.gauss(24, 6),
+            humidity=rng.gauss(60, 15),
+            pressure_hpa=rng.gauss(1005, 12),
+            battery_voltage=rng.uniform(3.1, 4.2),
+        ))
+    return readings
+
+
+def linear_scan(rules, reading):
+    """Every rule checked against every reading: the unindexed baseline"""
+    node_id = str(reading['node_id'])
+    hits = 0
+    for rule in rules:
+        if rule.kind == 'stale' or (rule.node_id is not None and rule.node_id != node_id):
+            continue
+        getter = DERIVED_METRICS.get(rule.metric)
+        x = getter(reading) if getter else reading.get(rule.metric)
+        if x is not None and rule.kind == 'threshold' and rule.breached(x):
+            hits += 1
+    return hits
+
+
+def time_each(fn, readings):
+    latencies = []
+    for reading in readings:
+        started = time.perf_counter()
+        fn(reading)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    summary = latency_summary(latencies)
+    # latency_summary reports milliseconds; these are microseconds
+    return {key.replace('_ms', '_us'): value for key, value in summary.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark alert rule evaluation on ingest')
+    parser.add_argument('--rules', type=int, nargs='+', default=[1000, 5000, 10000], help='Rule counts to test')
+    parser.add_argument('--nodes', type=int, default=500, help='Nodes the rules are spread over (default: 500)')
+    parser.add_argument('--readings', type=int, default=20000, help='Readings per run (default: 20000)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    readings = build_readings(args.readings, args.nodes)
+    results = {}
+    print('%-8s %12s %12s %12s %12s %10s' % ('rules', 'index p50', 'index p99', 'scan p50', 'scan p99', 'alerts'))
+    for count in args.rules:
+        rules = build_rules(count, args.nodes)
+        engine = AlertEngine(rules)
+        indexed = time_each(lambda reading: engine.process([reading]), readings)
+        engine.check_stale()
+        scan = time_each(lambda reading: linear_scan(rules, reading), readings[:max(len(readings) // 10, 100)])
+        metrics = engine.metrics()
+        results[count] = {'indexed': indexed, 'linear_scan': scan, 'engine': metrics}
+        print('%-8d %10.1fus %10.1fus %10.1fus %10.1fus %10d' % (
+            count, indexed['p50_us'], indexed['p99_us'], scan['p50_us'], scan['p99_us'],
+            metrics['fired'] + metrics['resolved']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'nodes': args.nodes, 'readings': args.readings, 'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+
+
+if __name__ == '__main__':
+    main()
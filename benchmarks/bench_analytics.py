@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Aggregate endpoint benchmark: SQLite vs DuckDB (and pyarrow) on the same data
+Seeds one database, copies it, moves everything but the last day of the copy
+into the Parquet cold tier, then runs the /api/analytics/aggregate queries
+through each engine and checks that they return the same numbers:
+
+- sqlite          GROUP BY in SQLite over the untiered file
+- duckdb-sqlite   DuckDB scanning the untiered SQLite file (needs the sqlite extension)
+- duckdb-parquet  DuckDB over the Parquet cold tier (+ SQLite for the hot day)
+- pyarrow-parquet pyarrow group_by over the cold tier (the no-duckdb fallback)
+
+Examples:
+    python benchmarks/bench_analytics.py
+    python benchmarks/bench_analytics.py --rows 5000000 --nodes 100 --json analytics.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from seed_db import seed_database
+import analytics
+from analytics import AggregateQuery, Analytics
+from storage import cold, hours_ago, open_storage
+
+# (case name, AggregateQuery arguments)
+CASES = [
+    ('monthly_avg_per_node_1y', dict(metric='temperature_c', interval='month', group_by='node', days=365)),
+    ('weekly_avg_all_nodes_1y', dict(metric='humidity', interval='week', group_by='none', days=365)),
+    ('daily_avg_per_node_90d', dict(metric='temperature_f', interval='day', group_by='node', days=90)),
+    ('hourly_one_node_30d', dict(metric='pressure_hpa', interval='hour', group_by='node', node_id='1001', days=30)),
+    ('overall_per_node_all', dict(metric='rssi', interval='none', group_by='node', days=None)),
+]
+
+
+def build_query(spec):
+    spec = dict(spec)
+    days = spec.pop('days')
+    return AggregateQuery(t0=hours_ago(days * 24) if days else None, **spec)
+
+
+def same_rows(a, b):
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if (x['bucket'], x['node_id'], x['count']) != (y['bucket'], y['node_id'], y['count']):
+            return False
+        if abs(x['avg'] - y['avg']) > 0.01:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark analytics aggregates across engines')
+    parser.add_argument('--rows', type=int, default=1000000, help='Seeded rows (default: 1000000)')
+    parser.add_argument('--nodes', type=int, default=20, help='Seeded nodes (default: 20)')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per case (default: 5)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_analytics_')
+    try:
+        plain_path = os.path.join(work_dir, 'plain.db')
+        tiered_path = os.path.join(work_dir, 'tiered.db')
+        print('Seeding %d rows across %d nodes...' % (args.rows, args.nodes))
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(plain_path, 'sensor_data', args.rows, args.nodes)
+        shutil.copyfile(plain_path, tiered_path)
+
+        plain = open_storage(plain_path)
+        engines = {'sqlite': Analytics(plain, plain_path, 'sqlite')}
+        if analytics.duckdb_available():
+            duck = Analytics(plain, plain_path, 'duckdb')
+            with contextlib.redirect_stdout(io.StringIO()):
+                duck._duckdb()
+            if duck._duck_sqlite:
+                engines['duckdb-sqlite'] = duck
+            else:
+                print('duckdb-sqlite skipped: DuckDB sqlite extension not available')
+        else:
+            print('duckdb engines skipped: duckdb not installed')
+
+        if cold.available():
+            tiered = open_storage(tiered_path, cold_path=os.path.join(work_dir, 'cold'))
+            started = time.time()
+            moved = tiered.tier_out(hours_ago(24))
+            print('Tiered %d rows to Parquet in %.1fs (%.1f MB Parquet vs %.1f MB SQLite)' %
+                  (moved, time.time() - started, tiered.cold.size_bytes() / 1e6, os.path.getsize(plain_path) / 1e6))
+            if analytics.duckdb_available():
+                engines['duckdb-parquet'] = Analytics(tiered, tiered_path, 'duckdb')
+            engines['pyarrow-parquet'] = Analytics(tiered, tiered_path, 'sqlite')
+        else:
+            print('parquet engines skipped: pyarrow not installed')
+
+        results = {}
+        print('\n%-26s %-16s %10s %10s %6s' % ('case', 'engine', 'p50', 'p90', 'match'))
+        for name, spec in CASES:
+            results[name] = {}
+            reference = None
+            for engine_name, engine in engines.items():
+                query = build_query(spec)
+                latencies = []
+                rows = None
+                # First run is untimed: opens files and warms DuckDB's metadata cache
+                for i in range(args.repeats + 1):
+                    started = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        rows, _ = engine.aggregate(query)
+                    if i:
+                        latencies.append((time.perf_counter() - started) * 1000.0)
+                if reference is None:
+                    reference = rows
+                summary = latency_summary(latencies)
+                summary['groups'] = len(rows)
+                summary['matches_sqlite'] = same_rows(rows, reference)
+                results[name][engine_name] = summary
+                print('%-26s %-16s %8.1fms %8.1fms %6s' % (name, engine_name, summary['p50_ms'],
+                                                           summary['p90_ms'], summary['matches_sqlite']))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'nodes': args.nodes, 'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Online backup benchmark (docker/app/backup.py)
+Seeds a history, then keeps a writer inserting a batch every few
+milliseconds while snapshots are taken with different page step sizes (and
+once gzipped). The same writer runs alone first for a baseline.
+Measures:
+
+- backup: duration, copy throughput, snapshot size, restarts of the copy
+- writer stall: the backup's own write-lock probe, and the live writer's
+  insert latency (p50 / p99 / max) during the backup against the baseline
+- consistency: every snapshot is restored and must pass quick_check and
+  hold between the readings present when the backup started and ended
+
+Exits non-zero when a snapshot fails its consistency check.
+
+Examples:
+    python benchmarks/bench_backup.py
+    python benchmarks/bench_backup.py --rows 2000000 --steps 64,256,1024,-1 --json backup.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from seed_db import node_ids, seed_database
+from backup import BackupManager
+from storage import normalize_timestamp, open_storage
+
+
+def batch(nodes, cycle):
+    return [{'node_id': node, 'timestamp': normalize_timestamp(None), 'temperature_c': 20.0 + cycle % 50 / 10.0,
+             'humidity': 55.0, 'pressure_hpa': 1013.2, 'battery_voltage': 3.71, 'rssi': -70, 'snr': 7.5}
+            for node in nodes]
+
+
+class Writer:
+    """Inserts a batch every interval seconds, recording each insert's latency"""
+
+    def __init__(self, store, nodes, interval):
+        self.store = store
+        self.nodes = nodes
+        self.interval = interval
+        self.latencies = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        cycle = 0
+        while not self._stop.wait(self.interval):
+            began = time.perf_counter()
+            self.store.insert_readings(batch(self.nodes, cycle))
+            self.latencies.append((time.perf_counter() - began) * 1000.0)
+            cycle += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark stepped online backups under a live writer')
+    parser.add_argument('--rows', type=int, default=500000, help='Seeded readings (default: 500000)')
+    parser.add_argument('--nodes', type=int, default=20, help='Seeded nodes, one reading each per batch (default: 20)')
+    parser.add_argument('--steps', default='16,256,4096,-1',
+                        help='Comma-separated pages per backup step; -1 copies in one step (default: 16,256,4096,-1)')
+    parser.add_argument('--step-sleep-ms', type=float, default=10, help='Pause between steps (default: 10)')
+    parser.add_argument('--interval-ms', type=float, default=5, help='Pause between writer batches (default: 5)')
+    parser.add_argument('--baseline-seconds', type=float, default=3, help='Writer alone (default: 3)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_backup_')
+    results, failures = {}, []
+    try:
+        db_path = os.path.join(work_dir, 'lora_sensors.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(db_path, 'sensor_data', args.rows, args.nodes)
+        store = open_storage(db_path, schema='sensor_data')
+        with contextlib.redirect_stdout(io.StringIO()):
+            store.initialize()
+        nodes = node_ids(args.nodes)
+        print('Database: %d readings, %.1f MB' % (store.count(), os.path.getsize(db_path) / 1e6))
+
+        with Writer(store, nodes, args.interval_ms / 1000.0) as writer:
+            time.sleep(args.baseline_seconds)
+        results['baseline'] = latency_summary(writer.latencies)
+        print('\nWriter alone: insert p50 %.2fms, p99 %.2fms, max %.2fms (%d batches of %d)' % (
+            results['baseline']['p50_ms'], results['baseline']['p99_ms'], results['baseline']['max_ms'],
+            len(writer.latencies), len(nodes)))
+
+        cases = [(int(step), False) for step in args.steps.split(',')] + [(256, True)]
+        print('\n%-12s %9s %9s %9s %9s %11s %11s %11s' % ('step pages', 'seconds', 'MB/s', 'MB', 'restarts',
+                                                            'probe max', 'insert p99', 'insert max'))
+        results['backups'] = []
+        for step, compress in cases:
+            backup_dir = os.path.join(work_dir, 'backups')
+            manager = BackupManager(db_path, backup_dir, keep=1, compress=compress, step_pages=step,
+                                    step_sleep=args.step_sleep_ms / 1000.0)
+            before = store.count()
+            with Writer(store, nodes, args.interval_ms / 1000.0) as writer:
+                manifest = manager.backup()
+            after = store.count()
+            source_mb = sum(entry['pages'] for entry in manifest['files']) * 4096 / 1e6
+
+            restored_path = os.path.join(work_dir, 'restored.db')
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(restored_path + suffix):
+                    os.remove(restored_path + suffix)
+            manager.restore(manifest, restored_path)
+            conn = sqlite3.connect(restored_path)
+            check = conn.execute('PRAGMA quick_check').fetchone()[0]
+            restored = conn.execute('SELECT COUNT(*) FROM sensor_data').fetchone()[0]
+            conn.close()
+
+            label = '%d%s' % (step, ' gz' if compress else '')
+            result = {
+                'step_pages': step, 'compressed': compress, 'seconds': manifest['duration_seconds'],
+                'copy_seconds': manifest['copy_seconds'], 'snapshot_bytes': manifest['bytes'],
+                'copy_mb_per_s': round(source_mb / manifest['copy_seconds'], 1),
+                'restarts': sum(entry['restarts'] for entry in manifest['files']),
+                'writer_stall_max_ms': manifest['writer_stall_max_ms'],
+                'live_insert': latency_summary(writer.latencies),
+                'readings': {'before': before, 'snapshot': restored, 'after': after},
+            }
+            results['backups'].append(result)
+            print('%-12s %9.2f %9.1f %9.1f %9d %9.2fms %9.2fms %9.2fms' % (
+                label, result['seconds'], result['copy_mb_per_s'], result['snapshot_bytes'] / 1e6,
+                result['restarts'], result['writer_stall_max_ms'], result['live_insert']['p99_ms'],
+                result['live_insert']['max_ms']))
+            if check != 'ok' or not before <= restored <= after:
+                failures.append(label)
+                print('  FAIL %s: quick_check %s, %d readings restored (%d..%d expected)' %
+                      (label, check, restored, before, after))
+        store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('\nConsistency checks: %d failures' % len(failures))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'nodes': args.nodes, 'step_sleep_ms': args.step_sleep_ms,
+                       'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Battery forecast benchmark (docker/app/battery.py)
+Simulates a fleet reporting battery voltage every 15 minutes: most nodes
+drain at their own steady rate, some hold steady (solar/USB powered) and
+a few get a fresh battery part way through. The readings go through
+BatteryForecaster.append() in per-cycle batches, as the ingest path sends
+them. Measures:
+
+- update cost per reading, early in the run and at the end (it should not
+  grow with history)
+- query latency: one node's forecast, the whole fleet, and refitting one
+  node from its full history (what a query without the running fit costs)
+- exactness: the running fit's slope against a batch weighted least
+  squares over the same readings; exits non-zero on a mismatch
+- accuracy: predicted days to cutoff against the simulated truth
+
+Examples:
+    python benchmarks/bench_battery.py
+    python benchmarks/bench_battery.py --nodes 1000 --days 30 --json battery.json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from recent_cache import from_epoch
+from battery import DAY, BatteryForecaster
+
+CADENCE_SECONDS = 15 * 60
+NOISE_V = 0.005
+TOLERANCE = 1e-6
+
+
+def build_fleet(nodes, days, seed=1):
+    """Per-node discharge profiles: start voltage, drain (V/day) and an optional battery swap day"""
+    rng = random.Random(seed)
+    fleet = []
+    for i in range(nodes):
+        kind = 'steady' if i % 20 == 0 else 'swap' if i % 50 == 1 else 'draining'
+        fleet.append({
+            'node_id': str(1000 + i),
+            'kind': kind,
+            'start_v': rng.uniform(3.9, 4.2),
+            'drain': 0.0 if kind == 'steady' else rng.uniform(0.002, 0.030),
+            'swap_day': rng.uniform(days * 0.3, days * 0.7) if kind == 'swap' else None,
+        })
+    return fleet
+
+
+def true_voltage(node, day):
+    if node['swap_day'] is not None and day >= node['swap_day']:
+        return 4.15 - node['drain'] * (day - node['swap_day'])
+    return node['start_v'] - node['drain'] * day
+
+
+def build_cycles(fleet, days, start, seed=2):
+    """Reading batches, one per 15-minute collection cycle"""
+    rng = random.Random(seed)
+    cycles = []
+    reading_id = 0
+    for step in range(int(days * DAY / CADENCE_SECONDS)):
+        ts = start + step * CADENCE_SECONDS
+        timestamp = from_epoch(ts)
+        day = (ts - start) / DAY
+        batch = []
+        for node in fleet:
+            reading_id += 1
+            # ADC noise, rounded to millivolts like the node firmware's %.2f/%.3f output
+            voltage = round(true_voltage(node, day) + rng.gauss(0, NOISE_V), 3)
+            batch.append({'id': reading_id, 'node_id': node['node_id'], 'timestamp': timestamp,
+                          'battery_voltage': voltage})
+        cycles.append(batch)
+    return cycles
+
+
+def batch_slope(points, tau, now):
+    """Weighted least squares slope (V/day) over a node's whole history"""
+    weights = [math.exp((t - now) / tau) for t, _ in points]
+    total = sum(weights)
+    mean_t = sum(w * t for w, (t, _) in zip(weights, points)) / total
+    mean_v = sum(w * v for w, (_, v) in zip(weights, points)) / total
+    ctt = sum(w * (t - mean_t) ** 2 for w, (t, _) in zip(weights, points))
+    ctv = sum(w * (t - mean_t) * (v - mean_v) for w, (t, v) in zip(weights, points))
+    return ctv / ctt
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-node battery depletion forecasts')
+    parser.add_argument('--nodes', type=int, default=1000, help='Fleet size (default: 1000)')
+    parser.add_argument('--days', type=float, default=14, help='Simulated days of readings (default: 14)')
+    parser.add_argument('--half-life-days', type=float, default=7, help='Forgetting half-life (default: 7)')
+    parser.add_argument('--runs', type=int, default=200, help='Query repetitions (default: 200)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    start = int(time.time() - args.days * DAY) // CADENCE_SECONDS * CADENCE_SECONDS
+    fleet = build_fleet(args.nodes, args.days)
+    print('Simulating %d nodes over %g days...' % (args.nodes, args.days))
+    cycles = build_cycles(fleet, args.days, start)
+    total = sum(len(batch) for batch in cycles)
+
+    forecaster = BatteryForecaster(half_life_days=args.half_life_days)
+    # No database to warm from: the fleet starts with no history
+    forecaster.ready = True
+    per_cycle = []
+    started = time.perf_counter()
+    for batch in cycles:
+        cycle_started = time.perf_counter()
+        forecaster.append(batch)
+        per_cycle.append((time.perf_counter() - cycle_started) / len(batch) * 1e6)
+    elapsed = time.perf_counter() - started
+    day_cycles = int(DAY / CADENCE_SECONDS)
+    results = {
+        'append': {
+            'readings': total,
+            'seconds': round(elapsed, 3),
+            'readings_per_second': round(total / elapsed),
+            'us_per_reading_first_day': round(statistics.median(per_cycle[:day_cycles]), 2),
+            'us_per_reading_last_day': round(statistics.median(per_cycle[-day_cycles:]), 2),
+        }
+    }
+
+    now = start + len(cycles) * CADENCE_SECONDS
+    node_id = fleet[1]['node_id']
+
+    def timed(fn, runs):
+        latencies = []
+        for _ in range(runs):
+            query_started = time.perf_counter()
+            fn()
+            latencies.append((time.perf_counter() - query_started) * 1000.0)
+        return latency_summary(latencies)
+
+    # Each node's (day, voltage) points, on the forecaster's time axis (days since the epoch)
+    history = {node['node_id']: [] for node in fleet}
+    for i, batch in enumerate(cycles):
+        t = (start + i * CADENCE_SECONDS) / DAY
+        for reading in batch:
+            history[reading['node_id']].append((t, reading['battery_voltage']))
+    tau = forecaster.tau
+    results['query_node'] = timed(lambda: forecaster.forecast(node_id, now), args.runs)
+    results['query_fleet'] = timed(lambda: forecaster.forecasts(now), max(args.runs // 20, 5))
+    results['query_refit'] = timed(lambda: batch_slope(history[node_id], tau, now / DAY), max(args.runs // 20, 5))
+
+    # Exactness: the running fit against a batch fit of the same (post-swap) readings
+    mismatches = []
+    for node in fleet:
+        if node['kind'] == 'swap':
+            continue
+        fit = forecaster.fits[node['node_id']]
+        expected = batch_slope(history[node['node_id']], tau, now / DAY)
+        if not math.isclose(fit.slope(), expected, rel_tol=TOLERANCE, abs_tol=TOLERANCE):
+            mismatches.append((node['node_id'], fit.slope(), expected))
+
+    # Accuracy against the simulation
+    errors, steady_ok, swaps_found, swap_nodes, statuses = [], 0, 0, 0, {}
+    forecasts = {f['node_id']: f for f in forecaster.forecasts(now)}
+    for node in fleet:
+        forecast = forecasts[node['node_id']]
+        statuses[forecast['status']] = statuses.get(forecast['status'], 0) + 1
+        if node['kind'] == 'steady':
+            steady_ok += forecast['status'] == 'steady'
+            continue
+        if node['kind'] == 'swap':
+            # A fresh battery only stands out when it jumps past the fit by more than reset_jump_v
+            jump = true_voltage(node, node['swap_day']) - true_voltage(node, node['swap_day'] - 1e-9)
+            if jump > forecaster.reset_jump_v + 3 * NOISE_V:
+                swap_nodes += 1
+                swaps_found += forecast['battery_changes'] == 1
+        true_days = max(true_voltage(node, args.days) - forecaster.cutoff_v, 0.0) / node['drain']
+        if forecast['days_to_cutoff'] is not None and true_days > 0:
+            errors.append(abs(forecast['days_to_cutoff'] - true_days) / true_days * 100.0)
+    errors.sort()
+    steady_nodes = sum(node['kind'] == 'steady' for node in fleet)
+    results['accuracy'] = {
+        'statuses': statuses,
+        'forecast_nodes': len(errors),
+        'median_error_pct': round(errors[len(errors) // 2], 2) if errors else None,
+        'p90_error_pct': round(errors[int(len(errors) * 0.9)], 2) if errors else None,
+        'steady_detected': '%d/%d' % (steady_ok, steady_nodes),
+        'swaps_detected': '%d/%d' % (swaps_found, swap_nodes),
+        'slope_mismatches': len(mismatches),
+    }
+
+    append = results['append']
+    print('\nAppend:            %d readings in %.2fs (%.0f/s)' % (total, append['seconds'],
+                                                               append['readings_per_second']))
+    print('  per reading:     %.2fus first day, %.2fus last day' % (append['us_per_reading_first_day'],
+                                                                  append['us_per_reading_last_day']))
+    print('Query, one node:   %7.3fms p50' % results['query_node']['p50_ms'])
+    print('Query, fleet:      %7.3fms p50 (%d nodes)' % (results['query_fleet']['p50_ms'], args.nodes))
+    print('Refit from history:%7.3fms p50 (one node, %d readings)' % (results['query_refit']['p50_ms'],
+                                                                      len(history[node_id])))
+    accuracy = results['accuracy']
+    print('Statuses: %s' % ', '.join('%s %d' % item for item in sorted(statuses.items())))
+    print('Days to cutoff error: %s%% median, %s%% p90 over %d nodes' % (
+        accuracy['median_error_pct'], accuracy['p90_error_pct'], accuracy['forecast_nodes']))
+    print('Steady nodes recognised: %s, battery swaps detected: %s (clear jumps)' % (accuracy['steady_detected'],
+                                                                    accuracy['swaps_detected']))
+    for node_id, got, want in mismatches[:10]:
+        print('  MISMATCH node %s slope %r != %r' % (node_id, got, want))
+    print('Running fit vs batch refit: %d slope mismatches' % len(mismatches))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'nodes': args.nodes, 'days': args.days, 'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Compressed block storage benchmark (docker/app/storage/blocks.py, codec.py)
+Seeds a history, copies it, and seals every window of the copy into
+blocks (STORAGE_ENGINE=blocks). Measures:
+
+- size: bytes per reading of the block payloads (per column too) next to
+  the row table's file, both after VACUUM; the same blocks encoded with
+  Gorilla XOR only (no scaled-decimal columns) for comparison
+- seal speed: readings/s moved from the table into blocks
+- decode speed: readings/s for whole blocks and for one projected column
+- reads: per-node range scans (24h, 7d, 30d) and fleet-wide pages against
+  the plain table
+- correctness: every read must return exactly what the plain table does
+
+Exits non-zero when any read differs.
+
+Examples:
+    python benchmarks/bench_blocks.py
+    python benchmarks/bench_blocks.py --rows 1000000 --nodes 50 --window-hours 24 --json blocks.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from seed_db import node_ids, seed_database
+from storage import hours_ago, open_storage
+from storage.codec import decode_block, encode_block
+
+
+def timed(fn, repeats):
+    fn()
+    latencies = []
+    for _ in range(repeats):
+        began = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - began) * 1000.0)
+    return latency_summary(latencies)
+
+
+def vacuumed_size(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute('VACUUM')
+    conn.close()
+    return os.path.getsize(path)
+
+
+def payloads(path, table):
+    conn = sqlite3.connect(path)
+    rows = [row[0] for row in conn.execute(f'SELECT payload FROM {table}')]
+    conn.close()
+    return rows
+
+
+def decode_rate(blocks, names=None):
+    """Readings decoded per second over all blocks"""
+    began = time.perf_counter()
+    readings = sum(decode_block(payload, names)[0] for payload in blocks)
+    return readings / (time.perf_counter() - began)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compressed block storage against the row table')
+    parser.add_argument('--schema', choices=['sensor_data', 'sensor_readings'], default='sensor_data')
+    parser.add_argument('--rows', type=int, default=200000, help='Seeded readings (default: 200000)')
+    parser.add_argument('--nodes', type=int, default=20, help='Seeded nodes (default: 20)')
+    parser.add_argument('--window-hours', type=float, default=24, help='Block window (default: 24)')
+    parser.add_argument('--repeats', type=int, default=10, help='Timed calls per read case (default: 10)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_blocks_')
+    results, failures = {}, []
+    try:
+        plain_path = os.path.join(work_dir, 'plain.db')
+        blocks_path = os.path.join(work_dir, 'blocks.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(plain_path, args.schema, args.rows, args.nodes)
+        shutil.copyfile(plain_path, blocks_path)
+        plain = open_storage(plain_path, schema=args.schema)
+        blocks = open_storage(blocks_path, schema=args.schema, engine='blocks',
+                              block_seconds=int(args.window_hours * 3600))
+        with contextlib.redirect_stdout(io.StringIO()):
+            plain.initialize()
+            blocks.initialize()
+
+        # Seal everything but the newest hour, which stays in the table like live data
+        began = time.perf_counter()
+        sealed = blocks.seal(hours_ago(1))
+        seal_seconds = time.perf_counter() - began
+        stats = blocks.block_stats()
+        results['seal'] = {'readings': sealed, 'seconds': round(seal_seconds, 2),
+                           'readings_per_s': round(sealed / seal_seconds)}
+        print('Sealed %d of %d readings into %d blocks in %.1fs (%.0f readings/s)' %
+              (sealed, args.rows, stats['blocks'], seal_seconds, sealed / seal_seconds))
+
+        plain.close()
+        blocks.close()
+        plain_size, blocks_size = vacuumed_size(plain_path), vacuumed_size(blocks_path)
+        all_blocks = payloads(blocks_path, blocks.blocks_table)
+        names = ['id'] + blocks.block_fields
+        xor_bytes = 0
+        for payload in all_blocks:
+            _, columns = decode_block(payload, names)
+            xor_bytes += len(encode_block(columns, allow_decimal=False))
+        size = {
+            'table_file_bytes_per_reading': round(plain_size / args.rows, 1),
+            'blocks_file_bytes_per_reading': round(blocks_size / args.rows, 1),
+            'payload_bytes_per_reading': stats['bytes_per_reading'],
+            'payload_xor_only_bytes_per_reading': round(xor_bytes / max(sealed, 1), 2),
+            'columns': {name: dict(column, bytes_per_reading=round(column['bytes'] / max(sealed, 1), 2))
+                        for name, column in stats['columns'].items()},
+        }
+        results['size'] = size
+        print('\nBytes per reading (after VACUUM)')
+        print('  row table file            %8.1f' % size['table_file_bytes_per_reading'])
+        print('  blocks engine file        %8.1f' % size['blocks_file_bytes_per_reading'])
+        print('  block payloads            %8.2f' % size['payload_bytes_per_reading'])
+        print('  block payloads, XOR only  %8.2f' % size['payload_xor_only_bytes_per_reading'])
+        for name, column in size['columns'].items():
+            print('    %-18s %8.2f  %s' % (name, column['bytes_per_reading'],
+                                          ', '.join('%s x%d' % item for item in sorted(column['codecs'].items()))))
+
+        field = 'temperature_c' if 'temperature_c' in names else names[-1]
+        decode = {
+            'all_columns_readings_per_s': round(decode_rate(all_blocks)),
+            'one_column_readings_per_s': round(decode_rate(all_blocks, ('id', 'timestamp', field))),
+        }
+        results['decode'] = decode
+        print('\nDecode: %d readings/s (all columns), %d readings/s (id, timestamp, %s)' %
+              (decode['all_columns_readings_per_s'], decode['one_column_readings_per_s'], field))
+
+        plain = open_storage(plain_path, schema=args.schema)
+        blocks = open_storage(blocks_path, schema=args.schema, engine='blocks',
+                              block_seconds=int(args.window_hours * 3600))
+        node = node_ids(args.nodes)[0]
+        cases = [
+            ('range_24h_node', dict(node_id=node, t0=hours_ago(24))),
+            ('range_7d_node', dict(node_id=node, t0=hours_ago(168))),
+            ('range_30d_node', dict(node_id=node, t0=hours_ago(720))),
+            ('range_30d_node_temperature', dict(node_id=node, t0=hours_ago(720), fields=['temperature_c'])),
+            ('range_7d_all_limit_1000', dict(t0=hours_ago(168), limit=1000)),
+            ('range_all_oldest_1000', dict(limit=1000, descending=False)),
+        ]
+        print('\n%-28s %12s %12s' % ('read (p50 ms)', 'table', 'blocks'))
+        reads = {}
+        for name, kwargs in cases:
+            reads[name] = {'table': timed(lambda: plain.range(**kwargs), args.repeats),
+                           'blocks': timed(lambda: blocks.range(**kwargs), args.repeats)}
+            print('%-28s %12.2f %12.2f' % (name, reads[name]['table']['p50_ms'], reads[name]['blocks']['p50_ms']))
+            if blocks.range(**kwargs) != plain.range(**kwargs):
+                failures.append(name)
+                print('  FAIL %s: blocks differ from the table' % name)
+        for name, fn in (('latest', lambda s: s.latest()), ('count', lambda s: s.count())):
+            reads[name] = {'table': timed(lambda: fn(plain), args.repeats),
+                           'blocks': timed(lambda: fn(blocks), args.repeats)}
+            print('%-28s %12.2f %12.2f' % (name, reads[name]['table']['p50_ms'], reads[name]['blocks']['p50_ms']))
+            if fn(blocks) != fn(plain):
+                failures.append(name)
+                print('  FAIL %s: blocks differ from the table' % name)
+        results['reads'] = reads
+        if [r['id'] for r in blocks.iter_range(descending=False)] != [r['id'] for r in plain.iter_range(descending=False)]:
+            failures.append('full scan')
+            print('  FAIL full scan: blocks differ from the table')
+        plain.close()
+        blocks.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('\nRead checks: %d mismatches' % len(failures))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'schema': args.schema, 'rows': args.rows, 'nodes': args.nodes,
+                       'window_hours': args.window_hours, 'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Bulk import benchmark (tools/bulk_import.py)
+Seeds a simple-server database (sensor_readings, Fahrenheit), writes it out
+as the CSV /api/export/csv produces and as JSON lines with canonical field
+names, then imports each of the three into a fresh docker-app database
+(sensor_data, Celsius). For reference it also stores a sample the way the
+API does, one reading per transaction, appends a second import to a
+populated table with and without deferred indexes, and re-runs the import
+with duplicates skipped.
+Measures:
+
+- rows/s per source format, split into load and index rebuild time
+- rows/s of the one-row-per-transaction path
+- correctness: every import must hold all source rows, with temperatures
+  converted to Celsius and timestamps identical to the source, and a
+  re-run must add nothing
+
+Exits non-zero when an import is missing rows, a value differs or a re-run
+stores a duplicate.
+
+Examples:
+    python benchmarks/bench_bulk_import.py
+    python benchmarks/bench_bulk_import.py --rows 10000000 --nodes 100 --json bulk_import.json
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from bulk_import import bulk_import
+from seed_db import seed_database
+from storage import f_to_c, open_storage
+
+EXPORT_COLUMNS = ['node_id', 'gateway_timestamp', 'node_timestamp', 'temperature_f', 'humidity', 'pressure_hpa',
+                  'heat_index', 'dew_point', 'rssi', 'snr', 'collection_cycle', 'gateway_id', 'received_at']
+
+
+def write_sources(db_path, csv_path, jsonl_path):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute('SELECT %s FROM sensor_readings ORDER BY id' % ', '.join(EXPORT_COLUMNS))
+    with open(csv_path, 'w', newline='') as csv_file, open(jsonl_path, 'w') as jsonl_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(EXPORT_COLUMNS)
+        while True:
+            rows = cursor.fetchmany(50000)
+            if not rows:
+                break
+            writer.writerows(rows)
+            jsonl_file.writelines(json.dumps({
+                'node_id': r[0], 'timestamp': r[12], 'temperature_c': f_to_c(r[3]), 'humidity': r[4],
+                'pressure_hpa': r[5], 'rssi': r[8], 'snr': r[9], 'gateway_id': r[11]}) + '\n' for r in rows)
+    conn.close()
+
+
+def check(source_db, target_db, rows):
+    """Compare the target's readings with the source's, in id order; returns a list of problems"""
+    problems = []
+    src_conn, dst_conn = sqlite3.connect(source_db), sqlite3.connect(target_db)
+    src = src_conn.execute(
+        'SELECT node_id, received_at, temperature_f, humidity, pressure_hpa FROM sensor_readings ORDER BY id')
+    dst = dst_conn.execute(
+        'SELECT node_id, timestamp, temperature, humidity, pressure FROM sensor_data ORDER BY id')
+    seen = 0
+    for a, b in zip(src, dst):
+        seen += 1
+        if a[:2] != b[:2] or a[3:] != b[3:] or abs(f_to_c(a[2]) - b[2]) > 1e-6:
+            problems.append('row %d: %r != %r' % (seen, a, b))
+            if len(problems) >= 3:
+                break
+    src_conn.close()
+    dst_conn.close()
+    if seen != rows and len(problems) < 3:
+        problems.append('%d of %d rows' % (seen, rows))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bulk imports of CSV, JSONL and SQLite sources')
+    parser.add_argument('--rows', type=int, default=1000000, help='Source readings (default: 1000000)')
+    parser.add_argument('--nodes', type=int, default=50, help='Source nodes (default: 50)')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Rows per transaction (default: 50000)')
+    parser.add_argument('--api-sample', type=int, default=5000,
+                        help='Readings stored one per transaction for reference (default: 5000)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_import_')
+    results, failures = {}, []
+    try:
+        source_db = os.path.join(work_dir, 'simple.db')
+        csv_path = os.path.join(work_dir, 'export.csv')
+        jsonl_path = os.path.join(work_dir, 'readings.jsonl')
+        began = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(source_db, 'sensor_readings', args.rows, args.nodes)
+        write_sources(source_db, csv_path, jsonl_path)
+        print('Sources: %d readings, SQLite %.0f MB, CSV %.0f MB, JSONL %.0f MB (%.0fs to generate)' % (
+            args.rows, os.path.getsize(source_db) / 1e6, os.path.getsize(csv_path) / 1e6,
+            os.path.getsize(jsonl_path) / 1e6, time.perf_counter() - began))
+
+        print('\n%-22s %10s %10s %10s %12s' % ('source -> sensor_data', 'load s', 'index s', 'rows/s', 'skipped'))
+        for label, source in (('sqlite', source_db), ('csv', csv_path), ('jsonl', jsonl_path)):
+            target = os.path.join(work_dir, 'import_%s.db' % label)
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = bulk_import(source, target, 'sensor_data', chunk_size=args.chunk_size)
+            results[label] = result
+            print('%-22s %10.1f %10.1f %10d %12d' % (label, result['load_seconds'], result['index_seconds'],
+                                                     result['rows_per_s'], result['skipped']))
+            problems = check(source_db, target, args.rows)
+            if problems:
+                failures.append(label)
+                print('  FAIL %s: %s' % (label, '; '.join(problems)))
+            if label != 'sqlite':
+                os.remove(target)
+
+        # A second history appended to a populated table: index upkeep per row against one rebuild.
+        # The same source again, so duplicates are kept; the re-run skips them all
+        populated = os.path.join(work_dir, 'import_sqlite.db')
+        print('\n%-22s %10s %10s %10s %12s' % ('append to populated', 'load s', 'index s', 'rows/s', 'inserted'))
+        for label, defer, duplicates in (('defer indexes never', 'never', 'keep'),
+                                         ('defer indexes always', 'always', 'keep'),
+                                         ('re-run, skip existing', 'auto', 'skip')):
+            target = os.path.join(work_dir, 'append.db')
+            shutil.copyfile(populated, target)
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = bulk_import(source_db, target, 'sensor_data', chunk_size=args.chunk_size,
+                                     defer_indexes=defer, duplicates=duplicates)
+            results['append_defer_%s' % defer if duplicates == 'keep' else 'rerun_skip'] = result
+            print('%-22s %10.1f %10.1f %10d %12d' % (label, result['load_seconds'], result['index_seconds'],
+                                                     result['rows_per_s'], result['inserted']))
+            if duplicates == 'skip' and result['inserted']:
+                failures.append('rerun')
+                print('  FAIL re-run: %d duplicates stored' % result['inserted'])
+            os.remove(target)
+
+        # What the API path costs: one reading per transaction through the storage engine
+        store = open_storage(os.path.join(work_dir, 'api.db'), schema='sensor_data')
+        with contextlib.redirect_stdout(io.StringIO()):
+            store.initialize()
+        sample = open_storage(source_db, schema='sensor_readings').range(limit=args.api_sample, descending=False)
+        began = time.perf_counter()
+        for reading in sample:
+            store.insert_readings([dict(reading)])
+        seconds = time.perf_counter() - began
+        store.close()
+        results['one_per_transaction'] = {'rows': len(sample), 'rows_per_s': round(len(sample) / seconds)}
+        print('\nOne reading per transaction (the API path): %d rows/s' % (len(sample) / seconds))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('\nImport checks: %d failures' % len(failures))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'nodes': args.nodes, 'chunk_size': args.chunk_size, 'results': results},
+                      f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Clustered layout benchmark (docker/app/storage/clustered.py)
+Seeds a history, copies it and converts the copy online with
+tools/migrate_clustered.py while a writer keeps inserting, updating and
+deleting through the rowid engine, then cuts over (STORAGE_ENGINE=clustered).
+Measures:
+
+- migration: rows/s copied and the longest wait for the write lock the
+  live writer saw during the copy
+- size: bytes per reading of both files after VACUUM
+- reads: per-node range scans (24h, 7d, 30d, all) on a warm connection and
+  on a fresh one (cold page cache of the process), fleet-wide pages
+- writes: live inserts (a batch per node at the head of its key range)
+- correctness: after cut-over the clustered store must hold exactly the
+  rowid store's readings, and every read must return the same rows
+
+Exits non-zero when any read differs.
+
+Examples:
+    python benchmarks/bench_clustered.py
+    python benchmarks/bench_clustered.py --rows 1000000 --nodes 50 --json clustered.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from migrate_clustered import backfill, differences, prepare
+from seed_db import node_ids, seed_database
+from storage import hours_ago, normalize_timestamp, open_storage
+
+
+def timed(fn, repeats):
+    fn()
+    latencies = []
+    for _ in range(repeats):
+        began = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - began) * 1000.0)
+    return latency_summary(latencies)
+
+
+def timed_fresh(open_fn, fn, repeats):
+    """Latency of fn on a store opened just before each call (no warm page cache in the process)"""
+    latencies = []
+    for _ in range(repeats):
+        store = open_fn()
+        began = time.perf_counter()
+        fn(store)
+        latencies.append((time.perf_counter() - began) * 1000.0)
+        store.close()
+    return latency_summary(latencies)
+
+
+def vacuumed_size(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute('VACUUM')
+    conn.close()
+    return os.path.getsize(path)
+
+
+def reading(node, cycle):
+    # Fields the schema has no column for are dropped on insert
+    return {'node_id': node, 'timestamp': normalize_timestamp(None), 'rssi': -70 - cycle % 30,
+            'temperature_c': 20.0 + (cycle % 50) / 10.0, 'humidity': 55.25, 'pressure_hpa': 1013.2,
+            'battery_voltage': 3.712, 'snr': 7.5, 'gateway_id': 'gw-bench', 'collection_cycle': cycle}
+
+
+def live_writer(store, nodes, stop, stalls):
+    """Insert, update and delete through the rowid engine until stop is set"""
+    cycle = 0
+    while not stop.is_set():
+        began = time.perf_counter()
+        store.insert_readings([reading(node, cycle) for node in nodes[:5]])
+        stalls.append(time.perf_counter() - began)
+        newest = store.range(limit=2)
+        if newest:
+            store.update_fields(['rssi'], [newest[0]['id']], [[-42]])
+        if cycle % 5 == 0 and len(newest) > 1:
+            store.delete_range(node_id=newest[1]['node_id'], t0=newest[1]['timestamp'], max_id=newest[1]['id'])
+        cycle += 1
+        time.sleep(0.005)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the clustered WITHOUT ROWID layout against the rowid table')
+    parser.add_argument('--schema', choices=['sensor_data', 'sensor_readings'], default='sensor_data')
+    parser.add_argument('--rows', type=int, default=200000, help='Seeded readings (default: 200000)')
+    parser.add_argument('--nodes', type=int, default=20, help='Seeded nodes (default: 20)')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Migration rows per transaction (default: 5000)')
+    parser.add_argument('--repeats', type=int, default=10, help='Timed calls per read case (default: 10)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_clustered_')
+    results, failures = {}, []
+    try:
+        plain_path = os.path.join(work_dir, 'plain.db')
+        clustered_path = os.path.join(work_dir, 'clustered.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(plain_path, args.schema, args.rows, args.nodes)
+        shutil.copyfile(plain_path, clustered_path)
+        nodes = node_ids(args.nodes)
+
+        # Online conversion of the copy while the app (rowid engine) keeps writing to it
+        live = open_storage(clustered_path, schema=args.schema)
+        with contextlib.redirect_stdout(io.StringIO()):
+            live.initialize()
+        stop, stalls = threading.Event(), []
+        writer = threading.Thread(target=live_writer, args=(live, nodes, stop, stalls), daemon=True)
+        writer.start()
+        began = time.perf_counter()
+        top = prepare(live)
+        copied, lock_wait = backfill(live, top, args.chunk_size)
+        seconds = time.perf_counter() - began
+        stop.set()
+        writer.join()
+        missing, extra = differences(live)
+        results['migration'] = {
+            'readings': copied, 'seconds': round(seconds, 2), 'readings_per_s': round(copied / seconds),
+            'live_insert_max_ms': round(max(stalls, default=0) * 1000.0, 2),
+            'live_insert': latency_summary([s * 1000.0 for s in stalls]),
+            'backfill_lock_wait_max_ms': round(lock_wait * 1000.0, 2), 'missing': missing, 'extra': extra,
+        }
+        print('Copied %d readings online in %.1fs (%.0f readings/s) during %d live batches; '
+              'live insert p50 %.2fms, max %.2fms' %
+              (copied, seconds, copied / seconds, len(stalls),
+               results['migration']['live_insert']['p50_ms'], results['migration']['live_insert_max_ms']))
+        if missing or extra:
+            failures.append('migration')
+            print('  FAIL migration: %d missing, %d extra' % (missing, extra))
+
+        # The rowid store gets the live writer's changes too, so both sides hold the same readings
+        expected = live.range(descending=False)
+        live.close()
+        plain = open_storage(plain_path, schema=args.schema)
+        with contextlib.redirect_stdout(io.StringIO()):
+            plain.initialize()
+        with plain.transaction() as conn:
+            conn.execute(f'DELETE FROM {plain.schema.table}')
+        plain.insert_readings([dict(r) for r in expected], ids=[r['id'] for r in expected])
+        rows = len(expected)
+
+        clustered = open_storage(clustered_path, schema=args.schema, engine='clustered')
+        with contextlib.redirect_stdout(io.StringIO()):
+            clustered.initialize()
+        if clustered.range(descending=False) != expected:
+            failures.append('cut-over')
+            print('  FAIL cut-over: clustered readings differ from the rowid table')
+
+        plain.close()
+        clustered.close()
+        plain_size, clustered_size = vacuumed_size(plain_path), vacuumed_size(clustered_path)
+        results['size'] = {'rowid_file_bytes_per_reading': round(plain_size / rows, 1),
+                           'clustered_file_bytes_per_reading': round(clustered_size / rows, 1)}
+        print('\nBytes per reading (after VACUUM): rowid %.1f, clustered %.1f' %
+              (plain_size / rows, clustered_size / rows))
+
+        def open_plain():
+            return open_storage(plain_path, schema=args.schema)
+
+        def open_clustered():
+            return open_storage(clustered_path, schema=args.schema, engine='clustered')
+
+        plain, clustered = open_plain(), open_clustered()
+        node = nodes[0]
+        cases = [
+            ('range_24h_node', dict(node_id=node, t0=hours_ago(24))),
+            ('range_7d_node', dict(node_id=node, t0=hours_ago(168))),
+            ('range_30d_node', dict(node_id=node, t0=hours_ago(720))),
+            ('range_all_node', dict(node_id=node)),
+            ('range_30d_node_temperature', dict(node_id=node, t0=hours_ago(720), fields=['temperature_c'])),
+            ('range_7d_all_limit_1000', dict(t0=hours_ago(168), limit=1000)),
+            ('range_all_oldest_1000', dict(limit=1000, descending=False)),
+        ]
+        print('\n%-28s %10s %10s %12s %12s' % ('read (p50 ms)', 'rowid', 'clustered', 'rowid fresh', 'clust. fresh'))
+        reads = {}
+        for name, kwargs in cases:
+            reads[name] = {
+                'rowid': timed(lambda: plain.range(**kwargs), args.repeats),
+                'clustered': timed(lambda: clustered.range(**kwargs), args.repeats),
+                'rowid_fresh': timed_fresh(open_plain, lambda s: s.range(**kwargs), args.repeats),
+                'clustered_fresh': timed_fresh(open_clustered, lambda s: s.range(**kwargs), args.repeats),
+            }
+            print('%-28s %10.2f %10.2f %12.2f %12.2f' % (name, *(reads[name][k]['p50_ms'] for k in
+                                                             ('rowid', 'clustered', 'rowid_fresh', 'clustered_fresh'))))
+            if clustered.range(**kwargs) != plain.range(**kwargs):
+                failures.append(name)
+                print('  FAIL %s: clustered differs from the rowid table' % name)
+        for name, fn in (('latest', lambda s: s.latest()), ('stats', lambda s: s.stats()), ('count', lambda s: s.count())):
+            reads[name] = {'rowid': timed(lambda: fn(plain), args.repeats),
+                           'clustered': timed(lambda: fn(clustered), args.repeats)}
+            print('%-28s %10.2f %10.2f' % (name, reads[name]['rowid']['p50_ms'], reads[name]['clustered']['p50_ms']))
+            if fn(clustered) != fn(plain):
+                failures.append(name)
+                print('  FAIL %s: clustered differs from the rowid table' % name)
+        results['reads'] = reads
+
+        writes = {}
+        for label, store in (('rowid', plain), ('clustered', clustered)):
+            latencies = []
+            for cycle in range(args.repeats * 5):
+                batch = [reading(n, cycle) for n in nodes]
+                began = time.perf_counter()
+                store.insert_readings(batch)
+                latencies.append((time.perf_counter() - began) * 1000.0)
+            writes[label] = dict(latency_summary(latencies),
+                                 readings_per_s=round(len(nodes) * len(latencies) / (sum(latencies) / 1000.0)))
+        results['writes'] = writes
+        print('\nLive inserts (%d nodes per batch): rowid %d readings/s, clustered %d readings/s' %
+              (len(nodes), writes['rowid']['readings_per_s'], writes['clustered']['readings_per_s']))
+        plain.close()
+        clustered.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('\nRead checks: %d mismatches' % len(failures))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'schema': args.schema, 'rows': args.rows, 'nodes': args.nodes, 'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Deadband / swinging-door ingest compression benchmark (docker/app/deadband.py)
+Feeds simulated 15-minute cycles through the filter into a scratch
+database, once per mode (off, deadband, swinging_door), for quiet indoor
+nodes and for noisy outdoor ones (tools/seed_db.py's generator).
+Measures:
+
+- volume: readings and write transactions stored, file bytes per reading
+  received (after VACUUM)
+- filter speed: readings/s through filter() alone
+- fidelity: the history reconstructed from what was stored (step for
+  deadband, linear for swinging door), compared with every reading sent;
+  the largest error per metric must stay within its tolerance
+- reconstruct cost: a 24-hour history of every node
+
+Exits non-zero when a reconstruction misses a reading or exceeds a tolerance.
+
+Examples:
+    python benchmarks/bench_deadband.py
+    python benchmarks/bench_deadband.py --nodes 50 --days 30 --max-interval-minutes 360 --json deadband.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from seed_db import CADENCE_SECONDS, generate_rows, node_ids
+from deadband import FIELDS, CompressionRule, DeadbandFilter
+from storage import Reading, hours_ago, open_storage
+from recent_cache import from_epoch, to_epoch
+
+HISTORY_NAMES = ('id', 'node_id', 'timestamp') + FIELDS
+
+
+def indoor_cycles(nodes, cycles, end, seed):
+    """Basement/attic-like nodes: a small daily swing, sensor noise near the resolution"""
+    rng = random.Random(seed)
+    ids = node_ids(nodes)
+    base = [rng.uniform(14.0, 22.0) for _ in ids]
+    battery = [rng.uniform(3.9, 4.2) for _ in ids]
+    for cycle in range(cycles):
+        t = end - CADENCE_SECONDS * (cycles - 1 - cycle)
+        daily = math.sin((t % 86400) / 86400.0 * 2 * math.pi)
+        batch = []
+        for n, node_id in enumerate(ids):
+            battery[n] = max(3.0, battery[n] - rng.uniform(0, 0.00002))
+            batch.append(Reading(node_id=node_id, timestamp=from_epoch(t),
+                                 temperature_c=round(base[n] + 0.6 * daily + rng.gauss(0, 0.02), 2),
+                                 humidity=round(48.0 - 2.0 * daily + rng.gauss(0, 0.1), 1),
+                                 pressure_hpa=round(1013.0 + 3.0 * math.sin(cycle / 400.0 + n) + rng.gauss(0, 0.02), 2),
+                                 battery_voltage=round(battery[n], 3), rssi=-80 + rng.randint(-3, 3),
+                                 snr=round(rng.uniform(-5.0, 12.0), 1)))
+        yield batch
+
+
+def outdoor_cycles(nodes, cycles, end, seed):
+    """tools/seed_db.py's readings (daily swing, outdoor-sized noise), one batch per cycle"""
+    end_time = datetime.fromtimestamp(end, timezone.utc).replace(tzinfo=None)
+    batch = []
+    for row in generate_rows('sensor_data', nodes * cycles, nodes, end_time, seed):
+        node_id, temperature, humidity, pressure, battery, rssi, snr, ts, _ = row
+        batch.append(Reading(node_id=node_id, timestamp=ts, temperature_c=temperature, humidity=humidity,
+                             pressure_hpa=pressure, battery_voltage=battery, rssi=rssi, snr=snr))
+        if len(batch) == nodes:
+            yield batch
+            batch = []
+
+
+def vacuumed_size(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute('VACUUM')
+    conn.close()
+    return os.path.getsize(path)
+
+
+def run(profile, mode, args, work_dir):
+    """Ingest one profile through one mode; returns (results, failures)"""
+    generate = indoor_cycles if profile == 'indoor' else outdoor_cycles
+    cycles = int(args.days * 86400 / CADENCE_SECONDS)
+    end = int(time.time()) // CADENCE_SECONDS * CADENCE_SECONDS
+    batches = list(generate(args.nodes, cycles, end, args.seed))
+    received = sum(len(batch) for batch in batches)
+    rule = CompressionRule(None, mode, max_interval=args.max_interval_minutes * 60.0) if mode != 'off' else None
+
+    path = os.path.join(work_dir, '%s_%s.db' % (profile, mode))
+    store = open_storage(path, schema='sensor_data')
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.initialize()
+    filt = DeadbandFilter([rule] if rule else [])
+    stored = transactions = 0
+    began = time.perf_counter()
+    for batch in batches:
+        rows = filt.filter([Reading(**dict(r)) for r in batch])[0] if rule else batch
+        if rows:
+            store.insert_readings(rows)
+            stored += len(rows)
+            transactions += 1
+    if rule:
+        rows = filt.flush(force=True)[0]
+        if rows:
+            store.insert_readings(rows)
+            stored += len(rows)
+            transactions += 1
+    ingest_seconds = time.perf_counter() - began
+
+    result = {'received': received, 'stored': stored, 'stored_ratio': round(stored / received, 4),
+              'transactions': transactions, 'ingest_readings_per_s': round(received / ingest_seconds)}
+    failures = []
+    if rule:
+        metrics = filt.metrics()['totals']
+        if metrics['received'] != received or metrics['stored'] != stored:
+            failures.append('%s/%s counters' % (profile, mode))
+        # Filter alone, fresh state, no storage
+        timing = DeadbandFilter([rule])
+        copies = [[Reading(**dict(r)) for r in batch] for batch in batches]
+        began = time.perf_counter()
+        for batch in copies:
+            timing.filter(batch)
+        result['filter_readings_per_s'] = round(received / (time.perf_counter() - began))
+
+        # Fidelity: every reading sent against the history rebuilt from storage
+        rows = list(store.range_batch().rows(*HISTORY_NAMES))
+        rebuilt = {(row[1], row[2]): row for row in filt.reconstruct(rows, HISTORY_NAMES)}
+        worst, missing = dict.fromkeys(FIELDS, 0.0), 0
+        for batch in batches:
+            for reading in batch:
+                row = rebuilt.get((reading['node_id'], reading['timestamp']))
+                if row is None:
+                    missing += 1
+                    continue
+                for i, field in enumerate(FIELDS, start=3):
+                    worst[field] = max(worst[field], abs(row[i] - reading[field]))
+        result['max_error'] = {field: round(value, 6) for field, value in worst.items()}
+        result['missing'] = missing
+        over = [f for f in FIELDS if worst[f] > rule.tolerances[f] + 1e-6]
+        if missing or over:
+            failures.append('%s/%s fidelity' % (profile, mode))
+            print('  FAIL %s/%s: %d readings missing, over tolerance: %s' % (profile, mode, missing, over or '-'))
+
+        day = store.range_batch(t0=hours_ago(24))
+        day_rows = list(day.rows(*HISTORY_NAMES))
+        result['reconstruct_24h'] = latency_summary(
+            [timed_once(lambda: filt.reconstruct(day_rows, HISTORY_NAMES)) for _ in range(args.repeats)])
+        result['reconstruct_24h']['stored_rows'] = len(day_rows)
+    store.close()
+    result['file_bytes_per_reading'] = round(vacuumed_size(path) / received, 1)
+    return result, failures
+
+
+def timed_once(fn):
+    began = time.perf_counter()
+    fn()
+    return (time.perf_counter() - began) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark deadband / swinging-door compression at ingest')
+    parser.add_argument('--nodes', type=int, default=20, help='Simulated nodes (default: 20)')
+    parser.add_argument('--days', type=float, default=14, help='Days of 15-minute cycles (default: 14)')
+    parser.add_argument('--max-interval-minutes', type=float, default=180,
+                        help='Heartbeat: longest gap between stored readings (default: 180)')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed reconstructions (default: 5)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_deadband_')
+    results, failures = {}, []
+    try:
+        for profile in ('indoor', 'outdoor'):
+            print('\n%s nodes (%d nodes, %g days)' % (profile.capitalize(), args.nodes, args.days))
+            print('  %-14s %9s %8s %8s %10s %12s %12s' % ('mode', 'stored', 'ratio', 'txns', 'B/reading',
+                                                         'filter r/s', 'rebuild ms'))
+            results[profile] = {}
+            for mode in ('off', 'deadband', 'swinging_door'):
+                result, failed = run(profile, mode, args, work_dir)
+                results[profile][mode] = result
+                failures += failed
+                print('  %-14s %9d %8.3f %8d %10.1f %12s %12s' % (
+                    mode, result['stored'], result['stored_ratio'], result['transactions'],
+                    result['file_bytes_per_reading'], result.get('filter_readings_per_s', '-'),
+                    '%.2f' % result['reconstruct_24h']['p50_ms'] if 'reconstruct_24h' in result else '-'))
+                if 'max_error' in result:
+                    print('  %-14s max error %s' % ('', ', '.join('%s %.3f' % item for item in result['max_error'].items())))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('\nFidelity checks: %d failures' % len(failures))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'nodes': args.nodes, 'days': args.days, 'max_interval_minutes': args.max_interval_minutes,
+                       'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Derived weather metrics benchmark (docker/app/derived.py)
+Measures:
+
+- on read: derive_columns() over history-sized pages versus one
+  derive_one() call per row, and checks both give the same values
+- backfill: tools/backfill_derived.py throughput on a seeded database
+  whose heat_index/dew_point columns are still NULL
+
+Exits non-zero if the vectorized and scalar results differ.
+
+Examples:
+    python benchmarks/bench_derived.py
+    python benchmarks/bench_derived.py --rows 1000000 --pages 1000 10000 100000 --json derived.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from seed_db import seed_database
+from backfill_derived import backfill
+from storage import open_storage
+from derived import DERIVED_METRICS, available, derive_columns, derive_one
+
+ALTITUDE_M = 350.0
+
+
+def build_columns(count, seed=1):
+    rng = random.Random(seed)
+    temperature = [round(rng.gauss(24, 8), 2) for _ in range(count)]
+    humidity = [round(min(max(rng.gauss(60, 20), 1.0), 100.0), 2) for _ in range(count)]
+    pressure = [round(rng.gauss(1005, 12), 2) for _ in range(count)]
+    # A few sensor dropouts, as in real history pages
+    for i in range(0, count, 97):
+        humidity[i] = None
+    return temperature, humidity, pressure
+
+
+def scalar_columns(temperature, humidity, pressure):
+    rows = [derive_one(t, h, p, ALTITUDE_M) for t, h, p in zip(temperature, humidity, pressure)]
+    return {metric: [row[metric] for row in rows] for metric in DERIVED_METRICS}
+
+
+def best_of(fn, runs):
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def count_mismatches(vectorized, scalar):
+    # Rounding to DECIMALS can land either side of a .005 boundary; allow one unit in the last place
+    mismatches = 0
+    for metric in DERIVED_METRICS:
+        for a, b in zip(vectorized[metric], scalar[metric]):
+            if (a is None) != (b is None) or (a is not None and abs(a - b) > 0.0101):
+                mismatches += 1
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark derived weather metrics')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Rows per computed page (default: 1000 10000 100000)')
+    parser.add_argument('--rows', type=int, default=200000, help='Seeded rows for the backfill (default: 200000)')
+    parser.add_argument('--nodes', type=int, default=20, help='Seeded nodes (default: 20)')
+    parser.add_argument('--runs', type=int, default=3, help='Repetitions per page size, best kept (default: 3)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    print('derive_columns: %s' % ('NumPy' if available() else 'NumPy not installed, scalar fallback'))
+    results = {'numpy': available(), 'pages': {}}
+    mismatches = 0
+    print('%-10s %12s %12s %9s' % ('rows', 'vectorized', 'per row', 'speedup'))
+    for count in args.pages:
+        temperature, humidity, pressure = build_columns(count)
+        vector_s, vectorized = best_of(lambda: derive_columns(temperature, humidity, pressure, ALTITUDE_M), args.runs)
+        scalar_s, scalar = best_of(lambda: scalar_columns(temperature, humidity, pressure), args.runs)
+        page_mismatches = count_mismatches(vectorized, scalar)
+        mismatches += page_mismatches
+        results['pages'][count] = {'vectorized_ms': round(vector_s * 1000, 2), 'scalar_ms': round(scalar_s * 1000, 2),
+                                   'mismatches': page_mismatches}
+        print('%-10d %10.2fms %10.2fms %8.1fx' % (count, vector_s * 1000, scalar_s * 1000, scalar_s / vector_s))
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_derived_')
+    try:
+        db_path = os.path.join(work_dir, 'sensor_data.db')
+        print('\nSeeding %d rows across %d nodes...' % (args.rows, args.nodes))
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(db_path, 'sensor_data', args.rows, args.nodes)
+        store = open_storage(db_path)
+        # Seeded sensor_data rows have no derived metrics yet, like a database from before migration 4
+        store.initialize()
+        started = time.perf_counter()
+        updated = backfill(store)
+        elapsed = time.perf_counter() - started
+        rerun = backfill(store)
+        store.close()
+        results['backfill'] = {'rows': updated, 'seconds': round(elapsed, 3),
+                               'rows_per_second': round(updated / elapsed), 'rerun_rows': rerun}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('Backfill: %d rows in %.2fs (%.0f rows/s), re-run touched %d' % (
+        updated, elapsed, updated / elapsed, rerun))
+    print('Vectorized vs per-row: %d mismatches' % mismatches)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
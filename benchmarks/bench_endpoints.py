@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Endpoint microbenchmarks against seeded databases
+Times every API endpoint of the docker app and the simple server in-process
+(Flask test client) against synthetic databases of 100k, 1M or 10M rows and
+stores the results as JSON so runs can be compared commit to commit.
+
+Examples:
+    python benchmarks/bench_endpoints.py                      # 100k rows
+    python benchmarks/bench_endpoints.py --sizes 100k 1m 10m
+    python benchmarks/bench_endpoints.py --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+from common import REPO_ROOT, latency_summary, load_app
+from seed_db import seed_database
+
+DATA_DIR = os.path.join(BENCH_DIR, '.data')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# size label -> (rows, nodes)
+SIZES = {
+    '100k': (100000, 10),
+    '1m': (1000000, 50),
+    '10m': (10000000, 200),
+}
+
+SAMPLE_READING = {
+    'node_id': '1001',
+    'node_name': 'Basement',
+    'temperature_f': 71.6,
+    'humidity': 48.2,
+    'pressure_hpa': 1012.4,
+    'battery_voltage': 4.05,
+    'rssi': -72,
+    'timestamp': None,
+    'collected_by_gateway': True,
+    'gateway_ip': '192.168.1.50',
+}
+
+# (case name, app, method, url, repeats)
+CASES = [
+    ('receive_sensor_data', 'docker', 'POST', '/api/sensor-data', 50),
+    ('get_latest_sensor_data', 'docker', 'GET', '/api/sensor-data/latest', 5),
+    ('get_sensor_history_24h', 'docker', 'GET', '/api/sensor-data/history?hours=24', 5),
+    ('get_sensor_history_24h_node', 'docker', 'GET', '/api/sensor-data/history?hours=24&node_id=1001', 5),
+    ('get_sensor_history_7d', 'docker', 'GET', '/api/sensor-data/history?hours=168', 3),
+    ('get_network_stats', 'docker', 'GET', '/api/network/stats', 5),
+    ('simple_receive_sensor_data', 'simple', 'POST', '/api/sensor-data', 50),
+    ('get_readings_24h', 'simple', 'GET', '/api/readings?hours=24', 5),
+    ('get_readings_24h_node', 'simple', 'GET', '/api/readings?hours=24&node=1001', 5),
+    ('export_csv_7d', 'simple', 'GET', '/api/export/csv?days=7', 3),
+]
+
+APP_SCHEMAS = {'docker': 'sensor_data', 'simple': 'sensor_readings'}
+
+# The receive cases time the insert itself, comparable across commits: the merge window
+# answers before the reading is stored, and admission control may turn repeated POSTs away
+APP_ENV = {'MERGE_WINDOW_MS': '0', 'INGEST_ADMISSION': 'false'}
+
+
+def git_commit():
+    """Short commit hash of the working tree, if available"""
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or 'unknown'
+    except Exception:
+        return 'unknown'
+
+
+def seeded_database(app_kind, size, max_age_hours):
+    """Return a cached seeded database, regenerating it when missing or stale"""
+    rows, nodes = SIZES[size]
+    schema = APP_SCHEMAS[app_kind]
+    path = os.path.join(DATA_DIR, '%s_%s.db' % (schema, size))
+    # Reads are relative to "now", so an old seed would return empty windows
+    fresh = os.path.exists(path) and (time.time() - os.path.getmtime(path)) < max_age_hours * 3600
+    if not fresh:
+        print('Seeding %s (%d rows, %d nodes)...' % (os.path.basename(path), rows, nodes))
+        started = time.time()
+        seed_database(path, schema, rows, nodes)
+        print('  done in %.1fs' % (time.time() - started))
+    return path
+
+
+def run_case(client, method, url, repeats):
+    """Time one endpoint; returns per-call latencies and the last status code"""
+    latencies = []
+    status = None
+    # One untimed warm-up call fills the page cache and Flask's lazy state
+    for i in range(repeats + 1):
+        started = time.perf_counter()
+        if method == 'POST':
+            payload = dict(SAMPLE_READING, timestamp=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S'))
+            resp = client.post(url, json=payload)
+        else:
+            resp = client.get(url)
+        resp.get_data()
+        elapsed = (time.perf_counter() - started) * 1000.0
+        status = resp.status_code
+        if i:
+            latencies.append(elapsed)
+    return latencies, status
+
+
+def run_size(size, max_age_hours, only):
+    """Run every case for one database size"""
+    results = {}
+    apps = {}
+    for name, app_kind, method, url, repeats in CASES:
+        if only and name not in only:
+            continue
+        if app_kind not in apps:
+            db_path = seeded_database(app_kind, size, max_age_hours)
+            with contextlib.redirect_stdout(io.StringIO()):
+                module = load_app(app_kind, db_path, APP_ENV)
+            module.app.logger.disabled = True
+            apps[app_kind] = module.app.test_client()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies, status = run_case(apps[app_kind], method, url, repeats)
+        summary = latency_summary(latencies)
+        summary['status'] = status
+        results[name] = summary
+        print('  %-30s p50 %9.2fms  p90 %9.2fms  (HTTP %s)' % (name, summary['p50_ms'], summary['p90_ms'], status))
+    return results
+
+
+def compare(base_path, new_path):
+    """Print median latency ratios between two result files"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print('%-8s %-30s %12s %12s %8s' % ('size', 'case', 'base p50', 'new p50', 'ratio'))
+    for size, cases in new['results'].items():
+        for name, summary in cases.items():
+            old = base['results'].get(size, {}).get(name)
+            if not old or not old.get('p50_ms'):
+                continue
+            ratio = summary['p50_ms'] / old['p50_ms']
+            flag = '  <-- slower' if ratio > 1.2 else ''
+            print('%-8s %-30s %10.2fms %10.2fms %7.2fx%s' %
+                  (size, name, old['p50_ms'], summary['p50_ms'], ratio, flag))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark API endpoints against seeded databases')
+    parser.add_argument('--sizes', nargs='+', choices=sorted(SIZES), default=['100k'],
+                        help='Database sizes to run (default: 100k)')
+    parser.add_argument('--cases', nargs='+', help='Only run these cases')
+    parser.add_argument('--max-age-hours', type=float, default=6.0,
+                        help='Reseed cached databases older than this (default: 6)')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<date>_<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='Compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+        },
+        'results': {},
+    }
+    for size in args.sizes:
+        print('\n=== %s rows ===' % size)
+        report['results'][size] = run_size(size, args.max_age_hours, args.cases)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, '%s_%s.json' % (datetime.utcnow().strftime('%Y%m%d-%H%M%S'), report['meta']['commit']))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('\nResults written to %s' % output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Late data benchmark (docker/app/late_data.py, the aggregate bucket cache)
+Seeds a database, then plays a gateway reconnecting after an outage: every
+node it serves uploads the readings it missed, hours late and shuffled.
+Measures:
+
+- backlog insert: one transaction per reading (one POST each), one
+  executemany in arrival order, and the sorted bulk insert the batch
+  endpoint uses
+- aggregate queries: uncached, cached, and the background pass that
+  recomputes only the buckets the backlog dirtied, next to a full recompute
+- correctness: after the backlog, every cached query must return exactly
+  what an uncached query does
+
+Exits non-zero when a cached result differs.
+
+Examples:
+    python benchmarks/bench_late_data.py
+    python benchmarks/bench_late_data.py --rows 2000000 --nodes 100 --outage-hours 12 --json late.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from seed_db import seed_database
+from analytics import AggregateQuery, Analytics
+from late_data import DirtyBuckets, sort_readings
+from recent_cache import from_epoch
+from storage import Reading, hours_ago, open_storage
+
+CADENCE_SECONDS = 900
+
+# (case name, AggregateQuery arguments)
+CASES = [
+    ('daily_avg_per_node_90d', dict(metric='temperature_c', interval='day', group_by='node', days=90)),
+    ('hourly_all_nodes_7d', dict(metric='humidity', interval='hour', group_by='none', days=7)),
+    ('hourly_one_node_30d', dict(metric='pressure_hpa', interval='hour', group_by='node', node_id='1001', days=30)),
+    ('weekly_per_node_1y', dict(metric='battery_voltage', interval='week', group_by='node', days=365)),
+]
+
+
+def build_query(spec):
+    spec = dict(spec)
+    days = spec.pop('days')
+    return AggregateQuery(t0=hours_ago(days * 24), **spec)
+
+
+def backlog(nodes, hours, now, seed):
+    """Readings a gateway buffered for `nodes` during an outage, in the order it uploads them"""
+    rng = random.Random(seed)
+    readings = []
+    start = now - hours * 3600
+    for node_id in nodes:
+        t = start + rng.uniform(0, CADENCE_SECONDS)
+        while t < now - CADENCE_SECONDS:
+            readings.append(Reading(
+                node_id=node_id,
+                timestamp=from_epoch(int(t)),
+                temperature_c=round(rng.uniform(15, 30), 2),
+                humidity=round(rng.uniform(30, 80), 2),
+                pressure_hpa=round(rng.uniform(990, 1030), 2),
+                battery_voltage=round(rng.uniform(3.4, 4.2), 2),
+                rssi=-rng.randint(40, 120),
+                snr=round(rng.uniform(-5, 10), 1),
+            ))
+            t += CADENCE_SECONDS
+    rng.shuffle(readings)
+    return readings
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark backdated ingest and dirty-bucket recomputation')
+    parser.add_argument('--rows', type=int, default=500000, help='Seeded rows (default: 500000)')
+    parser.add_argument('--nodes', type=int, default=50, help='Seeded nodes (default: 50)')
+    parser.add_argument('--outage-nodes', type=int, default=10, help='Nodes behind the gateway that was offline (default: 10)')
+    parser.add_argument('--outage-hours', type=float, default=6, help='Length of the outage (default: 6)')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per query (default: 5)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_late_')
+    failures = []
+    results = {}
+    try:
+        path = os.path.join(work_dir, 'base.db')
+        print('Seeding %d rows across %d nodes...' % (args.rows, args.nodes))
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(path, 'sensor_data', args.rows, args.nodes)
+        now = time.time()
+        outage_nodes = [str(1001 + i) for i in range(min(args.outage_nodes, args.nodes))]
+
+        # Backlog insert strategies, each on its own copy of the database
+        print('\nBacklog: %d nodes x %gh' % (len(outage_nodes), args.outage_hours))
+        inserts = {}
+        for name in ('per_reading', 'executemany', 'sorted_executemany'):
+            copy = os.path.join(work_dir, name + '.db')
+            shutil.copyfile(path, copy)
+            storage = open_storage(copy)
+            with contextlib.redirect_stdout(io.StringIO()):
+                storage.initialize()
+            readings = backlog(outage_nodes, args.outage_hours, now, seed=7)
+            if name == 'per_reading':
+                _, elapsed = timed(lambda: [storage.insert_readings([r]) for r in readings])
+            elif name == 'executemany':
+                _, elapsed = timed(storage.insert_readings, readings)
+            else:
+                _, elapsed = timed(lambda: storage.insert_readings(sort_readings(readings)))
+            storage.close()
+            inserts[name] = {'readings': len(readings), 'ms': round(elapsed, 2),
+                             'readings_per_s': round(len(readings) / (elapsed / 1000.0)) if elapsed else None}
+            print('  %-20s %6d readings %9.1fms %10s/s' % (name, len(readings), elapsed,
+                                                          inserts[name]['readings_per_s']))
+        results['backlog_insert'] = inserts
+
+        # Aggregate cache: warm it, insert the backlog, recompute the dirty buckets
+        storage = open_storage(path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            storage.initialize()
+        dirty = DirtyBuckets()
+        cached = Analytics(storage, path, 'sqlite', dirty, cache_entries=64)
+        uncached = Analytics(storage, path, 'sqlite')
+        queries = {name: build_query(spec) for name, spec in CASES}
+        print('\n%-24s %12s %12s %10s' % ('case', 'uncached p50', 'cached p50', 'buckets'))
+        results['queries'] = {}
+        for name, query in queries.items():
+            cached.aggregate(query)  # fills the cache
+            cold, warm = [], []
+            for _ in range(args.repeats):
+                cold.append(timed(uncached.aggregate, query)[1])
+                (_, info), elapsed = timed(cached.aggregate, query)
+                warm.append(elapsed)
+            results['queries'][name] = {'uncached': latency_summary(cold), 'cached': latency_summary(warm),
+                                        'cache': info['cache']}
+            print('%-24s %10.1fms %10.1fms %5d/%-4d' % (name, results['queries'][name]['uncached']['p50_ms'],
+                                                        results['queries'][name]['cached']['p50_ms'],
+                                                        info['cache']['cached'], info['cache']['buckets']))
+
+        readings = backlog(outage_nodes, args.outage_hours, now, seed=7)
+        storage.insert_readings(sort_readings(readings))
+        dirty.observe(readings)
+        marks = dirty.metrics()['pending']['analytics']
+        recomputed, refresh_ms = timed(cached.refresh)
+        full_ms = sum(timed(uncached.aggregate, query)[1] for query in queries.values())
+        print('\nBacklog marked %d (node, hour) buckets dirty' % marks)
+        print('Recomputed %d cached buckets in %.1fms (recomputing every query: %.1fms)' %
+              (recomputed, refresh_ms, full_ms))
+        results['recompute'] = {'dirty_marks': marks, 'buckets': recomputed, 'ms': round(refresh_ms, 2),
+                                'full_recompute_ms': round(full_ms, 2)}
+
+        for name, query in queries.items():
+            expected, _ = uncached.aggregate(query)
+            got, info = cached.aggregate(query)
+            if got != expected:
+                failures.append(name)
+                print('  FAIL %s: cached result differs from an uncached query' % name)
+        results['mismatches'] = len(failures)
+        storage.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('Cached results after the backlog: %d mismatches' % len(failures))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'nodes': args.nodes, 'outage_nodes': args.outage_nodes,
+                       'outage_hours': args.outage_hours, 'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Node liveness benchmark (docker/app/liveness.py)
+Simulates a fleet reporting every 15 minutes with upload jitter, the odd
+lost packet and some nodes that go silent for good part way through, and
+drives LivenessTracker with simulated time: observe() per cycle and
+advance() every tick, as the apps do. Measures:
+
+- observe() cost per reading and advance() cost per tick, next to a tick
+  that scans every node's last report (the polling alternative)
+- detection: every silenced node must go stale and then offline within
+  a tick of its deadline; nodes that keep reporting must never go offline
+- heap size relative to the fleet
+
+Exits non-zero when a detection check fails.
+
+Examples:
+    python benchmarks/bench_liveness.py
+    python benchmarks/bench_liveness.py --nodes 20000 --hours 48 --json liveness.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from liveness import LivenessTracker
+
+CADENCE_SECONDS = 900
+TICK_SECONDS = 5
+JITTER_SECONDS = 20
+DROP_RATE = 0.03
+
+
+def polling_tick(last_seen, now, limit):
+    """What a tick costs without deadlines: look at every node"""
+    return sum(1 for seen in last_seen.values() if now - seen > limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark deadline-driven node liveness')
+    parser.add_argument('--nodes', type=int, default=10000, help='Fleet size (default: 10000)')
+    parser.add_argument('--hours', type=float, default=24, help='Simulated hours (default: 24)')
+    parser.add_argument('--silenced', type=float, default=0.05, help='Fraction of nodes that stop (default: 0.05)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    start = time.time() - args.hours * 3600
+    end = start + args.hours * 3600
+    nodes = [str(1000 + i) for i in range(args.nodes)]
+    # Each node's phase within the cycle, and when silenced nodes stop
+    phase = {node_id: rng.uniform(0, CADENCE_SECONDS) for node_id in nodes}
+    stops = {node_id: start + rng.uniform(args.hours * 3600 * 0.3, args.hours * 3600 * 0.7)
+             for node_id in rng.sample(nodes, int(args.nodes * args.silenced))}
+
+    # Every report of the run, in time order
+    reports = []
+    for node_id in nodes:
+        t = start + phase[node_id]
+        while t < min(end, stops.get(node_id, end)):
+            if rng.random() >= DROP_RATE:
+                reports.append((t + rng.uniform(0, JITTER_SECONDS), node_id))
+            t += CADENCE_SECONDS
+    reports.sort()
+    # Longest silence of each node while it was still reporting (lost packets in a row)
+    longest_gap, previous = {}, {}
+    for t, node_id in reports:
+        if node_id in previous:
+            longest_gap[node_id] = max(longest_gap.get(node_id, 0.0), t - previous[node_id])
+        previous[node_id] = t
+
+    transitions = []
+    tracker = LivenessTracker(listeners=[transitions.extend])
+    # No database to warm from: the fleet starts unknown
+    tracker.ready = True
+    observe_s, advance_ticks, polling_ticks = 0.0, [], []
+    last_seen, heap_peak, index = {}, 0, 0
+    offline_limit = CADENCE_SECONDS * tracker.offline_factor + tracker.grace_seconds
+    tick = start
+    while tick < end:
+        tick += TICK_SECONDS
+        batch_start = index
+        while index < len(reports) and reports[index][0] <= tick:
+            index += 1
+        for t, node_id in reports[batch_start:index]:
+            started = time.perf_counter()
+            tracker.observe([{'node_id': node_id}], now=t)
+            observe_s += time.perf_counter() - started
+            last_seen[node_id] = t
+        started = time.perf_counter()
+        tracker.advance(tick)
+        advance_ticks.append((time.perf_counter() - started) * 1000.0)
+        if len(polling_ticks) < 2000:
+            started = time.perf_counter()
+            polling_tick(last_seen, tick, offline_limit)
+            polling_ticks.append((time.perf_counter() - started) * 1000.0)
+        heap_peak = max(heap_peak, len(tracker.deadlines))
+
+    # Detection checks against the simulation
+    failures = []
+    went_offline = {}
+    for event in transitions:
+        if event['to'] == 'offline':
+            went_offline.setdefault(event['node_id'], event)
+    counts = tracker.counts()
+    for node_id in nodes:
+        if node_id in stops:
+            # Cadence estimates carry the upload jitter, so allow a little past the nominal deadline
+            if node_id not in went_offline and last_seen.get(node_id, start) + offline_limit < end - CADENCE_SECONDS / 4:
+                failures.append('%s never went offline' % node_id)
+        elif node_id in went_offline and longest_gap.get(node_id, 0.0) < CADENCE_SECONDS * (tracker.offline_factor - 0.5):
+            failures.append('%s went offline while reporting' % node_id)
+    stale_flaps = sum(1 for event in transitions if event['to'] == 'stale' and event['node_id'] not in stops)
+
+    results = {
+        'reports': len(reports),
+        'observe_us_per_reading': round(observe_s / max(len(reports), 1) * 1e6, 2),
+        'advance_ms': latency_summary(advance_ticks),
+        'polling_tick_ms': latency_summary(polling_ticks),
+        'heap_peak': heap_peak,
+        'heap_per_node': round(heap_peak / args.nodes, 2),
+        'counts': counts,
+        'events': tracker.sequence,
+        'stale_flaps_of_reporting_nodes': stale_flaps,
+        'failures': len(failures),
+    }
+
+    print('%d nodes, %d reports over %gh (%d%% packets lost, %d silenced)' % (
+        args.nodes, len(reports), args.hours, DROP_RATE * 100, len(stops)))
+    print('observe():        %7.2fus per reading' % results['observe_us_per_reading'])
+    print('advance() tick:   %7.3fms p50 %7.3fms p99' % (results['advance_ms']['p50_ms'], results['advance_ms']['p99_ms']))
+    print('polling tick:     %7.3fms p50 %7.3fms p99' % (results['polling_tick_ms']['p50_ms'],
+                                                         results['polling_tick_ms']['p99_ms']))
+    print('Heap peak:        %d entries (%.2f per node)' % (heap_peak, results['heap_per_node']))
+    print('Final states:     %s' % ', '.join('%s %d' % item for item in counts.items()))
+    print('Stale flaps from lost packets: %d, events: %d' % (stale_flaps, tracker.sequence))
+    for failure in failures[:10]:
+        print('  FAIL %s' % failure)
+    print('Detection: %d failures' % len(failures))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'nodes': args.nodes, 'hours': args.hours, 'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Memory and allocation benchmark for reading representations
+Loads the same 100k-row history result three ways and measures it with
+tracemalloc:
+
+- dict rows     one dict per row, what storage.range() used to return
+- Reading rows  storage.range(): one __slots__ Reading per row
+- ReadingBatch  storage.range_batch(): one list per column
+
+Then it measures the peak memory of the 100k-row history endpoints of the
+docker app and the simple server, which serialize from a ReadingBatch.
+
+Examples:
+    python benchmarks/bench_memory.py
+    python benchmarks/bench_memory.py --rows 500000 --json memory.json
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import load_app
+from seed_db import seed_database
+from storage import open_storage
+
+# (case name, app, schema, url with {rows})
+ENDPOINTS = [
+    ('docker_history', 'docker', 'sensor_data', '/api/sensor-data/history?hours=100000&limit={rows}'),
+    ('simple_readings', 'simple', 'sensor_readings', '/api/readings?hours=100000&limit={rows}'),
+]
+
+
+def dict_rows(store, rows):
+    """The pre-Reading result shape: one dict per row straight from the cursor"""
+    schema = store.schema
+    columns, names = schema.select_columns()
+    sql = f'SELECT {columns} FROM {schema.table} ORDER BY {schema.time_column} DESC, id DESC LIMIT ?'
+    with store.read_connection() as conn:
+        return [dict(zip(names, row)) for row in conn.execute(sql, (rows,))]
+
+
+def measure(build):
+    """(result, retained bytes, peak bytes, live blocks, seconds) for one call"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return result, current - base, peak - base, blocks, elapsed
+
+
+def representation_cases(db_path, rows):
+    store = open_storage(db_path)
+    cases = [
+        ('dict rows', lambda: dict_rows(store, rows)),
+        ('Reading rows', lambda: store.range(limit=rows)),
+        ('ReadingBatch', lambda: store.range_batch(limit=rows)),
+    ]
+    results = {}
+    for name, build in cases:
+        build()  # warm the page cache and the statement cache
+        result, retained, peak, blocks, elapsed = measure(build)
+        count = len(result)
+        results[name] = {
+            'rows': count,
+            'retained_bytes': retained,
+            'peak_bytes': peak,
+            'bytes_per_row': round(retained / count, 1) if count else None,
+            'blocks': blocks,
+            'blocks_per_row': round(blocks / count, 2) if count else None,
+            'seconds': round(elapsed, 3),
+        }
+        del result
+    store.close()
+    return results
+
+
+def endpoint_cases(work_dir, rows, nodes):
+    results = {}
+    for name, app_kind, schema, url in ENDPOINTS:
+        db_path = os.path.join(work_dir, name, schema + '.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(db_path, schema, rows, nodes)
+            module = load_app(app_kind, db_path)
+        module.app.logger.disabled = True
+        client = module.app.test_client()
+        url = url.format(rows=rows)
+        with contextlib.redirect_stdout(io.StringIO()):
+            client.get(url)
+            response, retained, peak, blocks, elapsed = measure(lambda: client.get(url))
+        body = response.get_json()
+        count = body['count'] if isinstance(body, dict) else len(body)
+        results[name] = {
+            'rows': count,
+            'status': response.status_code,
+            'peak_bytes': peak,
+            'peak_bytes_per_row': round(peak / count, 1) if count else None,
+            'seconds': round(elapsed, 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure memory per reading for each result shape')
+    parser.add_argument('--rows', type=int, default=100000, help='Rows per result (default: 100000)')
+    parser.add_argument('--nodes', type=int, default=10, help='Seeded nodes (default: 10)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_memory_')
+    try:
+        db_path = os.path.join(work_dir, 'sensor_data.db')
+        print('Seeding %d rows across %d nodes...' % (args.rows, args.nodes))
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(db_path, 'sensor_data', args.rows, args.nodes)
+
+        representations = representation_cases(db_path, args.rows)
+        print('\n%-14s %12s %12s %10s %12s %8s' % ('shape', 'retained', 'peak', 'bytes/row', 'blocks/row', 'time'))
+        for name, r in representations.items():
+            print('%-14s %10.1fMB %10.1fMB %10.1f %12.2f %7.2fs' % (
+                name, r['retained_bytes'] / 1e6, r['peak_bytes'] / 1e6, r['bytes_per_row'],
+                r['blocks_per_row'], r['seconds']))
+
+        endpoints = endpoint_cases(work_dir, args.rows, args.nodes)
+        print('\n%-16s %8s %12s %10s %8s' % ('endpoint', 'rows', 'peak', 'bytes/row', 'time'))
+        for name, r in endpoints.items():
+            print('%-16s %8d %10.1fMB %10.1f %7.2fs' % (
+                name, r['rows'], r['peak_bytes'] / 1e6, r['peak_bytes_per_row'], r['seconds']))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'representations': representations, 'endpoints': endpoints},
+                      f, indent=2)
+        print('Results written to %s' % args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Streaming node statistics benchmark (docker/app/node_stats.py)
+Seeds a sensor_data database and measures:
+
+- warm-up: rebuilding from a scan of the longest window versus restoring
+  a checkpoint and catching up on the rows inserted after it
+- ingest cost: StreamingStats.append() per reading
+- query latency: node_stats() versus the same mean/variance/min/max in SQL
+- accuracy: every window of every node checked against SQL over the
+  window's bucket-aligned start; exits non-zero on a mismatch
+
+Examples:
+    python benchmarks/bench_node_stats.py
+    python benchmarks/bench_node_stats.py --rows 1000000 --nodes 50 --json node_stats.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from seed_db import seed_database
+from storage import Reading, hours_ago, open_storage
+from node_stats import STATS_FIELDS, StreamingStats
+
+TOLERANCE = 1e-6
+
+
+def sql_stats(store, node_id, t0):
+    """Per-field count/mean/variance/min/max straight from SQLite"""
+    exprs = []
+    for field in STATS_FIELDS:
+        column = store.schema.field_sql(field)
+        exprs.append(f'COUNT({column}), AVG({column}), AVG({column} * {column}), MIN({column}), MAX({column})')
+    sql = (f'SELECT {", ".join(exprs)} FROM {store.schema.table} '
+           f'WHERE node_id = ? AND {store.schema.time_column} >= ?')
+    with store.read_connection() as conn:
+        row = conn.execute(sql, (node_id, t0)).fetchone()
+    result = {}
+    for i, field in enumerate(STATS_FIELDS):
+        count, mean, mean_sq, low, high = row[i * 5:i * 5 + 5]
+        variance = (mean_sq - mean * mean) * count / (count - 1) if count > 1 else None
+        result[field] = {'count': count, 'mean': mean, 'variance': variance, 'min': low, 'max': high}
+    return result
+
+
+def exact_stats(store, node_id, t0):
+    """Two-pass statistics of the raw values (AVG(x * x) loses digits on pressure)"""
+    columns = ', '.join(store.schema.field_sql(field) for field in STATS_FIELDS)
+    sql = (f'SELECT {columns} FROM {store.schema.table} '
+           f'WHERE node_id = ? AND {store.schema.time_column} >= ?')
+    with store.read_connection() as conn:
+        rows = conn.execute(sql, (node_id, t0)).fetchall()
+    result = {}
+    for i, field in enumerate(STATS_FIELDS):
+        values = [row[i] for row in rows if row[i] is not None]
+        result[field] = {
+            'count': len(values),
+            'mean': statistics.fmean(values) if values else None,
+            'variance': statistics.variance(values) if len(values) > 1 else None,
+            'min': min(values) if values else None,
+            'max': max(values) if values else None,
+        }
+    return result
+
+
+def close(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return math.isclose(a, b, rel_tol=TOLERANCE, abs_tol=TOLERANCE)
+
+
+def check_accuracy(stats, store, now):
+    """Compare every window of every node with SQL; returns the mismatches"""
+    mismatches = []
+    for node_id in stats.node_ids():
+        answer = stats.node_stats(node_id, now)
+        for name, window in answer['windows'].items():
+            expected = exact_stats(store, node_id, stats.window_start(name, now))
+            for field, got in window['fields'].items():
+                want = expected[field]
+                for key in ('count', 'mean', 'variance', 'min', 'max'):
+                    if not close(got[key], want[key]):
+                        mismatches.append((node_id, name, field, key, got[key], want[key]))
+    return mismatches
+
+
+def timed(fn, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return latency_summary(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming per-node statistics')
+    parser.add_argument('--rows', type=int, default=200000, help='Seeded rows (default: 200000)')
+    parser.add_argument('--nodes', type=int, default=20, help='Seeded nodes (default: 20)')
+    parser.add_argument('--ingest', type=int, default=20000, help='Readings appended after warm-up (default: 20000)')
+    parser.add_argument('--runs', type=int, default=200, help='Query repetitions (default: 200)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_node_stats_')
+    results = {}
+    try:
+        db_path = os.path.join(work_dir, 'sensor_data.db')
+        checkpoint_path = os.path.join(work_dir, 'node_stats.json')
+        print('Seeding %d rows across %d nodes...' % (args.rows, args.nodes))
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(db_path, 'sensor_data', args.rows, args.nodes)
+        store = open_storage(db_path)
+        store.initialize()
+
+        stats = StreamingStats(checkpoint_path=checkpoint_path)
+        started = time.perf_counter()
+        source, applied = stats.warm(store)
+        results['warm_scan'] = {'source': source, 'rows': applied, 'seconds': round(time.perf_counter() - started, 3)}
+
+        # Ingest: the readings a gateway fleet would send next, through the listener hook
+        node_ids = stats.node_ids()
+        readings = [Reading(node_id=node_ids[i % len(node_ids)], timestamp=hours_ago(0),
+                            temperature_c=20.0 + (i % 50) / 10.0, humidity=40.0 + i % 30, pressure_hpa=1000.0 + i % 20)
+                    for i in range(args.ingest)]
+        store.insert_readings(readings)
+        started = time.perf_counter()
+        for i in range(0, len(readings), 50):
+            stats.append(readings[i:i + 50])
+        elapsed = time.perf_counter() - started
+        results['append'] = {'readings': len(readings), 'us_per_reading': round(elapsed / len(readings) * 1e6, 2)}
+
+        written_at = time.perf_counter()
+        stats.checkpoint()
+        results['checkpoint'] = {'bytes': os.path.getsize(checkpoint_path),
+                                 'seconds': round(time.perf_counter() - written_at, 3)}
+
+        # Rows stored while the process was down
+        store.insert_readings([Reading(node_id=node_ids[0], timestamp=hours_ago(0), temperature_c=21.5,
+                                       humidity=45.0, pressure_hpa=1012.0) for _ in range(100)])
+        restored = StreamingStats(checkpoint_path=checkpoint_path)
+        started = time.perf_counter()
+        source, applied = restored.warm(store)
+        results['warm_checkpoint'] = {'source': source, 'rows': applied,
+                                      'seconds': round(time.perf_counter() - started, 3)}
+
+        now = time.time()
+        node_id = node_ids[0]
+        results['query_streaming'] = timed(lambda: restored.node_stats(node_id), args.runs)
+        starts = [restored.window_start(name, now) for name, _ in restored.windows]
+        results['query_sql'] = timed(lambda: [sql_stats(store, node_id, t0) for t0 in starts], max(args.runs // 10, 5))
+
+        mismatches = check_accuracy(restored, store, now)
+        results['accuracy'] = {'nodes': len(node_ids), 'mismatches': len(mismatches)}
+        store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('\nWarm-up by scan:       %7.3fs (%d rows)' % (results['warm_scan']['seconds'], results['warm_scan']['rows']))
+    print('Warm-up by checkpoint: %7.3fs (%s, +%d rows)' % (results['warm_checkpoint']['seconds'],
+                                                            results['warm_checkpoint']['source'],
+                                                            results['warm_checkpoint']['rows']))
+    print('Checkpoint write:      %7.3fs (%.1f KiB)' % (results['checkpoint']['seconds'],
+                                                        results['checkpoint']['bytes'] / 1024.0))
+    print('Append:                %7.2fus per reading' % results['append']['us_per_reading'])
+    print('Query, streaming:      %7.3fms p50' % results['query_streaming']['p50_ms'])
+    print('Query, SQL:            %7.3fms p50' % results['query_sql']['p50_ms'])
+    for node_id, name, field, key, got, want in mismatches[:10]:
+        print('  MISMATCH node %s %s %s %s: %r != %r' % (node_id, name, field, key, got, want))
+    print('Accuracy: %d mismatches across %d nodes' % (len(mismatches), len(node_ids)))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'nodes': args.nodes, 'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
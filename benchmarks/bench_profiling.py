@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Profiling overhead benchmark (docker/app/profiling.py)
+Times an ingest POST and a 24-hour history read on the docker app
+(in-process, Flask test client) under each profiling setting:
+
+- off: the default; no request hooks and no sampler thread
+- header: PROFILE_HEADER=true, hooks installed but requests carry no header
+- sampler 10 Hz / 100 Hz: the always-on stack sampler
+- cprofile / sample: every request profiled into a file
+
+Exits non-zero when the default installs any hook, or a per-request mode
+writes no profile files.
+
+Examples:
+    python benchmarks/bench_profiling.py
+    python benchmarks/bench_profiling.py --rows 1000000 --rounds 50 --json profiling.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+from common import latency_summary, load_app
+from seed_db import seed_database
+
+OFF = {'PROFILE_ENDPOINTS': '', 'PROFILE_MODE': 'cprofile', 'PROFILE_HEADER': 'false', 'PROFILE_SAMPLER_HZ': '0'}
+
+# (label, environment on top of OFF)
+SETTINGS = [
+    ('off', {}),
+    ('header', {'PROFILE_HEADER': 'true'}),
+    ('sampler 10 Hz', {'PROFILE_SAMPLER_HZ': '10'}),
+    ('sampler 100 Hz', {'PROFILE_SAMPLER_HZ': '100'}),
+    ('cprofile', {'PROFILE_ENDPOINTS': 'all'}),
+    ('sample', {'PROFILE_ENDPOINTS': 'all', 'PROFILE_MODE': 'sample'}),
+]
+
+READING = {'node_id': '1001', 'temperature': 21.5, 'humidity': 48.2, 'pressure': 1012.4,
+           'battery_voltage': 4.05, 'rssi': -72, 'snr': 7.5}
+
+
+def timed(client, method, url, repeats):
+    """Latencies of repeats calls, after one untimed warm-up call"""
+    latencies = []
+    for i in range(repeats + 1):
+        began = time.perf_counter()
+        if method == 'POST':
+            resp = client.post(url, json=dict(READING, timestamp=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')))
+        else:
+            resp = client.get(url)
+        resp.get_data()
+        if i:
+            latencies.append((time.perf_counter() - began) * 1000.0)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cost of each profiling setting')
+    parser.add_argument('--rows', type=int, default=100000, help='Seeded readings (default: 100000)')
+    parser.add_argument('--rounds', type=int, default=15,
+                        help='Rounds of 20 ingest POSTs and 2 history reads per setting (default: 15)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_profiling_')
+    results, failures = {}, []
+    try:
+        db_path = os.path.join(work_dir, 'lora_sensors.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_database(db_path, 'sensor_data', args.rows, 10)
+        cases = [('ingest POST', 'POST', '/api/sensor-data', 20),
+                 ('history 24h', 'GET', '/api/sensor-data/history?hours=24', 2)]
+
+        apps = {}
+        for label, env in SETTINGS:
+            profile_dir = os.path.join(work_dir, 'profiles_' + label.replace(' ', '_'))
+            extra = dict(OFF, PROFILE_DIR=profile_dir, PROFILE_KEEP='0', INGEST_ADMISSION='false', **env)
+            with contextlib.redirect_stdout(io.StringIO()):
+                module = load_app('docker', db_path, extra)
+            module.app.logger.disabled = True
+            apps[label] = (module, module.app.test_client(), profile_dir)
+
+        # Settings take turns a batch at a time, so drift in machine speed hits them all alike
+        latencies = {label: {name: [] for name, _, _, _ in cases} for label, _ in SETTINGS}
+        for _ in range(args.rounds):
+            for label, _ in SETTINGS:
+                module, client, _ = apps[label]
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if module.profile_sampler:
+                        module.profile_sampler.start()
+                    for name, method, url, repeats in cases:
+                        latencies[label][name] += timed(client, method, url, repeats)
+                    if module.profile_sampler:
+                        module.profile_sampler.stop()
+
+        print('%-16s %16s %16s %8s' % ('setting', cases[0][0] + ' p50', cases[1][0] + ' p50', 'files'))
+        for label, env in SETTINGS:
+            module, _, profile_dir = apps[label]
+            result = {name: latency_summary(values) for name, values in latencies[label].items()}
+            if module.profile_sampler:
+                result['sampler'] = module.profile_sampler.metrics()
+            hooks = len(module.app.before_request_funcs.get(None, []))
+            files = len(os.listdir(profile_dir)) if os.path.isdir(profile_dir) else 0
+            result.update(hooks=hooks, files=files)
+            results[label] = result
+            print('%-16s %14.2fms %14.2fms %8d' % (label, result[cases[0][0]]['p50_ms'],
+                                                  result[cases[1][0]]['p50_ms'], files))
+            if label == 'off' and (hooks or module.profile_sampler):
+                failures.append(label)
+                print('  FAIL off: %d request hooks installed' % hooks)
+            if env.get('PROFILE_ENDPOINTS') and not files:
+                failures.append(label)
+                print('  FAIL %s: no profile files written' % label)
+
+        base = results['off']
+        print('\nOverhead against off (p50):')
+        for label, _ in SETTINGS[1:]:
+            print('  %-16s %s' % (label, ', '.join(
+                '%s %+.1f%%' % (name, 100.0 * (results[label][name]['p50_ms'] / base[name]['p50_ms'] - 1))
+                for name, _, _, _ in cases)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('\nChecks: %d failures' % len(failures))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'rounds': args.rounds, 'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Sharded storage benchmark (docker/app/storage/sharded.py)
+Runs concurrent writers, one per gateway, each posting its own nodes'
+readings, against the single-file SQLite engine and against the sharded
+engine at several shard counts. Measures:
+
+- write throughput: readings/s summed over all writers, and the latency of
+  each insert_readings() call (a POST's time on the write lock)
+- fan-out reads on a seeded history: latest, stats and 24h history
+  without a node, next to a one-node history that stays on one shard
+- correctness: every engine must end up with the same rows (count, latest)
+
+Exits non-zero when an engine's rows differ from the single file.
+
+Examples:
+    python benchmarks/bench_sharding.py
+    python benchmarks/bench_sharding.py --shards 1 2 4 8 16 --writers 16 --seconds 10 --json sharding.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from recent_cache import from_epoch
+from storage import hours_ago, open_storage
+
+CADENCE_SECONDS = 900
+
+
+def make_reading(rng, node_id, t):
+    return {
+        'node_id': node_id,
+        'timestamp': from_epoch(int(t)),
+        'temperature_c': round(rng.uniform(15, 30), 2),
+        'humidity': round(rng.uniform(30, 80), 2),
+        'pressure_hpa': round(rng.uniform(990, 1030), 2),
+        'battery_voltage': round(rng.uniform(3.4, 4.2), 2),
+        'rssi': -rng.randint(40, 120),
+        'snr': round(rng.uniform(-5, 10), 1),
+    }
+
+
+def history(nodes, rows, now, seed=1):
+    """`rows` readings spread over the nodes at the 15-minute cadence, oldest first"""
+    rng = random.Random(seed)
+    per_node = max(rows // len(nodes), 1)
+    readings = []
+    for step in range(per_node, 0, -1):
+        for node_id in nodes:
+            readings.append(make_reading(rng, node_id, now - step * CADENCE_SECONDS))
+    return readings
+
+
+def open_engine(label, path):
+    if label == 'single':
+        store = open_storage(path)
+    else:
+        store = open_storage(path, engine='sharded', shards=int(label.split('x')[1]))
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.initialize()
+    return store
+
+
+def write_load(store, nodes, writers, seconds, batch):
+    """Writers post their own nodes' readings back to back for `seconds`; returns (readings, elapsed, latencies)"""
+    deadline = time.perf_counter() + seconds
+    counts = [0] * writers
+    latencies = [[] for _ in range(writers)]
+    start = threading.Barrier(writers + 1)
+
+    def writer(index):
+        rng = random.Random(index)
+        own = nodes[index::writers]
+        t = time.time()
+        start.wait()
+        position = 0
+        while time.perf_counter() < deadline:
+            readings = []
+            for _ in range(batch):
+                readings.append(make_reading(rng, own[position % len(own)], t))
+                position += 1
+            began = time.perf_counter()
+            store.insert_readings(readings)
+            latencies[index].append((time.perf_counter() - began) * 1000.0)
+            counts[index] += len(readings)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    return sum(counts), elapsed, [ms for per_writer in latencies for ms in per_writer]
+
+
+def timed(fn, repeats):
+    fn()
+    latencies = []
+    for _ in range(repeats):
+        began = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - began) * 1000.0)
+    return latency_summary(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark write throughput and fan-out reads against shard count')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8], help='Shard counts (default: 1 2 4 8)')
+    parser.add_argument('--writers', type=int, default=8, help='Concurrent writer threads (default: 8)')
+    parser.add_argument('--batch', type=int, default=1, help='Readings per insert, 1 = one POST each (default: 1)')
+    parser.add_argument('--seconds', type=float, default=3, help='Write load per engine (default: 3)')
+    parser.add_argument('--nodes', type=int, default=200, help='Nodes (default: 200)')
+    parser.add_argument('--rows', type=int, default=200000, help='Seeded history for the read cases (default: 200000)')
+    parser.add_argument('--repeats', type=int, default=10, help='Timed calls per read case (default: 10)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    nodes = [str(1001 + i) for i in range(args.nodes)]
+    labels = ['single'] + ['sharded x%d' % n for n in args.shards]
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_sharding_')
+    results, failures = {}, []
+    reference = None
+    try:
+        print('%d writers x %d reading(s) per insert, %gs per engine' % (args.writers, args.batch, args.seconds))
+        print('%-12s %12s %10s %10s' % ('engine', 'readings/s', 'p50 ms', 'p99 ms'))
+        for label in labels:
+            store = open_engine(label, os.path.join(work_dir, label.replace(' ', '_') + '_write.db'))
+            written, elapsed, latencies = write_load(store, nodes, args.writers, args.seconds, args.batch)
+            summary = latency_summary(latencies)
+            results[label] = {'write': dict(readings=written, readings_per_s=round(written / elapsed),
+                                            insert_ms=summary)}
+            print('%-12s %12d %10.2f %10.2f' % (label, written / elapsed, summary['p50_ms'], summary['p99_ms']))
+            store.close()
+
+        now = time.time()
+        seed = history(nodes, args.rows, now)
+        print('\nReads on %d seeded readings (p50 ms)' % len(seed))
+        cases = [
+            ('latest', lambda s: s.latest()),
+            ('stats', lambda s: s.stats()),
+            ('range_24h_all', lambda s: s.range(t0=hours_ago(24))),
+            ('range_7d_all_limit_1000', lambda s: s.range(t0=hours_ago(168), limit=1000)),
+            ('range_24h_node', lambda s: s.range(node_id=nodes[0], t0=hours_ago(24))),
+        ]
+        print('%-12s ' % 'engine' + ' '.join('%24s' % name for name, _ in cases))
+        for label in labels:
+            store = open_engine(label, os.path.join(work_dir, label.replace(' ', '_') + '_read.db'))
+            for start in range(0, len(seed), 5000):
+                store.insert_readings([dict(r) for r in seed[start:start + 5000]])
+            reads = {name: timed(lambda: fn(store), args.repeats) for name, fn in cases}
+            results[label]['read'] = reads
+            print('%-12s ' % label + ' '.join('%24.2f' % reads[name]['p50_ms'] for name, _ in cases))
+
+            outcome = (store.count(), sorted((r['node_id'], r['timestamp'], r['temperature_c']) for r in store.latest()))
+            if reference is None:
+                reference = outcome
+            elif outcome != reference:
+                failures.append(label)
+                print('  FAIL %s: rows differ from the single file' % label)
+            store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('\nRow checks: %d mismatches' % len(failures))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'writers': args.writers, 'batch': args.batch, 'nodes': args.nodes, 'rows': args.rows,
+                       'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark: time from process spawn to the first good responses
+Starts each server variant as a real process (python app.py) on a free
+port against a seeded database and polls until /health and then the
+first data endpoint answer 200. Each case runs several times; the first
+run of a case also pays for a cold Python bytecode cache.
+
+Cases:
+- docker, docker-blocking   warm-up in the background (default) vs before serving
+- docker-prewarm            PREWARM_PAGE_CACHE=true
+- api, experimental, simple the other variants
+- experimental+init_db      the image's old start script: init_db.py, then app.py
+
+Examples:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --rows 1000000 --runs 5 --json startup.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+from common import REPO_ROOT, app_env, latency_summary, resolve_app_path
+from seed_db import seed_database
+
+INIT_DB = os.path.join(REPO_ROOT, 'docker', 'Experimental', 'init_db.py')
+
+LATEST = '/api/sensor-data/latest'
+
+# (case name, app, schema, health endpoint, data endpoint, extra env, run init_db.py first)
+CASES = [
+    ('docker', 'docker', 'sensor_data', '/health', LATEST, {}, False),
+    ('docker-blocking', 'docker', 'sensor_data', '/health', LATEST, {'STARTUP_WARMUP': 'blocking'}, False),
+    ('docker-prewarm', 'docker', 'sensor_data', '/health', LATEST, {'PREWARM_PAGE_CACHE': 'true'}, False),
+    ('api', 'api', 'sensor_data', '/health', LATEST, {}, False),
+    ('experimental', 'experimental', 'sensor_data', '/health', LATEST, {}, False),
+    ('experimental+init_db', 'experimental', 'sensor_data', '/health', LATEST, {}, True),
+    # The simple server has no /health; its node list is the first thing the dashboard needs
+    ('simple', 'simple', 'sensor_readings', '/api/nodes', '/api/nodes', {}, False),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Straight to localhost, whatever HTTP_PROXY says
+OPENER = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+def wait_for(url, deadline):
+    """Poll url until it answers 200; returns the time it did"""
+    while time.perf_counter() < deadline:
+        try:
+            with OPENER.open(url, timeout=1) as resp:
+                if resp.status == 200:
+                    resp.read()
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.005)
+    raise TimeoutError('no 200 from %s' % url)
+
+
+def start_once(app_kind, db_path, health_endpoint, data_endpoint, extra_env, init_db, timeout):
+    """Spawn one server; returns (seconds to health, seconds to the data endpoint)"""
+    port = free_port()
+    env = dict(os.environ)
+    # The shipped defaults, not the in-process tools' blocking warm-up
+    env.update(app_env(db_path, dict({'STARTUP_WARMUP': 'background', 'PORT': str(port)}, **extra_env)))
+    app_path = resolve_app_path(app_kind)
+    started = time.perf_counter()
+    if init_db:
+        subprocess.run([sys.executable, INIT_DB], cwd=os.path.dirname(INIT_DB), env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    proc = subprocess.Popen([sys.executable, app_path], cwd=os.path.dirname(app_path), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = 'http://127.0.0.1:%d' % port
+        deadline = started + timeout
+        health = wait_for(base + health_endpoint, deadline) - started
+        data = wait_for(base + data_endpoint, deadline) - started
+        return health, data
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure time to first /health and /latest per app')
+    parser.add_argument('--rows', type=int, default=100000, help='Seeded rows (default: 100000)')
+    parser.add_argument('--nodes', type=int, default=10, help='Seeded nodes (default: 10)')
+    parser.add_argument('--runs', type=int, default=3, help='Starts per case (default: 3)')
+    parser.add_argument('--cases', nargs='+', help='Only run these cases')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds before a start counts as failed')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_startup_')
+    results = {}
+    try:
+        seeded = {}
+        for schema in sorted({case[2] for case in CASES}):
+            path = os.path.join(work_dir, 'seed', schema + '.db')
+            print('Seeding %s (%d rows, %d nodes)...' % (schema, args.rows, args.nodes))
+            with contextlib.redirect_stdout(io.StringIO()):
+                seed_database(path, schema, args.rows, args.nodes)
+            seeded[schema] = path
+
+        print('\n%-22s %12s %12s %12s' % ('case', '/health p50', 'data p50', 'data max'))
+        for name, app_kind, schema, health_endpoint, data_endpoint, extra_env, init_db in CASES:
+            if args.cases and name not in args.cases:
+                continue
+            # Each case gets its own copy, so config files and WAL state start the same way
+            case_dir = os.path.join(work_dir, name)
+            os.makedirs(case_dir)
+            db_path = os.path.join(case_dir, 'lora_sensors.db')
+            health_times, data_times = [], []
+            for _ in range(args.runs):
+                shutil.copyfile(seeded[schema], db_path)
+                health, data = start_once(app_kind, db_path, health_endpoint, data_endpoint, extra_env,
+                                          init_db, args.timeout)
+                health_times.append(health * 1000.0)
+                data_times.append(data * 1000.0)
+            results[name] = {'health': latency_summary(health_times), 'data': latency_summary(data_times)}
+            print('%-22s %10.0fms %10.0fms %10.0fms' % (name, results[name]['health']['p50_ms'],
+                                                     results[name]['data']['p50_ms'],
+                                                     results[name]['data']['max_ms']))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'runs': args.runs, 'results': results}, f, indent=2)
+        print('Results written to %s' % args.json)
+
+
+if __name__ == '__main__':
+    main()
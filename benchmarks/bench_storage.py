@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Storage engine microbenchmarks
+Times the storage API directly (no Flask) for every registered engine on a
+seeded database: single and batched inserts, latest-per-node, per-node and
+fleet-wide range scans and stats. Use it to compare engines, or a branch
+against master, without endpoint formatting in the numbers.
+
+Examples:
+    python benchmarks/bench_storage.py
+    python benchmarks/bench_storage.py --rows 1000000 --nodes 50 --engines sqlite
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+from common import latency_summary
+from seed_db import seed_database
+import storage
+from storage.schemas import utc_now
+
+# Engines that read a plain SQLite file as it is (blocks seals the copy's old windows first)
+SINGLE_FILE_ENGINES = ('sqlite', 'blocks')
+
+
+def timed(fn, repeats):
+    """Latencies in ms of repeats calls after one warm-up call"""
+    fn()
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return latencies
+
+
+def reading(node_id='1001'):
+    return {
+        'node_id': node_id,
+        'timestamp': utc_now(),
+        'temperature_c': 21.5,
+        'humidity': 48.2,
+        'pressure_hpa': 1012.4,
+        'battery_voltage': 4.05,
+        'rssi': -72,
+        'snr': 7.0,
+    }
+
+
+def run_engine(engine, schema, seed_path, work_dir, repeats):
+    path = os.path.join(work_dir, '%s_%s.db' % (engine, schema))
+    if engine in SINGLE_FILE_ENGINES:
+        shutil.copyfile(seed_path, path)
+    store = storage.open_storage(path, schema=schema, engine=engine)
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.initialize()
+    if hasattr(store, 'seal'):
+        store.seal()
+    if engine not in SINGLE_FILE_ENGINES:
+        # Engines with their own file layout load the seeded rows through the storage API
+        seed = storage.open_storage(seed_path, schema=schema)
+        rows = seed.iter_range(descending=False)
+        while store.insert_readings(itertools.islice(rows, 5000)):
+            pass
+        seed.close()
+
+    batch = [reading(format(0x1001 + i, 'x')) for i in range(100)]
+    cases = [
+        ('insert_1', lambda: store.insert_readings([reading()]), repeats * 10),
+        ('insert_batch_100', lambda: store.insert_readings(batch), repeats),
+        ('latest', lambda: store.latest(), repeats),
+        ('range_24h_node', lambda: store.range(node_id='1001', t0=storage.hours_ago(24)), repeats),
+        ('range_24h_all', lambda: store.range(t0=storage.hours_ago(24)), repeats),
+        ('range_7d_all_limit_1000', lambda: store.range(t0=storage.hours_ago(168), limit=1000), repeats),
+        ('stats', lambda: store.stats(), repeats),
+    ]
+    results = {}
+    for name, fn, count in cases:
+        summary = latency_summary(timed(fn, count))
+        results[name] = summary
+        print('  %-10s %-16s %-24s p50 %9.3fms  p90 %9.3fms' %
+              (engine, schema, name, summary['p50_ms'], summary['p90_ms']))
+    store.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark storage engines through the storage API')
+    parser.add_argument('--engines', nargs='+', choices=sorted(storage.ENGINES), default=sorted(storage.ENGINES))
+    parser.add_argument('--schemas', nargs='+', choices=sorted(storage.SCHEMAS), default=['sensor_data'])
+    parser.add_argument('--rows', type=int, default=100000, help='Seeded rows (default: 100000)')
+    parser.add_argument('--nodes', type=int, default=10, help='Seeded nodes (default: 10)')
+    parser.add_argument('--repeats', type=int, default=20, help='Timed calls per case (default: 20)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_bench_storage_')
+    report = {'rows': args.rows, 'nodes': args.nodes, 'results': {}}
+    try:
+        for schema in args.schemas:
+            seed_path = os.path.join(work_dir, 'seed_%s.db' % schema)
+            with contextlib.redirect_stdout(io.StringIO()):
+                seed_database(seed_path, schema, args.rows, args.nodes)
+            for engine in args.engines:
+                report['results']['%s/%s' % (engine, schema)] = run_engine(
+                    engine, schema, seed_path, work_dir, args.repeats)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('Results written to %s' % args.json)
+
+
+if __name__ == '__main__':
+    main()
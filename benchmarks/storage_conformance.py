@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Storage engine conformance checks
+Runs the same scenario against every registered storage engine and schema
+(storage.ENGINES x storage.SCHEMAS) and verifies they all honor the storage
+API: canonical fields in and out, Celsius round trips (and exact °F ones
+where a schema stores Fahrenheit), ordering, time windows, limits,
+latest-per-node, stats and retention. With pyarrow installed it also checks
+that a Parquet cold tier returns exactly what the engine alone would. Exits non-zero when any check fails, so it can gate a
+new engine before it is registered.
+
+Examples:
+    python benchmarks/storage_conformance.py
+    python benchmarks/storage_conformance.py --engines sqlite --schemas sensor_readings
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+from datetime import timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'docker', 'app'))
+import storage
+from storage import cold
+from storage.schemas import TIMESTAMP_FORMAT, utc_now
+
+NODES = ['1001', '1002', '1003']
+READINGS_PER_NODE = 12
+CADENCE_MINUTES = 15
+
+
+def build_readings(now):
+    """Canonical readings, oldest first, one per node every 15 minutes"""
+    readings = []
+    for i in range(READINGS_PER_NODE):
+        ts = now - timedelta(minutes=CADENCE_MINUTES * (READINGS_PER_NODE - 1 - i))
+        for n, node_id in enumerate(NODES):
+            readings.append({
+                'node_id': node_id,
+                'timestamp': ts.strftime(TIMESTAMP_FORMAT),
+                'temperature_c': round(18.5 + n + i * 0.25, 2),
+                'humidity': 40.0 + n,
+                'pressure_hpa': 1010.0 + i,
+                'battery_voltage': 4.1,
+                'rssi': -70 - n,
+                'snr': 7.5,
+            })
+    return readings
+
+
+class Checker:
+    def __init__(self, label):
+        self.label = label
+        self.failures = []
+        self.passed = 0
+
+    def check(self, name, condition, detail=''):
+        if condition:
+            self.passed += 1
+        else:
+            self.failures.append('%s: %s %s' % (self.label, name, detail))
+
+
+def close_enough(a, b, tolerance=1e-3):
+    return a is not None and b is not None and abs(a - b) <= tolerance
+
+
+def run_scenario(engine, schema_name, work_dir):
+    """Exercise one engine/schema pair; returns a Checker with the outcome"""
+    c = Checker('%s/%s' % (engine, schema_name))
+    path = os.path.join(work_dir, '%s_%s.db' % (engine, schema_name))
+    store = storage.open_storage(path, schema=schema_name, engine=engine)
+
+    version = store.initialize()
+    c.check('initialize returns latest version', version == storage.latest_version(schema_name),
+            '(got %r)' % version)
+    c.check('initialize is idempotent', store.initialize() == version)
+    c.check('empty latest', store.latest() == [])
+    c.check('empty stats', store.stats()['total_readings'] == 0)
+
+    # Timestamps only exist on sensor_data; sensor_readings stamps receive time
+    stamped = store.schema.time_column == 'timestamp'
+    now = utc_now()
+    readings = build_readings(now)
+    if stamped:
+        stored = store.insert_readings(readings)
+    else:
+        stored = sum(store.insert_readings([r]) for r in readings)
+    c.check('insert count', stored == len(readings), '(got %r)' % stored)
+    c.check('count', store.count() == len(readings))
+    c.check('empty batch', store.insert_readings([]) == 0)
+    if hasattr(store, 'seal'):
+        # Engines that compress old readings: seal all but the newest few, so reads span both forms
+        sealed = store.seal(now - timedelta(minutes=CADENCE_MINUTES * 2 + 1)) if stamped else \
+            store.seal(now + timedelta(minutes=1))
+        c.check('seal', sealed > 0 and store.count() == len(readings), '(sealed %r)' % sealed)
+
+    latest = store.latest()
+    c.check('latest has one row per node', sorted(r['node_id'] for r in latest) == sorted(NODES),
+            '(got %r)' % [r['node_id'] for r in latest])
+    last_by_node = {}
+    for r in readings:
+        last_by_node[r['node_id']] = r
+    for row in latest:
+        expected = last_by_node[row['node_id']]
+        c.check('latest temperature_c %s' % row['node_id'],
+                close_enough(row['temperature_c'], expected['temperature_c']),
+                '(%r != %r)' % (row['temperature_c'], expected['temperature_c']))
+        c.check('latest canonical fields %s' % row['node_id'],
+                all(f in storage.FIELDS or f == 'id' for f in row), '(got %r)' % sorted(row))
+    c.check('latest newest first', [r['timestamp'] for r in latest] ==
+            sorted((r['timestamp'] for r in latest), reverse=True))
+
+    history = store.range(node_id='1001')
+    c.check('range per node', len(history) == READINGS_PER_NODE and
+            all(r['node_id'] == '1001' for r in history), '(got %d)' % len(history))
+    c.check('range descending', [r['timestamp'] for r in history] ==
+            sorted((r['timestamp'] for r in history), reverse=True))
+    ascending = store.range(node_id='1001', descending=False)
+    c.check('range ascending', [r['id'] for r in ascending] == [r['id'] for r in reversed(history)])
+    c.check('range limit', len(store.range(limit=5)) == 5)
+    projected = store.range(node_id='1002', fields=['humidity'], limit=1)
+    c.check('range projection', projected and set(projected[0]) == {'id', 'node_id', 'timestamp', 'humidity'},
+            '(got %r)' % (sorted(projected[0]) if projected else None))
+    c.check('iter_range matches range', [r['id'] for r in store.iter_range(node_id='1003', chunk_size=4)] ==
+            [r['id'] for r in store.range(node_id='1003')])
+    middle = sorted(r['id'] for r in store.range())[len(readings) // 2]
+    c.check('iter_range after_id', [r['id'] for r in store.iter_range(after_id=middle)] ==
+            [r['id'] for r in store.range() if r['id'] > middle])
+    c.check('range_batch matches range', list(store.range_batch(limit=20, chunk_size=7)) == store.range(limit=20))
+    batch = store.range_batch(node_id='1002', fields=['humidity'])
+    c.check('range_batch columns', batch.names == ('id', 'node_id', 'timestamp', 'humidity') and
+            batch.column('humidity') == [r['humidity'] for r in store.range(node_id='1002')])
+
+    all_ids = sorted(r['id'] for r in store.range())
+    scanned = store.scan_batch(after_id=all_ids[2], limit=5, fields=['humidity'])
+    c.check('scan_batch id order', scanned.column('id') == all_ids[3:8] and 'humidity' in scanned.names)
+    missing = store.scan_batch(limit=len(all_ids) + 1, missing=['dew_point'])
+    c.check('scan_batch missing', missing.column('id') == all_ids, '(got %d rows)' % len(missing))
+    updated = store.update_fields(['heat_index', 'dew_point'], all_ids[:4], [[70.0] * 4, [9.5] * 4])
+    c.check('update_fields', updated == 4 and store.update_fields(['dew_point'], [], [[]]) == 0 and
+            store.scan_batch(limit=len(all_ids) + 1, missing=['dew_point']).column('id') == all_ids[4:] and
+            [r['dew_point'] for r in store.range(fields=['dew_point']) if r['id'] in all_ids[:4]] == [9.5] * 4)
+
+    if stamped:
+        window = store.range(t0=now - timedelta(minutes=CADENCE_MINUTES * 2), t1=now)
+        c.check('range time window', len(window) == 3 * len(NODES), '(got %d)' % len(window))
+        c.check('gateway T timestamps normalized',
+                store.insert_readings([dict(readings[-1], timestamp=now.strftime('%Y-%m-%dT%H:%M:%S'))]) == 1
+                and store.range(node_id=readings[-1]['node_id'], limit=1)[0]['timestamp'] ==
+                now.strftime(TIMESTAMP_FORMAT))
+
+    stats = store.stats()
+    c.check('stats total', stats['total_readings'] == store.count())
+    c.check('stats active nodes', stats['active_nodes'] == len(NODES), '(got %r)' % stats['active_nodes'])
+    c.check('stats last update', stats['last_update'] == max(r['timestamp'] for r in store.range(limit=1)))
+
+    if store.schema.node_table:
+        status = store.node_status()
+        c.check('node_status rows', sorted(n['node_id'] for n in status) == sorted(NODES))
+        c.check('node_status totals', all(n['total_readings'] == READINGS_PER_NODE for n in status),
+                '(got %r)' % [n['total_readings'] for n in status])
+        c.check('set_node_active', store.set_node_active({NODES[0]: False, 'unknown': False}) == 1 and
+                store.set_node_active({}) == 0 and
+                {n['node_id']: n['is_active'] for n in store.node_status()}[NODES[0]] == 0)
+
+    alert = {'rule_id': 'temp-high', 'node_id': '1001', 'kind': 'threshold', 'metric': 'temperature_f',
+             'value': 85.0, 'threshold': 80.0, 'severity': 'warning', 'message': 'hot',
+             'timestamp': now.strftime('%Y-%m-%dT%H:%M:%S')}
+    stored = store.insert_alerts([dict(alert, state='firing'), dict(alert, node_id='1002', state='firing'),
+                                  dict(alert, state='resolved')])
+    c.check('insert_alerts count', stored == 3 and store.insert_alerts([]) == 0, '(got %r)' % stored)
+    alerts = store.alerts()
+    c.check('alerts newest first', [a['state'] for a in alerts] == ['resolved', 'firing', 'firing'] and
+            alerts[0]['timestamp'] == now.strftime(TIMESTAMP_FORMAT))
+    c.check('alerts filters', len(store.alerts(node_id='1001', state='firing')) == 1 and len(store.alerts(limit=1)) == 1)
+    c.check('open_alerts', [(a['rule_id'], a['node_id']) for a in store.open_alerts()] == [('temp-high', '1002')])
+
+    removed = store.delete_before(now + timedelta(minutes=1))
+    c.check('delete_before', removed == len(readings) + (1 if stamped else 0) and store.count() == 0,
+            '(removed %r)' % removed)
+
+    if 'temperature_c' in storage.SCHEMAS[schema_name].to_db:
+        # A °F column must hand back the gateway's value: every tenth of a degree through F -> C -> F
+        sent = [tenths / 10.0 for tenths in range(-400, 1301)]
+        store.insert_readings([{'node_id': '1001', 'timestamp': now, 'temperature_c': storage.f_to_c(f),
+                                'humidity': 50.0, 'pressure_hpa': 1013.0} for f in sent])
+        returned = [storage.c_to_f(r['temperature_c'])
+                    for r in store.range(descending=False, fields=['temperature_c'])]
+        drifted = [(f, back) for f, back in zip(sent, returned) if f != back]
+        c.check('fahrenheit round trip', len(returned) == len(sent) and not drifted,
+                '(%d of %d drifted, e.g. %r)' % (len(drifted), len(sent), drifted[:3]))
+        store.delete_before(now + timedelta(minutes=1))
+    store.close()
+    return c
+
+
+def run_tiering_scenario(engine, schema_name, work_dir):
+    """Tier out part of a 10-week history and compare every read with an untiered copy"""
+    # Tiering keys on the stored time column, which sensor_readings stamps with receive time
+    if storage.SCHEMAS[schema_name].time_column != 'timestamp':
+        return None
+    c = Checker('%s/%s+cold' % (engine, schema_name))
+    plain = storage.open_storage(os.path.join(work_dir, 'plain_%s_%s.db' % (engine, schema_name)),
+                                 schema=schema_name, engine=engine)
+    tiered = storage.open_storage(os.path.join(work_dir, 'tiered_%s_%s.db' % (engine, schema_name)),
+                                  schema=schema_name, engine=engine,
+                                  cold_path=os.path.join(work_dir, 'cold_%s_%s' % (engine, schema_name)))
+    now = utc_now()
+    readings = []
+    for hour in range(70 * 24, -1, -6):
+        for n, node_id in enumerate(NODES):
+            readings.append({
+                'node_id': node_id,
+                'timestamp': (now - timedelta(hours=hour)).strftime(TIMESTAMP_FORMAT),
+                'temperature_c': 15.0 + n + hour % 7,
+                'humidity': 50.0,
+                'pressure_hpa': 1000.0 + hour % 11,
+                'rssi': -80,
+                'gateway_id': 'GATEWAY_01',
+            })
+    for store in (plain, tiered):
+        store.initialize()
+        store.insert_readings(readings)
+        if hasattr(store, 'seal'):
+            store.seal(now - timedelta(days=10))
+
+    moved = tiered.tier_out(now - timedelta(days=30))
+    c.check('tier_out moved rows', moved > 0 and tiered.hot.count() + moved == len(readings),
+            '(moved %r)' % moved)
+    c.check('count spans tiers', tiered.count() == plain.count())
+    c.check('stats spans tiers', tiered.stats()['total_readings'] == plain.stats()['total_readings'])
+    c.check('tier_out is idempotent', tiered.tier_out(now - timedelta(days=30)) == 0)
+
+    windows = [
+        {},
+        {'node_id': '1002'},
+        {'t0': now - timedelta(days=45), 't1': now - timedelta(days=20)},
+        {'t0': now - timedelta(days=5)},
+        {'limit': 7},
+        {'limit': 7, 'descending': False},
+        {'node_id': '1001', 'fields': ['pressure_hpa'], 'descending': False},
+    ]
+    for args in windows:
+        c.check('range %r' % args, tiered.range(**args) == plain.range(**args))
+        iter_args = dict((k, v) for k, v in args.items() if k != 'limit')
+        c.check('iter_range %r' % iter_args,
+                list(tiered.iter_range(**iter_args)) == list(plain.iter_range(**iter_args)))
+        c.check('range_batch %r' % args, list(tiered.range_batch(**args)) == plain.range(**args))
+    middle = sorted(r['id'] for r in plain.range())[len(readings) // 2]
+    c.check('iter_range after_id spans tiers', list(tiered.iter_range(after_id=middle, descending=False)) ==
+            list(plain.iter_range(after_id=middle, descending=False)))
+
+    c.check('delete_before spans tiers', tiered.delete_before(now - timedelta(days=40)) ==
+            plain.delete_before(now - timedelta(days=40)) and tiered.range() == plain.range())
+    plain.close()
+    tiered.close()
+    return c
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check storage engines against the storage API')
+    parser.add_argument('--engines', nargs='+', choices=sorted(storage.ENGINES), default=sorted(storage.ENGINES))
+    parser.add_argument('--schemas', nargs='+', choices=sorted(storage.SCHEMAS), default=sorted(storage.SCHEMAS))
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='lora_storage_')
+    failures = []
+    try:
+        for engine in args.engines:
+            for schema_name in args.schemas:
+                try:
+                    checker = run_scenario(engine, schema_name, work_dir)
+                except Exception:
+                    failures.append('%s/%s: crashed\n%s' % (engine, schema_name, traceback.format_exc()))
+                    print('  %-28s CRASHED' % ('%s/%s' % (engine, schema_name)))
+                    continue
+                failures.extend(checker.failures)
+                print('  %-28s %3d passed  %d failed' % (checker.label, checker.passed, len(checker.failures)))
+                if not cold.available():
+                    continue
+                checker = run_tiering_scenario(engine, schema_name, work_dir)
+                if checker:
+                    failures.extend(checker.failures)
+                    print('  %-28s %3d passed  %d failed' % (checker.label, checker.passed,
+                                                            len(checker.failures)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if failures:
+        print('\nFailures:')
+        for failure in failures:
+            print('  ' + failure)
+        sys.exit(1)
+    print('\nAll storage engines conform')
+
+
+if __name__ == '__main__':
+    main()
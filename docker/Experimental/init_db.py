@@ -4,14 +4,20 @@ Database initialization script for LoRa Sensor Network
 This script creates the SQLite database and tables if they don't exist.
 """
 
-import sqlite3
 import os
+import sys
 import json
 from datetime import datetime
 
+# Shared storage engine (copied next to this script in the image)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+from storage import open_storage
+
 # Configuration
 DATABASE_PATH = os.environ.get('DB_PATH', '/app/data/sensors.db')
 CONFIG_PATH = os.environ.get('CONFIG_PATH', '/app/config')
+# The image points CONFIG_PATH at settings.json itself, which is what app.py reads
+CONFIG_DIR = os.path.dirname(CONFIG_PATH) if CONFIG_PATH.endswith('.json') else CONFIG_PATH
 
 def init_database():
     """Initialize SQLite database with required tables"""
@@ -21,48 +27,10 @@ def init_database():
         
         print(f"Initializing database at: {DATABASE_PATH}")
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        # Create sensor_data table (matches your app.py structure)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sensor_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                node_id TEXT NOT NULL,
-                temperature REAL,
-                humidity REAL,
-                pressure REAL,
-                battery_voltage REAL,
-                rssi INTEGER,
-                snr REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Create settings table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Create indexes for better performance
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_sensor_data_node_id 
-            ON sensor_data(node_id)
-        ''')
-        
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_sensor_data_timestamp 
-            ON sensor_data(timestamp)
-        ''')
+        # Tables and indexes come from the versioned storage migrations
+        version = open_storage(DATABASE_PATH, schema='sensor_data').initialize()
+        print(f"📐 Schema version: {version}")
 
-        conn.commit()
-        conn.close()
-        
         print("✅ Database tables created successfully")
         return True
         
@@ -74,10 +42,10 @@ def init_config():
     """Initialize configuration files"""
     try:
         # Ensure config directory exists
-        os.makedirs(CONFIG_PATH, exist_ok=True)
+        os.makedirs(CONFIG_DIR, exist_ok=True)
         
         # Create default settings.json if it doesn't exist
-        settings_file = os.path.join(CONFIG_PATH, 'settings.json')
+        settings_file = os.path.join(CONFIG_DIR, 'settings.json')
         if not os.path.exists(settings_file):
             default_settings = {
                 "timezone": "UTC",
@@ -106,7 +74,7 @@ def init_config():
             print(f"✅ Created default settings: {settings_file}")
         
         # Create default nodes.json if it doesn't exist
-        nodes_file = os.path.join(CONFIG_PATH, 'nodes.json')
+        nodes_file = os.path.join(CONFIG_DIR, 'nodes.json')
         if not os.path.exists(nodes_file):
             default_nodes = {
                 "nodes": [
@@ -0,0 +1,195 @@
+# admission.py - Burst-absorbing admission control for the ingest endpoint
+"""
+Every gateway collects from its nodes at MINUTE % 15 == 0 and uploads them
+back to back, so /api/sensor-data sees a sharp burst four times an hour.
+Admission control smooths those bursts:
+
+- a token bucket per gateway caps how fast any one gateway can post
+- a bounded semaphore caps how many requests write to SQLite at once
+- rejected requests get 429 with a jittered Retry-After hint
+"""
+
+import math
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """Classic token bucket: refills at `rate` tokens/s up to `capacity`"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic() if now is None else now
+
+    def refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def try_acquire(self, now, tokens=1.0):
+        """Take tokens if available; otherwise return seconds until they will be"""
+        self.refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True, 0.0
+        if self.rate <= 0:
+            return False, float('inf')
+        return False, (tokens - self.tokens) / self.rate
+
+
+class RateMeter:
+    """Per-second counters over a sliding window for burst-versus-sustained reporting"""
+
+    def __init__(self, window_seconds=3600):
+        self.window = int(window_seconds)
+        self.buckets = deque()  # (epoch second, count)
+        self.started = time.time()
+
+    def add(self, now=None, count=1):
+        second = int(now if now is not None else time.time())
+        if self.buckets and self.buckets[-1][0] == second:
+            self.buckets[-1] = (second, self.buckets[-1][1] + count)
+        else:
+            self.buckets.append((second, count))
+        self._expire(second)
+
+    def _expire(self, second):
+        while self.buckets and self.buckets[0][0] <= second - self.window:
+            self.buckets.popleft()
+
+    def snapshot(self, now=None):
+        now = now if now is not None else time.time()
+        self._expire(int(now))
+        total = sum(c for _, c in self.buckets)
+        peak = max((c for _, c in self.buckets), default=0)
+        span = max(1.0, min(self.window, now - self.started))
+        return {
+            'window_seconds': self.window,
+            'total': total,
+            'burst_peak_per_second': peak,
+            'sustained_per_second': round(total / span, 3),
+            'burst_to_sustained_ratio': round(peak / (total / span), 1) if total else None,
+        }
+
+
+class IngestAdmission:
+    """Admission control shared by every ingest request"""
+
+    def __init__(self, rate=2.0, burst=120, max_writers=2, writer_timeout=5.0,
+                 retry_jitter=2.0, enabled=True, idle_bucket_seconds=1800, metrics_window=3600):
+        self.enabled = enabled
+        self.rate = rate
+        self.burst = burst
+        self.max_writers = max_writers
+        self.writer_timeout = writer_timeout
+        self.retry_jitter = retry_jitter
+        self.idle_bucket_seconds = idle_bucket_seconds
+
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._writers = threading.BoundedSemaphore(max_writers)
+        self._in_flight = 0
+        self._last_prune = time.monotonic()
+
+        self.accepted = RateMeter(metrics_window)
+        self.offered = RateMeter(metrics_window)
+        self.rejected_rate_limit = 0
+        self.rejected_writer_busy = 0
+        self.max_in_flight = 0
+        self.max_writer_wait_ms = 0.0
+        self.total_writer_wait_ms = 0.0
+        self.writes = 0
+
+    def retry_after_hint(self, wait_seconds):
+        """Whole seconds to wait, jittered so rejected gateways don't return in lockstep"""
+        if math.isinf(wait_seconds):
+            wait_seconds = 60.0
+        return max(1, int(math.ceil(wait_seconds + random.uniform(0, self.retry_jitter))))
+
+    def admit(self, gateway_key):
+        """Charge one request to the gateway's bucket; returns (allowed, retry_after_seconds)"""
+        now = time.monotonic()
+        with self._lock:
+            self.offered.add()
+            if not self.enabled:
+                return True, 0
+            bucket = self._buckets.get(gateway_key)
+            if bucket is None:
+                bucket = self._buckets[gateway_key] = TokenBucket(self.rate, self.burst, now)
+            allowed, wait = bucket.try_acquire(now)
+            if not allowed:
+                self.rejected_rate_limit += 1
+            if now - self._last_prune > 60:
+                self._prune(now)
+        if allowed:
+            return True, 0
+        return False, self.retry_after_hint(wait)
+
+    def _prune(self, now):
+        """Drop buckets of gateways that have been quiet long enough to be full again"""
+        idle = [k for k, b in self._buckets.items() if now - b.updated > self.idle_bucket_seconds]
+        for key in idle:
+            del self._buckets[key]
+        self._last_prune = now
+
+    @contextmanager
+    def writer_slot(self):
+        """Wait (bounded) for one of max_writers database write slots; yields False on timeout"""
+        if not self.enabled:
+            yield True
+            return
+        started = time.monotonic()
+        acquired = self._writers.acquire(timeout=self.writer_timeout)
+        waited_ms = (time.monotonic() - started) * 1000.0
+        with self._lock:
+            self.total_writer_wait_ms += waited_ms
+            self.max_writer_wait_ms = max(self.max_writer_wait_ms, waited_ms)
+            if acquired:
+                self._in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            else:
+                self.rejected_writer_busy += 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with self._lock:
+                    self._in_flight -= 1
+                    self.writes += 1
+                    self.accepted.add()
+                self._writers.release()
+
+    def metrics(self):
+        """Counters for /api/ingest/metrics"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'config': {
+                    'rate_per_gateway': self.rate,
+                    'burst_per_gateway': self.burst,
+                    'max_writers': self.max_writers,
+                    'writer_timeout_s': self.writer_timeout,
+                    'retry_jitter_s': self.retry_jitter,
+                },
+                'gateways_tracked': len(self._buckets),
+                'offered': self.offered.snapshot(),
+                'accepted': self.accepted.snapshot(),
+                'rejected': {
+                    'rate_limited': self.rejected_rate_limit,
+                    'writer_busy': self.rejected_writer_busy,
+                },
+                'writers': {
+                    'in_flight': self._in_flight,
+                    'max_in_flight': self.max_in_flight,
+                    'max_wait_ms': round(self.max_writer_wait_ms, 3),
+                    'avg_wait_ms': round(self.total_writer_wait_ms / self.writes, 3) if self.writes else 0.0,
+                },
+            }
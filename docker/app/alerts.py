@@ -0,0 +1,411 @@
+# alerts.py - Incremental alert rules evaluated on ingest
+"""
+Rules are checked as readings arrive, not when a dashboard renders:
+
+- threshold: a metric above or below a value (low_battery is shorthand for
+  battery_voltage below 3.3 V)
+- rate: a metric changing faster than `per_hour` between two consecutive
+  readings of a node
+- stale: no reading from a node for `minutes`, found by a periodic sweep
+
+Rules are indexed by (node_id, metric), so a reading evaluates only the rules
+of its own node and metrics plus the all-node rules for those metrics.
+
+Each (rule, node) pair keeps its state. It fires once when the condition
+starts and resolves once the value is back past the threshold by
+`hysteresis`. After it fires, it does not fire again for `cooldown` seconds.
+Every transition is stored in the alerts table and handed to the sinks
+(e.g. WebhookSink).
+
+Readings older than a node's newest by more than `late_after` seconds (a
+gateway's backlog after an outage) are skipped: they would fire and
+resolve alerts for conditions that are long over.
+"""
+
+import json
+import queue
+import threading
+import time
+import urllib.request
+
+from storage import c_to_f, normalize_timestamp
+from recent_cache import from_epoch, to_epoch
+
+KINDS = ('threshold', 'rate', 'stale', 'low_battery')
+
+# A backlog reading this much older than the node's newest doesn't change live alert state
+LATE_AFTER_SECONDS = 900.0
+
+# Metrics rules can watch that aren't stored fields
+DERIVED_METRICS = {
+    'temperature_f': lambda reading: c_to_f(reading.get('temperature_c')),
+}
+
+# What the dashboards used to highlight, plus battery and silence
+DEFAULT_RULES = [
+    {'id': 'temp-high', 'kind': 'threshold', 'metric': 'temperature_f', 'above': 80, 'hysteresis': 1},
+    {'id': 'humidity-high', 'kind': 'threshold', 'metric': 'humidity', 'above': 70, 'hysteresis': 2},
+    {'id': 'low-battery', 'kind': 'low_battery'},
+    {'id': 'node-stale', 'kind': 'stale', 'minutes': 60},
+]
+
+
+class Rule:
+    """One alert rule; node_id None applies it to every node"""
+
+    __slots__ = ('id', 'kind', 'node_id', 'metric', 'above', 'value', 'hysteresis', 'cooldown',
+                 'severity', 'message')
+
+    def __init__(self, id, kind, metric=None, value=None, above=True, node_id=None, hysteresis=0.0,
+                 cooldown=900.0, severity='warning', message=None):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown rule kind: {kind} (use one of {', '.join(KINDS)})")
+        if kind == 'low_battery':
+            kind, metric, above = 'threshold', metric or 'battery_voltage', False
+            value = 3.3 if value is None else value
+            hysteresis = hysteresis or 0.1
+        if kind != 'stale' and not metric:
+            raise ValueError(f"Rule {id} needs a metric")
+        if value is None:
+            raise ValueError(f"Rule {id} needs a threshold")
+        self.id = str(id)
+        self.kind = kind
+        self.node_id = str(node_id) if node_id is not None else None
+        self.metric = metric if kind != 'stale' else None
+        self.above = above
+        self.value = float(value)
+        self.hysteresis = float(hysteresis)
+        self.cooldown = float(cooldown)
+        self.severity = severity
+        self.message = message
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Rule from its JSON form, e.g. {"id": "t", "kind": "threshold", "metric": "humidity", "above": 70}"""
+        spec = dict(spec)
+        kind = spec.pop('kind', 'threshold')
+        value, above = spec.pop('value', None), True
+        if 'above' in spec:
+            value = spec.pop('above')
+        elif 'below' in spec:
+            value, above = spec.pop('below'), False
+        elif 'per_hour' in spec:
+            value = spec.pop('per_hour')
+        elif 'minutes' in spec:
+            value = float(spec.pop('minutes')) * 60.0
+        try:
+            return cls(kind=kind, value=value, above=above, **spec)
+        except TypeError as e:
+            raise ValueError(f"Bad rule {spec.get('id')}: {e}")
+
+    def to_dict(self):
+        spec = {'id': self.id, 'kind': self.kind, 'node_id': self.node_id, 'hysteresis': self.hysteresis,
+                'cooldown': self.cooldown, 'severity': self.severity}
+        if self.kind == 'threshold':
+            spec.update({'metric': self.metric, 'above' if self.above else 'below': self.value})
+        elif self.kind == 'rate':
+            spec.update({'metric': self.metric, 'per_hour': self.value})
+        else:
+            spec['minutes'] = self.value / 60.0
+        return spec
+
+    def breached(self, x):
+        if self.kind == 'threshold' and not self.above:
+            return x < self.value
+        return x > self.value
+
+    def cleared(self, x):
+        if self.kind == 'threshold' and not self.above:
+            return x >= self.value + self.hysteresis
+        return x <= self.value - self.hysteresis
+
+
+def reading_time(reading):
+    """Epoch seconds of a reading's timestamp (stored readings carry the canonical form); now if it has none"""
+    timestamp = reading.get('timestamp')
+    if not timestamp:
+        return time.time()
+    try:
+        return to_epoch(timestamp)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return to_epoch(normalize_timestamp(timestamp))
+    except (TypeError, ValueError):
+        return time.time()  # unparseable: storage kept the text as sent
+
+
+def load_rules(path):
+    """Rules from a JSON file holding a list of rule objects; DEFAULT_RULES if the file is missing"""
+    try:
+        with open(path) as f:
+            specs = json.load(f)
+    except FileNotFoundError:
+        specs = DEFAULT_RULES
+    return [Rule.from_dict(spec) for spec in specs]
+
+
+class RuleState:
+    """Whether a (rule, node) pair is firing and when it last fired"""
+
+    __slots__ = ('firing', 'fired_at')
+
+    def __init__(self, firing=False, fired_at=None):
+        self.firing = firing
+        self.fired_at = fired_at
+
+
+class AlertEngine:
+    """Evaluates rules against readings as they are stored"""
+
+    def __init__(self, rules=(), storage=None, sinks=(), late_after=LATE_AFTER_SECONDS):
+        self.storage = storage
+        self.sinks = list(sinks)
+        self.late_after = late_after
+        self.states = {}       # (rule id, node id) -> RuleState
+        self.last_seen = {}    # node id -> epoch seconds of its newest reading
+        self.last_values = {}  # (node id, metric) -> (epoch seconds, value), for rate rules
+        self.evaluations = 0
+        self.fired = 0
+        self.resolved = 0
+        self.suppressed = 0
+        self.late_skipped = 0
+        self.sink_errors = 0
+        self._lock = threading.Lock()
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        """Replace the rule set and rebuild the (node, metric) index"""
+        rules = list(rules)
+        ids = [rule.id for rule in rules]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Rule ids must be unique")
+        index, stale = {}, {}
+        for rule in rules:
+            if rule.kind == 'stale':
+                stale.setdefault(rule.node_id, []).append(rule)
+            else:
+                index.setdefault((rule.node_id, rule.metric), []).append(rule)
+        with self._lock:
+            self.rules = rules
+            self.index = index
+            self.stale_rules = stale
+            self.watched = sorted({metric for _, metric in index})
+            known = set(ids)
+            self.states = {key: state for key, state in self.states.items() if key[0] in known}
+
+    def prime(self, latest=(), open_alerts=()):
+        """Start from the newest stored reading per node and the alerts still firing"""
+        with self._lock:
+            for reading in latest:
+                self._remember(str(reading['node_id']), reading_time(reading), reading)
+            for alert in open_alerts:
+                fired_at = to_epoch(alert['timestamp'])
+                self.states[(alert['rule_id'], alert['node_id'])] = RuleState(True, fired_at)
+
+    # ----- evaluation -----
+
+    def process(self, readings):
+        """Evaluate stored readings (they should carry their id and timestamp); returns new alerts"""
+        alerts = []
+        with self._lock:
+            for reading in readings:
+                if reading.get('node_id') is None:
+                    continue
+                self._evaluate(str(reading['node_id']), reading, alerts)
+        self._emit(alerts)
+        return alerts
+
+    def _evaluate(self, node_id, reading, alerts):
+        ts = reading_time(reading)
+        if node_id in self.last_seen and ts < self.last_seen[node_id] - self.late_after:
+            self.late_skipped += 1
+            return
+        silent = ts - self.last_seen[node_id] if node_id in self.last_seen else None
+        for rule in self.stale_rules.get(node_id, []) + self.stale_rules.get(None, []):
+            state = self.states.get((rule.id, node_id))
+            if state is not None and state.firing:
+                self._transition(rule, node_id, state, False, silent, ts, reading, alerts)
+        index = self.index
+        for metric in self.watched:
+            rules = index.get((node_id, metric))
+            wildcard = index.get((None, metric))
+            if wildcard:
+                rules = rules + wildcard if rules else wildcard
+            elif not rules:
+                continue
+            getter = DERIVED_METRICS.get(metric)
+            x = getter(reading) if getter else reading.get(metric)
+            if x is None:
+                continue
+            previous = self.last_values.get((node_id, metric))
+            if previous is None or ts >= previous[0]:
+                # Rates run against the newest value, not whichever arrived last
+                self.last_values[(node_id, metric)] = (ts, x)
+            for rule in rules:
+                self.evaluations += 1
+                if rule.kind == 'rate':
+                    if previous is None or ts <= previous[0]:
+                        continue
+                    value = abs(x - previous[1]) * 3600.0 / (ts - previous[0])
+                else:
+                    value = x
+                self._check(rule, node_id, value, ts, reading, alerts)
+        self.last_seen[node_id] = max(ts, self.last_seen.get(node_id, ts))
+
+    def _check(self, rule, node_id, value, ts, reading, alerts):
+        key = (rule.id, node_id)
+        state = self.states.get(key)
+        if state is None or not state.firing:
+            if rule.breached(value):
+                if state is None:
+                    state = self.states[key] = RuleState()
+                self._transition(rule, node_id, state, True, value, ts, reading, alerts)
+        elif rule.cleared(value):
+            self._transition(rule, node_id, state, False, value, ts, reading, alerts)
+
+    def _transition(self, rule, node_id, state, firing, value, ts, reading, alerts):
+        if firing:
+            if state.fired_at is not None and ts - state.fired_at < rule.cooldown:
+                # Flapping around the threshold: stay quiet until the cooldown has passed
+                self.suppressed += 1
+                return
+            state.fired_at = ts
+            self.fired += 1
+        else:
+            self.resolved += 1
+        state.firing = firing
+        alerts.append({
+            'rule_id': rule.id,
+            'node_id': node_id,
+            'kind': rule.kind,
+            'metric': rule.metric,
+            'state': 'firing' if firing else 'resolved',
+            'value': value,
+            'threshold': rule.value,
+            'severity': rule.severity,
+            'message': self._message(rule, node_id, firing, value),
+            'reading_id': reading.get('id') if reading is not None else None,
+            'timestamp': from_epoch(int(ts)),
+        })
+
+    def _message(self, rule, node_id, firing, value):
+        if rule.message:
+            return rule.message.format(node_id=node_id, value=value, threshold=rule.value)
+        if rule.kind == 'stale':
+            if firing:
+                return f"Node {node_id} silent for {value / 60.0:.0f} min"
+            return f"Node {node_id} reporting again"
+        what = f"{rule.metric} changing {value:.2f}/h" if rule.kind == 'rate' else f"{rule.metric} {value:.2f}"
+        if not firing:
+            return f"Node {node_id} {what}, back to normal"
+        side = 'below' if rule.kind == 'threshold' and not rule.above else 'above'
+        return f"Node {node_id} {what} {side} {rule.value:g}"
+
+    def check_stale(self, now=None):
+        """Fire stale rules for nodes silent too long (run periodically); returns new alerts"""
+        now = time.time() if now is None else now
+        alerts = []
+        with self._lock:
+            wildcard = self.stale_rules.get(None, [])
+            for node_id, last_seen in self.last_seen.items():
+                silent = now - last_seen
+                for rule in self.stale_rules.get(node_id, []) + wildcard:
+                    key = (rule.id, node_id)
+                    state = self.states.get(key)
+                    if silent > rule.value and (state is None or not state.firing):
+                        if state is None:
+                            state = self.states[key] = RuleState()
+                        self._transition(rule, node_id, state, True, silent, now, None, alerts)
+        self._emit(alerts)
+        return alerts
+
+    def _remember(self, node_id, ts, reading):
+        self.last_seen[node_id] = max(ts, self.last_seen.get(node_id, ts))
+        for metric in self.watched:
+            getter = DERIVED_METRICS.get(metric)
+            x = getter(reading) if getter else reading.get(metric)
+            if x is not None:
+                self.last_values[(node_id, metric)] = (ts, x)
+
+    def _emit(self, alerts):
+        if not alerts:
+            return
+        if self.storage is not None:
+            self.storage.insert_alerts(alerts)
+        for sink in self.sinks:
+            try:
+                sink(alerts)
+            except Exception as e:
+                self.sink_errors += 1
+                print(f"Alert sink error: {e}")
+
+    # ----- reporting -----
+
+    def firing(self):
+        """(rule id, node id) pairs currently firing"""
+        with self._lock:
+            return sorted(key for key, state in self.states.items() if state.firing)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'rules': len(self.rules),
+                'index_keys': len(self.index),
+                'nodes': len(self.last_seen),
+                'firing': sum(1 for state in self.states.values() if state.firing),
+                'evaluations': self.evaluations,
+                'fired': self.fired,
+                'resolved': self.resolved,
+                'suppressed': self.suppressed,
+                'late_skipped': self.late_skipped,
+                'sink_errors': self.sink_errors,
+                'sinks': [getattr(sink, 'name', type(sink).__name__) for sink in self.sinks],
+            }
+
+
+class WebhookSink:
+    """POSTs alert batches as JSON to a local URL from a background thread
+
+    Ingest never waits on the receiver: batches queue up (up to max_queue)
+    and are dropped, and counted, when the receiver can't keep up.
+    """
+
+    name = 'webhook'
+
+    def __init__(self, url, timeout=5.0, max_queue=1000):
+        self.url = url
+        self.timeout = timeout
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        # A local receiver: don't route it through HTTP(S)_PROXY
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        self._thread = threading.Thread(target=self._run, name='alert-webhook', daemon=True)
+        self._thread.start()
+
+    def __call__(self, alerts):
+        try:
+            self._queue.put_nowait(list(alerts))
+        except queue.Full:
+            self.dropped += len(alerts)
+
+    def _run(self):
+        while True:
+            alerts = self._queue.get()
+            body = json.dumps({'alerts': alerts}).encode('utf-8')
+            request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+            try:
+                with self._opener.open(request, timeout=self.timeout) as response:
+                    response.read()
+                self.sent += len(alerts)
+            except Exception as e:
+                self.failed += len(alerts)
+                print(f"Alert webhook error ({self.url}): {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until every queued batch has been posted (or failed)"""
+        self._queue.join()
@@ -0,0 +1,513 @@
+# analytics.py - Long-range aggregates for /api/analytics/aggregate
+"""
+Aggregates one metric per time bucket (hour/day/week/month), optionally per
+node, over months of readings.
+
+Every source computes mergeable partials (count, sum, min, max) per
+(bucket, node) and the partials are combined in Python, so a query can span
+the hot SQLite file and the Parquet cold tier:
+
+- SQLite file: DuckDB through its sqlite extension when that can be loaded
+  (columnar, multi-threaded scan), otherwise a GROUP BY in SQLite itself
+- sealed blocks (STORAGE_ENGINE=blocks): decoded and bucketed in Python,
+  only the blocks overlapping the query window
+- Parquet cold tier: DuckDB read_parquet() over the hive partitions when
+  duckdb is installed, otherwise pyarrow's group_by
+
+duckdb is optional; ANALYTICS_ENGINE=sqlite forces the fallback path. It is
+imported on the first aggregate query rather than at startup, since the
+import alone costs more than the rest of app startup on a Raspberry Pi.
+
+Partials of buckets that have ended are cached per (metric, interval,
+group_by, node), so a repeated dashboard query only scans its first
+(partial) and current bucket. Late readings mark their hour dirty
+(late_data.DirtyBuckets); the buckets holding those hours are dropped and
+recomputed on their own.
+"""
+
+import calendar
+import importlib.util
+import threading
+import time
+from collections import OrderedDict
+
+from recent_cache import from_epoch, to_epoch
+from storage import normalize_timestamp
+
+METRICS = ('temperature_c', 'temperature_f', 'humidity', 'pressure_hpa', 'battery_voltage', 'rssi', 'snr')
+# Field names used by the dashboard JSON
+METRIC_ALIASES = {'temperature': 'temperature_c', 'pressure': 'pressure_hpa'}
+INTERVALS = ('hour', 'day', 'week', 'month', 'none')
+GROUP_BY = ('node', 'none')
+ENGINES = ('auto', 'duckdb', 'sqlite')
+
+BUCKET_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Bucket start as canonical text; weeks start on Monday like DuckDB's date_trunc('week')
+SQLITE_BUCKETS = {
+    'hour': "strftime('%Y-%m-%d %H:00:00', {ts})",
+    'day': "strftime('%Y-%m-%d 00:00:00', {ts})",
+    'week': "(date({ts}, '-6 days', 'weekday 1') || ' 00:00:00')",
+    'month': "strftime('%Y-%m-01 00:00:00', {ts})",
+    'none': 'NULL',
+}
+
+
+def duckdb_available():
+    """True when duckdb is installed (checked without importing it)"""
+    return importlib.util.find_spec('duckdb') is not None
+
+
+def duckdb_bucket(interval, ts):
+    if interval == 'none':
+        return 'NULL'
+    return "strftime(date_trunc('%s', CAST(%s AS TIMESTAMP)), '%s')" % (interval, ts, BUCKET_FORMAT)
+
+
+def c_to_f(value):
+    return None if value is None else value * 9.0 / 5.0 + 32.0
+
+
+def bucket_floor(interval, t):
+    """Epoch seconds of the start of the bucket holding t (UTC, the same edges as SQLITE_BUCKETS)"""
+    t = int(t)
+    if interval == 'hour':
+        return t - t % 3600
+    day = t - t % 86400
+    if interval == 'day':
+        return day
+    if interval == 'week':
+        return day - time.gmtime(day).tm_wday * 86400  # tm_wday 0 is Monday
+    g = time.gmtime(t)
+    return calendar.timegm((g.tm_year, g.tm_mon, 1, 0, 0, 0))
+
+
+def bucket_next(interval, start):
+    """Start of the bucket after the one starting at start"""
+    if interval == 'month':
+        g = time.gmtime(start)
+        year, month = (g.tm_year + 1, 1) if g.tm_mon == 12 else (g.tm_year, g.tm_mon + 1)
+        return calendar.timegm((year, month, 1, 0, 0, 0))
+    return start + {'hour': 3600, 'day': 86400, 'week': 7 * 86400}[interval]
+
+
+class AggregateQuery:
+    """Validated aggregate request"""
+
+    def __init__(self, metric, interval='day', group_by='node', node_id=None, t0=None, t1=None):
+        metric = METRIC_ALIASES.get(metric, metric)
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric} (use one of {', '.join(METRICS)})")
+        if interval not in INTERVALS:
+            raise ValueError(f"Unknown interval: {interval} (use one of {', '.join(INTERVALS)})")
+        if group_by not in GROUP_BY:
+            raise ValueError(f"Unknown group_by: {group_by} (use one of {', '.join(GROUP_BY)})")
+        self.metric = metric
+        # Fahrenheit is derived from the Celsius partials after the merge
+        self.field = 'temperature_c' if metric == 'temperature_f' else metric
+        self.interval = interval
+        self.group_by = group_by
+        self.node_id = node_id
+        self.t0 = normalize_timestamp(t0, default_now=False)
+        self.t1 = normalize_timestamp(t1, default_now=False)
+
+    def cache_key(self):
+        return self.field, self.interval, self.group_by, self.node_id
+
+    def narrowed(self, t0, t1):
+        """The same query over [t0, t1] (epoch seconds, t1 inclusive)"""
+        query = AggregateQuery.__new__(AggregateQuery)
+        query.__dict__.update(self.__dict__)
+        query.t0 = from_epoch(t0)
+        query.t1 = from_epoch(t1) if t1 is not None else None
+        return query
+
+    def where(self, ts, value, time_param='?'):
+        """(SQL conditions, params) shared by every SQL source"""
+        conditions, params = [f'{value} IS NOT NULL'], []
+        if self.node_id:
+            conditions.append('node_id = ?')
+            params.append(self.node_id)
+        if self.t0:
+            conditions.append(f'{ts} >= {time_param}')
+            params.append(self.t0)
+        if self.t1:
+            conditions.append(f'{ts} <= {time_param}')
+            params.append(self.t1)
+        return ' AND '.join(conditions), params
+
+
+class Partials:
+    """count/sum/min/max per (bucket, node), mergeable across sources"""
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, bucket, node_id, count, total, low, high):
+        if not count:
+            return
+        key = (bucket, node_id)
+        current = self.groups.get(key)
+        if current is None:
+            self.groups[key] = [count, total, low, high]
+        else:
+            current[0] += count
+            current[1] += total
+            current[2] = min(current[2], low)
+            current[3] = max(current[3], high)
+
+    def rows(self, metric):
+        fahrenheit = metric == 'temperature_f'
+        result = []
+        for (bucket, node_id), (count, total, low, high) in sorted(
+                self.groups.items(), key=lambda item: (item[0][0] or '', item[0][1] or '')):
+            avg = total / count
+            if fahrenheit:
+                avg, low, high = c_to_f(avg), c_to_f(low), c_to_f(high)
+            result.append({
+                'bucket': bucket,
+                'node_id': node_id,
+                'count': count,
+                'avg': round(avg, 3),
+                'min': round(low, 3),
+                'max': round(high, 3),
+            })
+        return result
+
+
+class Analytics:
+    """Runs aggregate queries against a storage engine (and its cold tier, if any)"""
+
+    def __init__(self, storage, db_path, engine='auto', dirty=None, cache_entries=0):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown analytics engine: {engine}")
+        available = engine != 'sqlite' and duckdb_available()
+        if engine == 'duckdb' and not available:
+            raise RuntimeError('ANALYTICS_ENGINE=duckdb but duckdb is not installed (pip install duckdb)')
+        self.storage = storage
+        self.db_path = db_path
+        self.use_duckdb = available
+        self._duck = None
+        self._duck_sqlite = None  # None: not tried yet, then True/False
+        self._lock = threading.Lock()
+        # (field, interval, group_by, node_id) -> {bucket start: {node: [count, sum, min, max]}}
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.dirty = dirty
+        if dirty is not None:
+            dirty.register('analytics')
+        self.bucket_hits = 0
+        self.bucket_scans = 0
+        self.recomputed = 0
+
+    # ----- DuckDB -----
+
+    def _duckdb(self):
+        """Shared DuckDB connection; attaches the SQLite file when the sqlite extension loads"""
+        with self._lock:
+            if self._duck is None:
+                import duckdb
+                self._duck = duckdb.connect()
+                try:
+                    self._duck.execute('LOAD sqlite')
+                except Exception:
+                    try:
+                        self._duck.execute('INSTALL sqlite')
+                        self._duck.execute('LOAD sqlite')
+                    except Exception as e:
+                        print(f"DuckDB sqlite extension unavailable, SQLite runs hot-tier aggregates: {e}")
+                        self._duck_sqlite = False
+                if self._duck_sqlite is None:
+                    self._duck.execute("ATTACH ? AS hot (TYPE sqlite, READ_ONLY)", [self.db_path])
+                    self._duck_sqlite = True
+            return self._duck.cursor()
+
+    def _duckdb_partials(self, cursor, source, ts, value, query, partials, extra_where=None):
+        # Bounds arrive as canonical text; compare as TIMESTAMP so DuckDB can use min/max stats
+        conditions, params = query.where(ts, value, time_param='CAST(? AS TIMESTAMP)')
+        if extra_where:
+            conditions += ' AND ' + extra_where[0]
+            params += extra_where[1]
+        node = 'node_id' if query.group_by == 'node' else 'NULL'
+        sql = f'''
+            SELECT {duckdb_bucket(query.interval, ts)} AS bucket, {node} AS node,
+                   COUNT({value}), SUM({value}), MIN({value}), MAX({value})
+            FROM {source}
+            WHERE {conditions}
+            GROUP BY 1, 2
+        '''
+        for row in cursor.execute(sql, params).fetchall():
+            partials.add(*row)
+
+    # ----- hot tier -----
+
+    def _hot_partials(self, query, partials):
+        hot = getattr(self.storage, 'hot', self.storage)
+        schema = hot.schema
+        value = schema.field_sql(query.field)
+        # A sharded engine has no single file for DuckDB to attach: each shard aggregates its own nodes
+        sharded = hasattr(hot, 'fan_out')
+        # DuckDB casts the raw time column, which only works when it holds canonical text
+        text_time = schema.time_param == '?'
+        if self.use_duckdb and self._duck_sqlite is not False and not sharded and text_time:
+            cursor = self._duckdb()
+            if self._duck_sqlite:
+                ts = f'CAST("{schema.time_column}" AS TIMESTAMP)'
+                self._duckdb_partials(cursor, f'hot.{schema.table}', ts, value, query, partials)
+                return 'duckdb'
+
+        conditions, params = query.where(schema.time_column, value, time_param=schema.time_param)
+        node = 'node_id' if query.group_by == 'node' else 'NULL'
+        sql = f'''
+            SELECT {SQLITE_BUCKETS[query.interval].format(ts=schema.field_sql('timestamp'))} AS bucket, {node} AS node,
+                   COUNT({value}), SUM({value}), MIN({value}), MAX({value})
+            FROM {schema.table}
+            WHERE {conditions}
+            GROUP BY 1, 2
+        '''
+
+        def scan(source):
+            with source.read_connection() as conn:
+                return conn.execute(sql, params).fetchall()
+
+        for rows in hot.fan_out(scan) if sharded else [scan(hot)]:
+            for row in rows:
+                partials.add(*row)
+        return 'sqlite'
+
+    # ----- sealed blocks -----
+
+    def _sealed_partials(self, query, partials):
+        """Partials of readings sealed into compressed blocks (STORAGE_ENGINE=blocks), decoded in Python"""
+        hot = getattr(self.storage, 'hot', self.storage)
+        if not hasattr(hot, 'iter_sealed_values'):
+            return None
+        interval = query.interval
+        groups = {}
+        start = stop = None
+        for node_id, seconds, values in hot.iter_sealed_values(query.field, query.node_id, query.t0, query.t1):
+            node = node_id if query.group_by == 'node' else None
+            for t, value in zip(seconds, values):
+                if value is None:
+                    continue
+                if interval != 'none' and not (start is not None and start <= t < stop):
+                    # A block's readings are in time order, so the bucket rarely changes between them
+                    start = bucket_floor(interval, t)
+                    stop = bucket_next(interval, start)
+                current = groups.get((start, node))
+                if current is None:
+                    groups[(start, node)] = [1, value, value, value]
+                else:
+                    current[0] += 1
+                    current[1] += value
+                    if value < current[2]:
+                        current[2] = value
+                    elif value > current[3]:
+                        current[3] = value
+        for (bucket, node), values in groups.items():
+            partials.add(None if bucket is None else from_epoch(bucket), node, *values)
+        return 'python'
+
+    # ----- cold tier -----
+
+    def _cold_partials(self, query, partials):
+        cold = getattr(self.storage, 'cold', None)
+        if cold is None or cold.watermark is None or cold.count() == 0:
+            return None
+        if query.t0 and query.t0 >= cold.watermark:
+            return None
+
+        if self.use_duckdb:
+            cursor = self._duckdb()
+            source = ("read_parquet('%s/*/*/*.parquet', hive_partitioning = true, "
+                      "hive_types = {'month': VARCHAR, 'node_id': VARCHAR})" % cold.root.replace("'", "''"))
+            # month is a partition column, so this prunes whole directories before any file is opened
+            months, params = [], []
+            if query.t0:
+                months.append('month >= ?')
+                params.append(query.t0[:7])
+            if query.t1:
+                months.append('month <= ?')
+                params.append(query.t1[:7])
+            extra = (' AND '.join(months), params) if months else None
+            self._duckdb_partials(cursor, source, '"timestamp"', query.field, query, partials, extra)
+            return 'duckdb'
+
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        table = cold.table(query.node_id, query.t0, query.t1, [query.field])
+        if table is None:
+            return 'pyarrow'
+        if query.interval == 'none':
+            buckets = pa.nulls(table.num_rows, pa.string())
+        else:
+            floored = pc.floor_temporal(table.column('timestamp'), unit=query.interval, week_starts_monday=True)
+            buckets = pc.strftime(floored, format=BUCKET_FORMAT)
+        if query.group_by == 'node':
+            nodes = table.column('node_id')
+        else:
+            nodes = pa.nulls(table.num_rows, pa.string())
+        grouped = pa.table({'bucket': buckets, 'node': nodes, 'value': table.column(query.field)})
+        grouped = grouped.filter(pc.is_valid(grouped.column('value'))).group_by(['bucket', 'node']).aggregate(
+            [('value', 'count'), ('value', 'sum'), ('value', 'min'), ('value', 'max')])
+        for row in grouped.to_pylist():
+            partials.add(row['bucket'], row['node'], row['value_count'], row['value_sum'],
+                         row['value_min'], row['value_max'])
+        return 'pyarrow'
+
+    def _fetch(self, query, partials, engines):
+        """Partials of one query from every source"""
+        engines['hot'] = self._hot_partials(query, partials)
+        sealed = self._sealed_partials(query, partials)
+        if sealed:
+            engines['sealed'] = sealed
+        cold = self._cold_partials(query, partials)
+        if cold:
+            engines['cold'] = cold
+
+    def aggregate(self, query):
+        """Run an AggregateQuery; returns (rows, info about the engines used)"""
+        started = time.perf_counter()
+        partials = Partials()
+        engines = {}
+        cache = None
+        if self.cache_entries and query.interval != 'none' and query.t0:
+            cache = self._cached_aggregate(query, partials, engines)
+        else:
+            self._fetch(query, partials, engines)
+        info = {
+            'engines': engines,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000.0, 2),
+        }
+        if cache is not None:
+            info['cache'] = cache
+        return partials.rows(query.metric), info
+
+    # ----- bucket cache -----
+
+    def _cached_aggregate(self, query, partials, engines):
+        """Ended buckets from the cache, the partial first and the current bucket from storage"""
+        self._take_dirty()
+        interval = query.interval
+        lo = to_epoch(query.t0)
+        hi = to_epoch(query.t1) if query.t1 else None
+        first = bucket_floor(interval, lo)
+        if first < lo:
+            first = bucket_next(interval, first)
+        end = bucket_floor(interval, time.time())  # the current bucket is still filling
+        if hi is not None:
+            end = min(end, bucket_floor(interval, hi + 1))
+        if first >= end:
+            self._fetch(query, partials, engines)
+            return {'buckets': 0, 'cached': 0, 'scanned': 0}
+        starts = []
+        start = first
+        while start < end:
+            starts.append(start)
+            start = bucket_next(interval, start)
+
+        key = query.cache_key()
+        sequence = self.dirty.sequence if self.dirty else 0
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                entry = self._cache[key] = {}
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.move_to_end(key)
+            cached = {start: entry[start] for start in starts if start in entry}
+        missing = [start for start in starts if start not in cached]
+
+        if lo < first:
+            self._fetch(query.narrowed(lo, first - 1), partials, engines)
+        if hi is None or hi >= end:
+            self._fetch(query.narrowed(end, hi), partials, engines)
+        fetched = self._fetch_buckets(query, missing, engines)
+        for buckets in (cached, fetched):
+            for start, groups in buckets.items():
+                label = from_epoch(start)
+                for node_id, values in groups.items():
+                    partials.add(label, node_id, *values)
+        self._store(key, fetched, sequence)
+        with self._cache_lock:
+            self.bucket_hits += len(cached)
+            self.bucket_scans += len(missing)
+        return {'buckets': len(starts), 'cached': len(cached), 'scanned': len(missing)}
+
+    def _fetch_buckets(self, query, starts, engines):
+        """{start: {node: partials}} of whole buckets, one query per run of consecutive buckets"""
+        fetched = {}
+        run = []
+        for start in sorted(starts) + [None]:
+            if run and (start is None or start != bucket_next(query.interval, run[-1])):
+                partials = Partials()
+                self._fetch(query.narrowed(run[0], bucket_next(query.interval, run[-1]) - 1), partials, engines)
+                for bucket in run:
+                    fetched[bucket] = {}
+                for (label, node_id), values in partials.groups.items():
+                    fetched.setdefault(int(to_epoch(label)), {})[node_id] = values
+                run = []
+            if start is not None:
+                run.append(start)
+        return fetched
+
+    def _store(self, key, fetched, sequence):
+        """Cache freshly scanned buckets unless a late reading landed while they were being read"""
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None or (self.dirty and self.dirty.sequence != sequence):
+                return
+            entry.update(fetched)
+
+    def _take_dirty(self):
+        """Drop cached buckets late readings changed; returns {key: bucket starts dropped}"""
+        if self.dirty is None:
+            return {}
+        marks = self.dirty.take('analytics')
+        dropped = {}
+        with self._cache_lock:
+            if marks is None:
+                self._cache.clear()
+                return {}
+            for key, entry in self._cache.items():
+                _, interval, _, node_id = key
+                for node, hour in marks:
+                    if node_id is not None and node != str(node_id):
+                        continue
+                    start = bucket_floor(interval, hour)
+                    if entry.pop(start, None) is not None:
+                        dropped.setdefault(key, set()).add(start)
+        return dropped
+
+    def refresh(self):
+        """Recompute only the cached buckets late readings changed (background pass); returns the count"""
+        recomputed = 0
+        for key, starts in self._take_dirty().items():
+            field, interval, group_by, node_id = key
+            sequence = self.dirty.sequence
+            fetched = self._fetch_buckets(AggregateQuery(field, interval, group_by, node_id), starts, {})
+            self._store(key, fetched, sequence)
+            recomputed += len(starts)
+        with self._cache_lock:
+            self.recomputed += recomputed
+        return recomputed
+
+    def clear_cache(self):
+        """Forget every cached bucket (rows moved between tiers mid-scan could be counted twice)"""
+        with self._cache_lock:
+            self._cache.clear()
+
+    def cache_metrics(self):
+        with self._cache_lock:
+            lookups = self.bucket_hits + self.bucket_scans
+            return {
+                'entries': len(self._cache),
+                'max_entries': self.cache_entries,
+                'buckets': sum(len(entry) for entry in self._cache.values()),
+                'bucket_hits': self.bucket_hits,
+                'bucket_scans': self.bucket_scans,
+                'hit_ratio': round(self.bucket_hits / lookups, 4) if lookups else None,
+                'recomputed': self.recomputed,
+            }
@@ -1,19 +1,39 @@
 # app.py - Complete Flask API with Timezone Support
-from flask import Flask, request, jsonify, render_template_string, render_template, session, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template_string, render_template, session, send_from_directory
 from datetime import datetime
-import pytz
-import sqlite3
+import atexit
 import json
 import os
 from functools import wraps
 import sys
 import logging
+import threading
+import time
 
+from contextlib import nullcontext
 from pathlib import Path
 
+from admission import IngestAdmission
+from udp_ingest import UDPIngestListener
+from snapshot import SnapshotReader
+from storage import Reading, hours_ago, open_storage
+from analytics import AggregateQuery, Analytics
+from recent_cache import RecentCache
+from node_stats import StreamingStats, parse_windows
+from battery import BatteryForecaster
+from liveness import LivenessTracker
+from alerts import DEFAULT_RULES, AlertEngine, Rule, WebhookSink, load_rules
+from derived import derive_columns, derive_one, fill_reading
+from gateway_merge import GatewayMerge
+from late_data import DirtyBuckets, sort_readings, split_backdated
+from deadband import FILLS, DeadbandFilter
+from deadband import load_rules as load_deadband_rules
+from backup import BackupManager
+from profiling import RequestProfiler, StackSampler
+
 def ensure_database_directory():
     """Ensure the database directory exists and is writable"""
-    db_path = Path("/app/data")
+    db_path = Path(os.path.dirname(DATABASE_PATH) or '.')
     db_path.mkdir(parents=True, exist_ok=True)
     
     # Ensure the directory is writable
@@ -26,6 +46,200 @@ app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
 # Configuration
 DATABASE_PATH = os.environ.get('DATABASE_PATH', '/app/data/lora_sensors.db')
 CONFIG_PATH = os.environ.get('CONFIG_PATH', '/app/config/settings.json')
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'sqlite')
+# STORAGE_ENGINE=clustered: WITHOUT ROWID table keyed on (node_id, time); convert with tools/migrate_clustered.py
+# STORAGE_ENGINE=sharded: readings split across this many files by node (tools/rebalance_shards.py changes it)
+STORAGE_SHARDS = int(os.environ.get('STORAGE_SHARDS', 4))
+# STORAGE_ENGINE=blocks: each node's readings are sealed into one compressed block per window,
+# BLOCK_SEAL_AFTER_HOURS after the window closes (late readings arriving before then are free)
+BLOCK_WINDOW_HOURS = float(os.environ.get('BLOCK_WINDOW_HOURS', 24))
+BLOCK_SEAL_AFTER_HOURS = float(os.environ.get('BLOCK_SEAL_AFTER_HOURS', 6))
+BLOCK_SEAL_INTERVAL_MINUTES = float(os.environ.get('BLOCK_SEAL_INTERVAL_MINUTES', 60))
+DEBUG_LOG_PATH = os.environ.get('DEBUG_LOG_PATH', '/app/debug.log')
+
+# Ingest admission control (smooths the 15-minute gateway upload bursts)
+INGEST_ADMISSION = os.environ.get('INGEST_ADMISSION', 'true').lower() == 'true'
+INGEST_RATE_PER_GATEWAY = float(os.environ.get('INGEST_RATE_PER_GATEWAY', 2.0))
+INGEST_BURST_PER_GATEWAY = float(os.environ.get('INGEST_BURST_PER_GATEWAY', 120))
+# Sharded storage has a writer per shard file, so as many writes can commit at once
+INGEST_MAX_WRITERS = int(os.environ.get('INGEST_MAX_WRITERS', STORAGE_SHARDS if STORAGE_ENGINE == 'sharded' else 2))
+INGEST_WRITER_TIMEOUT = float(os.environ.get('INGEST_WRITER_TIMEOUT', 5.0))
+INGEST_RETRY_JITTER = float(os.environ.get('INGEST_RETRY_JITTER', 2.0))
+
+# Optional Parquet cold tier (needs pyarrow): readings older than COLD_TIER_AFTER_DAYS move out of SQLite
+COLD_STORAGE_PATH = os.environ.get('COLD_STORAGE_PATH', '')
+COLD_TIER_AFTER_DAYS = float(os.environ.get('COLD_TIER_AFTER_DAYS', 90))
+COLD_TIER_INTERVAL_HOURS = float(os.environ.get('COLD_TIER_INTERVAL_HOURS', 24))
+
+storage_options = {}
+if STORAGE_ENGINE == 'sharded':
+    storage_options = {'shards': STORAGE_SHARDS}
+elif STORAGE_ENGINE == 'blocks':
+    storage_options = {'block_seconds': int(BLOCK_WINDOW_HOURS * 3600), 'seal_after': BLOCK_SEAL_AFTER_HOURS * 3600}
+storage = open_storage(DATABASE_PATH, schema='sensor_data', engine=STORAGE_ENGINE,
+                       cold_path=COLD_STORAGE_PATH or None, **storage_options)
+
+ingest_admission = IngestAdmission(
+    rate=INGEST_RATE_PER_GATEWAY,
+    burst=INGEST_BURST_PER_GATEWAY,
+    max_writers=INGEST_MAX_WRITERS,
+    writer_timeout=INGEST_WRITER_TIMEOUT,
+    retry_jitter=INGEST_RETRY_JITTER,
+    enabled=INGEST_ADMISSION
+)
+
+# Optional UDP datagram ingest (disabled unless a port and key are set)
+UDP_INGEST_PORT = int(os.environ.get('UDP_INGEST_PORT', 0))
+UDP_INGEST_KEY = os.environ.get('UDP_INGEST_KEY', '')
+UDP_INGEST_BATCH = int(os.environ.get('UDP_INGEST_BATCH', 64))
+UDP_INGEST_LINGER_MS = int(os.environ.get('UDP_INGEST_LINGER_MS', 0))
+
+udp_listener = None
+
+# Overlapping gateways: copies of one packet are held MERGE_WINDOW_MS and stored once (0 stores every copy)
+MERGE_WINDOW_MS = int(os.environ.get('MERGE_WINDOW_MS', 2000))
+MERGE_LATE_SECONDS = float(os.environ.get('MERGE_LATE_SECONDS', 120))
+MERGE_MAX_PENDING = int(os.environ.get('MERGE_MAX_PENDING', 10000))
+
+# Long-range aggregates: auto (DuckDB when installed), duckdb or sqlite
+ANALYTICS_ENGINE = os.environ.get('ANALYTICS_ENGINE', 'auto').lower()
+
+# Late readings (a gateway's backlog after an outage): uploads older than LATE_AFTER_SECONDS skip the
+# merge window for a sorted bulk insert, and mark their hour dirty for the aggregate cache
+LATE_AFTER_SECONDS = float(os.environ.get('LATE_AFTER_SECONDS', 900))
+LATE_RECOMPUTE_SECONDS = float(os.environ.get('LATE_RECOMPUTE_SECONDS', 30))
+# Aggregate queries cached per bucket once the bucket has ended (0 disables)
+ANALYTICS_CACHE_ENTRIES = int(os.environ.get('ANALYTICS_CACHE_ENTRIES', 64))
+
+dirty_buckets = DirtyBuckets()
+analytics = Analytics(storage, DATABASE_PATH, ANALYTICS_ENGINE, dirty_buckets, ANALYTICS_CACHE_ENTRIES)
+
+# In-memory window of recent readings serving /latest, short /history and /network/stats (0 disables)
+RECENT_CACHE_HOURS = float(os.environ.get('RECENT_CACHE_HOURS', 72))
+
+recent_cache = RecentCache(RECENT_CACHE_HOURS) if RECENT_CACHE_HOURS > 0 else None
+
+# Streaming per-node statistics behind /api/nodes/<id>/stats (no windows and no half-life disables)
+NODE_STATS_WINDOWS = parse_windows(os.environ.get('NODE_STATS_WINDOWS', '1h,24h,7d'))
+NODE_STATS_HALF_LIFE_HOURS = float(os.environ.get('NODE_STATS_HALF_LIFE_HOURS', 6))
+NODE_STATS_CHECKPOINT_PATH = os.environ.get(
+    'NODE_STATS_CHECKPOINT_PATH', os.path.join(os.path.dirname(DATABASE_PATH), 'node_stats.json'))
+NODE_STATS_CHECKPOINT_SECONDS = float(os.environ.get('NODE_STATS_CHECKPOINT_SECONDS', 300))
+
+node_stats = None
+if NODE_STATS_WINDOWS or NODE_STATS_HALF_LIFE_HOURS > 0:
+    node_stats = StreamingStats(NODE_STATS_WINDOWS, NODE_STATS_HALF_LIFE_HOURS,
+                                checkpoint_path=NODE_STATS_CHECKPOINT_PATH)
+
+# Battery depletion forecasts behind /api/nodes/<id>/battery (checkpointed with node stats)
+BATTERY_FORECAST = os.environ.get('BATTERY_FORECAST', 'true').lower() == 'true'
+BATTERY_CUTOFF_V = float(os.environ.get('BATTERY_CUTOFF_V', 3.3))
+BATTERY_HALF_LIFE_DAYS = float(os.environ.get('BATTERY_HALF_LIFE_DAYS', 7))
+BATTERY_LOOKBACK_DAYS = float(os.environ.get('BATTERY_LOOKBACK_DAYS', 30))
+BATTERY_CHECKPOINT_PATH = os.environ.get(
+    'BATTERY_CHECKPOINT_PATH', os.path.join(os.path.dirname(DATABASE_PATH), 'battery_forecast.json'))
+
+battery_forecaster = None
+if BATTERY_FORECAST:
+    battery_forecaster = BatteryForecaster(BATTERY_CUTOFF_V, BATTERY_HALF_LIFE_DAYS, BATTERY_LOOKBACK_DAYS,
+                                           checkpoint_path=BATTERY_CHECKPOINT_PATH)
+
+# Node liveness from each node's report cadence: online -> stale -> offline as deadlines pass
+LIVENESS_TRACKING = os.environ.get('LIVENESS_TRACKING', 'true').lower() == 'true'
+LIVENESS_DEFAULT_CADENCE_SECONDS = float(os.environ.get('LIVENESS_DEFAULT_CADENCE_SECONDS', 900))
+LIVENESS_STALE_FACTOR = float(os.environ.get('LIVENESS_STALE_FACTOR', 1.5))
+LIVENESS_OFFLINE_FACTOR = float(os.environ.get('LIVENESS_OFFLINE_FACTOR', 4))
+LIVENESS_TICK_SECONDS = float(os.environ.get('LIVENESS_TICK_SECONDS', 5))
+LIVENESS_WARM_HOURS = float(os.environ.get('LIVENESS_WARM_HOURS', 6))
+
+liveness = None
+if LIVENESS_TRACKING:
+    liveness = LivenessTracker(storage, LIVENESS_DEFAULT_CADENCE_SECONDS, LIVENESS_STALE_FACTOR,
+                               LIVENESS_OFFLINE_FACTOR)
+
+# Site altitude for sea-level pressure in derived metrics
+ALTITUDE_M = float(os.environ.get('ALTITUDE_M', 0))
+
+# Alert rules evaluated on ingest (JSON list of rules; the built-in defaults when the file is missing)
+ALERT_RULES_PATH = os.environ.get('ALERT_RULES_PATH', os.path.join(os.path.dirname(CONFIG_PATH), 'alert_rules.json'))
+ALERT_WEBHOOK_URL = os.environ.get('ALERT_WEBHOOK_URL', '')
+ALERT_STALE_CHECK_SECONDS = float(os.environ.get('ALERT_STALE_CHECK_SECONDS', 60))
+
+try:
+    alert_rules = load_rules(ALERT_RULES_PATH)
+except (OSError, ValueError) as e:
+    print(f"Error loading alert rules from {ALERT_RULES_PATH}: {e} - using defaults")
+    alert_rules = [Rule.from_dict(spec) for spec in DEFAULT_RULES]
+
+alert_engine = AlertEngine(alert_rules, storage, [WebhookSink(ALERT_WEBHOOK_URL)] if ALERT_WEBHOOK_URL else [],
+                           LATE_AFTER_SECONDS)
+
+# Per-node deadband / swinging-door compression of live readings (JSON list of rules; off when the file is
+# missing). Held readings whose heartbeat is due are stored every DEADBAND_FLUSH_SECONDS
+DEADBAND_RULES_PATH = os.environ.get('DEADBAND_RULES_PATH', os.path.join(os.path.dirname(CONFIG_PATH), 'deadband.json'))
+DEADBAND_FLUSH_SECONDS = float(os.environ.get('DEADBAND_FLUSH_SECONDS', 60))
+
+try:
+    deadband_rules = load_deadband_rules(DEADBAND_RULES_PATH)
+except (OSError, ValueError) as e:
+    print(f"Error loading deadband rules from {DEADBAND_RULES_PATH}: {e} - compression off")
+    deadband_rules = []
+
+deadband = DeadbandFilter(deadband_rules) if deadband_rules else None
+
+# Startup warm-up (recent cache, optional page cache pre-read): background serves /health at once
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', 'background').lower()
+PREWARM_PAGE_CACHE = os.environ.get('PREWARM_PAGE_CACHE', 'false').lower() == 'true'
+PREWARM_MAX_MB = int(os.environ.get('PREWARM_MAX_MB', 256))
+
+# Callbacks that receive every batch of readings after it is stored (they mirror the table)
+reading_listeners = []
+if recent_cache:
+    reading_listeners.append(recent_cache.append)
+if node_stats:
+    reading_listeners.append(node_stats.append)
+if battery_forecaster:
+    reading_listeners.append(battery_forecaster.append)
+reading_listeners.append(dirty_buckets.observe)
+# Callbacks that receive every reading as it arrives, including those the deadband filter doesn't store
+arrival_listeners = []
+if liveness:
+    arrival_listeners.append(liveness.observe)
+arrival_listeners.append(alert_engine.process)
+
+# Optional read path for dashboard queries: off, memory (backup-API copy) or wal (read-only connections)
+READ_SNAPSHOT_MODE = os.environ.get('READ_SNAPSHOT_MODE', 'off').lower()
+READ_SNAPSHOT_INTERVAL = float(os.environ.get('READ_SNAPSHOT_INTERVAL', 30))
+
+read_snapshot = None
+
+# Scheduled online backups (BACKUP_DIR unset disables): snapshots taken with the SQLite backup API
+# in BACKUP_STEP_PAGES steps, BACKUP_KEEP newest kept; restore with tools/backup_db.py
+BACKUP_DIR = os.environ.get('BACKUP_DIR', '')
+BACKUP_INTERVAL_HOURS = float(os.environ.get('BACKUP_INTERVAL_HOURS', 24))
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 7))
+BACKUP_COMPRESS = os.environ.get('BACKUP_COMPRESS', 'false').lower() == 'true'
+BACKUP_STEP_PAGES = int(os.environ.get('BACKUP_STEP_PAGES', 256))
+BACKUP_STEP_SLEEP_MS = float(os.environ.get('BACKUP_STEP_SLEEP_MS', 10))
+
+backups = None
+if BACKUP_DIR:
+    backups = BackupManager(DATABASE_PATH, BACKUP_DIR, keep=BACKUP_KEEP, compress=BACKUP_COMPRESS,
+                            step_pages=BACKUP_STEP_PAGES, step_sleep=BACKUP_STEP_SLEEP_MS / 1000.0)
+
+# Profiling, all off by default: PROFILE_ENDPOINTS profiles every request to those view functions
+# ('all' for every one), PROFILE_HEADER honours an X-Profile: cprofile|sample request header, and
+# PROFILE_SAMPLER_HZ runs the background stack sampler; results under /debug/profile
+PROFILE_ENDPOINTS = [e.strip() for e in os.environ.get('PROFILE_ENDPOINTS', '').split(',') if e.strip()]
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile').lower()
+PROFILE_HEADER = os.environ.get('PROFILE_HEADER', 'false').lower() == 'true'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(DATABASE_PATH), 'profiles'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+PROFILE_SAMPLER_HZ = float(os.environ.get('PROFILE_SAMPLER_HZ', 0))
+
+request_profiler = RequestProfiler(PROFILE_DIR, PROFILE_ENDPOINTS, PROFILE_MODE, PROFILE_HEADER, keep=PROFILE_KEEP)
+request_profiler.install(app)
+profile_sampler = StackSampler(1.0 / PROFILE_SAMPLER_HZ) if PROFILE_SAMPLER_HZ > 0 else None
 
 # Default settings
 DEFAULT_SETTINGS = {
@@ -69,6 +283,8 @@ def get_user_timezone():
 
 def format_timestamp_for_user(utc_timestamp, timezone_str=None):
     """Convert UTC timestamp to user's timezone"""
+    # Imported on first use: nothing at startup needs pytz
+    import pytz
     if timezone_str is None:
         timezone_str = get_user_timezone()
 
@@ -106,44 +322,271 @@ def format_timestamp_for_user(utc_timestamp, timezone_str=None):
 def init_database():
     """Initialize SQLite database"""
     try:
-        ensure_database_directory()
-        os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        # Create sensor_data table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sensor_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                node_id TEXT NOT NULL,
-                temperature REAL,
-                humidity REAL,
-                pressure REAL,
-                battery_voltage REAL,
-                rssi INTEGER,
-                snr REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Create settings table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        conn.commit()
-        conn.close()
-        print("Database initialized successfully")
+        if not os.path.exists(DATABASE_PATH):
+            ensure_database_directory()
+        version = storage.initialize()
+        print(f"Database initialized successfully (schema version {version})")
+        # Pick up where the last run left off: newest reading per node, alerts still firing
+        latest = storage.latest()
+        alert_engine.prime(latest, storage.open_alerts())
+        if deadband:
+            deadband.prime(latest)
+        start_warmup()
         return True
     except Exception as e:
         print(f"Database initialization error: {e}")
         return False
 
+def warm_caches():
+    """Pre-read the database file if enabled, then fill the recent-readings cache"""
+    try:
+        if PREWARM_PAGE_CACHE:
+            started = time.time()
+            requested = storage.prewarm(PREWARM_MAX_MB * 1024 * 1024)
+            print(f"🔥 Page cache pre-warm: {requested / 1e6:.1f} MB in {time.time() - started:.2f}s")
+        if recent_cache:
+            elapsed = recent_cache.warm(storage)
+            metrics = recent_cache.metrics()
+            print(f"🧠 Recent cache: {metrics['readings']} readings from {metrics['nodes']} nodes "
+                  f"({metrics['memory_bytes'] / 1024:.0f} KiB, {RECENT_CACHE_HOURS:g}h window) in {elapsed:.2f}s")
+    except Exception as e:
+        print(f"Cache warm-up error: {e}")
+    if node_stats:
+        try:
+            started = time.time()
+            source, applied = node_stats.warm(storage)
+            print(f"📈 Node stats: {len(node_stats.node_ids())} nodes from {source} "
+                  f"(+{applied} readings) in {time.time() - started:.2f}s")
+        except Exception as e:
+            print(f"Node stats warm-up error: {e}")
+    if battery_forecaster:
+        try:
+            started = time.time()
+            source, applied = battery_forecaster.warm(storage)
+            print(f"🔋 Battery forecasts: {len(battery_forecaster.node_ids())} nodes from {source} "
+                  f"(+{applied} readings) in {time.time() - started:.2f}s")
+        except Exception as e:
+            print(f"Battery forecast warm-up error: {e}")
+    if liveness:
+        try:
+            liveness.warm(LIVENESS_WARM_HOURS)
+            counts = liveness.counts()
+            print(f"💓 Liveness: {counts['online']} online, {counts['stale']} stale, {counts['offline']} offline")
+        except Exception as e:
+            print(f"Liveness warm-up error: {e}")
+
+def start_warmup():
+    """Warm caches inline (STARTUP_WARMUP=blocking) or next to the server (background)"""
+    if STARTUP_WARMUP == 'blocking':
+        warm_caches()
+        return None
+    # Until the recent cache is ready, reads fall back to SQLite
+    thread = threading.Thread(target=warm_caches, name='cache-warmup', daemon=True)
+    thread.start()
+    return thread
+
+def checkpointed_state():
+    """In-memory per-node state that checkpoints to disk (node statistics, battery forecasts)"""
+    return [state for state in (node_stats, battery_forecaster) if state and state.checkpoint_path]
+
+def node_stats_checkpoint_loop():
+    """Checkpoint node statistics and battery forecasts every NODE_STATS_CHECKPOINT_SECONDS"""
+    while True:
+        time.sleep(NODE_STATS_CHECKPOINT_SECONDS)
+        for state in checkpointed_state():
+            try:
+                state.checkpoint()
+            except Exception as e:
+                print(f"Checkpoint error ({state.checkpoint_path}): {e}")
+
+def start_node_stats_checkpoints():
+    """Start the checkpoint thread if node statistics or battery forecasts are enabled"""
+    states = checkpointed_state()
+    if not states or NODE_STATS_CHECKPOINT_SECONDS <= 0:
+        return None
+    thread = threading.Thread(target=node_stats_checkpoint_loop, name='node-stats-checkpoint', daemon=True)
+    thread.start()
+    # One more on a clean shutdown, so a restart picks up where this process stopped
+    for state in states:
+        atexit.register(state.checkpoint)
+    return thread
+
+def alert_stale_loop():
+    """Fire stale-node rules every ALERT_STALE_CHECK_SECONDS"""
+    while True:
+        time.sleep(ALERT_STALE_CHECK_SECONDS)
+        try:
+            alert_engine.check_stale()
+        except Exception as e:
+            print(f"Stale node check error: {e}")
+
+def start_alerts():
+    """Start the stale-node sweep if any stale rule is configured"""
+    print(f"🔔 Alert rules: {len(alert_engine.rules)} ({ALERT_RULES_PATH})"
+          + (f", webhook {ALERT_WEBHOOK_URL}" if ALERT_WEBHOOK_URL else ""))
+    if not alert_engine.stale_rules or ALERT_STALE_CHECK_SECONDS <= 0:
+        return None
+    thread = threading.Thread(target=alert_stale_loop, name='alert-stale-check', daemon=True)
+    thread.start()
+    return thread
+
+def liveness_loop():
+    """Apply passed report deadlines every LIVENESS_TICK_SECONDS"""
+    while True:
+        time.sleep(LIVENESS_TICK_SECONDS)
+        try:
+            liveness.tick()
+        except Exception as e:
+            print(f"Liveness tick error: {e}")
+
+def start_liveness():
+    """Start the deadline thread if liveness tracking is enabled"""
+    if not liveness or LIVENESS_TICK_SECONDS <= 0:
+        return None
+    thread = threading.Thread(target=liveness_loop, name='liveness', daemon=True)
+    thread.start()
+    return thread
+
+def late_recompute_loop():
+    """Recompute the cached aggregate buckets late readings changed every LATE_RECOMPUTE_SECONDS"""
+    while True:
+        time.sleep(LATE_RECOMPUTE_SECONDS)
+        try:
+            analytics.refresh()
+        except Exception as e:
+            print(f"Late bucket recompute error: {e}")
+
+def start_late_recompute():
+    """Start the dirty-bucket pass if the aggregate cache is enabled"""
+    if not analytics.cache_entries or LATE_RECOMPUTE_SECONDS <= 0:
+        return None
+    thread = threading.Thread(target=late_recompute_loop, name='late-recompute', daemon=True)
+    thread.start()
+    return thread
+
+def start_read_snapshot():
+    """Serve read endpoints from a snapshot if READ_SNAPSHOT_MODE is set"""
+    global read_snapshot
+    if READ_SNAPSHOT_MODE == 'off':
+        return None
+    if STORAGE_ENGINE == 'sharded':
+        # Fan-out reads already spread over one file per shard; a snapshot copies a single file
+        print("📸 READ_SNAPSHOT_MODE is ignored with STORAGE_ENGINE=sharded")
+        return None
+    read_snapshot = SnapshotReader(DATABASE_PATH, READ_SNAPSHOT_MODE, READ_SNAPSHOT_INTERVAL).start()
+    storage.read_connector = read_snapshot.connect
+    if READ_SNAPSHOT_MODE == 'memory':
+        # A bucket recomputed from a copy older than its late readings would stay cached without them
+        analytics.cache_entries = 0
+    print(f"📸 Read snapshot mode: {READ_SNAPSHOT_MODE} (refresh every {READ_SNAPSHOT_INTERVAL}s)")
+    return read_snapshot
+
+def cold_tiering_loop():
+    """Move readings older than COLD_TIER_AFTER_DAYS to the cold tier every COLD_TIER_INTERVAL_HOURS"""
+    while True:
+        try:
+            moved = storage.tier_out(hours_ago(COLD_TIER_AFTER_DAYS * 24))
+            if moved:
+                # An aggregate scanned mid-move may have seen those rows in both tiers
+                analytics.clear_cache()
+                print(f"🧊 Moved {moved} readings to the cold tier")
+        except Exception as e:
+            print(f"Cold tiering error: {e}")
+        time.sleep(COLD_TIER_INTERVAL_HOURS * 3600)
+
+def start_cold_tiering():
+    """Start the tiering thread if COLD_STORAGE_PATH is set"""
+    if not COLD_STORAGE_PATH:
+        return None
+    thread = threading.Thread(target=cold_tiering_loop, name='cold-tiering', daemon=True)
+    thread.start()
+    print(f"🧊 Cold tier: {COLD_STORAGE_PATH} (after {COLD_TIER_AFTER_DAYS:g} days)")
+    return thread
+
+def block_seal_loop():
+    """Seal closed windows into compressed blocks every BLOCK_SEAL_INTERVAL_MINUTES"""
+    while True:
+        try:
+            started = time.time()
+            sealed = storage.seal()
+            if sealed:
+                # An aggregate scanned mid-seal may have seen those rows in both the table and a block
+                analytics.clear_cache()
+                print(f"🧱 Sealed {sealed} readings into blocks in {time.time() - started:.1f}s")
+        except Exception as e:
+            print(f"Block sealing error: {e}")
+        time.sleep(BLOCK_SEAL_INTERVAL_MINUTES * 60)
+
+def start_block_sealing():
+    """Start the sealing thread if STORAGE_ENGINE=blocks"""
+    if STORAGE_ENGINE != 'blocks':
+        return None
+    thread = threading.Thread(target=block_seal_loop, name='block-seal', daemon=True)
+    thread.start()
+    print(f"🧱 Block storage: {BLOCK_WINDOW_HOURS:g}h windows sealed {BLOCK_SEAL_AFTER_HOURS:g}h after they close")
+    return thread
+
+def deadband_flush_loop():
+    """Store swinging-door readings held past their heartbeat every DEADBAND_FLUSH_SECONDS"""
+    while True:
+        time.sleep(DEADBAND_FLUSH_SECONDS)
+        try:
+            flush_deadband()
+        except Exception as e:
+            print(f"Deadband flush error: {e}")
+
+def start_deadband():
+    """Start the heartbeat flush thread if deadband rules are configured"""
+    if not deadband:
+        return None
+    # Whatever is still held when the process stops
+    atexit.register(flush_deadband, True)
+    modes = sorted({rule.mode for rule in deadband_rules})
+    print(f"🗜️ Deadband compression: {len(deadband_rules)} rules ({', '.join(modes)}) from {DEADBAND_RULES_PATH}")
+    if DEADBAND_FLUSH_SECONDS <= 0:
+        return None
+    thread = threading.Thread(target=deadband_flush_loop, name='deadband-flush', daemon=True)
+    thread.start()
+    return thread
+
+def take_backup():
+    """One snapshot, logged; returns its manifest or None on failure"""
+    try:
+        manifest = backups.backup()
+        print(f"💾 Backup {manifest['name']}: {manifest['bytes'] / 1e6:.1f} MB in {manifest['duration_seconds']:.1f}s, "
+              f"longest writer stall {manifest['writer_stall_max_ms']:.1f}ms")
+        return manifest
+    except Exception as e:
+        print(f"Backup error: {e}")
+        return None
+
+def backup_loop():
+    """Take a snapshot every BACKUP_INTERVAL_HOURS"""
+    while True:
+        time.sleep(BACKUP_INTERVAL_HOURS * 3600)
+        take_backup()
+
+def start_backups():
+    """Start the backup thread if BACKUP_DIR is set"""
+    if not backups or BACKUP_INTERVAL_HOURS <= 0:
+        return None
+    thread = threading.Thread(target=backup_loop, name='backup', daemon=True)
+    thread.start()
+    print(f"💾 Backups: {BACKUP_DIR} every {BACKUP_INTERVAL_HOURS:g}h, keeping {BACKUP_KEEP}")
+    return thread
+
+def start_profile_sampler():
+    """Start the background stack sampler if PROFILE_SAMPLER_HZ is set"""
+    if not profile_sampler:
+        return None
+    profile_sampler.start()
+    print(f"🔬 Stack sampler: {PROFILE_SAMPLER_HZ:g} Hz, hot functions at /debug/profile")
+    return profile_sampler
+
+def snapshot_info(cached=False):
+    """Staleness of the data behind a read endpoint, or None when it came from the live file or recent_cache"""
+    return read_snapshot.staleness() if read_snapshot and not cached else None
+
 # API Routes
 
 @app.route('/static/<path:filename>')
@@ -187,6 +630,7 @@ def update_settings():
         # Handle timezone settings (existing functionality)
         if 'timezone' in data:
             timezone_str = data.get('timezone', 'UTC')
+            import pytz
             try:
                 pytz.timezone(timezone_str)
                 settings['timezone'] = timezone_str
@@ -272,7 +716,7 @@ def receive_sensor_data():
         app.logger.info(f"lastUpdate field: {gateway_timestamp}")
 
         # Write to file for debugging
-        with open('/app/debug.log', 'a') as f:
+        with open(DEBUG_LOG_PATH, 'a') as f:
             f.write(f"=== {datetime.utcnow()} ===\n")
             f.write(f"Gateway lastUpdate: {gateway_timestamp}\n")
 
@@ -281,52 +725,23 @@ def receive_sensor_data():
         print(f"Backend received request at: {receive_time.strftime('%H:%M:%S')}")
         print(f"Gateway lastUpdate: {gateway_timestamp}")
 
-        # Extract sensor data
-        node_id = data.get('node_id')
-        temperature = data.get('temperature_f')
-        humidity = data.get('humidity')
-        pressure = data.get('pressure_hpa')
-        battery_voltage = data.get('battery_voltage')
-        rssi = data.get('rssi')
-        snr = data.get('snr')
-
-        # Convert F to C for database storage
-        if temperature:
-            temperature = (temperature - 32) * 5/9
-
-        # Store in database with original timestamp
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        if gateway_timestamp:
-            # Convert gateway timestamp format to SQLite format
-            try:
-                dt = datetime.strptime(gateway_timestamp, "%Y-%m-%d  %H:%M:%S")
-                sqlite_timestamp = dt.strftime("%Y-%m-%d  %H:%M:%S")
-            except:
-                sqlite_timestamp = gateway_timestamp
-
-            cursor.execute('''
-                INSERT INTO sensor_data
-                (node_id, temperature, humidity, pressure, battery_voltage, rssi, snr, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (node_id, temperature, humidity, pressure, battery_voltage, rssi, snr, sqlite_timestamp))
-        else:
-            print("No gateway timestamp, using server time")
-            cursor.execute('''
-                INSERT INTO sensor_data
-                (node_id, temperature, humidity, pressure, battery_voltage, rssi, snr)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (node_id, temperature, humidity, pressure, battery_voltage, rssi, snr))
+        # Per-gateway rate limit before touching the database
+        gateway_key = data.get('gateway_id') or data.get('gateway_ip') or request.remote_addr
+        allowed, retry_after = ingest_admission.admit(gateway_key)
+        if not allowed:
+            return ingest_rejected(retry_after, 'Gateway rate limit exceeded')
 
-        conn.commit()
+        if not gateway_timestamp:
+            print("No gateway timestamp, using server time")
 
-        # Verify what was actually stored
-        cursor.execute('SELECT timestamp FROM sensor_data WHERE id = last_insert_rowid()')
-        stored_timestamp = cursor.fetchone()[0]
-        print(f"Actually stored in DB: {stored_timestamp}")
+        # Checked before the merge window: a held reading has already been answered 200
+        try:
+            reading = reading_from_payload(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        conn.close()
+        if not ingest_readings([reading], gateway_key):
+            return ingest_rejected(ingest_admission.retry_after_hint(1.0), 'Database writers busy')
 
         return jsonify({
             'success': True,
@@ -340,59 +755,429 @@ def receive_sensor_data():
         print(f"Error in receive_sensor_data: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/sensor-data/batch', methods=['POST'])
+def receive_sensor_data_batch():
+    """Many readings in one upload (a JSON list, or {"readings": [...]}): a gateway's backlog after an outage"""
+    try:
+        data = request.get_json()
+        payloads = data.get('readings') if isinstance(data, dict) else data
+        if not isinstance(payloads, list) or not all(isinstance(p, dict) for p in payloads):
+            return jsonify({'error': 'Expected a list of readings'}), 400
+
+        first = payloads[0] if payloads else {}
+        gateway_key = first.get('gateway_id') or first.get('gateway_ip') or request.remote_addr
+        allowed, retry_after = ingest_admission.admit(gateway_key)
+        if not allowed:
+            return ingest_rejected(retry_after, 'Gateway rate limit exceeded')
+
+        try:
+            readings = [reading_from_payload(p) for p in payloads]
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not ingest_batch(readings, gateway_key):
+            return ingest_rejected(ingest_admission.retry_after_hint(1.0), 'Database writers busy')
+
+        return jsonify({
+            'success': True,
+            'message': 'Sensor data received',
+            'count': len(readings)
+        })
+
+    except Exception as e:
+        print(f"Error in receive_sensor_data_batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def reading_from_payload(data):
+    """Map a gateway JSON document onto a canonical storage reading; ValueError if it can't be stored"""
+    if data.get('node_id') in (None, ''):
+        raise ValueError('Missing required field: node_id')
+    temperature = data.get('temperature_f')
+
+    # Convert F to C for database storage
+    if temperature:
+        temperature = (temperature - 32) * 5/9
+
+    # Storage normalizes the gateway's timestamp; readings without one get server time
+    return fill_reading(Reading(
+        node_id=data.get('node_id'),
+        timestamp=data.get('timestamp'),
+        temperature_c=temperature,
+        humidity=data.get('humidity'),
+        pressure_hpa=data.get('pressure_hpa'),
+        battery_voltage=data.get('battery_voltage'),
+        rssi=data.get('rssi'),
+        snr=data.get('snr'),
+        gateway_id=data.get('gateway_id') or data.get('gateway_ip'),
+        heat_index=data.get('heat_index'),
+        dew_point=data.get('dew_point')
+    ))
+
+def store_sensor_readings(readings, received=None, slot=True):
+    """Insert readings in one transaction; False if no writer slot was free (slot=False: the caller holds one)"""
+    with (ingest_admission.writer_slot() if slot else nullcontext(True)) as acquired:
+        if not acquired:
+            return False
+        if readings:
+            storage.insert_readings(readings)
+    on_readings_stored(readings, readings if received is None else received)
+    return True
+
+def store_live_readings(readings, slot=True):
+    """Store live readings, through the deadband filter when configured"""
+    if not deadband:
+        return store_sensor_readings(readings, slot=slot)
+    stored, undo = deadband.filter(readings)
+    try:
+        if store_sensor_readings(stored, readings, slot=slot):
+            return True
+    except Exception:
+        deadband.rollback(undo)
+        raise
+    # Turned away: the retry finds the filter as it was
+    deadband.rollback(undo)
+    return False
+
+def flush_deadband(force=False):
+    """Store held readings whose heartbeat is due (all of them with force)"""
+    stored, undo = deadband.flush(force=force)
+    if stored and not store_sensor_readings(stored, []):
+        deadband.rollback(undo)
+
+def on_readings_stored(readings, received):
+    """Hand stored readings (now carrying their ids) and the readings that arrived to their listeners"""
+    for listeners, batch in ((reading_listeners, readings), (arrival_listeners, received)):
+        if not batch:
+            continue
+        for listener in listeners:
+            try:
+                listener(batch)
+            except Exception as e:
+                print(f"Reading listener error: {e}")
+
+gateway_merge = None
+if MERGE_WINDOW_MS > 0:
+    gateway_merge = GatewayMerge(store_live_readings, storage.update_fields, MERGE_WINDOW_MS / 1000.0,
+                                 MERGE_LATE_SECONDS, MERGE_MAX_PENDING)
+    # Whatever is still held when the process stops
+    atexit.register(gateway_merge.close)
+
+def ingest_readings(readings, gateway_key):
+    """Store readings, through the merge window when enabled; False means answer 429"""
+    if not gateway_merge:
+        return store_live_readings(readings)
+    accepted = True
+    for reading in readings:
+        accepted = gateway_merge.submit(reading, reading.get('gateway_id') or gateway_key) and accepted
+    return accepted
+
+def ingest_batch(readings, gateway_key):
+    """Store an upload of many readings: the backdated ones in one sorted insert, the rest as live readings"""
+    backdated, live = split_backdated(readings, late_after=LATE_AFTER_SECONDS)
+    if live and backdated and not gateway_merge:
+        # Nothing would absorb a retry of the live part: both inserts share one writer slot,
+        # so a 429 means none of the upload was written
+        with ingest_admission.writer_slot() as acquired:
+            if not acquired:
+                return False
+            store_live_readings(live, slot=False)
+            return store_sensor_readings(sort_readings(backdated), slot=False)
+    # Live first: if the backlog insert finds the writers busy, the gateway's retry merges the live ones away
+    if live and not ingest_readings(live, gateway_key):
+        return False
+    return not backdated or store_sensor_readings(sort_readings(backdated))
+
+def store_gateway_payloads(payloads):
+    """Storage path for batched UDP readings, shared with receive_sensor_data"""
+    return ingest_batch([reading_from_payload(p) for p in payloads], None)
+
+def start_udp_listener():
+    """Start the UDP ingest listener next to the Flask app if configured"""
+    global udp_listener
+    if not UDP_INGEST_PORT:
+        return None
+    if not UDP_INGEST_KEY:
+        print("⚠️ UDP_INGEST_PORT is set but UDP_INGEST_KEY is empty - UDP ingest disabled")
+        return None
+    udp_listener = UDPIngestListener(
+        store_gateway_payloads,
+        UDP_INGEST_KEY,
+        port=UDP_INGEST_PORT,
+        batch_size=UDP_INGEST_BATCH,
+        linger=UDP_INGEST_LINGER_MS / 1000.0
+    ).start()
+    print(f"📡 UDP ingest listening on port {udp_listener.port}")
+    return udp_listener
+
+def ingest_rejected(retry_after, reason):
+    """429 response telling the gateway when to try again"""
+    response = jsonify({
+        'success': False,
+        'error': reason,
+        'retry_after': retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+@app.route('/api/ingest/metrics', methods=['GET'])
+def get_ingest_metrics():
+    """Admission control counters: burst peak versus sustained ingest rate"""
+    try:
+        return jsonify({
+            'success': True,
+            'metrics': ingest_admission.metrics(),
+            'udp': udp_listener.stats() if udp_listener else None,
+            'late': dirty_buckets.metrics()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ingest/merge', methods=['GET'])
+def get_merge_metrics():
+    """Gateway merge counters: copies received, packets stored, gateways per packet"""
+    try:
+        return jsonify({
+            'success': True,
+            'enabled': gateway_merge is not None,
+            'metrics': gateway_merge.metrics() if gateway_merge else None
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ingest/deadband', methods=['GET'])
+def get_deadband_metrics():
+    """Deadband counters: readings received, stored and suppressed per compressed node"""
+    try:
+        return jsonify({
+            'success': True,
+            'enabled': deadband is not None,
+            'rules': [rule.to_dict() for rule in deadband_rules],
+            'metrics': deadband.metrics() if deadband else None
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/backups', methods=['GET'])
+def get_backups():
+    """Backup settings, the last run and the snapshots on disk"""
+    try:
+        return jsonify({
+            'success': True,
+            'enabled': backups is not None,
+            'status': backups.status() if backups else None,
+            'snapshots': backups.snapshots() if backups else []
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/backups', methods=['POST'])
+def trigger_backup():
+    """Start a snapshot now in the background"""
+    if not backups:
+        return jsonify({'error': 'Backups are disabled (set BACKUP_DIR)'}), 400
+    if backups.running:
+        return jsonify({'error': 'A backup is already running'}), 409
+    threading.Thread(target=take_backup, name='backup-now', daemon=True).start()
+    return jsonify({'success': True, 'started': True}), 202
+
+@app.route('/api/cache/metrics', methods=['GET'])
+def get_cache_metrics():
+    """Recent-readings and aggregate cache footprint and hit ratios"""
+    try:
+        return jsonify({
+            'success': True,
+            'enabled': recent_cache is not None,
+            'metrics': recent_cache.metrics() if recent_cache else None,
+            'analytics': analytics.cache_metrics()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/storage/blocks', methods=['GET'])
+def get_block_metrics():
+    """Sealed block counts and compressed bytes per reading (STORAGE_ENGINE=blocks)"""
+    try:
+        enabled = STORAGE_ENGINE == 'blocks'
+        return jsonify({
+            'success': True,
+            'enabled': enabled,
+            'metrics': storage.block_stats() if enabled else None
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nodes/<node_id>/stats', methods=['GET'])
+def get_node_stats(node_id):
+    """Running mean, variance, min and max per window for one node, from memory"""
+    try:
+        if node_stats is None:
+            return jsonify({'error': 'Node statistics are disabled'}), 404
+        if not node_stats.ready:
+            response = jsonify({'success': False, 'error': 'Node statistics are loading'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        stats = node_stats.node_stats(node_id)
+        if stats is None:
+            return jsonify({'error': f'No readings for node {node_id}'}), 404
+        window = request.args.get('window')
+        if window:
+            if window not in stats['windows']:
+                return jsonify({'error': f'Unknown window: {window}'}), 400
+            stats['windows'] = {window: stats['windows'][window]}
+        return jsonify(dict({'success': True, 'node_id': node_id}, **stats))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nodes/stats/metrics', methods=['GET'])
+def get_node_stats_metrics():
+    """Node statistics engine state: nodes, buckets, last checkpoint"""
+    try:
+        return jsonify({
+            'success': True,
+            'enabled': node_stats is not None,
+            'metrics': node_stats.metrics() if node_stats else None
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nodes/<node_id>/battery', methods=['GET'])
+def get_node_battery(node_id):
+    """Predicted days until a node's battery reaches BATTERY_CUTOFF_V, from the running fit"""
+    try:
+        if battery_forecaster is None:
+            return jsonify({'error': 'Battery forecasts are disabled'}), 404
+        if not battery_forecaster.ready:
+            response = jsonify({'success': False, 'error': 'Battery forecasts are loading'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        forecast = battery_forecaster.forecast(node_id)
+        if forecast is None:
+            return jsonify({'error': f'No battery readings for node {node_id}'}), 404
+        return jsonify(dict({'success': True, 'node_id': node_id}, **forecast))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nodes/battery', methods=['GET'])
+def get_fleet_battery():
+    """Every node's battery forecast, soonest cutoff first"""
+    try:
+        if battery_forecaster is None:
+            return jsonify({'error': 'Battery forecasts are disabled'}), 404
+        forecasts = battery_forecaster.forecasts()
+        limit = request.args.get('limit', type=int)
+        if limit and limit > 0:
+            forecasts = forecasts[:limit]
+        return jsonify({
+            'success': True,
+            'data': forecasts,
+            'count': len(forecasts),
+            'metrics': battery_forecaster.metrics()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nodes/liveness', methods=['GET'])
+def get_node_liveness():
+    """Online/stale/offline state of every node with its cadence and next deadline"""
+    try:
+        if liveness is None:
+            return jsonify({'error': 'Liveness tracking is disabled'}), 404
+        return jsonify({
+            'success': True,
+            'counts': liveness.counts(),
+            'data': liveness.node_states(),
+            'metrics': liveness.metrics()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nodes/liveness/events', methods=['GET'])
+def get_node_liveness_events():
+    """Liveness transitions after ?since=<seq>, oldest first"""
+    try:
+        if liveness is None:
+            return jsonify({'error': 'Liveness tracking is disabled'}), 404
+        events = liveness.events(request.args.get('since', 0, type=int), request.args.get('limit', type=int))
+        return jsonify({
+            'success': True,
+            'data': events,
+            'count': len(events),
+            'last_seq': events[-1]['seq'] if events else request.args.get('since', 0, type=int)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/alerts', methods=['GET'])
+def get_alerts():
+    """Stored alert transitions, newest first (?node_id=, hours=, state=firing|resolved, limit=)"""
+    try:
+        hours = request.args.get('hours', type=float)
+        alerts = storage.alerts(
+            node_id=request.args.get('node_id') or None,
+            t0=hours_ago(hours) if hours else None,
+            state=request.args.get('state') or None,
+            limit=request.args.get('limit', 100, type=int)
+        )
+        return jsonify({'success': True, 'alerts': alerts, 'count': len(alerts)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/alerts/rules', methods=['GET'])
+def get_alert_rules():
+    """Configured alert rules, the (rule, node) pairs firing now and engine counters"""
+    try:
+        return jsonify({
+            'success': True,
+            'rules': [rule.to_dict() for rule in alert_engine.rules],
+            'firing': [{'rule_id': rule_id, 'node_id': node_id} for rule_id, node_id in alert_engine.firing()],
+            'metrics': alert_engine.metrics()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/sensor-data/latest', methods=['GET'])
 def get_latest_sensor_data():
     """Get latest sensor data for all nodes"""
     try:
         user_tz = get_user_timezone()
 
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        # Get latest data for each node
-        cursor.execute('''
-            SELECT s1.* FROM sensor_data s1
-            INNER JOIN (
-                SELECT node_id, MAX(timestamp) as max_timestamp
-                FROM sensor_data
-                GROUP BY node_id
-            ) s2 ON s1.node_id = s2.node_id AND s1.timestamp = s2.max_timestamp
-            ORDER BY s1.timestamp DESC
-        ''')
-
-        rows = cursor.fetchall()
         latest_data = []
 
-        for row in rows:
-            # Don't use format_timestamp_for_user - it's causing the malformed output
-            # Just clean up the double space and use the stored timestamp directly
-            clean_timestamp = row['timestamp'].replace('  ', ' ')  # Remove double space
+        rows = recent_cache.latest() if recent_cache else None
+        cached = rows is not None
+        if not cached:
+            rows = storage.latest()
+        if deadband:
+            # Newest readings the filter held back or dropped
+            rows = deadband.latest(rows)
 
+        # Latest reading for each node
+        for row in rows:
             # Convert temperature back to Fahrenheit for display
             temp_f = None
-            if row['temperature']:
-                temp_f = (row['temperature'] * 9/5) + 32
+            if row['temperature_c']:
+                temp_f = (row['temperature_c'] * 9/5) + 32
 
-            latest_data.append({
+            entry = {
                 'id': row['id'],
                 'node_id': row['node_id'],
-                'temperature': row['temperature'],
+                'temperature': row['temperature_c'],
                 'temperature_f': round(temp_f, 1) if temp_f else None,
                 'humidity': row['humidity'],
-                'pressure': row['pressure'],
+                'pressure': row['pressure_hpa'],
                 'battery_voltage': row['battery_voltage'],
                 'rssi': row['rssi'],
                 'snr': row['snr'],
-                'timestamp': clean_timestamp  # Use clean timestamp directly
-            })
+                'timestamp': row['timestamp']
+            }
+            entry.update(derive_one(row['temperature_c'], row['humidity'], row['pressure_hpa'], ALTITUDE_M))
+            latest_data.append(entry)
 
-        conn.close()
         return jsonify({
             'success': True,
             'data': latest_data,
             'count': len(latest_data),
-            'timezone': user_tz
+            'timezone': user_tz,
+            'snapshot': snapshot_info(cached)
         })
 
     except Exception as e:
@@ -405,56 +1190,67 @@ def get_sensor_history():
         node_id = request.args.get('node_id')
         hours = int(request.args.get('hours', 24))
         limit = request.args.get('limit', type=int)
+        with_derived = request.args.get('derived', 'false').lower() == 'true'
+        # Deadband-compressed nodes: step/linear fill between stored readings (auto: per the node's mode)
+        fill = request.args.get('fill', 'auto').lower()
+        if fill not in FILLS:
+            return jsonify({'error': f"fill must be one of {', '.join(FILLS)}"}), 400
         
         print(f"DEBUG: hours={hours}, limit={limit}")
         
         user_tz = get_user_timezone()
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        query = '''
-            SELECT * FROM sensor_data
-            WHERE timestamp >= datetime('now', '-{} hours')
-            ORDER BY timestamp DESC
-        '''.format(hours)
-        
-        if limit and limit > 0:
-            query += f' LIMIT {limit}'
-            
-            print(f"DEBUG: Final query: {query}")
-        
-        if node_id:
-            cursor.execute(query, (node_id,))
-        else:
-            cursor.execute(query)
-            
-        rows = cursor.fetchall()
+        query = {
+            'node_id': node_id or None,
+            't0': hours_ago(hours),
+            'limit': limit if limit and limit > 0 else None
+        }
+        batch = recent_cache.range_batch(**query) if recent_cache else None
+        cached = batch is not None
+        if not cached:
+            batch = storage.range_batch(**query)
         
+        # Serialize straight from the result columns; no per-row reading objects.
+        # Nodes share cycle timestamps, so each one is formatted once per response
         history = []
-        for row in rows:
-            timestamp_info = format_timestamp_for_user(row['timestamp'], user_tz)
+        formatted = {}
+        names = ('id', 'node_id', 'timestamp', 'temperature_c', 'humidity', 'pressure_hpa',
+                 'battery_voltage', 'rssi', 'snr')
+        rows = batch.rows(*names)
+        if deadband:
+            rows = deadband.reconstruct(list(rows), names, fill)
+        for reading_id, node, timestamp, temperature, humidity, pressure, battery, rssi, snr in rows:
+            timestamp_info = formatted.get(timestamp)
+            if timestamp_info is None:
+                timestamp_info = formatted[timestamp] = format_timestamp_for_user(timestamp, user_tz)
             history.append({
-                'id': row['id'],
-                'node_id': row['node_id'],
-                'temperature': row['temperature'],
-                'humidity': row['humidity'],
-                'pressure': row['pressure'],
-                'battery_voltage': row['battery_voltage'],
-                'rssi': row['rssi'],
-                'snr': row['snr'],
+                'id': reading_id,
+                'node_id': node,
+                'temperature': temperature,
+                'humidity': humidity,
+                'pressure': pressure,
+                'battery_voltage': battery,
+                'rssi': rssi,
+                'snr': snr,
                 'timestamp': timestamp_info
             })
-            
-        conn.close()
+        
+        if with_derived:
+            # Heat index, dew point, absolute humidity and sea-level pressure for the whole page at once
+            derived = derive_columns([entry['temperature'] for entry in history],
+                                     [entry['humidity'] for entry in history],
+                                     [entry['pressure'] for entry in history], ALTITUDE_M)
+            names = list(derived)
+            for entry, values in zip(history, zip(*derived.values())):
+                entry.update(zip(names, values))
         
         return jsonify({
             'success': True,
             'data': history,
             'count': len(history),
             'timezone': user_tz,
-            'hours': hours
+            'hours': hours,
+            'snapshot': snapshot_info(cached)
         })
         
     except Exception as e:
@@ -466,37 +1262,18 @@ def get_network_stats():
     try:
         user_tz = get_user_timezone()
 
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        # Total messages
-        cursor.execute('SELECT COUNT(*) as total FROM sensor_data')
-        total_messages = cursor.fetchone()[0]
-
-        # Active nodes (nodes that sent data in last hour)
-        cursor.execute('''
-            SELECT COUNT(DISTINCT node_id) as active
-            FROM sensor_data
-            WHERE timestamp >= datetime('now', '-1 hour')
-        ''')
-        active_nodes = cursor.fetchone()[0]
-
-        # Average RSSI
-        cursor.execute('''
-            SELECT AVG(rssi) as avg_rssi
-            FROM sensor_data
-            WHERE timestamp >= datetime('now', '-24 hours')
-        ''')
-        avg_rssi = cursor.fetchone()[0] or 0
-
-        # Last update
-        cursor.execute('''
-            SELECT MAX(timestamp) as last_update
-            FROM sensor_data
-        ''')
-        last_update = cursor.fetchone()[0]
-
-        conn.close()
+        stats = recent_cache.stats(active_hours=1, rssi_hours=24) if recent_cache else None
+        cached = stats is not None
+        if not cached:
+            stats = storage.stats(active_hours=1, rssi_hours=24)
+        total_messages = stats['total_readings']
+        active_nodes = stats['active_nodes']
+        if liveness and liveness.ready:
+            # Nodes still reporting on schedule (or just late), no scan needed
+            counts = liveness.counts()
+            active_nodes = counts['online'] + counts['stale']
+        avg_rssi = stats['avg_rssi'] or 0
+        last_update = stats['last_update']
 
         # Format last update timestamp
         last_update_info = None
@@ -513,7 +1290,45 @@ def get_network_stats():
                 'uptime': '7d 12h',    # This would be calculated from server start time
                 'last_update': last_update_info
             },
-            'timezone': user_tz
+            'timezone': user_tz,
+            'snapshot': snapshot_info(cached)
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/aggregate', methods=['GET'])
+def get_analytics_aggregate():
+    """Per-bucket aggregates of one metric, e.g. ?metric=temperature&group_by=node&interval=month&days=365"""
+    try:
+        days = request.args.get('days', type=float)
+        t0 = request.args.get('from') or (hours_ago(days * 24) if days else hours_ago(24 * 30))
+        try:
+            query = AggregateQuery(
+                metric=request.args.get('metric', 'temperature'),
+                interval=request.args.get('interval', 'day'),
+                group_by=request.args.get('group_by', 'node'),
+                node_id=request.args.get('node_id') or None,
+                t0=t0,
+                t1=request.args.get('to') or None
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        rows, info = analytics.aggregate(query)
+        return jsonify({
+            'success': True,
+            'metric': query.metric,
+            'interval': query.interval,
+            'group_by': query.group_by,
+            'from': query.t0,
+            'to': query.t1,
+            'data': rows,
+            'count': len(rows),
+            'engines': info['engines'],
+            'cache': info.get('cache'),
+            'elapsed_ms': info['elapsed_ms'],
+            'snapshot': snapshot_info()
         })
 
     except Exception as e:
@@ -522,6 +1337,7 @@ def get_network_stats():
 @app.route('/api/timezone/validate', methods=['POST'])
 def validate_timezone():
     """Validate a timezone string"""
+    import pytz
     try:
         data = request.get_json()
         timezone_str = data.get('timezone', '')
@@ -571,6 +1387,41 @@ def charts():
     except:
         return jsonify({'error': 'Charts not found. Make sure static/charts.html exists.'}), 404
 
+@app.route('/debug/profile', methods=['GET'])
+def get_profile():
+    """Sampler hot functions and recent request profiles; ?format=collapsed for the sampler's stacks"""
+    if not profile_sampler and not request_profiler.enabled:
+        return jsonify({'error': 'Profiling is disabled (set PROFILE_SAMPLER_HZ, PROFILE_ENDPOINTS or PROFILE_HEADER)'}), 404
+    try:
+        if request.args.get('format') == 'collapsed':
+            if not profile_sampler:
+                return jsonify({'error': 'The stack sampler is disabled (set PROFILE_SAMPLER_HZ)'}), 404
+            return Response(profile_sampler.collapsed(), mimetype='text/plain')
+        limit = int(request.args.get('limit', 20))
+        return jsonify({
+            'success': True,
+            'sampler': dict(profile_sampler.metrics(), **profile_sampler.hot(limit)) if profile_sampler else None,
+            'requests': request_profiler.metrics() if request_profiler.enabled else None,
+            'files': request_profiler.files()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/debug/profile', methods=['DELETE'])
+def reset_profile():
+    """Start the sampler's counts over"""
+    if not profile_sampler:
+        return jsonify({'error': 'The stack sampler is disabled (set PROFILE_SAMPLER_HZ)'}), 404
+    profile_sampler.reset()
+    return jsonify({'success': True})
+
+@app.route('/debug/profile/<path:name>', methods=['GET'])
+def download_profile(name):
+    """One .pstats or .collapsed file written by the request profiler"""
+    if not request_profiler.enabled:
+        return jsonify({'error': 'Request profiling is disabled'}), 404
+    return send_from_directory(PROFILE_DIR, name, as_attachment=True)
+
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
@@ -601,6 +1452,18 @@ if __name__ == '__main__':
         settings = load_settings()
         print(f"Server starting with timezone: {settings.get('timezone', 'UTC')}")
         
+        start_udp_listener()
+        start_read_snapshot()
+        start_cold_tiering()
+        start_block_sealing()
+        start_node_stats_checkpoints()
+        start_liveness()
+        start_alerts()
+        start_late_recompute()
+        start_deadband()
+        start_backups()
+        start_profile_sampler()
+        
         # Run the app
         app.run(
             host='0.0.0.0',
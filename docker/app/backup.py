@@ -0,0 +1,306 @@
+# backup.py - Online backups and point-in-time snapshots of the database
+"""
+Copying lora_sensors.db while the app writes to it can tear the copy, and
+stopping the container loses readings. BackupManager copies the live file
+with SQLite's online backup API instead:
+
+- the source is read inside one read transaction, so under WAL the copy is
+  the database as of that instant and writers carry on committing meanwhile
+- pages are copied step_pages at a time with a step_sleep pause between
+  steps, which keeps the copy from hogging the disk and the GIL
+- a probe takes the write lock every probe_interval seconds during the copy
+  and records how long it waited: the longest writer stall the backup caused
+- each snapshot is a directory <stem>-<UTC time>/ with one file per database
+  file (every shard with STORAGE_ENGINE=sharded) and a manifest.json; it is
+  written under a .part name and renamed once it passed PRAGMA quick_check,
+  optionally gzipped, and only the newest keep snapshots are kept
+
+restore() puts a snapshot back in place; the app must be stopped first.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from storage.sharded import existing_shards, shard_path
+
+MANIFEST = 'manifest.json'
+STAMP_FORMAT = '%Y%m%dT%H%M%SZ'
+CHUNK_BYTES = 1024 * 1024
+
+
+def database_files(db_path):
+    """The database file and any shard files beside it that exist"""
+    files = [db_path] if os.path.exists(db_path) else []
+    return files + [shard_path(db_path, i) for i in existing_shards(db_path)]
+
+
+def snapshot_time(name):
+    """UTC time a snapshot directory name was taken at, or None for other names"""
+    try:
+        return datetime.strptime(name.rsplit('-', 1)[-1], STAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def quick_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise RuntimeError(f"{os.path.basename(path)} failed quick_check: {result}")
+
+
+def gzip_file(path):
+    """Compress path to path.gz and remove the original; returns the new path"""
+    with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_BYTES)
+    os.remove(path)
+    return path + '.gz'
+
+
+class StallProbe:
+    """Times an empty write transaction every interval seconds on its own connection"""
+
+    def __init__(self, db_path, interval=0.05, timeout=30.0):
+        self.db_path = db_path
+        self.interval = interval
+        self.timeout = timeout
+        self.waits = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name='backup-probe', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        try:
+            while not self._stop.wait(self.interval):
+                began = time.perf_counter()
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('COMMIT')
+                self.waits.append(time.perf_counter() - began)
+        finally:
+            conn.close()
+
+    def max_ms(self):
+        return round(max(self.waits, default=0.0) * 1000.0, 2)
+
+
+class BackupManager:
+    """Takes, lists, rotates and restores snapshots of one database"""
+
+    def __init__(self, db_path, backup_dir, keep=7, compress=False, step_pages=256, step_sleep=0.01,
+                 probe_interval=0.05):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.compress = compress
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+        self.probe_interval = probe_interval
+        self.stem = os.path.splitext(os.path.basename(db_path))[0]
+
+        self._lock = threading.Lock()
+        self.running = False
+        self.last = None
+        self.backups = 0
+        self.errors = 0
+
+    def backup(self):
+        """Take one snapshot now; returns its manifest"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('A backup is already running')
+        self.running = True
+        try:
+            manifest = self._backup()
+            self.backups += 1
+            self.last = manifest
+            return manifest
+        except Exception as e:
+            self.errors += 1
+            self.last = {'error': str(e), 'failed_at': datetime.utcnow().isoformat() + 'Z'}
+            raise
+        finally:
+            self.running = False
+            self._lock.release()
+
+    def _backup(self):
+        sources = database_files(self.db_path)
+        if not sources:
+            raise FileNotFoundError(f"No database at {self.db_path}")
+        taken = datetime.utcnow()
+        name = f"{self.stem}-{taken.strftime(STAMP_FORMAT)}"
+        final = os.path.join(self.backup_dir, name)
+        part = os.path.join(self.backup_dir, '.' + name + '.part')
+        if os.path.exists(final):
+            raise FileExistsError(f"Snapshot {name} already exists")
+        shutil.rmtree(part, ignore_errors=True)
+        os.makedirs(part)
+
+        started = time.monotonic()
+        files = []
+        try:
+            with StallProbe(sources[0], self.probe_interval) as probe:
+                for source in sources:
+                    files.append(self._copy(source, part))
+            copy_seconds = time.monotonic() - started
+            for entry in files:
+                quick_check(os.path.join(part, entry['file']))
+                if self.compress:
+                    entry['file'] = os.path.basename(gzip_file(os.path.join(part, entry['file'])))
+                entry['bytes'] = os.path.getsize(os.path.join(part, entry['file']))
+            manifest = {
+                'name': name,
+                'created': taken.isoformat() + 'Z',
+                'source': os.path.abspath(self.db_path),
+                'files': files,
+                'compressed': self.compress,
+                'bytes': sum(entry['bytes'] for entry in files),
+                'copy_seconds': round(copy_seconds, 3),
+                'duration_seconds': round(time.monotonic() - started, 3),
+                'step_pages': self.step_pages,
+                'writer_stall_max_ms': probe.max_ms(),
+                'writer_probes': len(probe.waits),
+            }
+            with open(os.path.join(part, MANIFEST), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.rename(part, final)
+        except Exception:
+            shutil.rmtree(part, ignore_errors=True)
+            raise
+        manifest['rotated'] = self.rotate()
+        return manifest
+
+    def _copy(self, source_path, part):
+        """Stepped backup of one file into the snapshot directory"""
+        target = os.path.join(part, os.path.basename(source_path))
+        source = sqlite3.connect(source_path, timeout=30, isolation_level=None)
+        dest = sqlite3.connect(target)
+        restarts = [0]
+        last_remaining = [None]
+
+        def progress(status, remaining, total):
+            # The remaining count only goes up when a write from another connection restarted the copy
+            if last_remaining[0] is not None and remaining > last_remaining[0]:
+                restarts[0] += 1
+            last_remaining[0] = remaining
+            if remaining and self.step_sleep:
+                time.sleep(self.step_sleep)
+
+        try:
+            wal = source.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+            if wal:
+                # Pin one WAL snapshot for every step; it never blocks writers
+                source.execute('BEGIN')
+                source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            source.backup(dest, pages=self.step_pages, progress=progress)
+            pages = dest.execute('PRAGMA page_count').fetchone()[0]
+            if wal:
+                source.execute('COMMIT')
+                # A single-file copy: the snapshot carries no -wal beside it
+                dest.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            dest.close()
+            source.close()
+        return {'file': os.path.basename(target), 'pages': pages, 'restarts': restarts[0]}
+
+    def rotate(self):
+        """Delete all but the newest keep snapshots; returns the names removed"""
+        if self.keep <= 0:
+            return []
+        removed = []
+        for entry in self.snapshots()[self.keep:]:
+            shutil.rmtree(os.path.join(self.backup_dir, entry['name']), ignore_errors=True)
+            removed.append(entry['name'])
+        return removed
+
+    def snapshots(self):
+        """Manifests of the complete snapshots of this database, newest first"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        found = []
+        for name in os.listdir(self.backup_dir):
+            path = os.path.join(self.backup_dir, name, MANIFEST)
+            if name.startswith(self.stem + '-') and snapshot_time(name) and os.path.exists(path):
+                with open(path) as f:
+                    found.append(json.load(f))
+        return sorted(found, key=lambda m: m['name'], reverse=True)
+
+    def find(self, at=None):
+        """Newest snapshot taken at or before at (a naive UTC datetime), or the newest of all"""
+        for manifest in self.snapshots():
+            if at is None or snapshot_time(manifest['name']) <= at:
+                return manifest
+        return None
+
+    def restore(self, manifest, db_path=None, force=False):
+        """Copy a snapshot over db_path (default: the managed database); the app must be stopped"""
+        db_path = db_path or self.db_path
+        target_dir = os.path.dirname(os.path.abspath(db_path))
+        old_stem = os.path.splitext(os.path.basename(manifest['source']))[0]
+        new_stem = os.path.splitext(os.path.basename(db_path))[0]
+        snapshot_dir = os.path.join(self.backup_dir, manifest['name'])
+
+        plan = []
+        for entry in manifest['files']:
+            name = entry['file'][:-3] if entry['file'].endswith('.gz') else entry['file']
+            plan.append((entry['file'], os.path.join(target_dir, new_stem + name[len(old_stem):])))
+        present = [target for _, target in plan if os.path.exists(target)]
+        if present and not force:
+            raise FileExistsError(f"{', '.join(present)} exists; stop the app and pass force to overwrite")
+
+        os.makedirs(target_dir, exist_ok=True)
+        restored = []
+        for stored, target in plan:
+            source = os.path.join(snapshot_dir, stored)
+            staged = None
+            if stored.endswith('.gz'):
+                staged = target + '.restore'
+                with gzip.open(source, 'rb') as src, open(staged, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_BYTES)
+                source = staged
+            try:
+                quick_check(source)
+                # Through the backup API, so a -wal left beside the target can't replay over the copy
+                src = sqlite3.connect(source)
+                dst = sqlite3.connect(target, timeout=30)
+                try:
+                    src.backup(dst)
+                    dst.execute('PRAGMA journal_mode = WAL')
+                    dst.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                finally:
+                    dst.close()
+                    src.close()
+            finally:
+                if staged and os.path.exists(staged):
+                    os.remove(staged)
+            restored.append(target)
+        return restored
+
+    def status(self):
+        return {
+            'backup_dir': self.backup_dir,
+            'keep': self.keep,
+            'compress': self.compress,
+            'step_pages': self.step_pages,
+            'step_sleep_ms': round(self.step_sleep * 1000.0, 1),
+            'running': self.running,
+            'backups': self.backups,
+            'errors': self.errors,
+            'last': self.last
+        }
@@ -0,0 +1,305 @@
+# battery.py - Battery depletion forecasts per node (online least squares)
+"""
+Fits each node's battery voltage against time as readings arrive and
+extrapolates the line to the cutoff voltage, so /api/nodes/<id>/battery
+never reads history:
+
+- weighted least squares kept as running means and co-moments (the
+  weighted form of Welford's update), O(1) per reading and no loss of
+  precision from large epoch times
+- exponential forgetting: a reading loses half its weight every half-life,
+  so the fit follows the current part of the discharge curve (LiPo decay
+  isn't a straight line over months)
+- a jump back up well above the fitted line (new or recharged battery)
+  starts a fresh fit
+- checkpoints: the fits and the newest applied row id go to a JSON file;
+  a restart loads it and reads only rows inserted since
+
+See docs/Power Analysis.md for the expected drain of a node.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+from recent_cache import from_epoch, stored_epoch
+from node_stats import number
+
+DAY = 86400.0
+CHECKPOINT_VERSION = 1
+
+
+class DischargeFit:
+    """Exponentially weighted straight-line fit of voltage over time (days)"""
+
+    __slots__ = ('weight', 'weight_sq', 'mean_t', 'mean_v', 'ctt', 'ctv', 'cvv', 'last', 'first', 'count',
+                 'latest_v', 'latest_t')
+
+    def __init__(self, weight=0.0, weight_sq=0.0, mean_t=0.0, mean_v=0.0, ctt=0.0, ctv=0.0, cvv=0.0,
+                 last=None, first=None, count=0, latest_v=None, latest_t=None):
+        self.weight = weight
+        self.weight_sq = weight_sq  # sum of squared weights, for the effective sample size
+        self.mean_t = mean_t
+        self.mean_v = mean_v
+        self.ctt = ctt
+        self.ctv = ctv
+        self.cvv = cvv
+        self.last = last  # day the weights are relative to
+        self.first = first
+        self.count = count
+        self.latest_v = latest_v
+        self.latest_t = latest_t
+
+    def add(self, t, v, tau):
+        if self.last is None or t >= self.last:
+            if self.last is not None and tau:
+                # Scaling every old weight scales the co-moments the same way; the means stay put
+                decay = math.exp((self.last - t) / tau)
+                self.weight *= decay
+                self.weight_sq *= decay * decay
+                self.ctt *= decay
+                self.ctv *= decay
+                self.cvv *= decay
+            self.last = t
+            w = 1.0
+        else:
+            # A late reading counts as much as it would have when it arrived on time
+            w = math.exp((t - self.last) / tau) if tau else 1.0
+        self.weight += w
+        self.weight_sq += w * w
+        dt = t - self.mean_t
+        dv = v - self.mean_v
+        self.mean_t += dt * w / self.weight
+        self.mean_v += dv * w / self.weight
+        self.ctt += w * dt * (t - self.mean_t)
+        self.ctv += w * dt * (v - self.mean_v)
+        self.cvv += w * dv * (v - self.mean_v)
+        self.first = t if self.first is None else min(self.first, t)
+        self.count += 1
+        if self.latest_t is None or t >= self.latest_t:
+            self.latest_t, self.latest_v = t, v
+
+    def slope(self):
+        """Volts per day, or None before the readings span any time"""
+        return self.ctv / self.ctt if self.ctt > 0 else None
+
+    def fitted(self, t):
+        slope = self.slope()
+        return self.mean_v + (slope or 0.0) * (t - self.mean_t)
+
+    def slope_error(self):
+        """Standard error of the slope, from the weighted residuals"""
+        if self.ctt <= 0 or not self.weight_sq:
+            return None
+        effective = self.weight * self.weight / self.weight_sq
+        if effective <= 2:
+            return None
+        variance = max(self.cvv - self.ctv * self.ctv / self.ctt, 0.0) / self.weight * effective / (effective - 2)
+        return math.sqrt(variance * self.weight_sq / (self.weight * self.ctt))
+
+    def to_list(self):
+        return [self.weight, self.weight_sq, self.mean_t, self.mean_v, self.ctt, self.ctv, self.cvv,
+                self.last, self.first, self.count, self.latest_v, self.latest_t]
+
+
+class BatteryForecaster:
+    """Per-node discharge fits, updated by the ingest path"""
+
+    def __init__(self, cutoff_v=3.3, half_life_days=7.0, lookback_days=30.0, min_readings=12, min_span_hours=24.0,
+                 reset_jump_v=0.15, checkpoint_path=None):
+        self.cutoff_v = cutoff_v
+        self.half_life_days = half_life_days
+        self.tau = half_life_days / math.log(2) if half_life_days > 0 else None
+        self.lookback_days = lookback_days
+        self.min_readings = min_readings
+        self.min_span_hours = min_span_hours
+        self.reset_jump_v = reset_jump_v
+        self.checkpoint_path = checkpoint_path
+        self.fits = {}
+        self.resets = {}  # node_id -> times a new battery was detected
+        self.last_id = 0  # newest row id applied
+        self.ready = False
+        self.updates = 0
+        self.checkpointed_at = None
+        self._lock = threading.Lock()
+
+    def config(self):
+        """What a checkpoint must match to be reused"""
+        return {'half_life_days': self.half_life_days, 'reset_jump_v': self.reset_jump_v}
+
+    # ----- filling -----
+
+    def warm(self, storage):
+        """Restore the checkpoint (if any) and apply the rows stored after it; returns (source, rows)"""
+        started = time.time()
+        with self._lock:
+            self.fits, self.resets, self.last_id = {}, {}, 0
+            source = 'checkpoint' if self._restore() else 'scan'
+            after_id = self.last_id if source == 'checkpoint' else None
+            applied = 0
+            for reading in storage.iter_range(t0=from_epoch(started - self.lookback_days * DAY),
+                                              fields=('battery_voltage',), descending=False, after_id=after_id):
+                self._add(reading)
+                applied += 1
+            self.ready = True
+        return source, applied
+
+    def append(self, readings):
+        """Add freshly stored readings (they must carry their row id and stored timestamp)"""
+        with self._lock:
+            if not self.ready:
+                return
+            for reading in readings:
+                reading_id = reading.get('id')
+                # Rows committed while warm() was scanning arrive here as well
+                if reading_id is not None and reading_id > self.last_id:
+                    self._add(reading)
+
+    def _add(self, reading):
+        node_id = reading.get('node_id')
+        voltage = number(reading.get('battery_voltage'))
+        if reading.get('id') is not None:
+            self.last_id = max(self.last_id, reading['id'])
+        # The gateway flags anything outside 2-5 V as a bad ADC read
+        if node_id is None or voltage is None or not 2.0 <= voltage <= 5.0:
+            return
+        node_id = str(node_id)
+        ts = stored_epoch(reading['timestamp'])
+        if ts is None:
+            return
+        t = ts / DAY
+        fit = self.fits.get(node_id)
+        if fit is None:
+            fit = self.fits[node_id] = DischargeFit()
+        elif (self.reset_jump_v and fit.count >= self.min_readings and t >= fit.last
+              and voltage - fit.fitted(t) > self.reset_jump_v):
+            # New or recharged battery: the old line says nothing about this one
+            fit = self.fits[node_id] = DischargeFit()
+            self.resets[node_id] = self.resets.get(node_id, 0) + 1
+        fit.add(t, voltage, self.tau)
+        self.updates += 1
+
+    # ----- queries -----
+
+    def node_ids(self):
+        with self._lock:
+            return list(self.fits)
+
+    def forecast(self, node_id, now=None):
+        """Days until a node's battery reaches the cutoff; None for an unknown node"""
+        now = time.time() if now is None else now
+        with self._lock:
+            fit = self.fits.get(str(node_id))
+            if fit is None:
+                return None
+            return self._forecast(fit, now / DAY, self.resets.get(str(node_id), 0))
+
+    def forecasts(self, now=None):
+        """Every node's forecast, soonest cutoff first"""
+        now = time.time() if now is None else now
+        with self._lock:
+            results = [dict(self._forecast(fit, now / DAY, self.resets.get(node_id, 0)), node_id=node_id)
+                       for node_id, fit in self.fits.items()]
+        results.sort(key=lambda f: (f['days_to_cutoff'] is None, f['days_to_cutoff'] or 0.0, f['node_id']))
+        return results
+
+    def _forecast(self, fit, today, resets):
+        span_hours = (fit.latest_t - fit.first) * 24.0
+        result = {
+            'cutoff_v': self.cutoff_v,
+            'latest_v': fit.latest_v,
+            'latest_at': from_epoch(fit.latest_t * DAY),
+            'readings': fit.count,
+            'span_hours': round(span_hours, 1),
+            'battery_changes': resets,
+            'status': 'learning',
+            'fitted_v': None,
+            'slope_mv_per_day': None,
+            'r_squared': None,
+            'days_to_cutoff': None,
+            'days_to_cutoff_range': None,
+            'cutoff_at': None,
+        }
+        slope = fit.slope()
+        if slope is None or fit.count < self.min_readings or span_hours < self.min_span_hours:
+            return result
+        fitted = fit.fitted(today)
+        error = fit.slope_error()
+        result['fitted_v'] = round(fitted, 3)
+        result['slope_mv_per_day'] = round(slope * 1000.0, 3)
+        if fit.cvv > 0:
+            result['r_squared'] = round(fit.ctv * fit.ctv / (fit.ctt * fit.cvv), 4)
+        if fitted <= self.cutoff_v:
+            result.update(status='below_cutoff', days_to_cutoff=0.0, cutoff_at=from_epoch(today * DAY))
+        elif slope >= 0 or (error is not None and slope + 2 * error >= 0):
+            # Flat, charging, or a decline too small to tell from noise
+            result['status'] = 'steady'
+        else:
+            days = (self.cutoff_v - fitted) / slope
+            result.update(status='discharging', days_to_cutoff=round(days, 2),
+                          cutoff_at=from_epoch((today + days) * DAY))
+            if error is not None:
+                # Two standard errors either side of the slope
+                result['days_to_cutoff_range'] = [round((self.cutoff_v - fitted) / (slope - 2 * error), 2),
+                                                  round((self.cutoff_v - fitted) / (slope + 2 * error), 2)]
+        return result
+
+    # ----- checkpoints -----
+
+    def checkpoint(self):
+        """Write the fits to checkpoint_path atomically; returns the node count"""
+        if not self.checkpoint_path:
+            return 0
+        with self._lock:
+            if not self.ready:
+                return 0
+            state = {
+                'version': CHECKPOINT_VERSION,
+                'config': self.config(),
+                'saved_at': from_epoch(time.time()),
+                'last_id': self.last_id,
+                'nodes': {node_id: fit.to_list() for node_id, fit in self.fits.items()},
+                'resets': dict(self.resets),
+            }
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp_path, self.checkpoint_path)
+        self.checkpointed_at = time.time()
+        return len(state['nodes'])
+
+    def _restore(self):
+        """Load a checkpoint written with the same configuration; False if there is none to use"""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return False
+        try:
+            with open(self.checkpoint_path) as f:
+                state = json.load(f)
+            if state.get('version') != CHECKPOINT_VERSION or state.get('config') != self.config():
+                return False
+            fits = {node_id: DischargeFit(*values) for node_id, values in state['nodes'].items()}
+            resets = {node_id: int(count) for node_id, count in state.get('resets', {}).items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring battery forecast checkpoint {self.checkpoint_path}: {e}")
+            return False
+        self.fits, self.resets, self.last_id = fits, resets, state['last_id']
+        return True
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'nodes': len(self.fits),
+                'cutoff_v': self.cutoff_v,
+                'half_life_days': self.half_life_days if self.tau else None,
+                'updates': self.updates,
+                'battery_changes': sum(self.resets.values()),
+                'last_id': self.last_id,
+                'checkpoint_path': self.checkpoint_path,
+                'checkpointed_at': from_epoch(self.checkpointed_at) if self.checkpointed_at else None,
+            }
@@ -0,0 +1,409 @@
+# deadband.py - Per-node deadband / swinging-door compression of live readings
+"""
+Indoor nodes report nearly the same values every cycle. With a rule for
+a node, the ingest path stores only the readings that carry information:
+
+- deadband: a reading is stored when a metric moved more than its
+  tolerance away from the last stored reading. Holding the last stored
+  value (step) reproduces every dropped reading within the tolerance
+- swinging door: the newest reading is held back. It is stored once a
+  later reading no longer fits a straight line from the last stored
+  reading within tolerance of every reading in between, so drawing lines
+  between stored readings (linear) reproduces the dropped ones
+- heartbeat: a reading is stored at least every `max_interval` seconds
+  whatever the values, so a gap in storage still means a gap in reports
+- a metric appearing or disappearing (NULL) always stores the reading
+
+Only the measured metrics (FIELDS) are compared; the stored reading keeps
+its own RSSI, SNR and gateways. Counters are exact per node: received =
+stored + suppressed + held. filter() hands back an undo token, so a batch
+the writers turn away (429) leaves the state as it was for the retry.
+
+reconstruct() fills history back in: between two stored readings of a
+compressed node it adds points at the node's report cadence (step or
+linear), and it extends the series to the newest reading received.
+Backdated uploads bypass the filter (late_data.py) and are stored as is.
+"""
+
+import copy
+import json
+import threading
+import time
+from collections import deque
+
+from late_data import reading_epoch
+from recent_cache import from_epoch, to_epoch
+from storage import Reading, normalize_timestamp
+
+MODES = ('deadband', 'swinging_door')
+FIELDS = ('temperature_c', 'humidity', 'pressure_hpa', 'battery_voltage')
+# Tolerances in canonical units: below the sensors' noise, invisible on a chart
+DEFAULT_TOLERANCES = {'temperature_c': 0.1, 'humidity': 0.5, 'pressure_hpa': 0.1, 'battery_voltage': 0.01}
+MAX_INTERVAL_SECONDS = 3 * 3600.0
+DEFAULT_CADENCE_SECONDS = 900.0
+CADENCE_SAMPLES = 8
+# Reports closer together than this are retries, not a cycle
+MIN_INTERVAL_SECONDS = 30.0
+REASONS = ('first', 'deviation', 'heartbeat', 'out_of_order', 'flush')
+FILLS = ('auto', 'step', 'linear', 'none')
+
+
+class CompressionRule:
+    """Compression settings for one node; node_id None applies to every node without its own rule"""
+
+    __slots__ = ('node_id', 'mode', 'tolerances', 'max_interval')
+
+    def __init__(self, node_id=None, mode='deadband', tolerance=None, max_interval=MAX_INTERVAL_SECONDS):
+        if mode not in MODES:
+            raise ValueError(f"Unknown compression mode: {mode} (use one of {', '.join(MODES)})")
+        tolerances = dict(DEFAULT_TOLERANCES)
+        for field, value in (tolerance or {}).items():
+            if field not in FIELDS:
+                raise ValueError(f"Unknown metric for node {node_id}: {field} (use one of {', '.join(FIELDS)})")
+            tolerances[field] = float(value)
+        if max_interval <= 0:
+            raise ValueError(f"max_interval must be positive for node {node_id}")
+        self.node_id = str(node_id) if node_id is not None else None
+        self.mode = mode
+        self.tolerances = tolerances
+        self.max_interval = float(max_interval)
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Rule from its JSON form, e.g. {"node_id": "1001", "mode": "deadband", "tolerance": {"humidity": 1}}"""
+        spec = dict(spec)
+        if 'max_interval_minutes' in spec:
+            spec['max_interval'] = float(spec.pop('max_interval_minutes')) * 60.0
+        try:
+            return cls(**spec)
+        except TypeError as e:
+            raise ValueError(f"Bad compression rule for node {spec.get('node_id')}: {e}")
+
+    def to_dict(self):
+        return {'node_id': self.node_id, 'mode': self.mode, 'tolerance': self.tolerances,
+                'max_interval_minutes': self.max_interval / 60.0}
+
+    @property
+    def fill(self):
+        """How history between stored readings is drawn"""
+        return 'step' if self.mode == 'deadband' else 'linear'
+
+
+def load_rules(path):
+    """Rules from a JSON file holding a list of rule objects; none (compression off) if the file is missing"""
+    try:
+        with open(path) as f:
+            specs = json.load(f)
+    except FileNotFoundError:
+        return []
+    return [CompressionRule.from_dict(spec) for spec in specs]
+
+
+class NodeState:
+    """What the filter remembers about one node"""
+
+    __slots__ = ('pivot_t', 'pivot', 'held', 'held_t', 'lower', 'upper', 'last_t', 'last', 'intervals',
+                 'received', 'suppressed', 'stored')
+
+    def __init__(self):
+        self.pivot_t = None   # time and values of the last stored reading
+        self.pivot = None
+        self.held = None      # swinging door: newest reading, not stored yet
+        self.held_t = None
+        self.lower = {}       # swinging door: slope bounds from the readings between pivot and held
+        self.upper = {}
+        self.last_t = None    # newest reading received
+        self.last = None
+        self.intervals = deque(maxlen=CADENCE_SAMPLES)
+        self.received = 0
+        self.suppressed = 0
+        self.stored = dict.fromkeys(REASONS, 0)
+
+    def copy(self):
+        state = copy.copy(self)
+        state.lower, state.upper = dict(self.lower), dict(self.upper)
+        state.intervals = deque(self.intervals, maxlen=CADENCE_SAMPLES)
+        state.stored = dict(self.stored)
+        return state
+
+    def cadence(self):
+        if not self.intervals:
+            return DEFAULT_CADENCE_SECONDS
+        ordered = sorted(self.intervals)
+        return ordered[len(ordered) // 2]
+
+
+def _values(reading):
+    values = []
+    for field in FIELDS:
+        value = reading.get(field)
+        try:
+            values.append(None if value is None else float(value))
+        except (TypeError, ValueError):
+            values.append(None)
+    return tuple(values)
+
+
+def _same_presence(a, b):
+    return all((x is None) == (y is None) for x, y in zip(a, b))
+
+
+class DeadbandFilter:
+    """Decides which live readings of compressed nodes are stored"""
+
+    def __init__(self, rules=()):
+        self.rules = {}
+        self.default_rule = None
+        for rule in rules:
+            if rule.node_id is None:
+                self.default_rule = rule
+            else:
+                self.rules[rule.node_id] = rule
+        self.nodes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.rules) or self.default_rule is not None
+
+    def rule(self, node_id):
+        return self.rules.get(str(node_id), self.default_rule)
+
+    def prime(self, latest=()):
+        """Start from the newest stored reading per node (after a restart)"""
+        with self._lock:
+            for reading in latest:
+                node_id = str(reading['node_id'])
+                if self.rule(node_id) is None or node_id in self.nodes:
+                    continue
+                t = reading_epoch(reading)
+                if t is None:
+                    continue
+                state = self.nodes[node_id] = NodeState()
+                state.pivot_t = state.last_t = t
+                state.pivot = _values(reading)
+                state.last = reading
+
+    # ----- filtering -----
+
+    def filter(self, readings):
+        """(readings to store, undo token) for a batch of live readings, in arrival order
+
+        Readings of nodes without a rule pass through. The list can hold
+        swinging-door readings held back by earlier calls; rollback(undo)
+        forgets the batch if it isn't stored after all
+        """
+        store, undo = [], {}
+        with self._lock:
+            for reading in readings:
+                node_id = reading.get('node_id')
+                rule = self.rule(node_id) if node_id is not None else None
+                if rule is None:
+                    store.append(reading)
+                    continue
+                node_id = str(node_id)
+                state = self.nodes.get(node_id)
+                if node_id not in undo:
+                    undo[node_id] = state.copy() if state is not None else None
+                if state is None:
+                    state = self.nodes[node_id] = NodeState()
+                # Held readings are stored later: pin server time now for readings sent without one
+                reading['timestamp'] = normalize_timestamp(reading.get('timestamp'))
+                t = reading_epoch(reading)
+                if t is None:
+                    store.append(reading)  # unparseable timestamp: stored as sent, outside the filter
+                    continue
+                self._add(rule, state, reading, t, store)
+        return store, undo
+
+    def rollback(self, undo):
+        """Restore the node states a filter() call changed (its readings were not stored)"""
+        with self._lock:
+            for node_id, state in undo.items():
+                if state is None:
+                    self.nodes.pop(node_id, None)
+                else:
+                    self.nodes[node_id] = state
+
+    def _add(self, rule, state, reading, t, store):
+        state.received += 1
+        values = _values(reading)
+        if state.last_t is not None and t <= state.last_t:
+            # Out of order (a retry, or a clock step back): keep it, leave the line alone
+            self._store(state, reading, store, 'out_of_order')
+            return
+        if state.last_t is not None and MIN_INTERVAL_SECONDS <= t - state.last_t <= 4 * rule.max_interval:
+            state.intervals.append(t - state.last_t)
+        state.last_t, state.last = t, reading
+        if state.pivot is None:
+            reason = 'first'
+        elif not _same_presence(values, state.pivot):
+            reason = 'deviation'
+        elif rule.mode == 'swinging_door':
+            self._swing(rule, state, reading, t, values, store)
+            if t - state.pivot_t >= rule.max_interval:
+                # The reading just held ends the segment
+                self._release(state, store, 'heartbeat')
+            return
+        elif t - state.pivot_t >= rule.max_interval:
+            reason = 'heartbeat'
+        elif self._outside(rule, state.pivot, values):
+            reason = 'deviation'
+        else:
+            state.suppressed += 1
+            return
+        self._release(state, store, 'deviation')
+        self._store(state, reading, store, reason)
+        state.pivot_t, state.pivot = t, values
+
+    def _outside(self, rule, pivot, values):
+        tolerances = rule.tolerances
+        for field, p, v in zip(FIELDS, pivot, values):
+            if p is not None and abs(v - p) > tolerances[field]:
+                return True
+        return False
+
+    def _swing(self, rule, state, reading, t, values, store):
+        """Hold the reading if a line from the pivot to it stays within tolerance of everything between"""
+        lower, upper = dict(state.lower), dict(state.upper)
+        if state.held is not None:
+            # The held reading becomes one of the readings in between
+            dt = state.held_t - state.pivot_t
+            for field, p, v in zip(FIELDS, state.pivot, _values(state.held)):
+                if p is None:
+                    continue
+                tolerance = rule.tolerances[field]
+                lower[field] = max(lower.get(field, float('-inf')), (v - p - tolerance) / dt)
+                upper[field] = min(upper.get(field, float('inf')), (v - p + tolerance) / dt)
+        dt = t - state.pivot_t
+        fits = all(lower[f] <= (v - p) / dt <= upper[f]
+                   for f, p, v in zip(FIELDS, state.pivot, values) if p is not None and f in lower)
+        if fits:
+            if state.held is not None:
+                state.suppressed += 1
+            state.lower, state.upper = lower, upper
+        else:
+            # The door closed: the held reading ends the segment and starts the next one
+            self._release(state, store, 'deviation')
+            state.lower, state.upper = {}, {}
+        state.held, state.held_t = reading, t
+
+    def _release(self, state, store, reason):
+        """Store the held reading (if any) and make it the pivot"""
+        if state.held is None:
+            return
+        self._store(state, state.held, store, reason)
+        state.pivot_t, state.pivot = state.held_t, _values(state.held)
+        state.held = state.held_t = None
+        state.lower, state.upper = {}, {}
+
+    def _store(self, state, reading, store, reason):
+        store.append(reading)
+        state.stored[reason] += 1
+
+    def flush(self, now=None, force=False):
+        """(readings to store, undo) for held readings whose heartbeat is due, or all of them with force"""
+        now = time.time() if now is None else now
+        store, undo = [], {}
+        with self._lock:
+            for node_id, state in self.nodes.items():
+                if state.held is None:
+                    continue
+                rule = self.rule(node_id)
+                if force or rule is None or now - state.pivot_t >= rule.max_interval:
+                    undo[node_id] = state.copy()
+                    self._release(state, store, 'flush')
+        return store, undo
+
+    # ----- reads -----
+
+    def latest(self, rows):
+        """Latest rows with each compressed node's newest received reading where it isn't stored yet"""
+        with self._lock:
+            newest = {node_id: state.last for node_id, state in self.nodes.items() if state.last is not None}
+        merged = []
+        for row in rows:
+            received = newest.pop(str(row['node_id']), None)
+            if received is not None and reading_epoch(received) > (reading_epoch(row) or 0):
+                # Same fields as the stored row; a reading that isn't stored has no id
+                row = Reading(**{name: received.get(name) for name in row})
+            merged.append(row)
+        return merged
+
+    def reconstruct(self, rows, names, fill='auto'):
+        """History rows (tuples laid out as names, newest first) with dropped readings filled back in
+
+        Added rows have id None. fill 'auto' draws each node the way its
+        rule compresses (deadband step, swinging door linear)
+        """
+        if fill == 'none' or not self.enabled:
+            return rows
+        id_index, node_index, ts_index = names.index('id'), names.index('node_id'), names.index('timestamp')
+        numeric = [i for i, name in enumerate(names) if name not in ('id', 'node_id', 'timestamp')]
+        by_node = {}
+        for row in rows:
+            by_node.setdefault(str(row[node_index]), []).append(row)
+        if not any(self.rule(node_id) for node_id in by_node):
+            return rows
+        with self._lock:
+            anchors = {node_id: (state.last_t, state.last, state.cadence())
+                       for node_id, state in self.nodes.items() if state.last is not None}
+        filled = []
+        for node_id, node_rows in by_node.items():
+            rule = self.rule(node_id)
+            if rule is None:
+                filled.extend(node_rows)
+                continue
+            mode = rule.fill if fill == 'auto' else fill
+            last_t, last, cadence = anchors.get(node_id, (None, None, DEFAULT_CADENCE_SECONDS))
+            try:
+                series = [(to_epoch(row[ts_index]), row) for row in reversed(node_rows)]
+            except (TypeError, ValueError):
+                filled.extend(node_rows)  # timestamps stored as sent: nothing to interpolate on
+                continue
+            if last is not None and last_t > series[-1][0]:
+                # Up to the newest reading received (held back or dropped)
+                anchor = tuple(None if name == 'id' else last.get(name) for name in names)
+                series.append((last_t, anchor))
+            out = [series[0][1]]
+            for (t0, a), (t1, b) in zip(series, series[1:]):
+                if t1 - t0 <= rule.max_interval + cadence + MIN_INTERVAL_SECONDS:
+                    # A longer gap is a real gap in reports: left empty
+                    t = t0 + cadence
+                    while t < t1 - MIN_INTERVAL_SECONDS:
+                        out.append(self._point(a, b, (t - t0) / (t1 - t0), mode, numeric, id_index, ts_index, t))
+                        t += cadence
+                out.append(b)
+            filled.extend(reversed(out))
+        # Newest first as the query returned them, ties by id
+        filled.sort(key=lambda row: (row[ts_index], row[id_index] or 0), reverse=True)
+        return filled
+
+    def _point(self, a, b, f, mode, numeric, id_index, ts_index, t):
+        point = list(a)
+        point[id_index] = None
+        point[ts_index] = from_epoch(t)
+        if mode == 'linear':
+            for i in numeric:
+                if a[i] is not None and b[i] is not None:
+                    point[i] = round(a[i] + (b[i] - a[i]) * f, 6)
+        return tuple(point)
+
+    def metrics(self):
+        """Exact counters per node and in total: received = stored + suppressed + held"""
+        with self._lock:
+            nodes = {}
+            for node_id, state in self.nodes.items():
+                stored = sum(state.stored.values())
+                nodes[node_id] = {
+                    'mode': self.rule(node_id).mode if self.rule(node_id) else None,
+                    'received': state.received,
+                    'stored': stored,
+                    'suppressed': state.suppressed,
+                    'held': int(state.held is not None),
+                    'stored_by_reason': dict(state.stored),
+                    'cadence_seconds': round(state.cadence(), 1),
+                }
+        totals = {key: sum(node[key] for node in nodes.values()) for key in ('received', 'stored', 'suppressed', 'held')}
+        totals['suppressed_ratio'] = round(totals['suppressed'] / totals['received'], 4) if totals['received'] else None
+        return {'totals': totals, 'nodes': nodes}
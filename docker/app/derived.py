@@ -0,0 +1,147 @@
+# derived.py - Weather metrics derived from temperature, humidity and pressure
+"""
+Metrics the server can work out from a BME280 reading:
+
+- heat_index (°F): the gateway firmware's formula (Rothfusz regression
+  above 80°F), so server-filled and gateway-sent values agree
+- dew_point (°C): Magnus formula, same constants as the firmware
+- absolute_humidity (g/m³)
+- sea_level_pressure_hpa: station pressure reduced to sea level for the
+  site altitude (hypsometric formula)
+
+The scalar functions serve the ingest path, one reading at a time.
+derive_columns() computes whole result columns at once with NumPy, for
+history pages and backfills. Without NumPy it falls back to the scalar
+functions.
+"""
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Stored in the readings tables (heat_index, dew_point columns)
+STORED_METRICS = ('heat_index', 'dew_point')
+# Computed when read (sea-level pressure depends on the configured altitude)
+DERIVED_METRICS = STORED_METRICS + ('absolute_humidity', 'sea_level_pressure_hpa')
+
+DECIMALS = 2
+
+
+def available():
+    """Whether derive_columns() is vectorized"""
+    return np is not None
+
+
+# ----- scalar fast path -----
+
+def heat_index_f(temperature_f, humidity):
+    if temperature_f < 80.0:
+        return temperature_f
+    hi = 0.5 * (temperature_f + 61.0 + (temperature_f - 68.0) * 1.2 + humidity * 0.094)
+    if hi > 79.0:
+        t, rh = temperature_f, humidity
+        hi = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh - 0.00683783 * t * t
+              - 0.05481717 * rh * rh + 0.00122874 * t * t * rh + 0.00085282 * t * rh * rh
+              - 0.00000199 * t * t * rh * rh)
+    return hi
+
+
+def dew_point_c(temperature_c, humidity):
+    if humidity <= 0:
+        return None
+    alpha = 17.27 * temperature_c / (237.7 + temperature_c) + math.log(humidity / 100.0)
+    return 237.7 * alpha / (17.27 - alpha)
+
+
+def absolute_humidity(temperature_c, humidity):
+    vapour_hpa = 6.112 * math.exp(17.67 * temperature_c / (temperature_c + 243.5)) * humidity / 100.0
+    return 216.74 * vapour_hpa / (273.15 + temperature_c)
+
+
+def sea_level_pressure(pressure_hpa, temperature_c, altitude_m=0.0):
+    if not altitude_m:
+        return pressure_hpa
+    lapse = 0.0065 * altitude_m
+    return pressure_hpa * (1.0 - lapse / (temperature_c + lapse + 273.15)) ** -5.257
+
+
+def _rounded(value):
+    return None if value is None else round(value, DECIMALS)
+
+
+def derive_one(temperature_c, humidity, pressure_hpa=None, altitude_m=0.0, metrics=DERIVED_METRICS):
+    """Derived metrics of one reading as a dict (None where an input is missing)"""
+    values = dict.fromkeys(metrics)
+    if temperature_c is None:
+        return values
+    if humidity is not None:
+        if 'heat_index' in values:
+            values['heat_index'] = _rounded(heat_index_f(temperature_c * 9.0 / 5.0 + 32.0, humidity))
+        if 'dew_point' in values:
+            values['dew_point'] = _rounded(dew_point_c(temperature_c, humidity))
+        if 'absolute_humidity' in values:
+            values['absolute_humidity'] = _rounded(absolute_humidity(temperature_c, humidity))
+    if pressure_hpa is not None and 'sea_level_pressure_hpa' in values:
+        values['sea_level_pressure_hpa'] = _rounded(sea_level_pressure(pressure_hpa, temperature_c, altitude_m))
+    return values
+
+
+def fill_reading(reading):
+    """Set a reading's heat_index/dew_point when the gateway didn't send them (ingest path)"""
+    if reading.get('heat_index') is not None and reading.get('dew_point') is not None:
+        return reading
+    values = derive_one(reading.get('temperature_c'), reading.get('humidity'), metrics=STORED_METRICS)
+    for metric, value in values.items():
+        if reading.get(metric) is None:
+            reading[metric] = value
+    return reading
+
+
+# ----- vectorized -----
+
+def derive_columns(temperature_c, humidity, pressure_hpa=None, altitude_m=0.0, metrics=DERIVED_METRICS):
+    """Derived metric columns (lists, None where an input is missing) for parallel input columns"""
+    if np is None:
+        pressures = pressure_hpa if pressure_hpa is not None else [None] * len(temperature_c)
+        rows = [derive_one(t, h, p, altitude_m, metrics) for t, h, p in zip(temperature_c, humidity, pressures)]
+        return {metric: [row[metric] for row in rows] for metric in metrics}
+
+    # None becomes NaN, and NaN flows through every formula below
+    t = np.array(temperature_c, dtype=float)
+    rh = np.array(humidity, dtype=float)
+    columns = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if 'heat_index' in metrics:
+            t_f = t * 9.0 / 5.0 + 32.0
+            simple = 0.5 * (t_f + 61.0 + (t_f - 68.0) * 1.2 + rh * 0.094)
+            rothfusz = (-42.379 + 2.04901523 * t_f + 10.14333127 * rh - 0.22475541 * t_f * rh
+                        - 0.00683783 * t_f * t_f - 0.05481717 * rh * rh + 0.00122874 * t_f * t_f * rh
+                        + 0.00085282 * t_f * rh * rh - 0.00000199 * t_f * t_f * rh * rh)
+            hi = np.where(simple > 79.0, rothfusz, simple)
+            # Keep NaN humidity as NaN below 80°F too, like derive_one()
+            columns['heat_index'] = np.where(t_f < 80.0, t_f + rh * 0.0, hi)
+        if 'dew_point' in metrics:
+            alpha = 17.27 * t / (237.7 + t) + np.log(np.where(rh > 0, rh, np.nan) / 100.0)
+            columns['dew_point'] = 237.7 * alpha / (17.27 - alpha)
+        if 'absolute_humidity' in metrics:
+            vapour = 6.112 * np.exp(17.67 * t / (t + 243.5)) * rh / 100.0
+            columns['absolute_humidity'] = 216.74 * vapour / (273.15 + t)
+        if 'sea_level_pressure_hpa' in metrics:
+            p = np.array(pressure_hpa if pressure_hpa is not None else [None] * len(t), dtype=float)
+            if altitude_m:
+                lapse = 0.0065 * altitude_m
+                p = p * (1.0 - lapse / (t + lapse + 273.15)) ** -5.257
+            columns['sea_level_pressure_hpa'] = p + t * 0.0
+    return {metric: _to_list(columns[metric]) for metric in metrics}
+
+
+def _to_list(values):
+    """Rounded Python floats with None for NaN"""
+    values = np.round(values, DECIMALS)
+    missing = np.isnan(values)
+    if not missing.any():
+        return values.tolist()
+    return np.where(missing, None, values).tolist()
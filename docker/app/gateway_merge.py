@@ -0,0 +1,267 @@
+# gateway_merge.py - Collapse one LoRa packet heard by several gateways into one reading
+"""
+With overlapping gateways every packet a node sends can arrive once per
+gateway that heard it. The merge stage sits between the ingest endpoints
+and storage:
+
+- packet key: (node_id, collection_cycle), else (node_id, node timestamp),
+  else (node_id, measured values). Gateway clocks and upload times differ,
+  but the packet's own contents don't
+- hold window: the first copy of a packet waits at most `window_seconds`
+  for the others, then one reading is stored with the best RSSI/SNR, the
+  gateway that got it and every gateway that heard it. The hold is the
+  only delay the dashboard sees
+- late copies (after the hold, within `late_seconds`) aren't stored again;
+  if one adds a gateway or a better signal, the stored row is updated
+- bounded: at most `max_pending` packets are held (submit() refuses more,
+  the endpoint answers 429) and `max_recent` stored keys are remembered
+- a failed insert doesn't lose the batch: each packet is retried on its
+  own, and only one that keeps failing is dropped (counted as `failed`)
+
+A gateway re-posting after a response timeout is collapsed the same way.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Fields the merge decides and late copies may update
+MERGED_FIELDS = ('rssi', 'snr', 'gateway_id', 'gateways')
+RETRY_SECONDS = 0.1
+# Failed inserts of one packet before it is dropped as unstorable
+STORE_ATTEMPTS = 3
+
+
+def packet_key(reading):
+    """Identity of the LoRa packet a reading came from"""
+    node_id = str(reading.get('node_id'))
+    cycle = reading.get('collection_cycle')
+    if cycle is not None:
+        return node_id, 'cycle', cycle
+    node_timestamp = reading.get('node_timestamp')
+    if node_timestamp:
+        return node_id, 'node_ts', node_timestamp
+    values = tuple(None if reading.get(f) is None else round(float(reading.get(f)), 3)
+                   for f in ('temperature_c', 'humidity', 'pressure_hpa', 'battery_voltage'))
+    return (node_id, 'values') + values
+
+
+def _signal(rssi, snr):
+    """Sort key for reception quality: RSSI first, SNR breaks ties; missing values rank last"""
+    return (rssi if rssi is not None else float('-inf'), snr if snr is not None else float('-inf'))
+
+
+class Packet:
+    """One packet's copies: the reading to store and who heard it how well"""
+
+    __slots__ = ('reading', 'heard', 'first_seen', 'deadline', 'failures')
+
+    def __init__(self, reading, gateway, now, window):
+        self.reading = reading
+        self.heard = {}  # gateway -> (rssi, snr)
+        self.first_seen = now
+        self.deadline = now + window
+        self.failures = 0
+        self.add(gateway, reading.get('rssi'), reading.get('snr'))
+
+    def add(self, gateway, rssi, snr):
+        """Record a copy; True if it changed what gets stored"""
+        gateway = str(gateway) if gateway is not None else 'UNKNOWN'
+        previous = self.heard.get(gateway)
+        if previous is not None and _signal(rssi, snr) <= _signal(*previous):
+            return False
+        self.heard[gateway] = (rssi, snr)
+        best = max(self.heard, key=lambda g: _signal(*self.heard[g]))
+        reading = self.reading
+        changed = previous is None or reading.get('gateway_id') != best
+        best_rssi, best_snr = self.heard[best]
+        changed = changed or (best_rssi, best_snr) != (reading.get('rssi'), reading.get('snr'))
+        reading['rssi'], reading['snr'] = best_rssi, best_snr
+        reading['gateway_id'] = best
+        reading['gateways'] = ','.join(sorted(self.heard))
+        return changed
+
+
+class GatewayMerge:
+    """Hold window and late-duplicate memory in front of storage"""
+
+    def __init__(self, store, update=None, window_seconds=2.0, late_seconds=120.0, max_pending=10000,
+                 max_recent=50000):
+        self.store = store    # store(readings) -> False when it couldn't write (retried)
+        self.update = update  # storage.update_fields, for late copies that improve a stored row
+        self.window = window_seconds
+        self.late_seconds = late_seconds
+        self.max_pending = max_pending
+        self.max_recent = max_recent
+        self.pending = OrderedDict()  # key -> Packet, oldest (earliest deadline) first
+        self.recent = OrderedDict()   # key -> Packet already stored
+        self.improved = {}            # key -> stored Packet whose merged fields changed late
+        self.counters = dict.fromkeys(('received', 'stored', 'merged', 'late', 'late_updates', 'rejected',
+                                       'failed'), 0)
+        self.heard_by = {}            # gateways per stored packet -> packets
+        self.max_hold = 0.0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # one flush at a time: the thread, atexit or a caller
+        self._closed = False
+        self._thread = None
+
+    def submit(self, reading, gateway, now=None):
+        """Queue one gateway's copy of a reading; False if the hold window is full"""
+        now = time.time() if now is None else now
+        key = packet_key(reading)
+        with self._cond:
+            self.counters['received'] += 1
+            packet = self.pending.get(key)
+            if packet is not None:
+                packet.add(gateway, reading.get('rssi'), reading.get('snr'))
+                self.counters['merged'] += 1
+                return True
+            packet = self.recent.get(key)
+            if packet is not None and now - packet.first_seen <= self.late_seconds:
+                self.counters['late'] += 1
+                if packet.add(gateway, reading.get('rssi'), reading.get('snr')) and self.update:
+                    self.improved[key] = packet
+                    self._cond.notify()
+                return True
+            if len(self.pending) >= self.max_pending:
+                self.counters['rejected'] += 1
+                return False
+            self.pending[key] = Packet(reading, gateway, now, self.window)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='gateway-merge', daemon=True)
+                self._thread.start()
+            elif len(self.pending) == 1:
+                self._cond.notify()
+        return True
+
+    def _run(self):
+        with self._cond:
+            while not self._closed:
+                wait = None
+                if self.pending:
+                    wait = max(next(iter(self.pending.values())).deadline - time.time(), 0)
+                if self.improved:
+                    wait = 0
+                if wait is None or wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                self._cond.release()
+                try:
+                    if not self.flush(time.time()):
+                        time.sleep(RETRY_SECONDS)
+                except Exception as e:
+                    print(f"Gateway merge flush error: {e}")
+                    time.sleep(RETRY_SECONDS)
+                finally:
+                    self._cond.acquire()
+
+    def flush(self, now=None):
+        """Store every packet whose hold has ended (all of them when now is None); False if storage was busy"""
+        with self._flush_lock:
+            with self._cond:
+                due = []
+                for key, packet in self.pending.items():
+                    if now is not None and packet.deadline > now:
+                        break
+                    due.append((key, packet))
+                # From here on copies of these packets count as late: they must not change a row mid-insert
+                for key, packet in due:
+                    del self.pending[key]
+                    self.recent[key] = packet
+                improved = {key: packet for key, packet in self.improved.items() if packet.reading.get('id')}
+                for key in improved:
+                    del self.improved[key]
+            ok = True
+            if improved and self.update:
+                try:
+                    readings = [packet.reading for packet in improved.values()]
+                    self.update(MERGED_FIELDS, [r['id'] for r in readings],
+                                [[r.get(f) for r in readings] for f in MERGED_FIELDS])
+                    with self._cond:
+                        self.counters['late_updates'] += len(improved)
+                except Exception as e:
+                    print(f"Gateway merge update error: {e}")
+                    ok = False
+                    with self._cond:
+                        self.improved.update(improved)
+            if not due:
+                return ok
+            stored, retry, failed = self._store(due)
+            stored_at = time.time()
+            with self._cond:
+                # Back to the front of the hold queue; copies merged meanwhile are already in the readings
+                for key, packet in reversed(retry):
+                    self.recent.pop(key, None)
+                    self.improved.pop(key, None)
+                    self.pending[key] = packet
+                    self.pending.move_to_end(key, last=False)
+                for key, packet in failed:
+                    self.recent.pop(key, None)
+                    self.improved.pop(key, None)
+                for key, packet in stored:
+                    copies = len(packet.heard)
+                    self.heard_by[copies] = self.heard_by.get(copies, 0) + 1
+                    self.max_hold = max(self.max_hold, stored_at - packet.first_seen)
+                self.counters['stored'] += len(stored)
+                self.counters['failed'] += len(failed)
+                self._expire(stored_at)
+            return ok and not retry
+
+    def _store(self, due):
+        """Store due packets; returns (stored, to retry, dropped) lists of (key, packet)"""
+        try:
+            if self.store([packet.reading for _, packet in due]):
+                return due, [], []
+            return [], due, []
+        except Exception as e:
+            if len(due) > 1:
+                print(f"Gateway merge store error, storing {len(due)} readings one by one: {e}")
+            error = e
+        if len(due) == 1:
+            results = [(due[0], error)]
+        else:
+            # One bad reading must not take the rest of the batch with it
+            results = []
+            for item in due:
+                try:
+                    results.append((item, self.store([item[1].reading])))
+                except Exception as e:
+                    results.append((item, e))
+        stored, retry, failed = [], [], []
+        for item, result in results:
+            if not isinstance(result, Exception):
+                (stored if result else retry).append(item)
+                continue
+            item[1].failures += 1
+            if item[1].failures < STORE_ATTEMPTS:
+                retry.append(item)
+            else:
+                print(f"Gateway merge dropped a reading from node {item[0][0]} after "
+                      f"{STORE_ATTEMPTS} failed inserts: {result}")
+                failed.append(item)
+        return stored, retry, failed
+
+    def _expire(self, now):
+        recent = self.recent
+        while recent:
+            key, packet = next(iter(recent.items()))
+            if len(recent) <= self.max_recent and now - packet.first_seen <= self.late_seconds:
+                break
+            del recent[key]
+
+    def close(self):
+        """Stop the background thread and store whatever is still held"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+
+    def metrics(self):
+        with self._cond:
+            return dict(self.counters,
+                        pending=len(self.pending),
+                        remembered=len(self.recent),
+                        window_ms=round(self.window * 1000),
+                        late_seconds=self.late_seconds,
+                        max_hold_ms=round(self.max_hold * 1000, 1),
+                        gateways_per_packet={str(k): v for k, v in sorted(self.heard_by.items())})
@@ -0,0 +1,120 @@
+# late_data.py - Backdated readings: sorted bulk inserts and dirty time buckets
+"""
+A gateway that lost Wi-Fi can hold readings and upload them when it
+reconnects, hours late and out of order. What that costs here:
+
+- inserts: a backlog is stored in one transaction, sorted by (node_id,
+  timestamp) so the executemany walks the (node_id, timestamp) index in
+  order instead of jumping around it. split_backdated() separates a batch
+  from live readings, which still go through the gateway merge window
+- cached state: every stored reading whose hour has already ended marks
+  (node_id, hour) dirty. Each consumer (the aggregate cache) takes its own
+  marks and recomputes those buckets only, never the whole history
+- marks are bounded per consumer; past max_marks a consumer is told to
+  drop everything instead (take() returns None)
+
+The recent cache and node statistics take late rows in place (ring
+inserts in time order, mergeable per-bucket moments), so they don't need
+marks.
+"""
+
+import threading
+import time
+
+from recent_cache import to_epoch
+from storage import normalize_timestamp
+
+BUCKET_SECONDS = 3600
+# Older than this on arrival counts as backdated (one reporting interval)
+LATE_AFTER_SECONDS = 900.0
+
+
+def reading_epoch(reading):
+    """Epoch seconds of a reading's timestamp, stored or as the gateway sent it (None if missing)"""
+    timestamp = reading.get('timestamp')
+    if not timestamp:
+        return None
+    try:
+        return to_epoch(timestamp)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return to_epoch(normalize_timestamp(timestamp))
+    except (TypeError, ValueError):
+        return None  # unparseable: storage keeps the text as sent
+
+
+def split_backdated(readings, now=None, late_after=LATE_AFTER_SECONDS):
+    """(backdated, live) readings of one upload; readings without a timestamp are live"""
+    now = time.time() if now is None else now
+    backdated, live = [], []
+    for reading in readings:
+        ts = reading_epoch(reading)
+        (backdated if ts is not None and ts < now - late_after else live).append(reading)
+    return backdated, live
+
+
+def sort_readings(readings):
+    """Readings in (node_id, timestamp) order for a bulk insert"""
+    # One upload uses one timestamp format, and its text sorts in time order without parsing
+    return sorted(readings, key=lambda r: (str(r.get('node_id')), str(r.get('timestamp') or '')))
+
+
+class DirtyBuckets:
+    """(node_id, hour) buckets that late readings changed, kept separately for each consumer"""
+
+    def __init__(self, bucket_seconds=BUCKET_SECONDS, max_marks=100000):
+        self.bucket_seconds = bucket_seconds
+        self.max_marks = max_marks
+        self.consumers = {}  # name -> set of (node_id, bucket start), or None after an overflow
+        self.sequence = 0    # bumped whenever anything is marked, for caches racing a late insert
+        self.observed = 0
+        self.late = 0
+        self.overflows = 0
+        self._lock = threading.Lock()
+
+    def register(self, name):
+        with self._lock:
+            self.consumers.setdefault(name, set())
+
+    def observe(self, readings, now=None):
+        """Mark the buckets of stored readings whose hour has ended (ingest listener)"""
+        now = time.time() if now is None else now
+        width = self.bucket_seconds
+        open_start = now - now % width
+        marks, late = set(), 0
+        for reading in readings:
+            ts = reading_epoch(reading)
+            if ts is not None and ts < open_start and reading.get('node_id') is not None:
+                marks.add((str(reading['node_id']), ts - ts % width))
+                late += 1
+        with self._lock:
+            self.observed += len(readings)
+            if not marks:
+                return
+            self.late += late
+            self.sequence += 1
+            for name, pending in self.consumers.items():
+                if pending is None:
+                    continue
+                pending |= marks
+                if len(pending) > self.max_marks:
+                    self.consumers[name] = None
+                    self.overflows += 1
+
+    def take(self, name):
+        """A consumer's marks since its last take(); None means recompute everything"""
+        with self._lock:
+            marks = self.consumers[name]
+            self.consumers[name] = set()
+            return marks
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'observed': self.observed,
+                'late': self.late,
+                'bucket_seconds': self.bucket_seconds,
+                'pending': {name: None if marks is None else len(marks) for name, marks in self.consumers.items()},
+                'overflows': self.overflows,
+            }
@@ -0,0 +1,287 @@
+# liveness.py - Node liveness from each node's own reporting cadence
+"""
+Tracks whether every node is online, stale or offline without querying
+the readings table:
+
+- cadence: the median of a node's last few report intervals (15 minutes
+  for stock firmware); duplicate uploads and outages don't skew it
+- deadlines: each report schedules the node's next one on a heap. A node
+  that misses STALE_FACTOR intervals goes stale, one that misses
+  OFFLINE_FACTOR goes offline. advance() only pops deadlines that have
+  passed, so a tick is O(log n) per due deadline rather than a scan
+- events: every transition (online, stale, offline, back online) is
+  logged with a sequence number for polling and handed to listeners
+- node_status: is_active follows the tracker (0 once a node is offline)
+  and changes are written in one batch per tick, on schemas that keep
+  a node_status table
+"""
+
+import heapq
+import threading
+import time
+from collections import deque
+
+from recent_cache import from_epoch, stored_epoch
+
+STATES = ('online', 'stale', 'offline')
+DEFAULT_CADENCE_SECONDS = 900.0
+CADENCE_SAMPLES = 8
+STALE_FACTOR = 1.5
+OFFLINE_FACTOR = 4.0
+GRACE_SECONDS = 30.0
+# Uploads closer together than this are retries or a second gateway, not a new cycle
+MIN_INTERVAL_SECONDS = 30.0
+
+
+class NodeLiveness:
+    """One node's state, last report and recent report intervals"""
+
+    __slots__ = ('state', 'last_seen', 'intervals', 'generation', 'changed_at')
+
+    def __init__(self):
+        self.state = None
+        self.last_seen = None
+        self.intervals = deque(maxlen=CADENCE_SAMPLES)
+        self.generation = 0  # bumped per report; heap entries of older generations are dead
+        self.changed_at = None
+
+    def cadence(self, default):
+        if not self.intervals:
+            return default
+        ordered = sorted(self.intervals)
+        return ordered[len(ordered) // 2]
+
+
+class LivenessTracker:
+    """Online/stale/offline state of every node, driven by report deadlines"""
+
+    def __init__(self, storage=None, default_cadence=DEFAULT_CADENCE_SECONDS, stale_factor=STALE_FACTOR,
+                 offline_factor=OFFLINE_FACTOR, grace_seconds=GRACE_SECONDS, event_log=1000, listeners=None):
+        self.storage = storage
+        # node_status.is_active is only kept by schemas with a node table (the simple server's)
+        self.writes_status = bool(storage is not None and storage.schema.node_table)
+        self.default_cadence = default_cadence
+        self.stale_factor = stale_factor
+        self.offline_factor = max(offline_factor, stale_factor)
+        self.grace_seconds = grace_seconds
+        self.listeners = list(listeners or [])
+        self.nodes = {}
+        self.deadlines = []  # heap of (deadline, node_id, generation, next state)
+        self.events_log = deque(maxlen=event_log)
+        self.sequence = 0
+        self._notified = 0  # newest sequence handed to listeners
+        self.persisted = {}  # node_id -> is_active as stored
+        self.pending = {}    # node_id -> is_active to store on the next flush
+        self.ready = False
+        self.written = 0
+        self._quiet = False
+        self._lock = threading.Lock()
+
+    # ----- filling -----
+
+    def warm(self, hours=6.0, now=None):
+        """Learn cadences from recent rows and every node's latest reading; returns nodes tracked"""
+        now = time.time() if now is None else now
+        storage = self.storage
+        with self._lock:
+            self._quiet = True
+            try:
+                if self.writes_status:
+                    self.persisted = {row['node_id']: bool(row['is_active']) for row in storage.node_status()}
+                for reading in storage.iter_range(t0=from_epoch(now - hours * 3600), fields=('id',),
+                                                  descending=False):
+                    self._observe_stored(reading)
+                # Nodes quiet for longer than the window still need a deadline (long past, most likely)
+                for reading in storage.latest(fields=('id',)):
+                    self._observe_stored(reading)
+                self._advance(now)
+            finally:
+                self._quiet = False
+            self.ready = True
+            tracked = len(self.nodes)
+        # Rows still marked active for nodes that went offline while nothing was tracking them
+        self.flush()
+        return tracked
+
+    def observe(self, readings, now=None):
+        """Record that readings just arrived (ingest listener); arrival time, not gateway time, counts"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self.ready:
+                return
+            for reading in readings:
+                node_id = reading.get('node_id')
+                if node_id is not None:
+                    # The insert's node_status upsert has already set is_active = 1
+                    if self.writes_status:
+                        self.persisted[str(node_id)] = True
+                    self._observe(str(node_id), now)
+            events = self._take_events()
+        self._notify(events)
+
+    def _observe_stored(self, reading):
+        at = stored_epoch(reading['timestamp'])
+        if at is not None:  # timestamps stored as sent can't be placed on the schedule
+            self._observe(str(reading['node_id']), at)
+
+    def _observe(self, node_id, at):
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = NodeLiveness()
+        elif at <= node.last_seen:
+            return  # replayed or out of order: nothing new about this node's schedule
+        else:
+            interval = at - node.last_seen
+            cadence = node.cadence(self.default_cadence)
+            # Gaps from an outage say nothing about the cadence
+            if MIN_INTERVAL_SECONDS <= interval <= cadence * self.offline_factor + self.grace_seconds:
+                node.intervals.append(interval)
+        node.last_seen = at
+        node.generation += 1
+        self._schedule(node_id, node, 'stale', self.stale_factor)
+        if node.state != 'online':
+            self._transition(node_id, node, 'online', at)
+
+    def _schedule(self, node_id, node, state, factor):
+        deadline = node.last_seen + node.cadence(self.default_cadence) * factor + self.grace_seconds
+        heapq.heappush(self.deadlines, (deadline, node_id, node.generation, state))
+
+    # ----- deadlines -----
+
+    def advance(self, now=None):
+        """Apply every deadline that has passed; returns the transition events"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._advance(now)
+            events = self._take_events()
+        self._notify(events)
+        return events
+
+    def _advance(self, now):
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] <= now:
+            deadline, node_id, generation, state = heapq.heappop(deadlines)
+            node = self.nodes.get(node_id)
+            if node is None or node.generation != generation:
+                continue  # the node reported again since this was scheduled
+            self._transition(node_id, node, state, deadline)
+            if state == 'stale':
+                self._schedule(node_id, node, 'offline', self.offline_factor)
+
+    def _transition(self, node_id, node, state, at):
+        previous = node.state
+        node.state = state
+        node.changed_at = at
+        active = state != 'offline'
+        if self.writes_status and self.persisted.get(node_id) != active:
+            self.pending[node_id] = active
+        else:
+            self.pending.pop(node_id, None)
+        if self._quiet:
+            return
+        self.sequence += 1
+        self.events_log.append({
+            'seq': self.sequence,
+            'node_id': node_id,
+            'from': previous,
+            'to': state,
+            'at': from_epoch(at),
+            'last_seen': from_epoch(node.last_seen),
+            'cadence_seconds': round(node.cadence(self.default_cadence), 1),
+        })
+
+    def _take_events(self):
+        """Events logged since the last call, for the listeners (lock held)"""
+        if self.sequence == self._notified:
+            return []
+        new = [event for event in self.events_log if event['seq'] > self._notified]
+        self._notified = self.sequence
+        return new
+
+    def _notify(self, events):
+        if not events:
+            return
+        for listener in self.listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                print(f"Liveness listener error: {e}")
+
+    # ----- node_status -----
+
+    def flush(self):
+        """Write pending is_active changes in one batch; returns the number written"""
+        if not self.writes_status:
+            return 0
+        with self._lock:
+            changes, self.pending = self.pending, {}
+        if not changes:
+            return 0
+        try:
+            written = self.storage.set_node_active(changes)
+        except Exception:
+            with self._lock:
+                # Newer transitions win over the ones that failed to write
+                self.pending = dict(changes, **self.pending)
+            raise
+        with self._lock:
+            self.persisted.update(changes)
+            self.written += written
+        return written
+
+    def tick(self, now=None):
+        """advance() then flush(): what the background loop runs"""
+        events = self.advance(now)
+        self.flush()
+        return events
+
+    # ----- queries -----
+
+    def events(self, since=0, limit=None):
+        """Logged transitions after sequence number `since`, oldest first"""
+        with self._lock:
+            events = [event for event in self.events_log if event['seq'] > since]
+        return events[-limit:] if limit else events
+
+    def counts(self):
+        with self._lock:
+            counts = dict.fromkeys(STATES, 0)
+            for node in self.nodes.values():
+                if node.state in counts:
+                    counts[node.state] += 1
+            return counts
+
+    def node_states(self, now=None):
+        """Every node's state, last report, cadence and next deadline"""
+        now = time.time() if now is None else now
+        with self._lock:
+            states = []
+            for node_id, node in self.nodes.items():
+                cadence = node.cadence(self.default_cadence)
+                factor = self.stale_factor if node.state == 'online' else self.offline_factor
+                next_deadline = None
+                if node.state != 'offline':
+                    next_deadline = from_epoch(node.last_seen + cadence * factor + self.grace_seconds)
+                states.append({
+                    'node_id': node_id,
+                    'state': node.state,
+                    'since': from_epoch(node.changed_at),
+                    'last_seen': from_epoch(node.last_seen),
+                    'silent_seconds': round(max(now - node.last_seen, 0.0), 1),
+                    'cadence_seconds': round(cadence, 1),
+                    'next_deadline': next_deadline,
+                })
+        states.sort(key=lambda s: (STATES.index(s['state']), s['node_id']))
+        return states
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'nodes': len(self.nodes),
+                'heap_entries': len(self.deadlines),
+                'events': self.sequence,
+                'pending_writes': len(self.pending),
+                'status_writes': self.written,
+                'writes_status': self.writes_status,
+            }
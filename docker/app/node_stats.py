@@ -0,0 +1,382 @@
+# node_stats.py - Streaming per-node statistics (Welford)
+"""
+Mean, variance, min and max of each node's temperature, humidity and
+pressure, kept current as readings arrive so /api/nodes/<id>/stats never
+scans sensor_data:
+
+- Welford's running mean and sum of squared deviations, O(1) per reading;
+  partial results combine with Chan's parallel formula
+- sliding windows (1h, 24h, 7d by default): each window is a ring of
+  BUCKETS time buckets, so it slides a bucket (window / BUCKETS) at a time
+  and old buckets just fall off; min and max stay exact per bucket
+- exponential decay: one weighted accumulator per field whose older
+  readings lose half their weight every half-life (mean and variance only)
+- checkpoints: the accumulators and the newest applied row id go to a JSON
+  file; a restart loads it and reads only rows inserted since
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+from recent_cache import from_epoch, stored_epoch
+
+STATS_FIELDS = ('temperature_c', 'humidity', 'pressure_hpa')
+DEFAULT_WINDOWS = (('1h', 3600.0), ('24h', 86400.0), ('7d', 604800.0))
+BUCKETS = 24
+CHECKPOINT_VERSION = 1
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_windows(spec):
+    """'1h,24h,7d' -> [('1h', 3600.0), ('24h', 86400.0), ('7d', 604800.0)]"""
+    windows = []
+    for name in (part.strip() for part in spec.split(',')):
+        if not name:
+            continue
+        if name[-1] not in _UNITS:
+            raise ValueError(f"Window needs a unit (s, m, h or d): {name}")
+        seconds = float(name[:-1]) * _UNITS[name[-1]]
+        if seconds <= 0:
+            raise ValueError(f"Window must be positive: {name}")
+        windows.append((name, seconds))
+    return windows
+
+
+def number(value):
+    """Float value of a reading field, or None for NULL and anything non-numeric"""
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+class Moments:
+    """Count, mean, sum of squared deviations, min and max of a stream"""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, low=None, high=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = low
+        self.max = high
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        """Fold another accumulator into this one (Chan et al.)"""
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def summary(self):
+        # Sample variance; a single reading has none
+        variance = self.m2 / (self.count - 1) if self.count > 1 else None
+        return {
+            'count': self.count,
+            'mean': self.mean if self.count else None,
+            'variance': variance,
+            'std': math.sqrt(max(variance, 0.0)) if variance is not None else None,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    def to_list(self):
+        return [self.count, self.mean, self.m2, self.min, self.max]
+
+
+class DecayedMoments:
+    """Exponentially weighted mean and variance; weights decay with reading time"""
+
+    __slots__ = ('weight', 'mean', 's', 'last')
+
+    def __init__(self, weight=0.0, mean=0.0, s=0.0, last=None):
+        self.weight = weight
+        self.mean = mean
+        self.s = s
+        self.last = last  # epoch seconds the weights are relative to
+
+    def add(self, x, ts, tau):
+        if self.last is None or ts >= self.last:
+            if self.last is not None:
+                # Scaling every old weight scales their sums the same way
+                decay = math.exp((self.last - ts) / tau)
+                self.weight *= decay
+                self.s *= decay
+            self.last = ts
+            w = 1.0
+        else:
+            # A late reading counts as much as it would have when it arrived on time
+            w = math.exp((ts - self.last) / tau)
+        self.weight += w
+        delta = x - self.mean
+        self.mean += delta * w / self.weight
+        self.s += w * delta * (x - self.mean)
+
+    def summary(self, now, tau):
+        if not self.weight:
+            return {'weight': 0.0, 'mean': None, 'variance': None, 'std': None}
+        variance = self.s / self.weight
+        return {
+            # Effective number of readings still carrying weight now
+            'weight': self.weight * math.exp(min(self.last - now, 0.0) / tau),
+            'mean': self.mean,
+            'variance': variance,
+            'std': math.sqrt(max(variance, 0.0)),
+        }
+
+    def to_list(self):
+        return [self.weight, self.mean, self.s, self.last]
+
+
+class NodeStats:
+    """Bucketed moments per window plus decayed moments for one node"""
+
+    __slots__ = ('buckets', 'decayed', 'last_seen')
+
+    def __init__(self, windows, fields):
+        # window name -> {bucket index: {field: Moments}}
+        self.buckets = {name: {} for name, _ in windows}
+        self.decayed = {field: DecayedMoments() for field in fields}
+        self.last_seen = None
+
+
+class StreamingStats:
+    """Windowed statistics of every node, updated by the ingest path"""
+
+    def __init__(self, windows=DEFAULT_WINDOWS, half_life_hours=6.0, fields=STATS_FIELDS, buckets=BUCKETS,
+                 checkpoint_path=None):
+        self.windows = list(windows)
+        self.widths = {name: seconds / buckets for name, seconds in self.windows}
+        self.buckets = buckets
+        self.half_life_hours = half_life_hours
+        self.tau = half_life_hours * 3600.0 / math.log(2) if half_life_hours > 0 else None
+        self.fields = tuple(fields)
+        self.horizon = max([seconds for _, seconds in self.windows] + [0.0])
+        if self.tau:
+            # Readings older than this keep under 1% of their weight
+            self.horizon = max(self.horizon, self.tau * math.log(100))
+        self.checkpoint_path = checkpoint_path
+        self.nodes = {}
+        self.last_id = 0  # newest row id applied
+        self.ready = False
+        self.updates = 0
+        self.checkpointed_at = None
+        self._lock = threading.Lock()
+
+    def config(self):
+        """What a checkpoint must match to be reused"""
+        return {
+            'windows': [[name, seconds] for name, seconds in self.windows],
+            'buckets': self.buckets,
+            'half_life_hours': self.half_life_hours,
+            'fields': list(self.fields),
+        }
+
+    # ----- filling -----
+
+    def warm(self, storage):
+        """Restore the checkpoint (if any) and apply the rows stored after it; returns (source, rows)"""
+        started = time.time()
+        with self._lock:
+            self.nodes, self.last_id = {}, 0
+            source = 'checkpoint' if self._restore() else 'scan'
+            after_id = self.last_id if source == 'checkpoint' else None
+            applied = 0
+            for reading in storage.iter_range(t0=from_epoch(started - self.horizon), fields=self.fields,
+                                              descending=False, after_id=after_id):
+                self._add(reading)
+                applied += 1
+            self.ready = True
+        return source, applied
+
+    def append(self, readings):
+        """Add freshly stored readings (they must carry their row id and stored timestamp)"""
+        with self._lock:
+            if not self.ready:
+                return
+            for reading in readings:
+                reading_id = reading.get('id')
+                # Rows committed while warm() was scanning arrive here as well
+                if reading_id is not None and reading_id > self.last_id:
+                    self._add(reading)
+
+    def _add(self, reading):
+        node_id = reading.get('node_id')
+        if node_id is None:
+            return
+        # node_id is a TEXT column; gateways sometimes send numbers
+        node_id = str(node_id)
+        ts = stored_epoch(reading['timestamp'])
+        if ts is None:
+            return
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = NodeStats(self.windows, self.fields)
+        values = [(field, number(reading.get(field))) for field in self.fields]
+        for name, _ in self.windows:
+            self._add_to_window(node.buckets[name], int(ts // self.widths[name]), values)
+        if self.tau:
+            for field, value in values:
+                if value is not None:
+                    node.decayed[field].add(value, ts, self.tau)
+        node.last_seen = ts if node.last_seen is None else max(node.last_seen, ts)
+        self.last_id = max(self.last_id, reading['id'])
+        self.updates += 1
+
+    def _add_to_window(self, buckets, index, values):
+        bucket = buckets.get(index)
+        if bucket is None:
+            newest = max(buckets) if buckets else index
+            if index <= newest - self.buckets:
+                return  # older than the whole window
+            bucket = buckets[index] = {field: Moments() for field in self.fields}
+            if index > newest or len(buckets) > self.buckets:
+                for old in [i for i in buckets if i <= max(index, newest) - self.buckets]:
+                    del buckets[old]
+        for field, value in values:
+            if value is not None:
+                bucket[field].add(value)
+
+    # ----- queries -----
+
+    def node_ids(self):
+        with self._lock:
+            return list(self.nodes)
+
+    def node_stats(self, node_id, now=None):
+        """Every window's statistics for one node; None for an unknown node"""
+        now = time.time() if now is None else now
+        with self._lock:
+            node = self.nodes.get(str(node_id))
+            if node is None:
+                return None
+            windows = {}
+            for name, seconds in self.windows:
+                width = self.widths[name]
+                first = int(now // width) - self.buckets + 1
+                totals = {field: Moments() for field in self.fields}
+                for index, bucket in node.buckets[name].items():
+                    if index >= first:
+                        for field, moments in bucket.items():
+                            totals[field].merge(moments)
+                windows[name] = {
+                    'from': from_epoch(first * width),
+                    'seconds': seconds,
+                    'fields': {field: moments.summary() for field, moments in totals.items()},
+                }
+            decayed = None
+            if self.tau:
+                decayed = {
+                    'half_life_hours': self.half_life_hours,
+                    'fields': {field: moments.summary(now, self.tau) for field, moments in node.decayed.items()},
+                }
+            return {
+                'last_seen': from_epoch(node.last_seen) if node.last_seen is not None else None,
+                'windows': windows,
+                'decayed': decayed,
+            }
+
+    def window_start(self, name, now=None):
+        """First timestamp a window's answer covers (windows move a bucket at a time)"""
+        now = time.time() if now is None else now
+        width = self.widths[name]
+        return from_epoch((int(now // width) - self.buckets + 1) * width)
+
+    # ----- checkpoints -----
+
+    def checkpoint(self):
+        """Write the accumulators to checkpoint_path atomically; returns the node count"""
+        if not self.checkpoint_path:
+            return 0
+        with self._lock:
+            if not self.ready:
+                return 0
+            state = {
+                'version': CHECKPOINT_VERSION,
+                'config': self.config(),
+                'saved_at': from_epoch(time.time()),
+                'last_id': self.last_id,
+                'nodes': {node_id: {
+                    'last_seen': node.last_seen,
+                    'buckets': {name: [[index, {field: m.to_list() for field, m in bucket.items()}]
+                                       for index, bucket in buckets.items()]
+                                for name, buckets in node.buckets.items()},
+                    'decayed': {field: m.to_list() for field, m in node.decayed.items()},
+                } for node_id, node in self.nodes.items()},
+            }
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp_path, self.checkpoint_path)
+        self.checkpointed_at = time.time()
+        return len(state['nodes'])
+
+    def _restore(self):
+        """Load a checkpoint written with the same configuration; False if there is none to use"""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return False
+        try:
+            with open(self.checkpoint_path) as f:
+                state = json.load(f)
+            if state.get('version') != CHECKPOINT_VERSION or state.get('config') != self.config():
+                return False
+            nodes = {}
+            for node_id, data in state['nodes'].items():
+                node = NodeStats(self.windows, self.fields)
+                node.last_seen = data['last_seen']
+                for name, buckets in data['buckets'].items():
+                    node.buckets[name] = {index: {field: Moments(*values) for field, values in bucket.items()}
+                                          for index, bucket in buckets}
+                node.decayed = {field: DecayedMoments(*values) for field, values in data['decayed'].items()}
+                nodes[node_id] = node
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring node stats checkpoint {self.checkpoint_path}: {e}")
+            return False
+        self.nodes, self.last_id = nodes, state['last_id']
+        return True
+
+    def metrics(self):
+        with self._lock:
+            buckets = sum(len(b) for node in self.nodes.values() for b in node.buckets.values())
+            return {
+                'ready': self.ready,
+                'nodes': len(self.nodes),
+                'windows': [name for name, _ in self.windows],
+                'half_life_hours': self.half_life_hours if self.tau else None,
+                'buckets': buckets,
+                'updates': self.updates,
+                'last_id': self.last_id,
+                'checkpoint_path': self.checkpoint_path,
+                'checkpointed_at': from_epoch(self.checkpointed_at) if self.checkpointed_at else None,
+            }
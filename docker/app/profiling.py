@@ -0,0 +1,283 @@
+# profiling.py - On-demand request profiling and a low-rate stack sampler
+"""
+Where a slow request spends its time, without attaching a debugger to the Pi:
+
+- RequestProfiler profiles selected requests, either every request to the
+  configured endpoints or any request carrying an `X-Profile: cprofile` or
+  `X-Profile: sample` header (when enabled). cprofile writes a .pstats file
+  (snakeviz, `python -m pstats`); sample polls the request thread's stack
+  every millisecond and writes collapsed stacks (flamegraph.pl, speedscope).
+- StackSampler is the always-on variant: every thread's stack a few times a
+  second, folded into per-function sample counts. Threads parked in a
+  sleep, wait or select are counted as idle, not as hot.
+
+Nothing here is installed or started unless configured, so a disabled
+profiler costs requests nothing.
+"""
+
+import cProfile
+import linecache
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import g, request
+
+MODES = ('cprofile', 'sample')
+HEADER = 'X-Profile'
+
+# Leaf frames of a thread that is waiting rather than working
+IDLE_FUNCTIONS = {
+    ('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'), ('selectors.py', 'select'),
+    ('socketserver.py', 'serve_forever'), ('queue.py', 'get'), ('socket.py', 'accept'),
+}
+IDLE_CALLS = ('time.sleep(', '.wait(', 'select(', '.recvfrom(', '.accept(')
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def is_idle(frame):
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in IDLE_FUNCTIONS:
+        return True
+    line = linecache.getline(code.co_filename, frame.f_lineno).strip()
+    return any(call in line for call in IDLE_CALLS)
+
+
+def stack_labels(frame):
+    """Function labels from the thread's root down to frame"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class StackSampler:
+    """Samples thread stacks every interval seconds and folds them into collapsed-stack counts"""
+
+    def __init__(self, interval, thread_ids=None, skip_idle=True, max_stacks=5000):
+        self.interval = interval
+        self.thread_ids = thread_ids  # only these threads, or every thread but the sampler's
+        self.skip_idle = skip_idle
+        self.max_stacks = max_stacks
+
+        self._lock = threading.Lock()
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+        self.idle = 0
+        self.started_at = None
+
+    def start(self):
+        self._stop.clear()
+        self.started_at = self.started_at or datetime.utcnow()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample_once(own)
+
+    def sample_once(self, own=None):
+        frames = sys._current_frames()
+        wanted = self.thread_ids if self.thread_ids is not None else frames.keys() - {own}
+        with self._lock:
+            for thread_id in wanted:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                self.samples += 1
+                if self.skip_idle and is_idle(frame):
+                    self.idle += 1
+                    continue
+                stack = ';'.join(stack_labels(frame))
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    stack = '[other stacks]'
+                self._stacks[stack] += 1
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = self.idle = 0
+            self.started_at = datetime.utcnow()
+
+    def collapsed(self):
+        """One 'root;...;leaf count' line per distinct stack, the input flame graph tools take"""
+        with self._lock:
+            items = sorted(self._stacks.items(), key=lambda item: -item[1])
+        return ''.join(f"{stack} {count}\n" for stack, count in items)
+
+    def hot(self, limit=20):
+        """Functions by samples on top of the stack (self) and anywhere in it (total)"""
+        own, total = Counter(), Counter()
+        with self._lock:
+            items = list(self._stacks.items())
+            busy = sum(self._stacks.values())
+        for stack, count in items:
+            labels = stack.split(';')
+            own[labels[-1]] += count
+            for label in set(labels):
+                total[label] += count
+
+        def rows(counter):
+            return [{'function': label, 'samples': count, 'percent': round(100.0 * count / busy, 1)}
+                    for label, count in counter.most_common(limit)]
+
+        return {'busy_samples': busy, 'self': rows(own), 'total': rows(total)}
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'interval_ms': round(self.interval * 1000.0, 1),
+                'since': self.started_at.isoformat() + 'Z' if self.started_at else None,
+                'samples': self.samples,
+                'idle_samples': self.idle,
+                'stacks': len(self._stacks)
+            }
+
+
+class RequestProfiler:
+    """Profiles selected Flask requests into pstats or collapsed-stack files"""
+
+    def __init__(self, output_dir, endpoints=(), mode='cprofile', header=False, sample_interval=0.001,
+                 keep=200):
+        self.output_dir = output_dir
+        self.endpoints = set(endpoints)
+        self.header = header
+        if mode not in MODES:
+            # A typo in a setting that isn't in use mustn't keep the app from starting
+            if self.enabled:
+                print(f"⚠️ Unsupported profile mode {mode!r}, using cprofile (one of: {', '.join(MODES)})")
+            mode = 'cprofile'
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.keep = keep
+
+        # cProfile can only run one profiler at a time; a request arriving meanwhile goes unprofiled
+        self._cprofile_lock = threading.Lock()
+        self.recent = deque(maxlen=50)
+        self.profiled = 0
+        self.skipped_busy = 0
+
+    @property
+    def enabled(self):
+        return bool(self.endpoints) or self.header
+
+    def install(self, app):
+        """Register the request hooks; a disabled profiler registers nothing"""
+        if not self.enabled:
+            return False
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+        return True
+
+    def wanted(self):
+        """Profile mode for the current request, or None"""
+        if self.header:
+            mode = request.headers.get(HEADER, '').strip().lower()
+            if mode in MODES:
+                return mode
+        if 'all' in self.endpoints or request.endpoint in self.endpoints:
+            return self.mode
+        return None
+
+    def _before(self):
+        mode = self.wanted()
+        if mode == 'cprofile':
+            if not self._cprofile_lock.acquire(blocking=False):
+                self.skipped_busy += 1
+                return
+            profile = cProfile.Profile()
+            g._profile = (mode, profile, time.perf_counter())
+            profile.enable()
+        elif mode == 'sample':
+            sampler = StackSampler(self.sample_interval, thread_ids={threading.get_ident()}, skip_idle=False)
+            g._profile = (mode, sampler.start(), time.perf_counter())
+
+    def _after(self, response):
+        entry = self._finish(response.status_code)
+        if entry:
+            response.headers['X-Profile-File'] = entry['file']
+        return response
+
+    def _teardown(self, exc):
+        # Only still running when the view raised
+        self._finish(500)
+
+    def _finish(self, status):
+        state = g.pop('_profile', None)
+        if state is None:
+            return None
+        mode, profiler, began = state
+        elapsed_ms = (time.perf_counter() - began) * 1000.0
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f')
+        name = f"{stamp}-{request.endpoint or 'unknown'}"
+        os.makedirs(self.output_dir, exist_ok=True)
+        if mode == 'cprofile':
+            profiler.disable()
+            self._cprofile_lock.release()
+            name += '.pstats'
+            profiler.dump_stats(os.path.join(self.output_dir, name))
+            top = self._top_cumulative(profiler)
+        else:
+            profiler.stop()
+            name += '.collapsed'
+            with open(os.path.join(self.output_dir, name), 'w') as f:
+                f.write(profiler.collapsed())
+            top = profiler.hot(5)['self']
+        entry = {
+            'file': name, 'mode': mode, 'endpoint': request.endpoint, 'path': request.path,
+            'status': status, 'ms': round(elapsed_ms, 2), 'at': stamp, 'top': top
+        }
+        self.recent.appendleft(entry)
+        self.profiled += 1
+        self._rotate()
+        return entry
+
+    @staticmethod
+    def _top_cumulative(profile, limit=5):
+        stats = pstats.Stats(profile).stats
+        rows = sorted(stats.items(), key=lambda item: -item[1][3])[:limit]
+        return [{'function': f"{func} ({os.path.basename(filename)}:{line})", 'calls': calls,
+                 'cumulative_ms': round(cumulative * 1000.0, 2)}
+                for (filename, line, func), (_, calls, _, cumulative, _) in rows]
+
+    def _rotate(self):
+        """Keep only the newest keep profile files"""
+        names = sorted(n for n in os.listdir(self.output_dir) if n.endswith(('.pstats', '.collapsed')))
+        for name in names[:-self.keep] if self.keep > 0 else []:
+            os.remove(os.path.join(self.output_dir, name))
+
+    def files(self):
+        if not os.path.isdir(self.output_dir):
+            return []
+        return sorted((n for n in os.listdir(self.output_dir) if n.endswith(('.pstats', '.collapsed'))),
+                      reverse=True)
+
+    def metrics(self):
+        return {
+            'endpoints': sorted(self.endpoints),
+            'mode': self.mode,
+            'header': self.header,
+            'output_dir': self.output_dir,
+            'profiled': self.profiled,
+            'skipped_busy': self.skipped_busy,
+            'recent': list(self.recent)
+        }
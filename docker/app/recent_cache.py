@@ -0,0 +1,339 @@
+# recent_cache.py - Per-node ring buffers of recent readings
+"""
+Dashboard traffic is almost all "the last day or three", which is a few
+hundred readings per node at the 15-minute cadence. RecentCache keeps that
+window in memory so /latest, short /history and /network/stats never touch
+SQLite:
+
+- one NodeRing per node, a column per field in typed arrays ('q' ids,
+  'd' epoch seconds and floats with NaN for missing values), so a reading
+  costs 64 bytes instead of a dict of boxed floats
+- filled at startup from the database, appended by the ingest path
+- a query is served only when the cache provably holds every row it asks
+  for (t0 at or after the cache's coverage start); otherwise the caller
+  falls back to the database and the miss is counted
+"""
+
+import bisect
+import calendar
+import functools
+import math
+import threading
+import time
+from array import array
+
+from storage import ReadingBatch
+
+NUMERIC_FIELDS = ('temperature_c', 'humidity', 'pressure_hpa', 'battery_voltage', 'rssi', 'snr')
+# rssi is an INTEGER column; keep it an int on the way out
+INTEGER_FIELDS = ('rssi',)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+NAN = float('nan')
+
+
+@functools.lru_cache(maxsize=4096)
+def to_epoch(timestamp):
+    """Canonical 'YYYY-MM-DD HH:MM:SS' (UTC) to epoch seconds"""
+    return float(calendar.timegm(time.strptime(timestamp, TIMESTAMP_FORMAT)))
+
+
+def stored_epoch(timestamp):
+    """to_epoch of a stored timestamp, or None when it isn't canonical (storage keeps unparseable text as sent)"""
+    try:
+        return to_epoch(timestamp)
+    except (TypeError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def from_epoch(seconds):
+    # Nodes report on the same cycle, so the same few timestamps repeat across rows
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds))
+
+
+def as_float(value):
+    """Column value for a typed array; NaN stands for NULL (and anything non-numeric)"""
+    if value is None:
+        return NAN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+class NodeRing:
+    """Time-ordered readings of one node in parallel typed arrays
+
+    Live entries are [start:]. Evicting advances start; the dead prefix is
+    cut off once it reaches capacity, so appends stay amortized O(1) and
+    memory stays under twice the capacity.
+    """
+
+    __slots__ = ('capacity', 'start', 'ids', 'times', 'columns', 'evicted_until')
+
+    def __init__(self, capacity, fields=NUMERIC_FIELDS):
+        self.capacity = capacity
+        self.start = 0
+        self.ids = array('q')
+        self.times = array('d')
+        self.columns = {field: array('d') for field in fields}
+        self.evicted_until = None  # newest timestamp that has been dropped
+
+    def __len__(self):
+        return len(self.times) - self.start
+
+    def add(self, reading_id, ts, values):
+        """Insert in time order (out-of-order readings are rare and shift a few slots)"""
+        times = self.times
+        if not times or ts > times[-1]:
+            index = len(times)
+        else:
+            index = bisect.bisect_right(times, ts, self.start)
+            # The same row delivered twice (an insert racing the warm-up scan)
+            j = index - 1
+            while j >= self.start and times[j] == ts:
+                if self.ids[j] == reading_id:
+                    return
+                j -= 1
+        # Convert everything before touching the arrays so a bad value can't leave them uneven
+        numbers = [as_float(values.get(field)) for field in self.columns]
+        if index == len(times):
+            times.append(ts)
+            self.ids.append(reading_id)
+            for column, number in zip(self.columns.values(), numbers):
+                column.append(number)
+        else:
+            times.insert(index, ts)
+            self.ids.insert(index, reading_id)
+            for column, number in zip(self.columns.values(), numbers):
+                column.insert(index, number)
+
+    def evict_before(self, horizon):
+        """Drop readings older than horizon and any beyond capacity"""
+        times = self.times
+        while self.start < len(times) and (times[self.start] < horizon or len(self) > self.capacity):
+            self.evicted_until = times[self.start]
+            self.start += 1
+        if self.start >= self.capacity:
+            del times[:self.start]
+            del self.ids[:self.start]
+            for column in self.columns.values():
+                del column[:self.start]
+            self.start = 0
+
+    def column_values(self, node_id, lo, hi):
+        """Python-value columns for slots [lo, hi), newest first, in names() order"""
+        columns = [self.ids[lo:hi].tolist()[::-1], [node_id] * (hi - lo),
+                   [from_epoch(t) for t in self.times[lo:hi].tolist()[::-1]]]
+        for field, column in self.columns.items():
+            values = column[lo:hi].tolist()[::-1]
+            if field in INTEGER_FIELDS:
+                values = [int(v) if v == v else None for v in values]
+            else:
+                values = [v if v == v else None for v in values]  # NaN != NaN
+            columns.append(values)
+        return columns
+
+    def window(self, t0, t1):
+        """Index range [lo, hi) of readings with t0 <= time <= t1"""
+        lo = bisect.bisect_left(self.times, t0, self.start) if t0 is not None else self.start
+        hi = bisect.bisect_right(self.times, t1, self.start) if t1 is not None else len(self.times)
+        return lo, hi
+
+    def nbytes(self):
+        arrays = [self.ids, self.times] + list(self.columns.values())
+        return sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+
+
+class RecentCache:
+    """Recent readings of every node, served without touching the database"""
+
+    def __init__(self, window_hours=72, cadence_seconds=900, slack=2.0, recount_seconds=300,
+                 fields=NUMERIC_FIELDS):
+        self.window = window_hours * 3600.0
+        self.fields = fields
+        # Room for retries and duplicate uploads on top of one reading per cadence
+        self.capacity = int(math.ceil(self.window / cadence_seconds * slack)) + 1
+        self.rings = {}
+        self.covered_since = None  # every reading at or after this is cached (per-node evictions aside)
+        self.ready = False
+        self.storage = None
+        # COUNT(*) is the one full scan behind /network/stats; keep a running total and recount now and then
+        self.recount_seconds = recount_seconds
+        self.total = 0
+        self.counted_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.unparseable = 0  # readings left out because their timestamp isn't canonical
+        self._lock = threading.Lock()
+
+    # ----- filling -----
+
+    def warm(self, storage):
+        """Load the window from storage, plus each node's latest reading if it is older"""
+        started = time.time()
+        t0 = started - self.window
+        with self._lock:
+            self.storage = storage
+            self.total = storage.count()
+            self.counted_at = started
+            self.rings = {}
+            for reading in storage.iter_range(t0=from_epoch(t0), descending=False):
+                self._add(reading)
+            # Nodes quiet for longer than the window still belong in /latest
+            for reading in storage.latest():
+                if reading['node_id'] not in self.rings:
+                    self._add(reading, force=True)
+            self.covered_since = to_epoch(from_epoch(t0))
+            self.ready = True
+        return time.time() - started
+
+    def append(self, readings):
+        """Add freshly stored readings (they must carry their row id and stored timestamp)"""
+        horizon = time.time() - self.window
+        with self._lock:
+            if not self.ready:
+                return
+            self.total += len(readings)
+            for reading in readings:
+                if reading.get('id') is not None and reading.get('node_id') is not None:
+                    self._add(reading, horizon=horizon)
+
+    def _add(self, reading, horizon=None, force=False):
+        ts = stored_epoch(reading['timestamp'])
+        if ts is None:
+            self.unparseable += 1
+            return
+        if not force and self.covered_since is not None and ts < self.covered_since:
+            # Late reading from before the cached window: the database already answers for it
+            return
+        node_id = reading['node_id']
+        ring = self.rings.get(node_id)
+        if ring is None:
+            ring = self.rings[node_id] = NodeRing(self.capacity, self.fields)
+        ring.add(reading['id'], ts, reading)
+        if horizon is not None:
+            ring.evict_before(min(horizon, ring.times[-1]))
+
+    # ----- queries -----
+
+    def _covers(self, t0, node_ids):
+        if not self.ready or t0 is None or t0 < self.covered_since:
+            return False
+        for node_id in node_ids:
+            ring = self.rings[node_id]
+            if ring.evicted_until is not None and t0 <= ring.evicted_until:
+                return False
+        return True
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def latest(self):
+        """Newest reading of every node, newest first (None when the cache isn't warm)"""
+        with self._lock:
+            self._count(self.ready)
+            if not self.ready:
+                return None
+            batch = self._collect([(node_id, len(ring.times) - 1, len(ring.times))
+                                   for node_id, ring in self.rings.items() if len(ring)], None)
+        return list(batch)
+
+    def _collect(self, slices, limit):
+        """ReadingBatch of (node_id, lo, hi) ring slices, newest first across nodes"""
+        batch = ReadingBatch.empty(('id', 'node_id', 'timestamp') + self.fields)
+        for node_id, lo, hi in slices:
+            for column, values in zip(batch.columns, self.rings[node_id].column_values(node_id, lo, hi)):
+                column.extend(values)
+        if len(slices) > 1:
+            ids, times = batch.columns[0], batch.columns[2]
+            order = sorted(range(len(ids)), key=lambda i: (times[i], ids[i]), reverse=True)
+            if limit:
+                order = order[:limit]
+            batch.columns = [[column[i] for i in order] for column in batch.columns]
+        elif limit:
+            batch.columns = [column[:limit] for column in batch.columns]
+        return batch
+
+    def range(self, node_id=None, t0=None, t1=None, limit=None):
+        """Readings with t0 <= timestamp <= t1, newest first; None if the cache can't answer"""
+        batch = self.range_batch(node_id, t0, t1, limit)
+        return None if batch is None else list(batch)
+
+    def range_batch(self, node_id=None, t0=None, t1=None, limit=None):
+        """range() as a ReadingBatch"""
+        t0 = to_epoch(t0) if t0 is not None else None
+        t1 = to_epoch(t1) if t1 is not None else None
+        with self._lock:
+            if node_id is not None:
+                node_ids = [node_id] if node_id in self.rings else []
+            else:
+                node_ids = list(self.rings)
+            hit = self._covers(t0, node_ids)
+            self._count(hit)
+            if not hit:
+                return None
+            return self._collect([(nid,) + self.rings[nid].window(t0, t1) for nid in node_ids], limit)
+
+    def stats(self, active_hours=1, rssi_hours=24):
+        """Same shape as storage.stats(), or None on a miss"""
+        now = time.time()
+        if self.ready and now - self.counted_at > self.recount_seconds:
+            # Picks up retention deletes and writes made by other processes
+            total = self.storage.count()
+            with self._lock:
+                self.total, self.counted_at = total, now
+        active_since = now - active_hours * 3600
+        rssi_since = now - rssi_hours * 3600
+        with self._lock:
+            hit = self._covers(min(active_since, rssi_since), list(self.rings))
+            self._count(hit)
+            if not hit:
+                return None
+            active = 0
+            rssi_total, rssi_count = 0.0, 0
+            last_update = None
+            for ring in self.rings.values():
+                if not len(ring):
+                    continue
+                newest = ring.times[-1]
+                last_update = newest if last_update is None else max(last_update, newest)
+                if newest >= active_since:
+                    active += 1
+                rssi = ring.columns.get('rssi')
+                if rssi is not None:
+                    lo, hi = ring.window(rssi_since, None)
+                    values = [v for v in rssi[lo:hi] if v == v]
+                    rssi_total += sum(values)
+                    rssi_count += len(values)
+            total = self.total
+        return {
+            'total_readings': total,
+            'active_nodes': active,
+            'avg_rssi': rssi_total / rssi_count if rssi_count else None,
+            'last_update': from_epoch(last_update) if last_update is not None else None,
+        }
+
+    def metrics(self):
+        with self._lock:
+            readings = sum(len(ring) for ring in self.rings.values())
+            memory = sum(ring.nbytes() for ring in self.rings.values())
+            lookups = self.hits + self.misses
+            return {
+                'ready': self.ready,
+                'window_hours': self.window / 3600.0,
+                'nodes': len(self.rings),
+                'readings': readings,
+                'capacity_per_node': self.capacity,
+                'memory_bytes': memory,
+                'bytes_per_reading': round(memory / readings, 1) if readings else None,
+                'covered_since': from_epoch(self.covered_since) if self.covered_since else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'unparseable_timestamps': self.unparseable,
+            }
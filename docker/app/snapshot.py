@@ -0,0 +1,121 @@
+# snapshot.py - Read path isolated from the ingest writer
+"""
+Dashboard reads (/latest, /history, /network/stats) and gateway writes share
+one SQLite file, so long history scans and the ingest writer contend for it.
+SnapshotReader gives the read endpoints their own connections:
+
+- memory: the database is copied into a shared-cache in-memory SQLite
+  database with the backup API every refresh_interval seconds. Readers never
+  touch the file, at the cost of RAM and up to refresh_interval staleness.
+- wal: the file is switched to WAL journaling and readers open read-only
+  connections, which see a consistent snapshot without blocking the writer.
+"""
+
+import itertools
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+MODES = ('off', 'memory', 'wal')
+
+_generation = itertools.count(1)
+
+
+class SnapshotReader:
+    """Serves read-only connections from a periodically refreshed snapshot"""
+
+    def __init__(self, db_path, mode='memory', refresh_interval=30.0, backup_pages=1024):
+        if mode not in MODES or mode == 'off':
+            raise ValueError(f"Unsupported snapshot mode: {mode}")
+        self.db_path = db_path
+        self.mode = mode
+        self.refresh_interval = float(refresh_interval)
+        self.backup_pages = backup_pages
+
+        self._lock = threading.Lock()
+        self._anchor = None  # keeps the current in-memory copy alive
+        self._uri = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.refreshed_at = None
+        self.refreshed_monotonic = None
+        self.last_refresh_ms = None
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def start(self):
+        if self.mode == 'wal':
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.close()
+            return self
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name='read-snapshot', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        with self._lock:
+            if self._anchor:
+                self._anchor.close()
+                self._anchor = None
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"Snapshot refresh error: {e}")
+
+    def refresh(self):
+        """Copy the database into a fresh in-memory snapshot and swap it in"""
+        started = time.monotonic()
+        uri = f"file:lora_snapshot_{id(self)}_{next(_generation)}?mode=memory&cache=shared"
+        snapshot = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        source = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            # Copy in page steps so the writer can get the lock between them
+            source.backup(snapshot, pages=self.backup_pages)
+        finally:
+            source.close()
+
+        with self._lock:
+            old, self._anchor, self._uri = self._anchor, snapshot, uri
+            self.refreshed_at = datetime.utcnow()
+            self.refreshed_monotonic = time.monotonic()
+        # Readers still holding the old copy keep it alive until they close
+        if old:
+            old.close()
+
+        self.refreshes += 1
+        self.last_refresh_ms = round((time.monotonic() - started) * 1000.0, 2)
+
+    def connect(self):
+        """New read-only connection to the current snapshot"""
+        if self.mode == 'wal':
+            return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=30)
+        # Opened under the lock: refresh() can't close the copy between reading its uri and attaching to it
+        with self._lock:
+            conn = sqlite3.connect(self._uri, uri=True)
+        conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    def staleness(self):
+        """How old the data behind read endpoints may be"""
+        if self.mode == 'wal':
+            return {'mode': self.mode, 'age_seconds': 0.0}
+        with self._lock:
+            refreshed_at, refreshed_monotonic = self.refreshed_at, self.refreshed_monotonic
+        return {
+            'mode': self.mode,
+            'age_seconds': round(time.monotonic() - refreshed_monotonic, 3) if refreshed_monotonic else None,
+            'refreshed_at': refreshed_at.isoformat() + 'Z' if refreshed_at else None,
+            'refresh_interval': self.refresh_interval,
+            'last_refresh_ms': self.last_refresh_ms
+        }
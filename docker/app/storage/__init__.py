@@ -0,0 +1,77 @@
+# storage - Shared readings storage for every LoRa Sensor Network server variant
+"""
+Typed storage API used by docker/app/app.py, api/app.py,
+docker/Experimental/app.py and server/Simple Flask server.py:
+
+    storage = open_storage(path, schema='sensor_data')
+    storage.initialize()                      # create / migrate
+    storage.insert_readings(batch)            # canonical reading dicts
+    storage.latest()                          # newest reading per node
+    storage.range(node, t0, t1, fields)       # history (Reading objects)
+    storage.range_batch(node, t0, t1, fields) # history as columns (ReadingBatch)
+    storage.stats()                           # network totals
+    storage.insert_alerts(alerts)             # alert transitions (alerts.py)
+    storage.set_node_active(changes)          # node_status.is_active (liveness.py)
+
+engine='sharded' splits readings across `shards` SQLite files by node
+(sharded.py), with writes per shard and fan-out reads. engine='blocks'
+seals old readings into compressed per-node blocks (blocks.py, codec.py).
+engine='clustered' keeps readings in a WITHOUT ROWID table clustered on
+(node_id, time) with fixed-point measurements (clustered.py).
+
+Passing cold_path adds a Parquet cold tier (needs pyarrow): range queries
+merge both tiers and storage.tier_out(before) moves old readings out.
+"""
+
+from .blocks import BlockStorage
+from .clustered import ClusteredStorage
+from .migrations import latest_version, migrate, schema_version
+from .readings import Reading, ReadingBatch
+from .schemas import (FIELDS, SCHEMAS, c_to_f, f_to_c, hours_ago, normalize_timestamp,
+                      parse_timestamp)
+from .sharded import ShardedStorage
+from .sqlite import SQLiteStorage
+from .tiered import TieredStorage
+
+ENGINES = {
+    'sqlite': SQLiteStorage,
+    'sharded': ShardedStorage,
+    'blocks': BlockStorage,
+    'clustered': ClusteredStorage,
+}
+
+
+def open_storage(path, schema='sensor_data', engine='sqlite', cold_path=None, **options):
+    """Create a storage engine instance for a database path, optionally with a cold tier"""
+    try:
+        engine_class = ENGINES[engine]
+    except KeyError:
+        raise ValueError(f"Unknown storage engine: {engine}")
+    storage = engine_class(path, schema=schema, **options)
+    if cold_path:
+        from .cold import ParquetColdTier
+        storage = TieredStorage(storage, ParquetColdTier(cold_path, storage.schema))
+    return storage
+
+
+__all__ = [
+    'BlockStorage',
+    'ClusteredStorage',
+    'ENGINES',
+    'FIELDS',
+    'Reading',
+    'ReadingBatch',
+    'SCHEMAS',
+    'SQLiteStorage',
+    'ShardedStorage',
+    'TieredStorage',
+    'c_to_f',
+    'f_to_c',
+    'hours_ago',
+    'latest_version',
+    'migrate',
+    'normalize_timestamp',
+    'open_storage',
+    'parse_timestamp',
+    'schema_version',
+]
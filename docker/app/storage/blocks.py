@@ -0,0 +1,467 @@
+# blocks.py - SQLite engine that seals old readings into compressed per-node blocks
+"""
+engine='blocks' keeps the readings table as a head for recent rows and,
+once a node's time window (block_seconds, a day by default) has been
+closed for seal_after seconds, moves that window's rows into one BLOB in
+{table}_blocks, compressed column by column (codec.py: delta-of-delta
+timestamps, Gorilla XOR / scaled-decimal floats, varint ids).
+
+- seal() does the moving, one node at a time, in the same transaction as
+  the DELETE from the head, so readers see a row in exactly one place
+- every block row carries node_id, first/last timestamp, min/max id and
+  count, so range reads pick their blocks from that index and only
+  decompress the ones that overlap the query (and only the columns asked
+  for)
+- reads merge head and blocks by (timestamp, id); a late reading for a
+  sealed window stays in the head until the next seal() merges it in
+- update_fields() and delete_range() rewrite only the blocks they touch;
+  blocks wholly inside a delete are dropped without being decoded
+"""
+
+import calendar
+import functools
+import heapq
+import itertools
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from .codec import block_layout, decode_block, encode_block
+from .readings import Reading, ReadingBatch
+from .schemas import TIMESTAMP_FORMAT, hours_ago, normalize_timestamp
+from .sqlite import SQLiteStorage
+
+DEFAULT_BLOCK_SECONDS = 86400
+DEFAULT_SEAL_AFTER = 6 * 3600
+SEAL_CHUNK = 20000
+# Block metadata columns, in the order _blocks() returns them
+BLOCK_META = ('rowid', 'node_id', 'first_ts', 'last_ts', 'min_id', 'max_id', 'count')
+
+
+@functools.lru_cache(maxsize=65536)
+def _text(seconds):
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds))
+
+
+def _epoch(text):
+    """Epoch seconds of canonical timestamp text, None for anything else"""
+    try:
+        seconds = calendar.timegm(time.strptime(text, TIMESTAMP_FORMAT))
+    except (TypeError, ValueError):
+        return None
+    return seconds if _text(seconds) == text else None
+
+
+def _order(reading):
+    return reading['timestamp'], reading['id']
+
+
+class BlockStorage(SQLiteStorage):
+    """SQLite head table plus compressed, sealed per-node blocks"""
+
+    engine = 'blocks'
+
+    def __init__(self, path: str, schema: str = 'sensor_data', block_seconds: int = DEFAULT_BLOCK_SECONDS,
+                 seal_after: float = DEFAULT_SEAL_AFTER, **options):
+        super().__init__(path, schema=schema, **options)
+        self.block_seconds = int(block_seconds)
+        self.seal_after = seal_after
+        self.blocks_table = self.schema.table + '_blocks'
+        # Block columns: row ids, then every stored field but node_id (the block's key)
+        self.block_fields = [f for f in self.schema.insert_fields if f != 'node_id']
+
+    def initialize(self) -> int:
+        version = super().initialize()
+        bt = self.blocks_table
+        with self.connection() as conn:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                  (bt,)).fetchone()
+        if not exists:
+            with self.transaction() as conn:
+                conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {bt} (
+                        node_id TEXT NOT NULL,
+                        window_start INTEGER NOT NULL,
+                        first_ts TEXT NOT NULL,
+                        last_ts TEXT NOT NULL,
+                        min_id INTEGER NOT NULL,
+                        max_id INTEGER NOT NULL,
+                        count INTEGER NOT NULL,
+                        payload BLOB NOT NULL,
+                        PRIMARY KEY (node_id, window_start)
+                    )
+                ''')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{bt}_node_last ON {bt} (node_id, last_ts)')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{bt}_last ON {bt} (last_ts)')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{bt}_max_id ON {bt} (max_id)')
+        return version
+
+    # ----- sealing -----
+
+    def seal(self, before=None) -> int:
+        """Move head readings older than `before` into blocks; returns the number sealed
+
+        By default `before` is the start of the newest window that closed at
+        least seal_after seconds ago. Rows whose timestamp isn't canonical
+        text stay in the head.
+        """
+        if before is None:
+            horizon = int(time.time() - self.seal_after)
+            cutoff = _text(horizon - horizon % self.block_seconds)
+        else:
+            cutoff = normalize_timestamp(before)
+        schema = self.schema
+        t, ts = schema.table, schema.time_column
+        columns = ', '.join(['id'] + [schema.columns[f] for f in self.block_fields])
+        ts_index = 1 + self.block_fields.index('timestamp')
+        with self.read_connection() as conn:
+            nodes = [row[0] for row in conn.execute(f'SELECT DISTINCT node_id FROM {t} WHERE {ts} < ?', (cutoff,))]
+        sealed = 0
+        for node_id in nodes:
+            after = ('', 0)
+            while True:
+                with self.transaction() as conn:
+                    rows = conn.execute(f'''
+                        SELECT {columns} FROM {t}
+                        WHERE node_id = ? AND {ts} < ? AND ({ts} > ? OR ({ts} = ? AND id > ?))
+                        ORDER BY {ts}, id LIMIT ?
+                    ''', (node_id, cutoff, after[0], after[0], after[1], SEAL_CHUNK)).fetchall()
+                    if not rows:
+                        break
+                    after = (rows[-1][ts_index], rows[-1][0])
+                    windows = {}
+                    for row in rows:
+                        seconds = _epoch(row[ts_index])
+                        if seconds is not None:
+                            row = list(row)
+                            row[ts_index] = seconds
+                            windows.setdefault(seconds - seconds % self.block_seconds, []).append(row)
+                    for window_start, window_rows in windows.items():
+                        self._merge_into_block(conn, node_id, window_start, window_rows)
+                        conn.executemany(f'DELETE FROM {t} WHERE id = ?', [(row[0],) for row in window_rows])
+                        sealed += len(window_rows)
+                if len(rows) < SEAL_CHUNK:
+                    break
+        return sealed
+
+    def _merge_into_block(self, conn, node_id, window_start, rows):
+        """Add raw rows (id, block fields, timestamp as epoch) to a node's block for a window"""
+        bt = self.blocks_table
+        existing = conn.execute(f'SELECT rowid, payload FROM {bt} WHERE node_id = ? AND window_start = ?',
+                                (node_id, window_start)).fetchone()
+        if existing:
+            rows = self._block_raw_rows(existing[1]) + rows
+        self._write_block(conn, node_id, window_start, rows, existing[0] if existing else None)
+
+    def _block_raw_rows(self, payload):
+        """Rows (id, block fields...) of a payload, timestamps as epoch seconds"""
+        names = ['id'] + self.block_fields
+        _, columns = decode_block(payload, names)
+        return [list(row) for row in zip(*(columns[name] for name in names))]
+
+    def _write_block(self, conn, node_id, window_start, rows, rowid=None):
+        """Store raw rows as one block (replacing block rowid), or drop the block when rows is empty"""
+        bt = self.blocks_table
+        if not rows:
+            conn.execute(f'DELETE FROM {bt} WHERE rowid = ?', (rowid,))
+            return
+        ts_index = 1 + self.block_fields.index('timestamp')
+        rows.sort(key=lambda row: (row[ts_index], row[0]))
+        names = ['id'] + self.block_fields
+        payload = encode_block({name: [row[i] for row in rows] for i, name in enumerate(names)})
+        ids = [row[0] for row in rows]
+        meta = (_text(rows[0][ts_index]), _text(rows[-1][ts_index]), min(ids), max(ids), len(rows), payload)
+        if rowid is None:
+            conn.execute(f'''INSERT INTO {bt} (node_id, window_start, first_ts, last_ts, min_id, max_id, count, payload)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', (node_id, window_start) + meta)
+        else:
+            conn.execute(f'''UPDATE {bt} SET first_ts = ?, last_ts = ?, min_id = ?, max_id = ?, count = ?, payload = ?
+                             WHERE rowid = ?''', meta + (rowid,))
+
+    def block_stats(self) -> Dict[str, Any]:
+        """Sealed blocks, readings and payload bytes (per column too), for /api/metrics and benchmarks"""
+        bt = self.blocks_table
+        columns = {}
+        with self.read_connection() as conn:
+            blocks, readings, payload = conn.execute(
+                f'SELECT COUNT(*), COALESCE(SUM(count), 0), COALESCE(SUM(LENGTH(payload)), 0) FROM {bt}').fetchone()
+            for (data,) in conn.execute(f'SELECT payload FROM {bt}'):
+                for name, codec, size in block_layout(data):
+                    entry = columns.setdefault(name, {'bytes': 0, 'codecs': {}})
+                    entry['bytes'] += size
+                    entry['codecs'][codec] = entry['codecs'].get(codec, 0) + 1
+        return {
+            'blocks': blocks,
+            'sealed_readings': readings,
+            'payload_bytes': payload,
+            'bytes_per_reading': round(payload / readings, 2) if readings else None,
+            'columns': columns,
+        }
+
+    # ----- block lookup and decoding -----
+
+    def _blocks(self, conn, node_id=None, t0=None, t1=None, after_id=None, max_id=None,
+                t1_exclusive=False, order=None):
+        """Metadata (BLOCK_META) of the blocks that may hold readings matching the filters"""
+        where, params = [], []
+        if node_id is not None:
+            where.append('node_id = ?')
+            params.append(node_id)
+        if t0 is not None:
+            where.append('last_ts >= ?')
+            params.append(t0)
+        if t1 is not None:
+            where.append('first_ts < ?' if t1_exclusive else 'first_ts <= ?')
+            params.append(t1)
+        if after_id is not None:
+            where.append('max_id > ?')
+            params.append(int(after_id))
+        if max_id is not None:
+            where.append('min_id <= ?')
+            params.append(int(max_id))
+        sql = f'SELECT {", ".join(BLOCK_META)} FROM {self.blocks_table}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        if order:
+            sql += ' ORDER BY ' + order
+        return conn.execute(sql, params).fetchall()
+
+    def _has_blocks(self, node_id=None, t0=None, t1=None, after_id=None):
+        t0, t1 = normalize_timestamp(t0, default_now=False), normalize_timestamp(t1, default_now=False)
+        with self.read_connection() as conn:
+            return bool(self._blocks(conn, node_id, t0, t1, after_id, order='rowid LIMIT 1'))
+
+    def _decode_rows(self, payload, node_id, names, t0=None, t1=None, after_id=None):
+        """(epoch, id, row) of a block's readings in the window, row laid out like names"""
+        _, columns = decode_block(payload, names)
+        result = []
+        for values in zip(*(columns[name] for name in names if name != 'node_id')):
+            row_id, seconds = values[0], values[1]
+            text = _text(seconds)
+            if (t0 is not None and text < t0) or (t1 is not None and text > t1) or \
+                    (after_id is not None and row_id <= after_id):
+                continue
+            result.append((seconds, row_id, (row_id, node_id, text) + values[2:]))
+        return result
+
+    def iter_sealed(self, node_id=None, t0=None, t1=None, fields=None, descending=True, after_id=None):
+        """Sealed readings with t0 <= timestamp <= t1 in (timestamp, id) order, decoding blocks lazily
+
+        Blocks are visited in the order of their first (or, descending, last)
+        timestamp; a decoded reading is handed out once no block still to be
+        visited can hold an earlier (later) one.
+        """
+        schema = self.schema
+        _, names = schema.select_columns(fields)
+        t0, t1 = normalize_timestamp(t0, default_now=False), normalize_timestamp(t1, default_now=False)
+        sign = -1 if descending else 1
+        with self.read_connection() as conn:
+            blocks = self._blocks(conn, node_id, t0, t1, after_id,
+                                  order='last_ts DESC' if descending else 'first_ts')
+            pending = []
+            for rowid, block_node, first_ts, last_ts, *_ in blocks:
+                bound = sign * _epoch(last_ts if descending else first_ts)
+                while pending and pending[0][0] < bound:
+                    yield schema.to_reading(names, heapq.heappop(pending)[2])
+                payload = conn.execute(f'SELECT payload FROM {self.blocks_table} WHERE rowid = ?',
+                                       (rowid,)).fetchone()[0]
+                for seconds, row_id, row in self._decode_rows(payload, block_node, names, t0, t1, after_id):
+                    heapq.heappush(pending, (sign * seconds, sign * row_id, row))
+            while pending:
+                yield schema.to_reading(names, heapq.heappop(pending)[2])
+
+    def iter_sealed_values(self, field, node_id=None, t0=None, t1=None):
+        """(node_id, epoch seconds, values) per block in the window, values canonical, for aggregates"""
+        convert = self.schema.from_db.get(field)
+        names = ('id', 'node_id', 'timestamp', field)
+        t0, t1 = normalize_timestamp(t0, default_now=False), normalize_timestamp(t1, default_now=False)
+        with self.read_connection() as conn:
+            for rowid, block_node, *_ in self._blocks(conn, node_id, t0, t1):
+                payload = conn.execute(f'SELECT payload FROM {self.blocks_table} WHERE rowid = ?',
+                                       (rowid,)).fetchone()[0]
+                rows = self._decode_rows(payload, block_node, names, t0, t1)
+                values = [row[2][3] for row in rows]
+                if convert:
+                    values = [None if v is None else convert(v) for v in values]
+                yield block_node, [row[0] for row in rows], values
+
+    # ----- writes -----
+
+    def delete_range(self, node_id: Optional[str] = None, t0=None, t1=None,
+                     max_id: Optional[int] = None) -> int:
+        """Delete readings with t0 <= timestamp < t1 (and id <= max_id) from head and blocks"""
+        removed = super().delete_range(node_id, t0, t1, max_id)
+        t0, t1 = normalize_timestamp(t0, default_now=False), normalize_timestamp(t1, default_now=False)
+        names = ['id'] + self.block_fields
+        ts_index = names.index('timestamp')
+        with self.transaction() as conn:
+            for rowid, block_node, first_ts, last_ts, _, block_max, count in self._blocks(
+                    conn, node_id, t0, t1, max_id=max_id, t1_exclusive=True):
+                if (t0 is None or first_ts >= t0) and (t1 is None or last_ts < t1) and \
+                        (max_id is None or block_max <= max_id):
+                    conn.execute(f'DELETE FROM {self.blocks_table} WHERE rowid = ?', (rowid,))
+                    removed += count
+                    continue
+                payload = conn.execute(f'SELECT payload FROM {self.blocks_table} WHERE rowid = ?',
+                                       (rowid,)).fetchone()[0]
+                rows = self._block_raw_rows(payload)
+                kept = [row for row in rows
+                        if (t0 is not None and _text(row[ts_index]) < t0) or
+                        (t1 is not None and _text(row[ts_index]) >= t1) or
+                        (max_id is not None and row[0] > max_id)]
+                if len(kept) < len(rows):
+                    window_start = rows[0][ts_index] - rows[0][ts_index] % self.block_seconds
+                    self._write_block(conn, block_node, window_start, kept, rowid)
+                    removed += len(rows) - len(kept)
+        return removed
+
+    def update_fields(self, fields: Sequence[str], ids: Sequence[int],
+                      columns: Sequence[Sequence[Any]]) -> int:
+        """Set fields of existing readings by id, in the head and in the blocks holding them"""
+        updated = super().update_fields(fields, ids, columns)
+        if not updated:
+            return updated
+        schema = self.schema
+        converters = [schema.to_db.get(f) for f in fields]
+        changes = {}
+        for row_id, *values in zip(ids, *columns):
+            changes[row_id] = [convert(v) if convert and v is not None else v
+                               for convert, v in zip(converters, values)]
+        names = ['id'] + self.block_fields
+        positions = [names.index(f) for f in fields]
+        with self.transaction() as conn:
+            for rowid, block_node, *_ in self._blocks(conn, after_id=min(changes) - 1, max_id=max(changes)):
+                payload = conn.execute(f'SELECT payload FROM {self.blocks_table} WHERE rowid = ?',
+                                       (rowid,)).fetchone()[0]
+                _, id_column = decode_block(payload, ('id',))
+                if not changes.keys() & set(id_column['id']):
+                    continue
+                rows = self._block_raw_rows(payload)
+                for row in rows:
+                    values = changes.get(row[0])
+                    if values is not None:
+                        for position, value in zip(positions, values):
+                            row[position] = value
+                seconds = rows[0][names.index('timestamp')]
+                self._write_block(conn, block_node, seconds - seconds % self.block_seconds, rows, rowid)
+        return updated
+
+    # ----- reads -----
+
+    def _merged(self, node_id, t0, t1, fields, descending, chunk_size=5000, after_id=None):
+        head = super().iter_range(node_id, t0, t1, fields, descending, chunk_size, after_id)
+        sealed = self.iter_sealed(node_id, t0, t1, fields, descending, after_id)
+        return heapq.merge(head, sealed, key=_order, reverse=descending)
+
+    def range(self, node_id: Optional[str] = None, t0=None, t1=None,
+              fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+              descending: bool = True) -> List[Reading]:
+        """Readings from head and blocks with t0 <= timestamp <= t1"""
+        if not self._has_blocks(node_id, t0, t1):
+            return super().range(node_id, t0, t1, fields, limit, descending)
+        if limit and descending:
+            # Newest-first pages that the head fills past every sealed reading never decode a block
+            head = super().range(node_id, t0, t1, fields, limit, descending)
+            if len(head) >= limit and not self._has_blocks(node_id, head[-1]['timestamp'], t1):
+                return head
+        merged = self._merged(node_id, t0, t1, fields, descending, min(limit or 5000, 5000))
+        return list(itertools.islice(merged, limit) if limit else merged)
+
+    def range_batch(self, node_id: Optional[str] = None, t0=None, t1=None,
+                    fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                    descending: bool = True, chunk_size: int = 5000) -> ReadingBatch:
+        """range() as a ReadingBatch"""
+        if not self._has_blocks(node_id, t0, t1):
+            return super().range_batch(node_id, t0, t1, fields, limit, descending, chunk_size)
+        _, names = self.schema.select_columns(fields)
+        return ReadingBatch.from_readings(names, self.range(node_id, t0, t1, fields, limit, descending))
+
+    def iter_range(self, node_id=None, t0=None, t1=None, fields=None, descending=True,
+                   chunk_size=5000, after_id=None):
+        """Like range() but streams head and blocks"""
+        if not self._has_blocks(node_id, t0, t1, after_id):
+            return super().iter_range(node_id, t0, t1, fields, descending, chunk_size, after_id)
+        return self._merged(node_id, t0, t1, fields, descending, chunk_size, after_id)
+
+    def scan_batch(self, after_id: int = 0, limit: int = 50000, fields: Optional[Sequence[str]] = None,
+                   missing: Optional[Sequence[str]] = None) -> ReadingBatch:
+        """Next readings after after_id in id order from head and blocks"""
+        head = super().scan_batch(after_id, limit, fields, missing)
+        if not self._has_blocks(after_id=after_id):
+            return head
+        schema = self.schema
+        _, names = schema.select_columns(fields)
+        wanted = list(names) + [f for f in missing or () if f not in names]
+        sealed = []
+        with self.read_connection() as conn:
+            # Blocks in min_id order: once `limit` ids are collected, a block starting past them adds nothing
+            for rowid, block_node, _, _, min_id, _, _ in self._blocks(conn, after_id=after_id, order='min_id'):
+                if len(sealed) >= limit and min_id > sealed[limit - 1][0]:
+                    break
+                payload = conn.execute(f'SELECT payload FROM {self.blocks_table} WHERE rowid = ?',
+                                       (rowid,)).fetchone()[0]
+                for _, row_id, row in self._decode_rows(payload, block_node, wanted, after_id=after_id):
+                    if missing and all(row[wanted.index(f)] is not None for f in missing):
+                        continue
+                    sealed.append((row_id, row[:len(names)]))
+                sealed.sort(key=lambda item: item[0])
+                del sealed[limit:]
+        readings = heapq.merge(head, (schema.to_reading(names, row) for _, row in sealed),
+                               key=lambda r: r['id'])
+        return ReadingBatch.from_readings(names, itertools.islice(readings, limit))
+
+    def latest(self, fields: Optional[Sequence[str]] = None) -> List[Reading]:
+        """Most recent reading of every node across head and blocks, newest first"""
+        newest = {r['node_id']: r for r in super().latest(fields)}
+        bt = self.blocks_table
+        _, names = self.schema.select_columns(fields)
+        with self.read_connection() as conn:
+            # Index-only per node; a block is decoded only when it may beat the head's newest row
+            for node_id, last_ts in conn.execute(f'SELECT node_id, MAX(last_ts) FROM {bt} GROUP BY node_id').fetchall():
+                head = newest.get(node_id)
+                if head is not None and head['timestamp'] > last_ts:
+                    continue
+                payload = conn.execute(f'SELECT payload FROM {bt} WHERE node_id = ? ORDER BY last_ts DESC LIMIT 1',
+                                       (node_id,)).fetchone()[0]
+                rows = self._decode_rows(payload, node_id, names)
+                candidate = self.schema.to_reading(names, max(rows, key=lambda item: (item[0], item[1]))[2])
+                if head is None or _order(candidate) > _order(head):
+                    newest[node_id] = candidate
+        return sorted(newest.values(), key=lambda r: r['timestamp'], reverse=True)
+
+    def stats(self, active_hours: float = 1, rssi_hours: float = 24) -> Dict[str, Any]:
+        """Network-wide totals over head and blocks"""
+        stats = super().stats(active_hours, rssi_hours)
+        schema = self.schema
+        t, ts, bt = schema.table, schema.time_column, self.blocks_table
+        active_since, rssi_since = hours_ago(active_hours), hours_ago(rssi_hours)
+        with self.read_connection() as conn:
+            total, last_update = conn.execute(f'SELECT COALESCE(SUM(count), 0), MAX(last_ts) FROM {bt}').fetchone()
+            if not total:
+                return stats
+            stats['total_readings'] += total
+            if stats['last_update'] is None or last_update > stats['last_update']:
+                stats['last_update'] = last_update
+            sealed_active = {row[0] for row in conn.execute(
+                f'SELECT DISTINCT node_id FROM {bt} WHERE last_ts >= ?', (active_since,))}
+            if sealed_active:
+                head_active = {row[0] for row in conn.execute(
+                    f'SELECT DISTINCT node_id FROM {t} WHERE {ts} >= ?', (active_since,))}
+                stats['active_nodes'] = len(head_active | sealed_active)
+            recent = self._blocks(conn, t0=rssi_since)
+            if recent:
+                count, total_rssi = conn.execute(f'SELECT COUNT(rssi), COALESCE(SUM(rssi), 0) FROM {t} WHERE {ts} >= ?',
+                                                 (rssi_since,)).fetchone()
+                names = ('id', 'node_id', 'timestamp', 'rssi')
+                for rowid, block_node, *_ in recent:
+                    payload = conn.execute(f'SELECT payload FROM {bt} WHERE rowid = ?', (rowid,)).fetchone()[0]
+                    for _, _, row in self._decode_rows(payload, block_node, names, t0=rssi_since):
+                        if row[3] is not None:
+                            count += 1
+                            total_rssi += row[3]
+                stats['avg_rssi'] = total_rssi / count if count else None
+        return stats
+
+    def count(self) -> int:
+        with self.read_connection() as conn:
+            sealed = conn.execute(f'SELECT COALESCE(SUM(count), 0) FROM {self.blocks_table}').fetchone()[0]
+        return super().count() + sealed
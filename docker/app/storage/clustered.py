@@ -0,0 +1,311 @@
+# clustered.py - Readings clustered by (node_id, time) with fixed-point measurements
+"""
+engine='clustered' stores readings in {table}_clustered, a WITHOUT ROWID
+table whose primary key is (node_id, time, id). The b-tree is the table,
+so one node's history sits on adjacent pages in time order, and a
+per-node range scan reads those pages instead of hopping through the
+rowid heap once per index entry.
+
+- time is stored as epoch seconds (INTEGER); timestamps that aren't
+  canonical are kept as text and sort after every reading
+- measurements are fixed-point integers (SCALES: centi-degrees, centi-%,
+  centi-hPa, millivolts, centi-dB), exact for the resolution the sensors
+  report; queries divide them back to the canonical floats
+- ids: a UNIQUE index keeps id lookups (update_fields, scan_batch) and
+  the AUTOINCREMENT high-water of the original table carries over, so ids
+  keep growing where the rowid table stopped. One process owns the file
+
+A database with readings in the rowid table is converted online by
+tools/migrate_clustered.py: triggers mirror every insert/update/delete
+into the clustered table while it is backfilled in chunks, and the next
+initialize() with this engine checks that every row is there, drops the
+triggers and empties the old table.
+"""
+
+import calendar
+import functools
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .readings import Reading
+from .schemas import SCHEMAS, TIMESTAMP_FORMAT, Schema, hours_ago, normalize_timestamp
+from .sqlite import SQLiteStorage
+
+# Canonical field -> fixed-point scale of the stored integer (in the schema's own units)
+SCALES = {
+    'temperature_c': 100,
+    'humidity': 100,
+    'pressure_hpa': 100,
+    'battery_voltage': 1000,
+    'snr': 100,
+    'heat_index': 100,
+    'dew_point': 100,
+}
+INTEGER_FIELDS = ('rssi', 'collection_cycle')
+TEXT_FIELDS = ('node_id', 'gateway_id', 'gateways', 'gateway_timestamp', 'node_timestamp')
+
+
+@functools.lru_cache(maxsize=65536)
+def _text(seconds):
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds))
+
+
+def to_stored_time(value):
+    """Epoch seconds for canonical timestamp text, the text itself otherwise"""
+    text = normalize_timestamp(value)
+    try:
+        seconds = calendar.timegm(time.strptime(text, TIMESTAMP_FORMAT))
+    except ValueError:
+        return text
+    return seconds if _text(seconds) == text else text
+
+
+def from_stored_time(value):
+    return _text(value) if isinstance(value, int) else value
+
+
+def _scaled(base_convert, scale):
+    if base_convert is None:
+        return lambda v: round(v * scale)
+    return lambda v: round(base_convert(v) * scale)
+
+
+def _unscaled(base_convert, scale):
+    return lambda v: base_convert(v / scale)
+
+
+@functools.lru_cache(maxsize=None)
+def clustered_schema(name: str) -> Schema:
+    """The clustered layout of a schema: same columns and units, fixed-point storage"""
+    base = SCHEMAS[name]
+    to_db, from_db, sql_exprs = {}, {}, {}
+    # Reads decode in SQL where the base schema has no converter of its own (C instead of a Python call per value)
+    select_exprs = {'timestamp': "CASE WHEN typeof({0}) = 'integer' "
+                                 "THEN strftime('%Y-%m-%d %H:%M:%S', {0}, 'unixepoch') ELSE {0} END"}
+    for field, column in base.columns.items():
+        scale = SCALES.get(field)
+        if scale is None:
+            continue
+        to_db[field] = _scaled(base.to_db.get(field), scale)
+        if field in base.from_db:
+            from_db[field] = _unscaled(base.from_db[field], scale)
+        else:
+            select_exprs[field] = '({} / %d.0)' % scale
+        sql_exprs[field] = base.field_sql(field).replace(column, f'({column} / {scale}.0)')
+    ts = base.time_column
+    sql_exprs['timestamp'] = f"strftime('%Y-%m-%d %H:%M:%S', {ts}, 'unixepoch')"
+    # Canonical text bounds become epoch seconds inside SQL, so comparisons stay on the stored integers
+    return Schema(name=base.name, table=base.table + '_clustered', time_column=ts, columns=base.columns,
+                  to_db=to_db, from_db=from_db, defaults=base.defaults, node_table=base.node_table,
+                  sql_exprs=sql_exprs, time_param="CAST(strftime('%s', ?) AS INTEGER)",
+                  select_exprs=select_exprs)
+
+
+def column_sql(base: Schema, field: str, source: str = '') -> str:
+    """SQL converting a rowid-table column (prefixed with source, e.g. 'NEW.') to its clustered value"""
+    column = source + base.columns[field]
+    if field == 'timestamp':
+        return f"COALESCE(CAST(strftime('%s', {column}) AS INTEGER), {column})"
+    if field in SCALES:
+        return f'CAST(round({column} * {SCALES[field]}) AS INTEGER)'
+    if field in INTEGER_FIELDS:
+        return f'CAST({column} AS INTEGER)'
+    return column
+
+
+def create_table_sql(base: Schema) -> List[str]:
+    """DDL of the clustered table and its indexes"""
+    clustered = clustered_schema(base.name)
+    t, ts = clustered.table, base.time_column
+    columns = []
+    for field in base.insert_fields:
+        column = base.columns[field]
+        kind = 'TEXT' if field in TEXT_FIELDS else 'INTEGER'
+        if field == 'timestamp':
+            kind = 'INTEGER'  # epoch seconds; non-canonical text kept as given
+        columns.append(f'{column} {kind} NOT NULL' if field in ('node_id', 'timestamp') else f'{column} {kind}')
+    return [
+        f'''
+        CREATE TABLE IF NOT EXISTS {t} (
+            id INTEGER NOT NULL,
+            {", ".join(columns)},
+            PRIMARY KEY (node_id, {ts}, id)
+        ) WITHOUT ROWID
+        ''',
+        f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{t}_id ON {t}(id)',
+        f'CREATE INDEX IF NOT EXISTS idx_{t}_time ON {t}({ts}, id)',
+    ]
+
+
+def mirror_sql(base: Schema) -> List[str]:
+    """Triggers copying every change of the rowid table into the clustered table"""
+    t = base.table
+    target = clustered_schema(base.name).table
+    names = ', '.join(['id'] + [base.columns[f] for f in base.insert_fields])
+    values = ', '.join(['NEW.id'] + [column_sql(base, f, 'NEW.') for f in base.insert_fields])
+    upsert = f'INSERT OR REPLACE INTO {target} ({names}) VALUES ({values});'
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {t}_mirror_insert AFTER INSERT ON {t} BEGIN {upsert} END',
+        f'''CREATE TRIGGER IF NOT EXISTS {t}_mirror_update AFTER UPDATE ON {t} BEGIN
+                DELETE FROM {target} WHERE id = OLD.id; {upsert} END''',
+        f'CREATE TRIGGER IF NOT EXISTS {t}_mirror_delete AFTER DELETE ON {t} BEGIN '
+        f'DELETE FROM {target} WHERE id = OLD.id; END',
+    ]
+
+
+def backfill_sql(base: Schema) -> str:
+    """Copy the next rows of the rowid table (id > ?, LIMIT ?) that the clustered table doesn't have"""
+    target = clustered_schema(base.name).table
+    names = ', '.join(['id'] + [base.columns[f] for f in base.insert_fields])
+    values = ', '.join(['id'] + [column_sql(base, f) for f in base.insert_fields])
+    return (f'INSERT OR IGNORE INTO {target} ({names}) '
+            f'SELECT {values} FROM {base.table} WHERE id > ? ORDER BY id LIMIT ?')
+
+
+def mirror_triggers(conn, base: Schema) -> List[str]:
+    return [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? AND name LIKE ?",
+        (base.table, f'{base.table}_mirror_%'))]
+
+
+class ClusteredStorage(SQLiteStorage):
+    """Readings in a WITHOUT ROWID table clustered on (node_id, time), fixed-point columns"""
+
+    engine = 'clustered'
+
+    def __init__(self, path: str, schema: str = 'sensor_data', **options):
+        super().__init__(path, schema=schema, **options)
+        self.base = self.schema
+        self.schema = clustered_schema(schema)
+        self._last_id = 0
+
+    # ----- lifecycle -----
+
+    def initialize(self) -> int:
+        """Migrate the base schema, create the clustered table and finish a pending conversion"""
+        # Migrations key on the schema name, so the rowid table and alerts/settings/node_status stay current
+        version = super().initialize()
+        base, t = self.base, self.schema.table
+        with self.connection() as conn:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (t,)).fetchone()
+            triggers = mirror_triggers(conn, base)
+            legacy = conn.execute(f'SELECT 1 FROM {base.table} LIMIT 1').fetchone()
+        if not exists:
+            with self.transaction() as conn:
+                for statement in create_table_sql(base):
+                    conn.execute(statement)
+        if triggers:
+            self._cut_over()
+        elif legacy:
+            raise RuntimeError(f"{self.path} still holds readings in the rowid {base.table} table; "
+                               f"run tools/migrate_clustered.py {self.path} first")
+        with self.connection() as conn:
+            seq = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (base.table,)).fetchone()
+            top = conn.execute(f'SELECT MAX(id) FROM {t}').fetchone()[0]
+        self._last_id = max(seq[0] if seq else 0, top or 0)
+        return version
+
+    def _cut_over(self):
+        """Finish tools/migrate_clustered.py: drop the mirror triggers and empty the rowid table"""
+        base, t = self.base, self.schema.table
+        with self.transaction() as conn:
+            missing = conn.execute(f'''
+                SELECT COUNT(*) FROM {base.table} b WHERE NOT EXISTS (SELECT 1 FROM {t} c WHERE c.id = b.id)
+            ''').fetchone()[0]
+            if missing:
+                raise RuntimeError(f"{missing} readings of {base.table} are not in {t} yet; "
+                                   f"let tools/migrate_clustered.py finish first")
+            for name in mirror_triggers(conn, base):
+                conn.execute(f'DROP TRIGGER {name}')
+            moved = conn.execute(f'SELECT COUNT(*) FROM {base.table}').fetchone()[0]
+            # DROP + CREATE frees the pages in one step; the DDL is the table's own, and ids keep their high-water
+            seq = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (base.table,)).fetchone()
+            ddl = [row[0] for row in conn.execute(
+                "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL ORDER BY type = 'index'",
+                (base.table,))]
+            conn.execute(f'DROP TABLE {base.table}')
+            for statement in ddl:
+                conn.execute(statement)
+            if seq:
+                conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (base.table, seq[0]))
+        print(f"Switched {moved} readings to the clustered {t} table")
+
+    # ----- writes -----
+
+    def insert_readings(self, batch: Iterable[Reading], ids: Optional[Sequence[int]] = None) -> int:
+        """Insert canonical readings in one transaction, ids taken from the table's own sequence"""
+        readings = list(batch)
+        if not readings:
+            return 0
+        schema = self.schema
+        ts_index = schema.insert_fields.index('timestamp')
+        rows = [schema.row_values(r) for r in readings]
+        texts = [row[ts_index] for row in rows]
+        for row in rows:
+            row[ts_index] = to_stored_time(row[ts_index])
+        with self.transaction() as conn:
+            if ids is None:
+                top = conn.execute(f'SELECT MAX(id) FROM {schema.table}').fetchone()[0] or 0
+                first = max(top, self._last_id) + 1
+                ids = range(first, first + len(rows))
+            conn.executemany(schema.insert_sql(with_id=True), [[i] + row for i, row in zip(ids, rows)])
+            if schema.node_table:
+                self._update_node_status(conn, readings)
+            self._last_id = max(self._last_id, max(ids))
+        for reading, text, row_id in zip(readings, texts, ids):
+            reading['id'] = row_id
+            reading['timestamp'] = text
+        return len(rows)
+
+    def delete_range(self, node_id: Optional[str] = None, t0=None, t1=None,
+                     max_id: Optional[int] = None) -> int:
+        """Delete readings with t0 <= timestamp < t1 (and id <= max_id); returns the number removed"""
+        schema = self.schema
+        ts = schema.time_column
+        where, params = [], []
+        if node_id is not None:
+            where.append('node_id = ?')
+            params.append(node_id)
+        if t0 is not None:
+            where.append(f'{ts} >= ?')
+            params.append(to_stored_time(t0))
+        if t1 is not None:
+            where.append(f'{ts} < ?')
+            params.append(to_stored_time(t1))
+        if max_id is not None:
+            where.append('id <= ?')
+            params.append(int(max_id))
+        sql = f'DELETE FROM {schema.table}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    # ----- reads -----
+
+    def _range_sql(self, columns, node_id, t0, t1, limit, descending, after_id=None):
+        # Same query as the rowid table's; only the bounds become stored (epoch) values
+        sql, params = super()._range_sql(columns, node_id, t0, t1, limit, descending, after_id)
+        bounds = [to_stored_time(t) for t in (t0, t1) if t is not None]
+        first = (after_id is not None) + (node_id is not None)
+        params[first:first + len(bounds)] = bounds
+        return sql, params
+
+    def stats(self, active_hours: float = 1, rssi_hours: float = 24) -> Dict[str, Any]:
+        """Network-wide totals used by the dashboards"""
+        schema = self.schema
+        t, ts = schema.table, schema.time_column
+        with self.read_connection() as conn:
+            total = conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+            active = conn.execute(f'SELECT COUNT(DISTINCT node_id) FROM {t} WHERE {ts} >= ?',
+                                  (to_stored_time(hours_ago(active_hours)),)).fetchone()[0]
+            avg_rssi = conn.execute(f'SELECT AVG(rssi) FROM {t} WHERE {ts} >= ?',
+                                    (to_stored_time(hours_ago(rssi_hours)),)).fetchone()[0]
+            # Newest canonical time; text timestamps sort after integers but aren't "latest"
+            last_update = conn.execute(f"SELECT MAX({ts}) FROM {t} WHERE typeof({ts}) = 'integer'").fetchone()[0]
+        return {
+            'total_readings': total,
+            'active_nodes': active,
+            'avg_rssi': avg_rssi,
+            'last_update': from_stored_time(last_update) if last_update is not None else None,
+        }
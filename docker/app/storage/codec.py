@@ -0,0 +1,368 @@
+# codec.py - Column codecs for sealed blocks of readings (blocks.py)
+"""
+A block is one node's readings for one time window, stored column by
+column. Each column picks the smallest codec that round-trips exactly:
+
+- timestamps: delta-of-delta in Gorilla's variable-width buckets, so a
+  steady 15-minute cadence costs one bit per reading
+- integers (ids, rssi, collection_cycle): zigzag varint deltas
+- floats with a few decimals (the sensors' resolution, e.g. 21.37):
+  scaled to integers and stored as varint deltas, if every value of the
+  column converts back to the identical float
+- other floats: Gorilla XOR against the previous value (leading/trailing
+  zero window reuse)
+- text and anything else: JSON run-length list, deflated when that is
+  smaller (distinct strings such as the simple server's gateway clocks)
+
+Columns are length-prefixed, so a projection skips the ones it doesn't
+need without decoding them. NULLs are a presence bitmap per column.
+"""
+
+import itertools
+import json
+import math
+import struct
+import zlib
+
+VERSION = 1
+
+CODEC_NULL = 0
+CODEC_INT = 1
+CODEC_DECIMAL = 2
+CODEC_XOR = 3
+CODEC_RUNS = 4
+CODEC_TIMESTAMP = 5
+CODEC_RUNS_ZLIB = 6
+
+CODEC_NAMES = {CODEC_NULL: 'null', CODEC_INT: 'int', CODEC_DECIMAL: 'decimal', CODEC_XOR: 'xor',
+               CODEC_RUNS: 'runs', CODEC_TIMESTAMP: 'delta-of-delta', CODEC_RUNS_ZLIB: 'runs+zlib'}
+
+MAX_SCALE = 6
+_EXACT_INT = 1 << 53
+
+# Delta-of-delta buckets (Gorilla): (prefix bits, prefix length, value bits) for zigzagged values
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12), (0b1111, 4, 40))
+
+
+# ----- bits and varints -----
+
+class BitWriter:
+    def __init__(self):
+        self.value = 0
+        self.bits = 0
+
+    def write(self, value, bits):
+        self.value = (self.value << bits) | value
+        self.bits += bits
+
+    def getvalue(self):
+        pad = -self.bits % 8
+        return (self.value << pad).to_bytes((self.bits + pad) // 8, 'big')
+
+
+class BitReader:
+    def __init__(self, data):
+        self.value = int.from_bytes(data, 'big')
+        self.remaining = len(data) * 8
+
+    def read(self, bits):
+        self.remaining -= bits
+        return (self.value >> self.remaining) & ((1 << bits) - 1)
+
+
+def _zigzag(n):
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+
+def _unzigzag(z):
+    return z >> 1 if not z & 1 else -((z + 1) >> 1)
+
+
+_ONE_BYTE = [_unzigzag(z) for z in range(128)]
+
+
+def _put_varint(out, n):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(data, pos):
+    shift = result = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+# ----- codecs -----
+
+def _encode_deltas(values):
+    out = bytearray()
+    previous = 0
+    for value in values:
+        _put_varint(out, _zigzag(value - previous))
+        previous = value
+    return bytes(out)
+
+
+def _decode_deltas(data, count):
+    if not count:
+        return []
+    first, pos = _get_varint(data, 0)
+    first = _unzigzag(first)
+    if len(data) - pos == count - 1:
+        # Every delta after the first fits in one byte: the usual case for slowly varying series
+        return list(itertools.accumulate(map(_ONE_BYTE.__getitem__, data[pos:]), initial=first))
+    values, previous = [first], first
+    for _ in range(count - 1):
+        shift = z = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            z |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        previous += z >> 1 if not z & 1 else -((z + 1) >> 1)
+        values.append(previous)
+    return values
+
+
+def _decimal_scale(values):
+    """Smallest number of decimals that reproduces every float exactly, or None"""
+    if any(not math.isfinite(v) or (v == 0 and math.copysign(1, v) < 0) for v in values):
+        return None  # NaN, infinities and -0.0 only survive XOR
+    for scale in range(MAX_SCALE + 1):
+        factor = 10 ** scale
+        for value in values:
+            scaled = round(value * factor)
+            if abs(scaled) >= _EXACT_INT or scaled / factor != value:
+                break
+        else:
+            return scale
+    return None
+
+
+def _encode_xor(values):
+    bits = BitWriter()
+    previous = struct.unpack('>Q', struct.pack('>d', values[0]))[0]
+    bits.write(previous, 64)
+    leading, trailing = 64, 0
+    for value in values[1:]:
+        current = struct.unpack('>Q', struct.pack('>d', value))[0]
+        xor = current ^ previous
+        previous = current
+        if not xor:
+            bits.write(0, 1)
+            continue
+        lead = min(64 - xor.bit_length(), 31)
+        trail = (xor & -xor).bit_length() - 1
+        if lead >= leading and trail >= trailing:
+            # Fits in the previous meaningful-bit window
+            bits.write(0b10, 2)
+            bits.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = lead, trail
+            meaningful = 64 - lead - trail
+            bits.write(0b11, 2)
+            bits.write(lead, 5)
+            bits.write(meaningful - 1, 6)
+            bits.write(xor >> trail, meaningful)
+    return bits.getvalue()
+
+
+def _decode_xor(data, count):
+    bits = BitReader(data)
+    previous = bits.read(64)
+    values = [struct.unpack('>d', struct.pack('>Q', previous))[0]]
+    leading = trailing = 0
+    for _ in range(count - 1):
+        if bits.read(1):
+            if bits.read(1):
+                leading = bits.read(5)
+                trailing = 64 - leading - (bits.read(6) + 1)
+            previous ^= bits.read(64 - leading - trailing) << trailing
+        values.append(struct.unpack('>d', struct.pack('>Q', previous))[0])
+    return values
+
+
+def _encode_timestamps(values):
+    bits = BitWriter()
+    bits.write(_zigzag(values[0]), 40)
+    previous, delta = values[0], 0
+    for value in values[1:]:
+        new_delta = value - previous
+        dod = _zigzag(new_delta - delta)
+        previous, delta = value, new_delta
+        if not dod:
+            bits.write(0, 1)
+            continue
+        for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+            if dod < 1 << value_bits:
+                bits.write(prefix, prefix_bits)
+                bits.write(dod, value_bits)
+                break
+        else:
+            raise ValueError('timestamp step out of range')
+    return bits.getvalue()
+
+
+def _decode_timestamps(data, count):
+    bits = BitReader(data)
+    previous = _unzigzag(bits.read(40))
+    values, delta = [previous], 0
+    for _ in range(count - 1):
+        if bits.read(1):
+            if not bits.read(1):
+                dod = bits.read(7)
+            elif not bits.read(1):
+                dod = bits.read(9)
+            elif not bits.read(1):
+                dod = bits.read(12)
+            else:
+                dod = bits.read(40)
+            delta += _unzigzag(dod)
+        previous += delta
+        values.append(previous)
+    return values
+
+
+def _encode_runs(values):
+    runs = []
+    for value in values:
+        if runs and runs[-1][0] == value:
+            runs[-1][1] += 1
+        else:
+            runs.append([value, 1])
+    return json.dumps(runs, separators=(',', ':')).encode('utf-8')
+
+
+def _decode_runs(data, count):
+    values = []
+    for value, repeat in json.loads(data.decode('utf-8')):
+        values.extend([value] * repeat)
+    return values
+
+
+def encode_column(values, timestamps=False, allow_decimal=True):
+    """(codec, bytes) for one column; timestamps are epoch seconds without NULLs"""
+    if timestamps:
+        return CODEC_TIMESTAMP, _encode_timestamps(values)
+    present = [v for v in values if v is not None]
+    if not present:
+        return CODEC_NULL, b''
+    out = bytearray()
+    if len(present) == len(values):
+        out.append(0)
+    else:
+        out.append(1)
+        bitmap = 0
+        for index, value in enumerate(values):
+            if value is not None:
+                bitmap |= 1 << index
+        out += bitmap.to_bytes((len(values) + 7) // 8, 'little')
+    kinds = {type(v) for v in present}
+    if kinds == {int}:
+        return CODEC_INT, bytes(out + _encode_deltas(present))
+    if kinds == {float}:
+        scale = _decimal_scale(present) if allow_decimal else None
+        if scale is not None:
+            factor = 10 ** scale
+            out.append(scale)
+            return CODEC_DECIMAL, bytes(out + _encode_deltas([round(v * factor) for v in present]))
+        return CODEC_XOR, bytes(out + _encode_xor(present))
+    runs = _encode_runs(present)
+    packed = zlib.compress(runs, 9)
+    if len(packed) < len(runs):
+        return CODEC_RUNS_ZLIB, bytes(out + packed)
+    return CODEC_RUNS, bytes(out + runs)
+
+
+def decode_column(codec, data, count):
+    if codec == CODEC_TIMESTAMP:
+        return _decode_timestamps(data, count)
+    if codec == CODEC_NULL:
+        return [None] * count
+    mask = None
+    pos = 1
+    if data[0]:
+        mask = int.from_bytes(data[1:1 + (count + 7) // 8], 'little')
+        pos += (count + 7) // 8
+    present = count if mask is None else bin(mask).count('1')
+    if codec == CODEC_INT:
+        values = _decode_deltas(data[pos:], present)
+    elif codec == CODEC_DECIMAL:
+        factor = 10 ** data[pos]
+        values = [v / factor for v in _decode_deltas(data[pos + 1:], present)]
+    elif codec == CODEC_XOR:
+        values = _decode_xor(data[pos:], present)
+    elif codec == CODEC_RUNS_ZLIB:
+        values = _decode_runs(zlib.decompress(data[pos:]), present)
+    else:
+        values = _decode_runs(data[pos:], present)
+    if mask is None:
+        return values
+    it = iter(values)
+    return [next(it) if mask >> index & 1 else None for index in range(count)]
+
+
+# ----- blocks -----
+
+def encode_block(columns, allow_decimal=True):
+    """Payload for {name: values} (equal lengths); 'timestamp' holds epoch seconds"""
+    names = list(columns)
+    count = len(columns[names[0]])
+    out = bytearray([VERSION])
+    _put_varint(out, count)
+    _put_varint(out, len(names))
+    for name in names:
+        codec, body = encode_column(columns[name], name == 'timestamp', allow_decimal)
+        label = name.encode('utf-8')
+        _put_varint(out, len(label))
+        out += label
+        out.append(codec)
+        _put_varint(out, len(body))
+        out += body
+    return bytes(out)
+
+
+def decode_block(payload, names=None):
+    """(count, {name: values}) for the wanted columns (all when names is None); absent ones are NULL"""
+    if payload[0] != VERSION:
+        raise ValueError(f"Unsupported block version {payload[0]}")
+    count, pos = _get_varint(payload, 1)
+    ncolumns, pos = _get_varint(payload, pos)
+    columns = {}
+    for _ in range(ncolumns):
+        length, pos = _get_varint(payload, pos)
+        name = payload[pos:pos + length].decode('utf-8')
+        pos += length
+        codec = payload[pos]
+        size, pos = _get_varint(payload, pos + 1)
+        if names is None or name in names:
+            columns[name] = decode_column(codec, payload[pos:pos + size], count)
+        pos += size
+    for name in names or ():
+        columns.setdefault(name, [None] * count)
+    return count, columns
+
+
+def block_layout(payload):
+    """[(column, codec name, bytes)] of a payload, for reports"""
+    count, pos = _get_varint(payload, 1)
+    ncolumns, pos = _get_varint(payload, pos)
+    layout = []
+    for _ in range(ncolumns):
+        length, pos = _get_varint(payload, pos)
+        name = payload[pos:pos + length].decode('utf-8')
+        pos += length
+        codec = payload[pos]
+        size, pos = _get_varint(payload, pos + 1)
+        layout.append((name, CODEC_NAMES.get(codec, str(codec)), size))
+        pos += size
+    return layout
@@ -0,0 +1,279 @@
+# cold.py - Parquet cold tier for readings that aged out of SQLite
+"""
+Old readings move out of the SQLite file into zstd-compressed Parquet
+files, one per month and node:
+
+    <root>/<table>/month=2025-01/node_id=1001/part-<id>.parquet
+
+Queries prune partitions from the directory names (month and node), then
+push the time filter and the column projection down into the Parquet
+reader, so a one-node week reads a few row groups of a few columns.
+pyarrow is optional; without it the cold tier is unavailable and the apps
+keep everything in SQLite.
+"""
+
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from urllib.parse import quote
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from .schemas import TIMESTAMP_FORMAT, parse_timestamp
+
+Reading = Dict[str, Any]
+
+MANIFEST = '_manifest.json'
+COMPRESSION = 'zstd'
+# ~10 days of 15-minute readings per row group, so time filters skip most of a month file
+ROW_GROUP_SIZE = 1024
+
+STRING_FIELDS = ('gateway_id', 'gateways', 'gateway_timestamp', 'node_timestamp')
+INTEGER_FIELDS = ('collection_cycle',)
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def month_key(dt: datetime) -> str:
+    return dt.strftime('%Y-%m')
+
+
+def _arrow_type(field):
+    if field == 'timestamp':
+        return pa.timestamp('s')
+    if field in STRING_FIELDS:
+        return pa.string()
+    if field in INTEGER_FIELDS:
+        return pa.int64()
+    return pa.float64()
+
+
+class ParquetColdTier:
+    """Month/node partitioned Parquet files holding canonical readings"""
+
+    def __init__(self, root: str, schema):
+        if pa is None:
+            raise RuntimeError('pyarrow is required for the Parquet cold tier (pip install pyarrow)')
+        self.schema = schema
+        self.root = os.path.join(root, schema.table)
+        # node_id lives in the partition path, not in the files
+        self.fields = [f for f in schema.insert_fields if f != 'node_id']
+        self.file_schema = pa.schema([('id', pa.int64())] + [(f, _arrow_type(f)) for f in self.fields])
+        self.partition_schema = pa.schema([('month', pa.string()), ('node_id', pa.string())])
+        self.dataset_schema = pa.schema(list(self.file_schema) + list(self.partition_schema))
+        self.partitioning = ds.partitioning(self.partition_schema, flavor='hive')
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self.manifest = self._load_manifest()
+
+    # ----- manifest -----
+
+    def _load_manifest(self):
+        path = os.path.join(self.root, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        return {'watermark': None, 'rows': 0}
+
+    def _save_manifest(self):
+        path = os.path.join(self.root, MANIFEST)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, path)
+
+    @property
+    def watermark(self) -> Optional[str]:
+        """Every cold reading is older than this timestamp (None until the first tiering run)"""
+        return self.manifest.get('watermark')
+
+    def set_watermark(self, value: str):
+        with self._lock:
+            if not self.manifest.get('watermark') or value > self.manifest['watermark']:
+                self.manifest['watermark'] = value
+                self._save_manifest()
+
+    def count(self) -> int:
+        return self.manifest.get('rows', 0)
+
+    # ----- writes -----
+
+    def _partition_dir(self, month, node_id):
+        return os.path.join(self.root, 'month=' + month, 'node_id=' + quote(str(node_id), safe=''))
+
+    def write(self, readings: Iterable[Reading]) -> int:
+        """Merge canonical readings (with their hot-tier id) into their partitions; returns rows added"""
+        groups = {}
+        for reading in readings:
+            ts = parse_timestamp(reading['timestamp'])
+            groups.setdefault((month_key(ts), reading['node_id']), []).append(reading)
+        added = 0
+        with self._lock:
+            for (month, node_id), rows in groups.items():
+                added += self._write_partition(month, node_id, rows)
+            self.manifest['rows'] = self.manifest.get('rows', 0) + added
+            self._save_manifest()
+        return added
+
+    def _write_partition(self, month, node_id, rows):
+        """Rewrite one partition as a single sorted file containing old and new rows"""
+        directory = self._partition_dir(month, node_id)
+        os.makedirs(directory, exist_ok=True)
+        old_files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.parquet')]
+        existing = [self._read_file(f) for f in old_files]
+
+        # Ids are unique in the hot tier, so a re-run after a crash can't duplicate rows
+        seen = set()
+        for table in existing:
+            seen.update(table.column('id').to_pylist())
+        rows = [r for r in rows if r.get('id') not in seen]
+        if not rows:
+            return 0
+
+        columns = {'id': [r.get('id') for r in rows]}
+        for field in self.fields:
+            if field == 'timestamp':
+                columns[field] = [parse_timestamp(r['timestamp']) for r in rows]
+            else:
+                columns[field] = [r.get(field) for r in rows]
+        table = pa.concat_tables(existing + [pa.table(columns, schema=self.file_schema)])
+        table = table.sort_by([('timestamp', 'ascending'), ('id', 'ascending')])
+
+        path = os.path.join(directory, 'part-%s.parquet' % uuid.uuid4().hex[:12])
+        pq.write_table(table, path + '.tmp', compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+        os.replace(path + '.tmp', path)
+        # Readers listing the directory mid-swap may see both files; they drop duplicate ids
+        for old in old_files:
+            os.remove(old)
+        return len(rows)
+
+    def _read_file(self, path):
+        return pq.read_table(path, schema=self.file_schema, partitioning=None)
+
+    def delete_before(self, t) -> int:
+        """Drop cold readings older than t (whole months removed, the boundary month rewritten)"""
+        cutoff = parse_timestamp(t)
+        boundary = month_key(cutoff)
+        removed = 0
+        with self._lock:
+            for month, directory, files in self._partitions():
+                if month > boundary:
+                    continue
+                for path in files:
+                    table = self._read_file(path)
+                    keep = table.filter(pc.field('timestamp') >= pa.scalar(cutoff, pa.timestamp('s')))
+                    removed += table.num_rows - keep.num_rows
+                    if keep.num_rows == 0:
+                        os.remove(path)
+                    elif keep.num_rows < table.num_rows:
+                        pq.write_table(keep, path + '.tmp', compression=COMPRESSION,
+                                       row_group_size=ROW_GROUP_SIZE)
+                        os.replace(path + '.tmp', path)
+            self.manifest['rows'] = max(0, self.manifest.get('rows', 0) - removed)
+            self._save_manifest()
+        return removed
+
+    # ----- reads -----
+
+    def _partitions(self, node_id=None, t0=None, t1=None):
+        """(month, partition dir, files) for partitions that can hold matching rows"""
+        m0 = month_key(parse_timestamp(t0)) if t0 is not None else None
+        m1 = month_key(parse_timestamp(t1)) if t1 is not None else None
+        for month_dir in sorted(os.listdir(self.root)):
+            if not month_dir.startswith('month='):
+                continue
+            month = month_dir[len('month='):]
+            if (m0 and month < m0) or (m1 and month > m1):
+                continue
+            month_path = os.path.join(self.root, month_dir)
+            if node_id is not None:
+                node_dirs = ['node_id=' + quote(str(node_id), safe='')]
+            else:
+                node_dirs = sorted(os.listdir(month_path))
+            for node_dir in node_dirs:
+                directory = os.path.join(month_path, node_dir)
+                if not os.path.isdir(directory):
+                    continue
+                files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.parquet')]
+                if files:
+                    yield month, directory, files
+
+    def _scan(self, files, t0, t1, fields):
+        """Read matching rows from files with the time filter and projection pushed down"""
+        dataset = ds.dataset(files, schema=self.dataset_schema, format='parquet',
+                             partitioning=self.partitioning, partition_base_dir=self.root)
+        names = ['id', 'node_id', 'timestamp']
+        for field in fields or self.schema.insert_fields:
+            if field in self.fields and field not in names:
+                names.append(field)
+        condition = None
+        if t0 is not None:
+            condition = ds.field('timestamp') >= pa.scalar(parse_timestamp(t0), pa.timestamp('s'))
+        if t1 is not None:
+            upper = ds.field('timestamp') <= pa.scalar(parse_timestamp(t1), pa.timestamp('s'))
+            condition = upper if condition is None else condition & upper
+        return dataset.to_table(columns=names, filter=condition), names
+
+    def _to_readings(self, table, names, descending, limit=None):
+        order = 'descending' if descending else 'ascending'
+        table = table.sort_by([('timestamp', order), ('id', order)])
+        if limit:
+            # Slack for duplicate ids left by an interrupted partition rewrite
+            table = table.slice(0, limit * 2)
+        index = names.index('timestamp')
+        table = table.set_column(index, 'timestamp', pc.strftime(table.column('timestamp'),
+                                                                 format=TIMESTAMP_FORMAT))
+        readings, seen = [], set()
+        for row in table.to_pylist():
+            if row['id'] in seen:
+                continue
+            seen.add(row['id'])
+            readings.append(row)
+            if limit and len(readings) >= limit:
+                break
+        return readings
+
+    def range(self, node_id: Optional[str] = None, t0=None, t1=None,
+              fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+              descending: bool = True) -> List[Reading]:
+        """Cold readings for one node (or all) with t0 <= timestamp <= t1"""
+        files = [f for _, _, fs in self._partitions(node_id, t0, t1) for f in fs]
+        if not files:
+            return []
+        table, names = self._scan(files, t0, t1, fields)
+        return self._to_readings(table, names, descending, limit)
+
+    def iter_range(self, node_id=None, t0=None, t1=None, fields=None,
+                   descending=True) -> Iterator[Reading]:
+        """Like range() but reads one month at a time"""
+        months = {}
+        for month, _, files in self._partitions(node_id, t0, t1):
+            months.setdefault(month, []).extend(files)
+        for month in sorted(months, reverse=descending):
+            table, names = self._scan(months[month], t0, t1, fields)
+            for reading in self._to_readings(table, names, descending):
+                yield reading
+
+    def table(self, node_id=None, t0=None, t1=None, fields=None):
+        """Matching rows as an unsorted pyarrow Table (None when no partition matches)"""
+        files = [f for _, _, fs in self._partitions(node_id, t0, t1) for f in fs]
+        if not files:
+            return None
+        return self._scan(files, t0, t1, fields)[0]
+
+    def size_bytes(self) -> int:
+        total = 0
+        for _, _, files in self._partitions():
+            total += sum(os.path.getsize(f) for f in files)
+        return total
@@ -0,0 +1,167 @@
+# migrations.py - Versioned schema migrations tracked in PRAGMA user_version
+"""
+Each schema has an ordered list of migrations. A database records the last
+one applied in PRAGMA user_version, so startup only runs what is missing.
+Version 1 is the original CREATE TABLE IF NOT EXISTS layout, which makes it
+safe to adopt databases created by the old init_database() functions.
+"""
+
+# Alert transitions written by the rule engine (docker/app/alerts.py), same layout in every database
+ALERTS_TABLE = [
+    '''
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        rule_id TEXT NOT NULL,
+        node_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        metric TEXT,
+        state TEXT NOT NULL,
+        value REAL,
+        threshold REAL,
+        severity TEXT,
+        message TEXT,
+        reading_id INTEGER,
+        timestamp DATETIME NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_alerts_rule_node ON alerts(rule_id, node_id, id)',
+    'CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts(timestamp)',
+]
+
+SENSOR_DATA_MIGRATIONS = [
+    (1, 'Baseline sensor_data and settings tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS sensor_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            node_id TEXT NOT NULL,
+            temperature REAL,
+            humidity REAL,
+            pressure REAL,
+            battery_voltage REAL,
+            rssi INTEGER,
+            snr REAL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, 'Canonical timestamps and per-node time index', [
+        # Older rows kept the gateway's 'T' or double-space spelling, which breaks range comparisons.
+        # Only the separator after 'YYYY-MM-DD' is rewritten; other spellings (e.g. 'Tue-10-13-2026--...') stay
+        '''
+        UPDATE sensor_data
+        SET timestamp = substr(timestamp, 1, 10) || ' ' || substr(timestamp, 12)
+        WHERE substr(timestamp, 11, 1) = 'T'
+        ''',
+        '''
+        UPDATE sensor_data
+        SET timestamp = substr(timestamp, 1, 10) || ' ' || substr(timestamp, 13)
+        WHERE substr(timestamp, 11, 2) = '  '
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sensor_data_node_time ON sensor_data(node_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_sensor_data_timestamp ON sensor_data(timestamp)',
+    ]),
+    (3, 'Alerts table', ALERTS_TABLE),
+    (4, 'Derived metric columns', [
+        # Same columns (and units) as sensor_readings: heat index in °F, dew point in °C
+        'ALTER TABLE sensor_data ADD COLUMN heat_index REAL',
+        'ALTER TABLE sensor_data ADD COLUMN dew_point REAL',
+    ]),
+    (5, 'Gateway columns', [
+        # Gateway with the best signal, and every gateway that heard the packet (comma separated)
+        'ALTER TABLE sensor_data ADD COLUMN gateway_id TEXT',
+        'ALTER TABLE sensor_data ADD COLUMN gateways TEXT',
+    ]),
+]
+
+SENSOR_READINGS_MIGRATIONS = [
+    (1, 'Baseline sensor_readings and node_status tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS sensor_readings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            node_id TEXT NOT NULL,
+            gateway_timestamp TEXT NOT NULL,
+            node_timestamp TEXT NOT NULL,
+            temperature_f REAL NOT NULL,
+            humidity REAL NOT NULL,
+            pressure_hpa REAL NOT NULL,
+            heat_index REAL,
+            dew_point REAL,
+            rssi REAL,
+            snr REAL,
+            collection_cycle INTEGER,
+            gateway_id TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_node_id ON sensor_readings(node_id)',
+        'CREATE INDEX IF NOT EXISTS idx_gateway_timestamp ON sensor_readings(gateway_timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_received_at ON sensor_readings(received_at)',
+        '''
+        CREATE TABLE IF NOT EXISTS node_status (
+            node_id TEXT PRIMARY KEY,
+            last_seen TIMESTAMP,
+            total_readings INTEGER DEFAULT 0,
+            last_temperature REAL,
+            last_humidity REAL,
+            last_pressure REAL,
+            last_rssi REAL,
+            is_active BOOLEAN DEFAULT 1,
+            location TEXT
+        )
+        ''',
+    ]),
+    (2, 'Per-node time index', [
+        # Covers per-node history and latest-per-node lookups; idx_node_id becomes redundant
+        'CREATE INDEX IF NOT EXISTS idx_sensor_readings_node_received ON sensor_readings(node_id, received_at)',
+        'DROP INDEX IF EXISTS idx_node_id',
+    ]),
+    (3, 'Alerts table', ALERTS_TABLE),
+    (4, 'Gateways heard column', [
+        'ALTER TABLE sensor_readings ADD COLUMN gateways TEXT',
+    ]),
+]
+
+MIGRATIONS = {
+    'sensor_data': SENSOR_DATA_MIGRATIONS,
+    'sensor_readings': SENSOR_READINGS_MIGRATIONS,
+}
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def latest_version(schema_name):
+    return MIGRATIONS[schema_name][-1][0]
+
+
+def migrate(conn, schema_name):
+    """Apply pending migrations in one transaction each; returns (old_version, new_version)"""
+    current = schema_version(conn)
+    start = current
+    for version, description, statements in MIGRATIONS[schema_name]:
+        if version <= current:
+            continue
+        try:
+            conn.execute('BEGIN')
+            for statement in statements:
+                conn.execute(statement)
+            # PRAGMA doesn't take parameters; version is an int from the table above
+            conn.execute('PRAGMA user_version = %d' % version)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        print(f"Applied {schema_name} migration {version}: {description}")
+        current = version
+    return start, current
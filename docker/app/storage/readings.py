@@ -0,0 +1,159 @@
+# readings.py - Compact containers for canonical readings
+"""
+A history response can hold 100k readings. As plain dicts each one costs
+a hash table (~350 bytes before the values). Two cheaper shapes are used
+instead:
+
+- Reading: one reading in __slots__ (no per-instance dict), still usable
+  as a mapping (reading['temperature_c'], .get(), dict(reading)) so code
+  written against dicts keeps working
+- ReadingBatch: a query result as one list per field (struct of arrays);
+  endpoints zip the columns they serialize and never build a per-row
+  object at all
+
+Both only carry the fields that were selected or set. A ReadingBatch also
+stores repeated node ids, timestamps and the like once per result.
+"""
+
+from collections.abc import MutableMapping
+from typing import Any, Iterable, Iterator, List, Sequence
+
+# Canonical reading fields accepted by insert_readings() and returned by queries
+FIELDS = (
+    'node_id',
+    'timestamp',
+    'temperature_c',
+    'humidity',
+    'pressure_hpa',
+    'battery_voltage',
+    'rssi',
+    'snr',
+    'gateway_id',
+    'gateways',
+    'collection_cycle',
+    'heat_index',
+    'dew_point',
+    'gateway_timestamp',
+    'node_timestamp',
+)
+
+SLOTS = ('id',) + FIELDS
+
+# Low-cardinality fields whose equal values a ReadingBatch stores once (a
+# history page repeats a handful of node ids and one timestamp per cycle)
+SHARED_FIELDS = ('node_id', 'timestamp', 'rssi', 'gateway_id', 'gateways', 'collection_cycle',
+                 'gateway_timestamp', 'node_timestamp')
+
+
+class Reading(MutableMapping):
+    """Canonical reading stored in slots; behaves like the dict it replaces"""
+
+    __slots__ = SLOTS + ('_names',)
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self._names = tuple(fields)
+
+    @classmethod
+    def from_row(cls, names: Sequence[str], values: Iterable[Any]) -> 'Reading':
+        """Build from parallel names/values; names should be a tuple shared by a whole result"""
+        reading = cls.__new__(cls)
+        for name, value in zip(names, values):
+            setattr(reading, name, value)
+        reading._names = names
+        return reading
+
+    def __getitem__(self, name):
+        if name not in self._names:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in self._names else default
+
+    def __setitem__(self, name, value):
+        if name not in SLOTS:
+            raise KeyError(f"Not a reading field: {name}")
+        setattr(self, name, value)
+        if name not in self._names:
+            self._names = tuple(self._names) + (name,)
+
+    def __delitem__(self, name):
+        if name not in self._names:
+            raise KeyError(name)
+        delattr(self, name)
+        self._names = tuple(n for n in self._names if n != name)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __repr__(self):
+        return 'Reading(%s)' % ', '.join('%s=%r' % (n, getattr(self, n)) for n in self._names)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self._names}
+
+
+class ReadingBatch:
+    """Query result as parallel columns, one list per field"""
+
+    __slots__ = ('names', 'columns', '_shared')
+
+    def __init__(self, names: Sequence[str], columns: Sequence[List[Any]]):
+        self.names = tuple(names)
+        self.columns = list(columns)
+        # column index -> {value: value}, so equal values end up as one object
+        self._shared = {i: {} for i, name in enumerate(self.names) if name in SHARED_FIELDS}
+
+    @classmethod
+    def empty(cls, names: Sequence[str]) -> 'ReadingBatch':
+        return cls(names, [[] for _ in names])
+
+    @classmethod
+    def from_readings(cls, names: Sequence[str], readings: Iterable[Any]) -> 'ReadingBatch':
+        batch = cls.empty(names)
+        for reading in readings:
+            for name, column in zip(batch.names, batch.columns):
+                column.append(reading.get(name))
+        return batch
+
+    def extend_rows(self, rows: Sequence[Sequence[Any]]):
+        """Append row tuples (e.g. a cursor.fetchmany() chunk) column by column"""
+        if not rows:
+            return
+        shared = self._shared
+        for index, (column, values) in enumerate(zip(self.columns, zip(*rows))):
+            memo = shared.get(index)
+            if memo is None:
+                column.extend(values)
+            else:
+                column.extend([memo.setdefault(v, v) for v in values])
+
+    def seal(self):
+        """Drop the value-sharing tables once every row is in"""
+        self._shared = {}
+        return self
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def column(self, name: str) -> List[Any]:
+        return self.columns[self.names.index(name)]
+
+    def rows(self, *names: str) -> Iterator[tuple]:
+        """Tuples of the named columns (all of them by default), without building readings"""
+        if not names:
+            return zip(*self.columns)
+        return zip(*(self.column(name) for name in names))
+
+    def __iter__(self) -> Iterator[Reading]:
+        names = self.names
+        for values in zip(*self.columns):
+            yield Reading.from_row(names, values)
@@ -0,0 +1,212 @@
+# schemas.py - Table layouts understood by the storage engine
+"""
+The apps grew two layouts for the same readings:
+
+- sensor_data (docker/api apps): Celsius, `timestamp` from the gateway
+- sensor_readings (simple server): Fahrenheit, `received_at` server time,
+  plus a node_status summary table
+
+The storage API always speaks canonical readings (FIELDS in readings.py,
+with temperature in Celsius). A Schema maps those fields onto its columns and
+converts units on the way in and out.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from .readings import FIELDS, Reading
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Timestamp spellings seen from gateways and older rows
+_PARSE_FORMATS = (
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d  %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%a-%m-%d-%Y--%H:%M:%S',
+)
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def parse_timestamp(value):
+    """Parse any supported timestamp (text, datetime or unix seconds) to a naive UTC datetime"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1]
+    for fmt in _PARSE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    try:
+        return parse_timestamp(datetime.fromisoformat(text))
+    except ValueError:
+        return None
+
+
+def normalize_timestamp(value, default_now=True):
+    """Canonical 'YYYY-MM-DD HH:MM:SS' text, the form SQLite's datetime() compares against"""
+    if value is None or value == '':
+        return utc_now().strftime(TIMESTAMP_FORMAT) if default_now else None
+    dt = parse_timestamp(value)
+    if dt is None:
+        return str(value)
+    return dt.strftime(TIMESTAMP_FORMAT)
+
+
+def hours_ago(hours):
+    """Canonical timestamp `hours` before now (UTC)"""
+    return (utc_now() - timedelta(hours=hours)).strftime(TIMESTAMP_FORMAT)
+
+
+# Only the way back to °F is rounded: 10 decimals drops the float error of the
+# round trip, so a °F value stored through f_to_c comes back as it was sent
+def c_to_f(value):
+    return None if value is None else round(value * 9.0 / 5.0 + 32.0, 10)
+
+
+def f_to_c(value):
+    return None if value is None else (value - 32.0) * 5.0 / 9.0
+
+
+def _identity(value):
+    return value
+
+
+class Schema:
+    """Maps canonical reading fields onto one table layout"""
+
+    def __init__(self, name, table, time_column, columns, to_db=None, from_db=None,
+                 defaults=None, node_table=None, sql_exprs=None, time_param='?', select_exprs=None):
+        self.name = name
+        self.table = table
+        self.time_column = time_column
+        self.columns = columns  # canonical field -> column
+        self.to_db = to_db or {}  # canonical field -> converter
+        self.from_db = from_db or {}  # canonical field -> converter
+        self.defaults = defaults or {}  # canonical field -> value stored when missing
+        self.node_table = node_table
+        self.sql_exprs = sql_exprs or {}  # canonical field -> SQL computing it from the columns
+        self.time_param = time_param  # placeholder SQL comparing canonical text with the time column
+        self.select_exprs = select_exprs or {}  # canonical field -> SQL template ({} = column) decoding it on read
+        self.insert_fields = [f for f in FIELDS if f in columns]
+        self.column_to_field = {c: f for f, c in columns.items()}
+
+    def row_values(self, reading):
+        """Column values for one canonical reading, in insert_fields order"""
+        values = []
+        for field in self.insert_fields:
+            value = reading.get(field)
+            if field == 'timestamp':
+                value = normalize_timestamp(value)
+            elif value is None:
+                value = self.defaults.get(field)
+            else:
+                value = self.to_db.get(field, _identity)(value)
+            values.append(value)
+        return values
+
+    def insert_sql(self, with_id=False):
+        """INSERT for row_values() rows, with the row id as an extra first value when with_id"""
+        names = (['id'] if with_id else []) + [self.columns[f] for f in self.insert_fields]
+        marks = ', '.join('?' for _ in names)
+        return f'INSERT INTO {self.table} ({", ".join(names)}) VALUES ({marks})'
+
+    def select_columns(self, fields=None, qualify=False):
+        """(column list SQL, canonical names) for a projection; node_id/timestamp always included"""
+        wanted = ['id', 'node_id', 'timestamp']
+        for field in fields or FIELDS:
+            if field in self.columns and field not in wanted:
+                wanted.append(field)
+        prefix = self.table + '.' if qualify else ''
+        parts = []
+        for f in wanted:
+            column = prefix + ('id' if f == 'id' else self.columns[f])
+            parts.append(self.select_exprs[f].format(column) if f in self.select_exprs else column)
+        sql = ', '.join(parts)
+        # A tuple, so every Reading of a result can share it
+        return sql, tuple(wanted)
+
+    def field_sql(self, field):
+        """SQL expression yielding a canonical field (units converted) for aggregates"""
+        return self.sql_exprs.get(field, self.columns[field])
+
+    def to_reading(self, names, row):
+        """Canonical Reading from a row selected with select_columns()"""
+        if self.from_db:
+            row = [self.from_db[name](value) if value is not None and name in self.from_db else value
+                   for name, value in zip(names, row)]
+        return Reading.from_row(names, row)
+
+    def convert_columns(self, batch):
+        """Apply from_db converters to a ReadingBatch of raw column values, in place"""
+        for index, name in enumerate(batch.names):
+            convert = self.from_db.get(name)
+            if convert:
+                batch.columns[index] = [None if v is None else convert(v) for v in batch.columns[index]]
+        return batch
+
+
+SENSOR_DATA = Schema(
+    name='sensor_data',
+    table='sensor_data',
+    time_column='timestamp',
+    columns={
+        'node_id': 'node_id',
+        'timestamp': 'timestamp',
+        'temperature_c': 'temperature',
+        'humidity': 'humidity',
+        'pressure_hpa': 'pressure',
+        'battery_voltage': 'battery_voltage',
+        'rssi': 'rssi',
+        'snr': 'snr',
+        'heat_index': 'heat_index',
+        'dew_point': 'dew_point',
+        'gateway_id': 'gateway_id',
+        'gateways': 'gateways',
+    },
+)
+
+SENSOR_READINGS = Schema(
+    name='sensor_readings',
+    table='sensor_readings',
+    time_column='received_at',
+    columns={
+        'node_id': 'node_id',
+        'timestamp': 'received_at',
+        'temperature_c': 'temperature_f',
+        'humidity': 'humidity',
+        'pressure_hpa': 'pressure_hpa',
+        'rssi': 'rssi',
+        'snr': 'snr',
+        'gateway_id': 'gateway_id',
+        'gateways': 'gateways',
+        'collection_cycle': 'collection_cycle',
+        'heat_index': 'heat_index',
+        'dew_point': 'dew_point',
+        'gateway_timestamp': 'gateway_timestamp',
+        'node_timestamp': 'node_timestamp',
+    },
+    to_db={'temperature_c': c_to_f},
+    from_db={'temperature_c': f_to_c},
+    sql_exprs={'temperature_c': '((temperature_f - 32.0) * 5.0 / 9.0)'},
+    defaults={'gateway_timestamp': '', 'node_timestamp': '', 'gateway_id': 'UNKNOWN'},
+    node_table='node_status',
+)
+
+SCHEMAS = {
+    SENSOR_DATA.name: SENSOR_DATA,
+    SENSOR_READINGS.name: SENSOR_READINGS,
+}
@@ -0,0 +1,306 @@
+# sharded.py - Readings split across several SQLite files by node
+"""
+ShardedStorage keeps one SQLiteStorage per shard file and routes every
+reading by a stable hash of its node_id (crc32 % shards), so all of a
+node's history lives in one file:
+
+- writes: each shard has its own write lock and WAL, so batches for nodes
+  on different shards commit in parallel instead of queueing on one lock.
+  A batch that spans shards commits once per shard
+- ids: one sequence across all shards, handed out in memory and stored as
+  explicit row ids, so an id names a reading whichever file holds it and a
+  rebalance keeps ids unchanged. One process owns the files
+- reads: anything with a node_id goes to that node's shard; latest(),
+  stats() and history without a node fan out to every shard on a thread
+  pool and are merged by (timestamp, id)
+- alerts live in shard 0; node_status rows sit with their node's readings
+
+Shard files are named after the database path: lora_sensors.db becomes
+lora_sensors.shard0.db ... lora_sensors.shard{N-1}.db. initialize() refuses
+to open files written with another shard count; tools/rebalance_shards.py
+moves nodes between files when the count changes.
+"""
+
+import glob
+import heapq
+import itertools
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .readings import Reading, ReadingBatch
+from .schemas import SCHEMAS, hours_ago
+from .sqlite import SQLiteStorage
+
+DEFAULT_SHARDS = 4
+# Ids per IN (...) lookup when locating rows for update_fields()
+LOCATE_CHUNK = 500
+
+
+def shard_index(node_id, shards: int) -> int:
+    """Shard that holds a node's readings (stable across processes and restarts)"""
+    return zlib.crc32(str(node_id).encode('utf-8')) % shards
+
+
+def shard_path(path: str, index: int) -> str:
+    root, ext = os.path.splitext(path)
+    return f'{root}.shard{index}{ext or ".db"}'
+
+
+def existing_shards(path: str) -> List[int]:
+    """Indexes of the shard files present for a database path"""
+    root, ext = os.path.splitext(path)
+    ext = ext or '.db'
+    pattern = re.compile(re.escape(os.path.basename(root)) + r'\.shard(\d+)' + re.escape(ext) + '$')
+    found = []
+    for name in glob.glob(glob.escape(root) + '.shard*' + ext):
+        match = pattern.match(os.path.basename(name))
+        if match:
+            found.append(int(match.group(1)))
+    return sorted(found)
+
+
+def high_water(store: SQLiteStorage) -> int:
+    """Largest readings id a SQLite file has ever stored, deleted rows included"""
+    table = store.schema.table
+    with store.connection() as conn:
+        seq = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+        top = conn.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0]
+    return max(seq[0] if seq else 0, top or 0)
+
+
+def _merge(results, descending):
+    return heapq.merge(*results, key=lambda r: (r['timestamp'], r['id']), reverse=descending)
+
+
+class ShardedStorage:
+    """Storage API over N SQLite files, one writer each, with fan-out reads"""
+
+    engine = 'sharded'
+
+    def __init__(self, path: str, schema: str = 'sensor_data', shards: int = DEFAULT_SHARDS,
+                 workers: Optional[int] = None, **options):
+        if shards < 1:
+            raise ValueError('shards must be at least 1')
+        self.path = path
+        self.schema = SCHEMAS[schema]
+        self.shards = [SQLiteStorage(shard_path(path, i), schema=schema, **options) for i in range(shards)]
+        self._executor = ThreadPoolExecutor(max_workers=workers or shards, thread_name_prefix='shard')
+        self._id_lock = threading.Lock()
+        self._next_id = None
+
+    @property
+    def meta(self) -> SQLiteStorage:
+        """Shard holding the tables that aren't per node (alerts)"""
+        return self.shards[0]
+
+    def shard_for(self, node_id) -> SQLiteStorage:
+        return self.shards[shard_index(node_id, len(self.shards))]
+
+    def fan_out(self, fn, items: Optional[Sequence[Any]] = None) -> List[Any]:
+        """fn(shard) for every shard (or fn(item) for each item) on the thread pool, results in order"""
+        items = self.shards if items is None else items
+        if len(items) == 1:
+            return [fn(items[0])]
+        return list(self._executor.map(fn, items))
+
+    # ----- lifecycle -----
+
+    def initialize(self) -> int:
+        """Create or migrate every shard; returns the schema version"""
+        found = existing_shards(self.path)
+        if found and found != list(range(len(self.shards))):
+            raise RuntimeError(
+                f"{self.path} is split into {len(found)} shard files but {len(self.shards)} are configured; "
+                f"run tools/rebalance_shards.py --to {len(self.shards)} first")
+        versions = self.fan_out(lambda shard: shard.initialize())
+        with self._id_lock:
+            self._next_id = None
+        return versions[0]
+
+    def _allocate(self, n: int) -> int:
+        """Reserve n consecutive ids; returns the first"""
+        with self._id_lock:
+            if self._next_id is None:
+                self._next_id = max(self.fan_out(high_water)) + 1
+            first = self._next_id
+            self._next_id += n
+            return first
+
+    def prewarm(self, max_bytes: int = 256 * 1024 * 1024) -> int:
+        """Prewarm every shard with an equal share of max_bytes"""
+        share = max_bytes // len(self.shards)
+        return sum(self.fan_out(lambda shard: shard.prewarm(share)))
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self._executor.shutdown(wait=False)
+
+    # ----- writes -----
+
+    def _by_shard(self, items, node_of):
+        groups = {}
+        count = len(self.shards)
+        for item in items:
+            groups.setdefault(shard_index(node_of(item), count), []).append(item)
+        return groups
+
+    def insert_readings(self, batch: Iterable[Reading]) -> int:
+        """Insert readings, each on its node's shard; returns the number stored
+
+        Fills in `id` and `timestamp` like SQLiteStorage. Shards touched by
+        one batch are written in parallel.
+        """
+        readings = list(batch)
+        if not readings:
+            return 0
+        first_id = self._allocate(len(readings))
+        numbered = list(zip(range(first_id, first_id + len(readings)), readings))
+        groups = self._by_shard(numbered, lambda item: item[1].get('node_id'))
+        jobs = [(self.shards[index], group) for index, group in groups.items()]
+
+        def write(job):
+            shard, group = job
+            return shard.insert_readings([r for _, r in group], ids=[i for i, _ in group])
+
+        return sum(self.fan_out(write, jobs))
+
+    def update_fields(self, fields: Sequence[str], ids: Sequence[int],
+                      columns: Sequence[Sequence[Any]]) -> int:
+        """Set fields of existing readings by id on whichever shard holds them; returns rows updated"""
+        if not ids:
+            return 0
+        wanted = [int(i) for i in ids]
+        table = self.schema.table
+
+        def locate(shard):
+            held = set()
+            with shard.read_connection() as conn:
+                for start in range(0, len(wanted), LOCATE_CHUNK):
+                    chunk = wanted[start:start + LOCATE_CHUNK]
+                    marks = ', '.join('?' for _ in chunk)
+                    held.update(row[0] for row in conn.execute(
+                        f'SELECT id FROM {table} WHERE id IN ({marks})', chunk))
+            return held
+
+        jobs = []
+        for shard, held in zip(self.shards, self.fan_out(locate)):
+            positions = [p for p, i in enumerate(wanted) if i in held]
+            if positions:
+                jobs.append((shard, [wanted[p] for p in positions],
+                             [[column[p] for p in positions] for column in columns]))
+        return sum(self.fan_out(lambda job: job[0].update_fields(fields, job[1], job[2]), jobs))
+
+    def set_node_active(self, changes: Dict[str, bool]) -> int:
+        """node_status.is_active for several nodes, each on its own shard; returns rows updated"""
+        if not self.schema.node_table:
+            raise NotImplementedError(f"{self.schema.name} has no node status table")
+        groups = self._by_shard(changes.items(), lambda item: item[0])
+        return sum(self.shards[index].set_node_active(dict(group)) for index, group in groups.items())
+
+    def delete_before(self, t) -> int:
+        return sum(self.fan_out(lambda shard: shard.delete_before(t)))
+
+    def delete_range(self, node_id: Optional[str] = None, t0=None, t1=None,
+                     max_id: Optional[int] = None) -> int:
+        """Delete readings with t0 <= timestamp < t1 (and id <= max_id); returns the number removed"""
+        if node_id is not None:
+            return self.shard_for(node_id).delete_range(node_id, t0, t1, max_id)
+        return sum(self.fan_out(lambda shard: shard.delete_range(None, t0, t1, max_id)))
+
+    # ----- reads -----
+
+    def latest(self, fields: Optional[Sequence[str]] = None) -> List[Reading]:
+        """Most recent reading of every node, newest first"""
+        results = self.fan_out(lambda shard: shard.latest(fields))
+        return sorted(itertools.chain.from_iterable(results), key=lambda r: r['timestamp'], reverse=True)
+
+    def range(self, node_id: Optional[str] = None, t0=None, t1=None,
+              fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+              descending: bool = True) -> List[Reading]:
+        """Readings for one node (its shard) or all (every shard, merged) with t0 <= timestamp <= t1"""
+        if node_id is not None:
+            return self.shard_for(node_id).range(node_id, t0, t1, fields, limit, descending)
+        if limit:
+            # A page needs about limit/N rows from each shard: stream them in chunks of that size
+            # and stop once the merge has the page, instead of reading `limit` rows per shard
+            chunk = int(limit) // len(self.shards) + 1
+            streams = [shard.iter_range(None, t0, t1, fields, descending, chunk) for shard in self.shards]
+            return list(itertools.islice(_merge(streams, descending), limit))
+        results = self.fan_out(lambda shard: shard.range(None, t0, t1, fields, None, descending))
+        return list(_merge(results, descending))
+
+    def range_batch(self, node_id: Optional[str] = None, t0=None, t1=None,
+                    fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                    descending: bool = True, chunk_size: int = 5000) -> ReadingBatch:
+        """range() as a ReadingBatch"""
+        if node_id is not None:
+            return self.shard_for(node_id).range_batch(node_id, t0, t1, fields, limit, descending, chunk_size)
+        _, names = self.schema.select_columns(fields)
+        return ReadingBatch.from_readings(names, self.range(None, t0, t1, fields, limit, descending))
+
+    def iter_range(self, node_id=None, t0=None, t1=None, fields=None, descending=True,
+                   chunk_size=5000, after_id=None):
+        """Like range() but streams; without a node the shards' streams are merged lazily"""
+        if node_id is not None:
+            return self.shard_for(node_id).iter_range(node_id, t0, t1, fields, descending, chunk_size, after_id)
+        return _merge([shard.iter_range(None, t0, t1, fields, descending, chunk_size, after_id)
+                       for shard in self.shards], descending)
+
+    def scan_batch(self, after_id: int = 0, limit: int = 50000, fields: Optional[Sequence[str]] = None,
+                   missing: Optional[Sequence[str]] = None) -> ReadingBatch:
+        """Next readings after after_id in id order across all shards"""
+        batches = self.fan_out(lambda shard: shard.scan_batch(after_id, limit, fields, missing))
+        _, names = self.schema.select_columns(fields)
+        merged = heapq.merge(*batches, key=lambda r: r['id'])
+        return ReadingBatch.from_readings(names, itertools.islice(merged, limit))
+
+    def stats(self, active_hours: float = 1, rssi_hours: float = 24) -> Dict[str, Any]:
+        """Network-wide totals; a node's rows are all on one shard, so node counts add up"""
+        t, ts = self.schema.table, self.schema.time_column
+        active_since, rssi_since = hours_ago(active_hours), hours_ago(rssi_hours)
+
+        def partial(shard):
+            with shard.read_connection() as conn:
+                # Separate statements: MAX alone is one index probe, next to COUNT it's a scan
+                total = conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+                last_update = conn.execute(f'SELECT MAX({ts}) FROM {t}').fetchone()[0]
+                active = conn.execute(f'SELECT COUNT(DISTINCT node_id) FROM {t} WHERE {ts} >= ?',
+                                      (active_since,)).fetchone()[0]
+                rssi_count, rssi_sum = conn.execute(f'SELECT COUNT(rssi), SUM(rssi) FROM {t} WHERE {ts} >= ?',
+                                                    (rssi_since,)).fetchone()
+            return total, active, rssi_count, rssi_sum or 0, last_update
+
+        parts = self.fan_out(partial)
+        rssi_count = sum(p[2] for p in parts)
+        updates = [p[4] for p in parts if p[4] is not None]
+        return {
+            'total_readings': sum(p[0] for p in parts),
+            'active_nodes': sum(p[1] for p in parts),
+            'avg_rssi': sum(p[3] for p in parts) / rssi_count if rssi_count else None,
+            'last_update': max(updates) if updates else None,
+        }
+
+    def node_status(self) -> List[Dict[str, Any]]:
+        """node_status rows from every shard, most recently seen first"""
+        rows = itertools.chain.from_iterable(self.fan_out(lambda shard: shard.node_status()))
+        return sorted(rows, key=lambda row: row['last_seen'] or '', reverse=True)
+
+    def count(self) -> int:
+        return sum(self.fan_out(lambda shard: shard.count()))
+
+    # ----- alerts -----
+
+    def insert_alerts(self, alerts: Iterable[Dict[str, Any]]) -> int:
+        return self.meta.insert_alerts(alerts)
+
+    def alerts(self, node_id: Optional[str] = None, t0=None, state: Optional[str] = None,
+               limit: Optional[int] = 100) -> List[Dict[str, Any]]:
+        return self.meta.alerts(node_id, t0, state, limit)
+
+    def open_alerts(self) -> List[Dict[str, Any]]:
+        return self.meta.open_alerts()
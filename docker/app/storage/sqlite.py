@@ -0,0 +1,445 @@
+# sqlite.py - SQLite implementation of the storage API
+"""
+One tuned SQLite engine shared by every server variant:
+
+- WAL journaling with synchronous=NORMAL, so readers never block the writer
+- pooled connections instead of a connect() per request
+- batched inserts in a single transaction
+- latest-per-node via an index skip-scan instead of a GROUP BY over the table
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .migrations import latest_version, migrate, schema_version
+from .readings import Reading, ReadingBatch
+from .schemas import SCHEMAS, c_to_f, hours_ago, normalize_timestamp
+
+# Columns of the alerts table written by insert_alerts()
+ALERT_COLUMNS = ('rule_id', 'node_id', 'kind', 'metric', 'state', 'value', 'threshold', 'severity',
+                 'message', 'reading_id', 'timestamp')
+
+
+class SQLiteStorage:
+    """Readings storage on a single SQLite file"""
+
+    engine = 'sqlite'
+
+    def __init__(self, path: str, schema: str = 'sensor_data', journal_mode: str = 'wal',
+                 timeout: float = 30.0, pool_size: int = 4):
+        self.path = path
+        self.schema = SCHEMAS[schema]
+        self.journal_mode = journal_mode
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._write_lock = threading.Lock()
+        self.read_connector = None  # optional callable returning a read-only connection
+
+    # ----- connections -----
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA cache_size = -8192')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection (autocommit mode; use transaction() for writes)"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def read_connection(self):
+        """Connection for queries; served by read_connector (e.g. a snapshot) when set"""
+        if self.read_connector is None:
+            with self.connection() as conn:
+                yield conn
+            return
+        conn = self.read_connector()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Serialized write transaction; commits on success"""
+        with self._write_lock, self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def initialize(self) -> int:
+        """Create or migrate the schema; returns the schema version"""
+        with self.connection() as conn:
+            # Restarts of an up-to-date database only read two pragmas: no DDL, no write lock
+            version = schema_version(conn)
+            if self.journal_mode:
+                mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+                if mode.lower() != self.journal_mode.lower():
+                    conn.execute('PRAGMA journal_mode = %s' % self.journal_mode)
+            if version != latest_version(self.schema.name):
+                _, version = migrate(conn, self.schema.name)
+        return version
+
+    def prewarm(self, max_bytes: int = 256 * 1024 * 1024) -> int:
+        """Pull the database into the OS page cache; returns the bytes requested
+
+        Files up to max_bytes are handed to the kernel with POSIX_FADV_WILLNEED
+        (read ahead in the background); bigger ones get their last max_bytes
+        read, which is where the newest rows live.
+        """
+        requested = 0
+        for path in (self.path, self.path + '-wal'):
+            if not os.path.exists(path) or requested >= max_bytes:
+                continue
+            size = os.path.getsize(path)
+            with open(path, 'rb') as f:
+                if size <= max_bytes - requested and hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                    requested += size
+                    continue
+                length = min(size, max_bytes - requested)
+                f.seek(size - length)
+                while f.read(1 << 20):
+                    pass
+                requested += length
+        # Fills SQLite's own cache and statement cache for the dashboard's first query
+        self.latest()
+        return requested
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    # ----- writes -----
+
+    def insert_readings(self, batch: Iterable[Reading], ids: Optional[Sequence[int]] = None) -> int:
+        """Insert canonical readings in one transaction; returns the number stored
+
+        Each reading dict gets its row `id` and the stored (normalized) `timestamp`
+        filled in, so listeners downstream of the insert see what the table holds.
+        ids, parallel to the batch, stores rows under ids chosen by the caller
+        (the sharded engine numbers readings across all its files).
+        """
+        readings = list(batch)
+        if not readings:
+            return 0
+        schema = self.schema
+        rows = [schema.row_values(r) for r in readings]
+        with self.transaction() as conn:
+            if ids is None:
+                conn.executemany(schema.insert_sql(), rows)
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            else:
+                conn.executemany(schema.insert_sql(with_id=True), [[i] + row for i, row in zip(ids, rows)])
+            if schema.node_table:
+                self._update_node_status(conn, readings)
+        if ids is None:
+            # AUTOINCREMENT ids are contiguous inside one serialized write transaction
+            first_id = last_id - len(rows) + 1
+            ids = range(first_id, first_id + len(rows))
+        ts_index = schema.insert_fields.index('timestamp')
+        for reading, row, row_id in zip(readings, rows, ids):
+            reading['id'] = row_id
+            reading['timestamp'] = row[ts_index]
+        return len(rows)
+
+    def _update_node_status(self, conn, readings: Sequence[Reading]):
+        """Keep the node_status summary in step with inserts (sensor_readings layout)"""
+        conn.executemany('''
+            INSERT INTO node_status
+            (node_id, last_seen, total_readings, last_temperature, last_humidity,
+             last_pressure, last_rssi, is_active)
+            VALUES (?, CURRENT_TIMESTAMP, 1, ?, ?, ?, ?, 1)
+            ON CONFLICT(node_id) DO UPDATE SET
+                last_seen = excluded.last_seen,
+                total_readings = node_status.total_readings + 1,
+                last_temperature = excluded.last_temperature,
+                last_humidity = excluded.last_humidity,
+                last_pressure = excluded.last_pressure,
+                last_rssi = excluded.last_rssi,
+                is_active = 1
+        ''', [(r.get('node_id'), c_to_f(r.get('temperature_c')), r.get('humidity'),
+               r.get('pressure_hpa'), r.get('rssi')) for r in readings])
+
+    def delete_before(self, t) -> int:
+        """Delete readings older than t; returns the number removed"""
+        return self.delete_range(t1=t)
+
+    def delete_range(self, node_id: Optional[str] = None, t0=None, t1=None,
+                     max_id: Optional[int] = None) -> int:
+        """Delete readings with t0 <= timestamp < t1 (and id <= max_id); returns the number removed"""
+        schema = self.schema
+        ts = schema.time_column
+        where, params = [], []
+        if node_id is not None:
+            where.append('node_id = ?')
+            params.append(node_id)
+        if t0 is not None:
+            where.append(f'{ts} >= ?')
+            params.append(normalize_timestamp(t0))
+        if t1 is not None:
+            where.append(f'{ts} < ?')
+            params.append(normalize_timestamp(t1))
+        if max_id is not None:
+            where.append('id <= ?')
+            params.append(int(max_id))
+        sql = f'DELETE FROM {schema.table}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def update_fields(self, fields: Sequence[str], ids: Sequence[int],
+                      columns: Sequence[Sequence[Any]]) -> int:
+        """Set fields of existing readings by id (columns parallel to ids); returns rows updated"""
+        schema = self.schema
+        assignments = ', '.join(f'{schema.columns[f]} = ?' for f in fields)
+        converters = [schema.to_db.get(f) for f in fields]
+        rows = []
+        for values in zip(*columns, ids):
+            rows.append([convert(v) if convert and v is not None else v
+                         for convert, v in zip(converters, values[:-1])] + [values[-1]])
+        if not rows:
+            return 0
+        with self.transaction() as conn:
+            conn.executemany(f'UPDATE {schema.table} SET {assignments} WHERE id = ?', rows)
+        return len(rows)
+
+    # ----- reads -----
+
+    def latest(self, fields: Optional[Sequence[str]] = None) -> List[Reading]:
+        """Most recent reading of every node, newest first"""
+        schema = self.schema
+        columns, names = schema.select_columns(fields, qualify=True)
+        t, ts = schema.table, schema.time_column
+        # Recursive CTE walks distinct node_ids through the (node_id, time) index
+        sql = f'''
+            WITH RECURSIVE nodes(node_id) AS (
+                SELECT MIN(node_id) FROM {t}
+                UNION ALL
+                SELECT (SELECT MIN(node_id) FROM {t} WHERE node_id > nodes.node_id)
+                FROM nodes WHERE nodes.node_id IS NOT NULL
+            )
+            SELECT {columns} FROM nodes
+            JOIN {t} ON {t}.id = (
+                SELECT id FROM {t} WHERE node_id = nodes.node_id
+                ORDER BY {ts} DESC, id DESC LIMIT 1
+            )
+            ORDER BY {t}.{ts} DESC
+        '''
+        with self.read_connection() as conn:
+            return [schema.to_reading(names, row) for row in conn.execute(sql)]
+
+    def range(self, node_id: Optional[str] = None, t0=None, t1=None,
+              fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+              descending: bool = True) -> List[Reading]:
+        """Readings for one node (or all) with t0 <= timestamp <= t1"""
+        schema = self.schema
+        columns, names = schema.select_columns(fields)
+        sql, params = self._range_sql(columns, node_id, t0, t1, limit, descending)
+        with self.read_connection() as conn:
+            return [schema.to_reading(names, row) for row in conn.execute(sql, params)]
+
+    def range_batch(self, node_id: Optional[str] = None, t0=None, t1=None,
+                    fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                    descending: bool = True, chunk_size: int = 5000) -> ReadingBatch:
+        """range() as a ReadingBatch: columns filled chunk by chunk, no per-row objects kept"""
+        schema = self.schema
+        columns, names = schema.select_columns(fields)
+        sql, params = self._range_sql(columns, node_id, t0, t1, limit, descending)
+        batch = ReadingBatch.empty(names)
+        with self.read_connection() as conn:
+            cur = conn.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                batch.extend_rows(rows)
+        return schema.convert_columns(batch.seal())
+
+    def iter_range(self, node_id=None, t0=None, t1=None, fields=None, descending=True,
+                   chunk_size=5000, after_id=None):
+        """Like range() but yields readings without materializing the whole result
+
+        after_id limits the scan to rows inserted after that row (catching up
+        from a checkpoint).
+        """
+        schema = self.schema
+        columns, names = schema.select_columns(fields)
+        sql, params = self._range_sql(columns, node_id, t0, t1, None, descending, after_id)
+        with self.read_connection() as conn:
+            cur = conn.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield schema.to_reading(names, row)
+
+    def scan_batch(self, after_id: int = 0, limit: int = 50000, fields: Optional[Sequence[str]] = None,
+                   missing: Optional[Sequence[str]] = None) -> ReadingBatch:
+        """Next readings after after_id in id order, optionally only those with a missing (NULL) field
+
+        Walks the whole table chunk by chunk along the rowid, for backfills.
+        """
+        schema = self.schema
+        columns, names = schema.select_columns(fields)
+        sql = f'SELECT {columns} FROM {schema.table} WHERE id > ?'
+        if missing:
+            sql += ' AND (' + ' OR '.join(f'{schema.columns[f]} IS NULL' for f in missing) + ')'
+        sql += ' ORDER BY id LIMIT ?'
+        batch = ReadingBatch.empty(names)
+        with self.read_connection() as conn:
+            batch.extend_rows(conn.execute(sql, (int(after_id), int(limit))).fetchall())
+        return schema.convert_columns(batch.seal())
+
+    def _range_sql(self, columns, node_id, t0, t1, limit, descending, after_id=None):
+        schema = self.schema
+        ts = schema.time_column
+        where, params = [], []
+        if after_id is not None:
+            where.append('id > ?')
+            params.append(int(after_id))
+        if node_id is not None:
+            where.append('node_id = ?')
+            params.append(node_id)
+        if t0 is not None:
+            where.append(f'{ts} >= ?')
+            params.append(normalize_timestamp(t0))
+        if t1 is not None:
+            where.append(f'{ts} <= ?')
+            params.append(normalize_timestamp(t1))
+        sql = f'SELECT {columns} FROM {schema.table}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        order = 'DESC' if descending else 'ASC'
+        sql += f' ORDER BY {ts} {order}, id {order}'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        return sql, params
+
+    def stats(self, active_hours: float = 1, rssi_hours: float = 24) -> Dict[str, Any]:
+        """Network-wide totals used by the dashboards"""
+        schema = self.schema
+        t, ts = schema.table, schema.time_column
+        with self.read_connection() as conn:
+            total = conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+            active = conn.execute(f'SELECT COUNT(DISTINCT node_id) FROM {t} WHERE {ts} >= ?',
+                                  (hours_ago(active_hours),)).fetchone()[0]
+            avg_rssi = conn.execute(f'SELECT AVG(rssi) FROM {t} WHERE {ts} >= ?',
+                                    (hours_ago(rssi_hours),)).fetchone()[0]
+            last_update = conn.execute(f'SELECT MAX({ts}) FROM {t}').fetchone()[0]
+        return {
+            'total_readings': total,
+            'active_nodes': active,
+            'avg_rssi': avg_rssi,
+            'last_update': last_update,
+        }
+
+    def node_status(self) -> List[Dict[str, Any]]:
+        """Rows of the node_status summary table (schemas that keep one)"""
+        if not self.schema.node_table:
+            raise NotImplementedError(f"{self.schema.name} has no node status table")
+        with self.read_connection() as conn:
+            cur = conn.execute('''
+                SELECT node_id, last_seen, total_readings, last_temperature,
+                       last_humidity, last_pressure, last_rssi, is_active
+                FROM node_status
+                ORDER BY last_seen DESC
+            ''')
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    def set_node_active(self, changes: Dict[str, bool]) -> int:
+        """Set node_status.is_active for several nodes in one transaction; returns rows updated"""
+        if not self.schema.node_table:
+            raise NotImplementedError(f"{self.schema.name} has no node status table")
+        if not changes:
+            return 0
+        with self.transaction() as conn:
+            cur = conn.executemany('UPDATE node_status SET is_active = ? WHERE node_id = ?',
+                                   [(1 if active else 0, node_id) for node_id, active in changes.items()])
+            return cur.rowcount
+
+    def count(self) -> int:
+        with self.read_connection() as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM {self.schema.table}').fetchone()[0]
+
+    # ----- alerts -----
+
+    def insert_alerts(self, alerts: Iterable[Dict[str, Any]]) -> int:
+        """Store alert transitions (firing/resolved) in one transaction; returns the number stored"""
+        rows = [tuple(normalize_timestamp(alert.get(c)) if c == 'timestamp' else alert.get(c)
+                      for c in ALERT_COLUMNS) for alert in alerts]
+        if not rows:
+            return 0
+        placeholders = ', '.join('?' for _ in ALERT_COLUMNS)
+        with self.transaction() as conn:
+            conn.executemany(f'INSERT INTO alerts ({", ".join(ALERT_COLUMNS)}) VALUES ({placeholders})',
+                             rows)
+        return len(rows)
+
+    def alerts(self, node_id: Optional[str] = None, t0=None, state: Optional[str] = None,
+               limit: Optional[int] = 100) -> List[Dict[str, Any]]:
+        """Stored alert transitions, newest first"""
+        where, params = [], []
+        if node_id is not None:
+            where.append('node_id = ?')
+            params.append(node_id)
+        if t0 is not None:
+            where.append('timestamp >= ?')
+            params.append(normalize_timestamp(t0))
+        if state is not None:
+            where.append('state = ?')
+            params.append(state)
+        sql = f'SELECT id, {", ".join(ALERT_COLUMNS)} FROM alerts'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY id DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        with self.read_connection() as conn:
+            cur = conn.execute(sql, params)
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    def open_alerts(self) -> List[Dict[str, Any]]:
+        """Alerts whose latest transition is 'firing', one per (rule, node)"""
+        sql = f'''
+            SELECT id, {", ".join(ALERT_COLUMNS)} FROM alerts
+            WHERE id IN (SELECT MAX(id) FROM alerts GROUP BY rule_id, node_id) AND state = 'firing'
+            ORDER BY id DESC
+        '''
+        with self.read_connection() as conn:
+            cur = conn.execute(sql)
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
@@ -0,0 +1,135 @@
+# tiered.py - Hot SQLite tier plus Parquet cold tier behind one storage API
+"""
+TieredStorage wraps a hot engine (SQLite) and a ParquetColdTier. Writes,
+latest() and everything else go to the hot engine; range() and
+iter_range() merge both tiers by (timestamp, id), so history and export
+endpoints don't need to know where a reading lives.
+
+tier_out(before) moves readings older than `before` to Parquet one node
+and month at a time, deleting each slice from SQLite only after it is
+written, and only up to the highest id it copied (rows that arrive late
+stay hot and move on the next run).
+"""
+
+import heapq
+import itertools
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from .readings import Reading, ReadingBatch
+from .schemas import TIMESTAMP_FORMAT, normalize_timestamp, parse_timestamp
+
+
+def _next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+
+
+def _merge(tiers, descending):
+    """Merge tier results sorted by (timestamp, id), dropping ids present in both tiers"""
+    merged = heapq.merge(*tiers, key=lambda r: (r['timestamp'], r['id']), reverse=descending)
+    last_id = None
+    for reading in merged:
+        if reading['id'] == last_id:
+            continue
+        last_id = reading['id']
+        yield reading
+
+
+class TieredStorage:
+    """Storage API over a hot engine and a Parquet cold tier"""
+
+    def __init__(self, hot, cold):
+        self.hot = hot
+        self.cold = cold
+
+    def __getattr__(self, name):
+        # Anything not tier-aware (insert_readings, latest, transaction, ...) is the hot engine's
+        return getattr(self.hot, name)
+
+    @property
+    def read_connector(self):
+        return self.hot.read_connector
+
+    @read_connector.setter
+    def read_connector(self, value):
+        self.hot.read_connector = value
+
+    def _needs_cold(self, t0):
+        watermark = self.cold.watermark
+        return watermark is not None and (t0 is None or normalize_timestamp(t0) < watermark)
+
+    # ----- reads -----
+
+    def range(self, node_id: Optional[str] = None, t0=None, t1=None,
+              fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+              descending: bool = True) -> List[Reading]:
+        """Readings from both tiers with t0 <= timestamp <= t1"""
+        hot = self.hot.range(node_id, t0, t1, fields, limit, descending)
+        if not self._needs_cold(t0):
+            return hot
+        # Newest-first pages that the hot tier fills past the watermark never touch Parquet
+        if descending and limit and len(hot) >= limit and hot[-1]['timestamp'] >= self.cold.watermark:
+            return hot
+        cold = self.cold.range(node_id, t0, t1, fields, limit, descending)
+        merged = _merge([hot, cold], descending)
+        return list(itertools.islice(merged, limit) if limit else merged)
+
+    def range_batch(self, node_id: Optional[str] = None, t0=None, t1=None,
+                    fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                    descending: bool = True) -> ReadingBatch:
+        """range() as a ReadingBatch"""
+        if not self._needs_cold(t0):
+            return self.hot.range_batch(node_id, t0, t1, fields, limit, descending)
+        _, names = self.hot.schema.select_columns(fields)
+        return ReadingBatch.from_readings(names, self.range(node_id, t0, t1, fields, limit, descending))
+
+    def iter_range(self, node_id=None, t0=None, t1=None, fields=None, descending=True,
+                   chunk_size=5000, after_id=None):
+        """Like range() but streams both tiers"""
+        hot = self.hot.iter_range(node_id, t0, t1, fields, descending, chunk_size, after_id)
+        if not self._needs_cold(t0):
+            return hot
+        cold = self.cold.iter_range(node_id, t0, t1, fields, descending)
+        if after_id is not None:
+            cold = (reading for reading in cold if reading['id'] > after_id)
+        return _merge([hot, cold], descending)
+
+    def count(self) -> int:
+        return self.hot.count() + self.cold.count()
+
+    def stats(self, active_hours: float = 1, rssi_hours: float = 24) -> Dict[str, Any]:
+        stats = self.hot.stats(active_hours, rssi_hours)
+        stats['total_readings'] += self.cold.count()
+        return stats
+
+    # ----- retention / tiering -----
+
+    def delete_before(self, t) -> int:
+        return self.hot.delete_before(t) + self.cold.delete_before(t)
+
+    def tier_out(self, before) -> int:
+        """Move hot readings older than `before` into the cold tier; returns the number moved"""
+        cutoff = parse_timestamp(normalize_timestamp(before))
+        oldest = self.hot.range(t1=cutoff, limit=1, descending=False)
+        if not oldest:
+            self.cold.set_watermark(cutoff.strftime(TIMESTAMP_FORMAT))
+            return 0
+
+        nodes = [r['node_id'] for r in self.hot.latest(fields=['node_id'])]
+        start = parse_timestamp(oldest[0]['timestamp'])
+        window_start = datetime(start.year, start.month, 1)
+        moved = 0
+        while window_start < cutoff:
+            window_end = min(_next_month(window_start), cutoff)
+            for node_id in nodes:
+                # range() is inclusive at t1; timestamps have one-second resolution
+                rows = self.hot.range(node_id, window_start, window_end - timedelta(seconds=1),
+                                      descending=False)
+                if not rows:
+                    continue
+                self.cold.write(rows)
+                moved += self.hot.delete_range(node_id, window_start, window_end,
+                                               max_id=max(r['id'] for r in rows))
+            window_start = window_end
+        self.cold.set_watermark(cutoff.strftime(TIMESTAMP_FORMAT))
+        return moved
@@ -0,0 +1,281 @@
+# udp_ingest.py - Compact UDP datagram ingest, an optional alternative to HTTP POST
+"""
+A gateway can send one datagram per collection cycle (or per reading) instead
+of opening a TCP connection and posting JSON for every node. Datagrams are
+authenticated with a truncated HMAC-SHA256 and carry a per-gateway sequence
+number. The listener batches them into the same storage path as
+receive_sensor_data and answers each datagram with a 12-byte ack once that
+path has taken its readings: stored, or held in the gateway merge window
+(MERGE_WINDOW_MS), which stores them when the window closes.
+
+Sequence numbers count from the gateway's last restart, so the header also
+carries a boot number that the gateway increases on every restart (a boot
+counter kept in flash, or the boot time in epoch seconds). A higher boot
+number starts a fresh replay window; datagrams from an older boot are
+replays.
+
+Datagram layout (network byte order):
+
+    header   2s magic 'LR' | B version | B reading count | I gateway id | I boot | I sequence
+    reading  H node id | I unix time | h temp F x100 | H humidity x100 |
+             I pressure hPa x100 | H battery mV | h rssi dBm | h snr x10
+    trailer  8 bytes HMAC-SHA256(key, header + readings)
+
+Ack: 2s magic 'LA' | B version | B status | I gateway id | I sequence
+"""
+
+import hashlib
+import hmac
+import select
+import socket
+import struct
+import threading
+import time
+from datetime import datetime
+
+MAGIC = b'LR'
+ACK_MAGIC = b'LA'
+VERSION = 2
+MAC_SIZE = 8
+MAX_READINGS = 64
+
+HEADER = struct.Struct('!2sBBIII')
+READING = struct.Struct('!HIhHIHhh')
+ACK = struct.Struct('!2sBBII')
+
+# Ack status codes
+ACK_OK = 0
+ACK_DUPLICATE = 1  # already stored; the sender can stop retrying
+ACK_BAD_MAC = 2
+ACK_MALFORMED = 3
+ACK_BUSY = 4  # not stored; retry later
+
+
+class DatagramError(ValueError):
+    """Raised for datagrams that fail framing or authentication"""
+
+    def __init__(self, message, status=ACK_MALFORMED):
+        super().__init__(message)
+        self.status = status
+
+
+def _mac(key, payload):
+    return hmac.new(key, payload, hashlib.sha256).digest()[:MAC_SIZE]
+
+
+def encode_datagram(key, gateway_id, boot, seq, readings):
+    """Pack readings (dicts shaped like the gateway's JSON upload) into one datagram"""
+    if not 0 < len(readings) <= MAX_READINGS:
+        raise ValueError('A datagram carries 1-%d readings' % MAX_READINGS)
+    parts = [HEADER.pack(MAGIC, VERSION, len(readings), gateway_id, boot, seq)]
+    for r in readings:
+        parts.append(READING.pack(
+            int(r['node_id'], 16) if isinstance(r['node_id'], str) else int(r['node_id']),
+            int(r['epoch']),
+            int(round(r['temperature_f'] * 100)),
+            int(round(r['humidity'] * 100)),
+            int(round(r['pressure_hpa'] * 100)),
+            int(round((r.get('battery_voltage') or 0) * 1000)),
+            int(r.get('rssi') or 0),
+            int(round((r.get('snr') or 0) * 10)),
+        ))
+    payload = b''.join(parts)
+    return payload + _mac(key, payload)
+
+
+def decode_datagram(key, data):
+    """Verify and unpack a datagram; returns (gateway_id, boot, seq, readings)"""
+    if len(data) < HEADER.size + MAC_SIZE:
+        raise DatagramError('Datagram too short')
+    payload, mac = data[:-MAC_SIZE], data[-MAC_SIZE:]
+    magic, version, count, gateway_id, boot, seq = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise DatagramError('Unknown magic or version')
+    if not hmac.compare_digest(_mac(key, payload), mac):
+        raise DatagramError('Bad HMAC', ACK_BAD_MAC)
+    if len(payload) != HEADER.size + count * READING.size:
+        raise DatagramError('Length does not match reading count')
+
+    readings = []
+    for i in range(count):
+        node, epoch, temp, hum, pres, batt, rssi, snr = READING.unpack_from(payload, HEADER.size + i * READING.size)
+        readings.append({
+            'node_id': format(node, 'x'),
+            'timestamp': datetime.utcfromtimestamp(epoch).strftime('%Y-%m-%dT%H:%M:%S'),
+            'temperature_f': temp / 100.0,
+            'humidity': hum / 100.0,
+            'pressure_hpa': pres / 100.0,
+            'battery_voltage': batt / 1000.0 if batt else None,
+            'rssi': rssi,
+            'snr': snr / 10.0,
+            'gateway_id': 'udp-%d' % gateway_id,
+        })
+    return gateway_id, boot, seq, readings
+
+
+def encode_ack(status, gateway_id, seq):
+    return ACK.pack(ACK_MAGIC, VERSION, status, gateway_id, seq)
+
+
+def decode_ack(data):
+    """Returns (status, gateway_id, seq)"""
+    magic, version, status, gateway_id, seq = ACK.unpack(data[:ACK.size])
+    if magic != ACK_MAGIC:
+        raise DatagramError('Not an ack')
+    return status, gateway_id, seq
+
+
+class ReplayWindow:
+    """Sliding 64-entry sequence window per gateway and boot, as used by IPsec/DTLS"""
+
+    SIZE = 64
+
+    def __init__(self):
+        self.boot = {}
+        self.highest = {}
+        self.bitmap = {}
+
+    def seen(self, gateway_id, boot, seq):
+        highest = self.highest.get(gateway_id)
+        if highest is None or boot > self.boot[gateway_id]:
+            return False  # first datagram since the gateway (re)started
+        if boot < self.boot[gateway_id]:
+            return True  # from before its last restart
+        if seq > highest:
+            return False
+        offset = highest - seq
+        if offset >= self.SIZE:
+            return True  # too old to tell apart; treat as a replay
+        return bool(self.bitmap[gateway_id] >> offset & 1)
+
+    def mark(self, gateway_id, boot, seq):
+        highest = self.highest.get(gateway_id)
+        if highest is None or boot > self.boot[gateway_id]:
+            self.boot[gateway_id] = boot
+            self.highest[gateway_id] = seq
+            self.bitmap[gateway_id] = 1
+        elif boot < self.boot[gateway_id]:
+            return
+        elif seq > highest:
+            shift = seq - highest
+            self.bitmap[gateway_id] = ((self.bitmap[gateway_id] << shift) | 1) & ((1 << self.SIZE) - 1)
+            self.highest[gateway_id] = seq
+        else:
+            self.bitmap[gateway_id] |= 1 << (highest - seq)
+
+
+class UDPIngestListener:
+    """Receives datagrams, batches their readings and acks once the storage path has taken them"""
+
+    def __init__(self, store_batch, key, host='0.0.0.0', port=5002, batch_size=64, linger=0.0):
+        if not key:
+            raise ValueError('UDP ingest requires a shared HMAC key')
+        self.store_batch = store_batch  # callable(list of payload dicts) -> bool
+        self.key = key.encode('utf-8') if isinstance(key, str) else key
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.linger = linger  # how long an open batch waits for more datagrams
+
+        self.sock = None
+        self.thread = None
+        self.running = False
+        self.replay = ReplayWindow()
+        self.pending = []  # (addr, gateway_id, boot, seq, readings)
+        self.pending_readings = 0
+        self.counters = {
+            'datagrams': 0,
+            'readings_stored': 0,
+            'batches': 0,
+            'duplicates': 0,
+            'bad_mac': 0,
+            'malformed': 0,
+            'store_failures': 0,
+        }
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.host, self.port))
+        self.sock.settimeout(0.5)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, name='udp-ingest', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=5)
+        if self.sock:
+            self.sock.close()
+
+    def _serve(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                if not self.running:
+                    break
+                continue
+            self._handle(data, addr)
+
+            # Batch whatever else is already queued (plus the linger window), then commit once
+            deadline = time.monotonic() + self.linger
+            try:
+                while self.pending_readings < self.batch_size:
+                    ready, _, _ = select.select([self.sock], [], [], max(0.0, deadline - time.monotonic()))
+                    if not ready:
+                        break
+                    data, addr = self.sock.recvfrom(2048)
+                    self._handle(data, addr)
+            except OSError:
+                pass
+            if self.pending:
+                self._flush()
+
+    def _handle(self, data, addr):
+        self.counters['datagrams'] += 1
+        try:
+            gateway_id, boot, seq, readings = decode_datagram(self.key, data)
+        except DatagramError as e:
+            self.counters['bad_mac' if e.status == ACK_BAD_MAC else 'malformed'] += 1
+            if len(data) >= HEADER.size:
+                _, _, _, gateway_id, _, seq = HEADER.unpack_from(data)
+                self.sock.sendto(encode_ack(e.status, gateway_id, seq), addr)
+            return
+
+        if self.replay.seen(gateway_id, boot, seq) or any(p[1:4] == (gateway_id, boot, seq) for p in self.pending):
+            # Our ack was lost and the gateway resent; confirm without storing twice
+            self.counters['duplicates'] += 1
+            self.sock.sendto(encode_ack(ACK_DUPLICATE, gateway_id, seq), addr)
+            return
+
+        self.pending.append((addr, gateway_id, boot, seq, readings))
+        self.pending_readings += len(readings)
+
+    def _flush(self):
+        batch, self.pending, self.pending_readings = self.pending, [], 0
+        readings = [r for _, _, _, _, rs in batch for r in rs]
+        try:
+            stored = self.store_batch(readings)
+        except Exception as e:
+            print(f"UDP ingest store error: {e}")
+            stored = False
+
+        if stored:
+            self.counters['batches'] += 1
+            self.counters['readings_stored'] += len(readings)
+        else:
+            self.counters['store_failures'] += 1
+
+        for addr, gateway_id, boot, seq, _ in batch:
+            if stored:
+                self.replay.mark(gateway_id, boot, seq)
+            self.sock.sendto(encode_ack(ACK_OK if stored else ACK_BUSY, gateway_id, seq), addr)
+
+    def stats(self):
+        return dict(self.counters, port=self.port, running=self.running,
+                    gateways=len(self.replay.highest))
@@ -5,28 +5,75 @@ Simple Flask server to receive and store BME280 sensor data from your LoRa gatew
 Perfect for running alongside RustDesk on your existing droplet
 """
 
-from flask import Flask, request, jsonify, render_template_string, send_file
+from flask import Flask, Response, request, jsonify, render_template_string, send_file, send_from_directory
 from flask_cors import CORS
-import sqlite3
 import json
 import os
+import sys
 from datetime import datetime, timedelta
 import csv
 import io
 import logging
+import atexit
 from logging.handlers import RotatingFileHandler
 import threading
 import time
 
+# Shared storage engine from docker/app/storage
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'docker', 'app'))
+from storage import Reading, f_to_c, c_to_f, hours_ago, open_storage
+from alerts import DEFAULT_RULES, AlertEngine, Rule, WebhookSink, load_rules
+from derived import derive_columns, fill_reading
+from liveness import LivenessTracker
+from gateway_merge import GatewayMerge
+from profiling import RequestProfiler, StackSampler
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests
 
 # Configuration
-DATABASE_FILE = '/opt/lora_sensors/sensor_data.db'
-LOG_FILE = '/opt/lora_sensors/sensor_api.log'
-DATA_RETENTION_DAYS = 90  # Keep 90 days of data
+DATABASE_FILE = os.environ.get('DATABASE_FILE', '/opt/lora_sensors/sensor_data.db')
+LOG_FILE = os.environ.get('LOG_FILE', '/opt/lora_sensors/sensor_api.log')
+DATA_RETENTION_DAYS = 90  # Keep 90 days of data in SQLite
+# Optional Parquet cold tier (needs pyarrow): with it, old data is moved there instead of deleted
+COLD_STORAGE_PATH = os.environ.get('COLD_STORAGE_PATH', '')
 API_KEY = 'your-secure-api-key-here'  # Change this!
+# Site altitude in metres, for sea-level pressure in derived metrics
+ALTITUDE_M = float(os.environ.get('ALTITUDE_M', 0))
+
+# Alert rules checked on every reading (JSON list; built-in defaults when the file is missing)
+ALERT_RULES_PATH = os.environ.get('ALERT_RULES_PATH', os.path.join(os.path.dirname(DATABASE_FILE), 'alert_rules.json'))
+ALERT_WEBHOOK_URL = os.environ.get('ALERT_WEBHOOK_URL', '')
+ALERT_STALE_CHECK_SECONDS = float(os.environ.get('ALERT_STALE_CHECK_SECONDS', 60))
+
+# Node liveness: node_status.is_active drops to 0 once a node misses LIVENESS_OFFLINE_FACTOR report intervals
+LIVENESS_DEFAULT_CADENCE_SECONDS = float(os.environ.get('LIVENESS_DEFAULT_CADENCE_SECONDS', 900))
+LIVENESS_STALE_FACTOR = float(os.environ.get('LIVENESS_STALE_FACTOR', 1.5))
+LIVENESS_OFFLINE_FACTOR = float(os.environ.get('LIVENESS_OFFLINE_FACTOR', 4))
+LIVENESS_TICK_SECONDS = float(os.environ.get('LIVENESS_TICK_SECONDS', 5))
+
+# Overlapping gateways: copies of one packet (same node and collection_cycle) are stored once,
+# after waiting at most MERGE_WINDOW_MS for the other gateways; 0 stores every copy
+MERGE_WINDOW_MS = int(os.environ.get('MERGE_WINDOW_MS', 2000))
+MERGE_LATE_SECONDS = float(os.environ.get('MERGE_LATE_SECONDS', 120))
+MERGE_MAX_PENDING = int(os.environ.get('MERGE_MAX_PENDING', 10000))
+
+# Profiling, all off by default: PROFILE_ENDPOINTS profiles every request to those view functions
+# ('all' for every one), PROFILE_HEADER honours an X-Profile: cprofile|sample request header, and
+# PROFILE_SAMPLER_HZ runs the background stack sampler; results under /debug/profile
+PROFILE_ENDPOINTS = [e.strip() for e in os.environ.get('PROFILE_ENDPOINTS', '').split(',') if e.strip()]
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile').lower()
+PROFILE_HEADER = os.environ.get('PROFILE_HEADER', 'false').lower() == 'true'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(DATABASE_FILE), 'profiles'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+PROFILE_SAMPLER_HZ = float(os.environ.get('PROFILE_SAMPLER_HZ', 0))
+
+storage = open_storage(DATABASE_FILE, schema='sensor_readings', cold_path=COLD_STORAGE_PATH or None)
+
+request_profiler = RequestProfiler(PROFILE_DIR, PROFILE_ENDPOINTS, PROFILE_MODE, PROFILE_HEADER, keep=PROFILE_KEEP)
+request_profiler.install(app)
+profile_sampler = StackSampler(1.0 / PROFILE_SAMPLER_HZ) if PROFILE_SAMPLER_HZ > 0 else None
 
 # Ensure directories exist
 os.makedirs(os.path.dirname(DATABASE_FILE), exist_ok=True)
@@ -39,54 +86,41 @@ logging.basicConfig(
     format='%(asctime)s %(levelname)s: %(message)s'
 )
 
+try:
+    alert_rules = load_rules(ALERT_RULES_PATH)
+except (OSError, ValueError) as e:
+    logging.error(f"Error loading alert rules from {ALERT_RULES_PATH}: {e} - using defaults")
+    alert_rules = [Rule.from_dict(spec) for spec in DEFAULT_RULES]
+
+alert_engine = AlertEngine(alert_rules, storage, [WebhookSink(ALERT_WEBHOOK_URL)] if ALERT_WEBHOOK_URL else [])
+
+def log_liveness(events):
+    for event in events:
+        logging.info(f"Node {event['node_id']}: {event['from'] or 'new'} -> {event['to']}")
+
+liveness = LivenessTracker(storage, LIVENESS_DEFAULT_CADENCE_SECONDS, LIVENESS_STALE_FACTOR,
+                           LIVENESS_OFFLINE_FACTOR, listeners=[log_liveness])
+
+def store_readings(readings):
+    """Insert readings, then update liveness and alerts"""
+    storage.insert_readings(readings)
+    liveness.observe(readings)
+    for alert in alert_engine.process(readings):
+        logging.warning(f"Alert {alert['state']}: {alert['message']}")
+    return True
+
+gateway_merge = None
+if MERGE_WINDOW_MS > 0:
+    gateway_merge = GatewayMerge(store_readings, storage.update_fields, MERGE_WINDOW_MS / 1000.0,
+                                 MERGE_LATE_SECONDS, MERGE_MAX_PENDING)
+    atexit.register(gateway_merge.close)
+
 def init_database():
     """Initialize SQLite database with sensor data table"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sensor_readings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            node_id TEXT NOT NULL,
-            gateway_timestamp TEXT NOT NULL,
-            node_timestamp TEXT NOT NULL,
-            temperature_f REAL NOT NULL,
-            humidity REAL NOT NULL,
-            pressure_hpa REAL NOT NULL,
-            heat_index REAL,
-            dew_point REAL,
-            rssi REAL,
-            snr REAL,
-            collection_cycle INTEGER,
-            gateway_id TEXT,
-            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create indexes for better performance
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_node_id ON sensor_readings(node_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_gateway_timestamp ON sensor_readings(gateway_timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_received_at ON sensor_readings(received_at)')
-    
-    # Create node status table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS node_status (
-            node_id TEXT PRIMARY KEY,
-            last_seen TIMESTAMP,
-            total_readings INTEGER DEFAULT 0,
-            last_temperature REAL,
-            last_humidity REAL,
-            last_pressure REAL,
-            last_rssi REAL,
-            is_active BOOLEAN DEFAULT 1,
-            location TEXT
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    logging.info("Database initialized successfully")
+    version = storage.initialize()
+    logging.info(f"Database initialized successfully (schema version {version})")
+    alert_engine.prime(storage.latest(), storage.open_alerts())
+    liveness.warm()
 
 def validate_api_key(provided_key):
     """Simple API key validation"""
@@ -124,53 +158,30 @@ def receive_sensor_data():
         
         # Validate required fields
         required_fields = ['node_id', 'temperature_f', 'humidity', 'pressure_hpa']
-        missing_fields = [field for field in required_fields if field not in data]
+        missing_fields = [field for field in required_fields if data.get(field) in (None, '')]
         if missing_fields:
             return jsonify({'error': f'Missing required fields: {missing_fields}'}), 400
         
-        # Insert into database
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO sensor_readings 
-            (node_id, gateway_timestamp, node_timestamp, temperature_f, humidity, 
-             pressure_hpa, heat_index, dew_point, rssi, snr, collection_cycle, gateway_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('node_id'),
-            data.get('gateway_timestamp', ''),
-            data.get('node_timestamp', ''),
-            data.get('temperature_f'),
-            data.get('humidity'),
-            data.get('pressure_hpa'),
-            data.get('heat_index'),
-            data.get('dew_point'),
-            data.get('rssi'),
-            data.get('snr'),
-            data.get('collection_cycle'),
-            data.get('gateway_id', 'UNKNOWN')
-        ))
-        
-        # Update node status
-        cursor.execute('''
-            INSERT OR REPLACE INTO node_status 
-            (node_id, last_seen, total_readings, last_temperature, last_humidity, 
-             last_pressure, last_rssi, is_active)
-            VALUES (?, CURRENT_TIMESTAMP, 
-                    COALESCE((SELECT total_readings FROM node_status WHERE node_id = ?) + 1, 1),
-                    ?, ?, ?, ?, 1)
-        ''', (
-            data.get('node_id'),
-            data.get('node_id'),
-            data.get('temperature_f'),
-            data.get('humidity'),
-            data.get('pressure_hpa'),
-            data.get('rssi')
+        # Insert into database (node_status is updated by the storage engine);
+        # heat index and dew point are computed here when the gateway leaves them out
+        reading = fill_reading(Reading(
+            node_id=data.get('node_id'),
+            gateway_timestamp=data.get('gateway_timestamp', ''),
+            node_timestamp=data.get('node_timestamp', ''),
+            temperature_c=f_to_c(data.get('temperature_f')),
+            humidity=data.get('humidity'),
+            pressure_hpa=data.get('pressure_hpa'),
+            heat_index=data.get('heat_index'),
+            dew_point=data.get('dew_point'),
+            rssi=data.get('rssi'),
+            snr=data.get('snr'),
+            collection_cycle=data.get('collection_cycle'),
+            gateway_id=data.get('gateway_id', 'UNKNOWN')
         ))
-        
-        conn.commit()
-        conn.close()
+        if not gateway_merge:
+            store_readings([reading])
+        elif not gateway_merge.submit(reading, data.get('gateway_id') or data.get('gateway_ip') or request.remote_addr):
+            return jsonify({'error': 'Too many packets waiting for other gateways'}), 429, {'Retry-After': '1'}
         
         logging.info(f"Received data from {data.get('node_id')}: {data.get('temperature_f')}°F, {data.get('humidity')}%")
         
@@ -189,30 +200,22 @@ def receive_sensor_data():
 def dashboard():
     """Simple web dashboard to view sensor data"""
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
         # Get recent readings (last 24 hours)
-        cursor.execute('''
-            SELECT node_id, gateway_timestamp, temperature_f, humidity, pressure_hpa, 
-                   rssi, received_at
-            FROM sensor_readings 
-            WHERE received_at > datetime('now', '-24 hours')
-            ORDER BY received_at DESC 
-            LIMIT 100
-        ''')
-        recent_readings = cursor.fetchall()
+        recent_readings = [
+            (r['node_id'], r['gateway_timestamp'], c_to_f(r['temperature_c']), r['humidity'],
+             r['pressure_hpa'], r['rssi'], r['timestamp'])
+            for r in storage.range(
+                t0=hours_ago(24), limit=100,
+                fields=['gateway_timestamp', 'temperature_c', 'humidity', 'pressure_hpa', 'rssi']
+            )
+        ]
         
         # Get node status
-        cursor.execute('''
-            SELECT node_id, last_seen, total_readings, last_temperature, 
-                   last_humidity, last_pressure, last_rssi, is_active
-            FROM node_status
-            ORDER BY last_seen DESC
-        ''')
-        node_status = cursor.fetchall()
-        
-        conn.close()
+        node_status = [
+            (n['node_id'], n['last_seen'], n['total_readings'], n['last_temperature'],
+             n['last_humidity'], n['last_pressure'], n['last_rssi'], n['is_active'])
+            for n in storage.node_status()
+        ]
         
         # HTML template
         html_template = '''
@@ -331,35 +334,41 @@ def dashboard():
 def get_nodes():
     """Get all nodes as JSON"""
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT node_id, last_seen, total_readings, last_temperature,
-                   last_humidity, last_pressure, last_rssi, is_active
-            FROM node_status
-            ORDER BY last_seen DESC
-        ''')
-        
         nodes = []
-        for row in cursor.fetchall():
-            nodes.append({
-                'node_id': row[0],
-                'last_seen': row[1],
-                'total_readings': row[2],
-                'last_temperature': row[3],
-                'last_humidity': row[4],
-                'last_pressure': row[5],
-                'last_rssi': row[6],
-                'is_active': bool(row[7])
-            })
+        for node in storage.node_status():
+            node['is_active'] = bool(node['is_active'])
+            nodes.append(node)
         
-        conn.close()
         return jsonify(nodes)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/nodes/liveness', methods=['GET'])
+def get_node_liveness():
+    """Online/stale/offline state of every node"""
+    try:
+        return jsonify({'counts': liveness.counts(), 'nodes': liveness.node_states()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nodes/liveness/events', methods=['GET'])
+def get_node_liveness_events():
+    """Liveness transitions after ?since=<seq>"""
+    try:
+        return jsonify(liveness.events(request.args.get('since', 0, type=int), request.args.get('limit', type=int)))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ingest/merge', methods=['GET'])
+def get_merge_metrics():
+    """Gateway merge counters: copies received, packets stored, gateways per packet"""
+    try:
+        return jsonify({'enabled': gateway_merge is not None,
+                        'metrics': gateway_merge.metrics() if gateway_merge else None})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/readings', methods=['GET'])
 def get_readings():
     """Get sensor readings with optional filtering"""
@@ -367,69 +376,82 @@ def get_readings():
         node_id = request.args.get('node')
         hours = int(request.args.get('hours', 24))
         limit = int(request.args.get('limit', 1000))
+        with_derived = request.args.get('derived', 'false').lower() == 'true'
         
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        query = '''
-            SELECT node_id, gateway_timestamp, node_timestamp, temperature_f, 
-                   humidity, pressure_hpa, heat_index, dew_point, rssi, snr,
-                   collection_cycle, received_at
-            FROM sensor_readings
-            WHERE received_at > datetime('now', '-%d hours')
-        ''' % hours
-        
-        params = []
-        if node_id:
-            query += ' AND node_id = ?'
-            params.append(node_id)
-        
-        query += ' ORDER BY received_at DESC LIMIT ?'
-        params.append(limit)
-        
-        cursor.execute(query, params)
+        batch = storage.range_batch(node_id=node_id or None, t0=hours_ago(hours), limit=limit)
         
+        # Serialize straight from the result columns; no per-row reading objects
         readings = []
-        for row in cursor.fetchall():
+        for (node, gateway_ts, node_ts, temperature_c, humidity, pressure, heat_index, dew_point,
+             rssi, snr, cycle, received_at) in batch.rows(
+                'node_id', 'gateway_timestamp', 'node_timestamp', 'temperature_c', 'humidity',
+                'pressure_hpa', 'heat_index', 'dew_point', 'rssi', 'snr', 'collection_cycle', 'timestamp'):
             readings.append({
-                'node_id': row[0],
-                'gateway_timestamp': row[1],
-                'node_timestamp': row[2],
-                'temperature_f': row[3],
-                'humidity': row[4],
-                'pressure_hpa': row[5],
-                'heat_index': row[6],
-                'dew_point': row[7],
-                'rssi': row[8],
-                'snr': row[9],
-                'collection_cycle': row[10],
-                'received_at': row[11]
+                'node_id': node,
+                'gateway_timestamp': gateway_ts,
+                'node_timestamp': node_ts,
+                'temperature_f': c_to_f(temperature_c),
+                'humidity': humidity,
+                'pressure_hpa': pressure,
+                'heat_index': heat_index,
+                'dew_point': dew_point,
+                'rssi': rssi,
+                'snr': snr,
+                'collection_cycle': cycle,
+                'received_at': received_at
             })
         
-        conn.close()
+        if with_derived:
+            # Whole-page computation; stored heat index/dew point win, older rows without them get filled in
+            derived = derive_columns(batch.column('temperature_c'), batch.column('humidity'),
+                                     batch.column('pressure_hpa'), ALTITUDE_M)
+            names = list(derived)
+            for reading, values in zip(readings, zip(*derived.values())):
+                for name, value in zip(names, values):
+                    if reading.get(name) is None:
+                        reading[name] = value
+        
         return jsonify(readings)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/alerts', methods=['GET'])
+def get_alerts():
+    """Stored alert transitions, newest first"""
+    try:
+        hours = request.args.get('hours', type=float)
+        alerts = storage.alerts(
+            node_id=request.args.get('node') or None,
+            t0=hours_ago(hours) if hours else None,
+            state=request.args.get('state') or None,
+            limit=int(request.args.get('limit', 100))
+        )
+        
+        return jsonify(alerts)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/alerts/rules', methods=['GET'])
+def get_alert_rules():
+    """Alert rules and the (rule, node) pairs firing now"""
+    try:
+        return jsonify({
+            'rules': [rule.to_dict() for rule in alert_engine.rules],
+            'firing': [{'rule_id': rule_id, 'node_id': node_id} for rule_id, node_id in alert_engine.firing()],
+            'metrics': alert_engine.metrics()
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/export/csv', methods=['GET'])
 def export_csv():
     """Export all data as CSV file"""
     try:
         days = int(request.args.get('days', 7))
         
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT node_id, gateway_timestamp, node_timestamp, temperature_f,
-                   humidity, pressure_hpa, heat_index, dew_point, rssi, snr,
-                   collection_cycle, gateway_id, received_at
-            FROM sensor_readings
-            WHERE received_at > datetime('now', '-%d days')
-            ORDER BY received_at DESC
-        ''' % days)
-        
         # Create CSV in memory
         output = io.StringIO()
         writer = csv.writer(output)
@@ -441,11 +463,14 @@ def export_csv():
             'collection_cycle', 'gateway_id', 'received_at'
         ])
         
-        # Write data
-        for row in cursor.fetchall():
-            writer.writerow(row)
-        
-        conn.close()
+        # Write data, streamed from storage instead of fetching every row at once
+        for row in storage.iter_range(t0=hours_ago(days * 24)):
+            writer.writerow([
+                row['node_id'], row['gateway_timestamp'], row['node_timestamp'],
+                c_to_f(row['temperature_c']), row['humidity'], row['pressure_hpa'],
+                row['heat_index'], row['dew_point'], row['rssi'], row['snr'],
+                row['collection_cycle'], row['gateway_id'], row['timestamp']
+            ])
         
         # Convert to bytes for download
         output.seek(0)
@@ -461,24 +486,75 @@ def export_csv():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/debug/profile', methods=['GET'])
+def get_profile():
+    """Sampler hot functions and recent request profiles; ?format=collapsed for the sampler's stacks"""
+    if not profile_sampler and not request_profiler.enabled:
+        return jsonify({'error': 'Profiling is disabled (set PROFILE_SAMPLER_HZ, PROFILE_ENDPOINTS or PROFILE_HEADER)'}), 404
+    try:
+        if request.args.get('format') == 'collapsed':
+            if not profile_sampler:
+                return jsonify({'error': 'The stack sampler is disabled (set PROFILE_SAMPLER_HZ)'}), 404
+            return Response(profile_sampler.collapsed(), mimetype='text/plain')
+        limit = int(request.args.get('limit', 20))
+        return jsonify({
+            'sampler': dict(profile_sampler.metrics(), **profile_sampler.hot(limit)) if profile_sampler else None,
+            'requests': request_profiler.metrics() if request_profiler.enabled else None,
+            'files': request_profiler.files()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/debug/profile', methods=['DELETE'])
+def reset_profile():
+    """Start the sampler's counts over"""
+    if not profile_sampler:
+        return jsonify({'error': 'The stack sampler is disabled (set PROFILE_SAMPLER_HZ)'}), 404
+    profile_sampler.reset()
+    return jsonify({'status': 'success'})
+
+@app.route('/debug/profile/<path:name>', methods=['GET'])
+def download_profile(name):
+    """One .pstats or .collapsed file written by the request profiler"""
+    if not request_profiler.enabled:
+        return jsonify({'error': 'Request profiling is disabled'}), 404
+    return send_from_directory(PROFILE_DIR, name, as_attachment=True)
+
+def check_stale_nodes():
+    """Stale-node alert sweep"""
+    while True:
+        time.sleep(ALERT_STALE_CHECK_SECONDS)
+        try:
+            for alert in alert_engine.check_stale():
+                logging.warning(f"Alert {alert['state']}: {alert['message']}")
+        except Exception as e:
+            logging.error(f"Stale node check error: {e}")
+
+def track_liveness():
+    """Liveness deadlines and batched is_active writes"""
+    while True:
+        time.sleep(LIVENESS_TICK_SECONDS)
+        try:
+            liveness.tick()
+        except Exception as e:
+            logging.error(f"Liveness tick error: {e}")
+
 def cleanup_old_data():
     """Cleanup thread to remove old data"""
     while True:
         try:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            
-            # Delete readings older than retention period
-            cursor.execute(
-                'DELETE FROM sensor_readings WHERE received_at < datetime("now", "-%d days")' % DATA_RETENTION_DAYS
-            )
-            deleted_count = cursor.rowcount
-            
-            conn.commit()
-            conn.close()
-            
-            if deleted_count > 0:
-                logging.info(f"Cleaned up {deleted_count} old records")
+            cutoff = hours_ago(DATA_RETENTION_DAYS * 24)
+            if COLD_STORAGE_PATH:
+                # Keep the history, just not in SQLite
+                moved_count = storage.tier_out(cutoff)
+                if moved_count > 0:
+                    logging.info(f"Moved {moved_count} old records to the cold tier")
+            else:
+                # Delete readings older than retention period
+                deleted_count = storage.delete_before(cutoff)
+                
+                if deleted_count > 0:
+                    logging.info(f"Cleaned up {deleted_count} old records")
             
         except Exception as e:
             logging.error(f"Cleanup error: {e}")
@@ -494,6 +570,21 @@ if __name__ == '__main__':
     cleanup_thread = threading.Thread(target=cleanup_old_data, daemon=True)
     cleanup_thread.start()
     
+    # Start stale-node alert sweep
+    if alert_engine.stale_rules and ALERT_STALE_CHECK_SECONDS > 0:
+        stale_thread = threading.Thread(target=check_stale_nodes, daemon=True)
+        stale_thread.start()
+    
+    # Start liveness tracking
+    if LIVENESS_TICK_SECONDS > 0:
+        liveness_thread = threading.Thread(target=track_liveness, daemon=True)
+        liveness_thread.start()
+    
+    # Start the background stack sampler
+    if profile_sampler:
+        profile_sampler.start()
+        logging.info(f"Stack sampler: {PROFILE_SAMPLER_HZ:g} Hz, hot functions at /debug/profile")
+    
     # Start Flask app
     logging.info("Starting LoRa Sensor API server")
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
\ No newline at end of file
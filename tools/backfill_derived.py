@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Fill in heat index and dew point for readings stored without them
+Rows written before the derived metric columns existed (or by gateways
+that don't send them) have NULL heat_index/dew_point. This walks the table
+in id order, a chunk at a time, computes both metrics for the whole chunk
+with derive_columns() (vectorized when NumPy is installed) and writes them
+back in one transaction per chunk. Safe to stop and re-run: only rows still
+missing a value are picked up.
+
+Examples:
+    python tools/backfill_derived.py docker/data/lora_sensors.db
+    python tools/backfill_derived.py /opt/lora_sensors/sensor_data.db --schema sensor_readings --force
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker', 'app'))
+from storage import ENGINES, SCHEMAS, open_storage
+from derived import STORED_METRICS, available, derive_columns
+
+
+def backfill(storage, chunk_size=50000, force=False, progress=None):
+    """Compute and store derived metrics chunk by chunk; returns rows updated"""
+    after_id, updated = 0, 0
+    while True:
+        batch = storage.scan_batch(after_id, chunk_size, fields=('temperature_c', 'humidity'),
+                                   missing=None if force else STORED_METRICS)
+        if not len(batch):
+            return updated
+        ids = batch.column('id')
+        derived = derive_columns(batch.column('temperature_c'), batch.column('humidity'), metrics=STORED_METRICS)
+        updated += storage.update_fields(STORED_METRICS, ids, [derived[metric] for metric in STORED_METRICS])
+        after_id = ids[-1]
+        if progress:
+            progress(updated, after_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill heat index and dew point for stored readings')
+    parser.add_argument('db', help='SQLite database file')
+    parser.add_argument('--schema', choices=sorted(SCHEMAS), default='sensor_data',
+                        help='sensor_data (docker/api apps) or sensor_readings (simple server)')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Rows per transaction (default: 50000)')
+    parser.add_argument('--force', action='store_true',
+                        help='Recompute every row, overwriting values that are already set')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='STORAGE_SHARDS of a sharded database (default: single file)')
+    parser.add_argument('--engine', choices=sorted(ENGINES),
+                        help='STORAGE_ENGINE of the app (default: sharded with --shards, else sqlite)')
+    args = parser.parse_args()
+
+    options = {'engine': 'sharded', 'shards': args.shards} if args.shards else {}
+    if args.engine:
+        options['engine'] = args.engine
+    storage = open_storage(args.db, schema=args.schema, **options)
+    storage.initialize()
+    print('Backfilling %s (%s)' % (args.db, 'NumPy' if available() else 'pure Python, install numpy to speed this up'))
+
+    started = time.time()
+
+    def progress(updated, after_id):
+        print('  %d rows (up to id %d), %.0f rows/s' % (updated, after_id, updated / max(time.time() - started, 1e-9)))
+
+    updated = backfill(storage, args.chunk_size, args.force, progress)
+    elapsed = time.time() - started
+    print('Updated %d readings in %.1fs' % (updated, elapsed))
+    storage.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Take, list and restore online snapshots of the database
+Same snapshots the docker app takes on a timer when BACKUP_DIR is set
+(docker/app/backup.py). Taking one is safe while the app runs; restoring one
+is not - stop the app (or container) first.
+
+Examples:
+    python tools/backup_db.py backup docker/data/lora_sensors.db docker/data/backups --compress --keep 14
+    python tools/backup_db.py list docker/data/lora_sensors.db docker/data/backups
+    python tools/backup_db.py restore docker/data/lora_sensors.db docker/data/backups --at "2026-10-01 06:00" --force
+    python tools/backup_db.py restore docker/data/lora_sensors.db docker/data/backups \\
+        --snapshot lora_sensors-20261001T030000Z --to /tmp/inspect.db
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker', 'app'))
+from backup import BackupManager
+
+
+def parse_at(value):
+    """UTC time as 'YYYY-MM-DD HH:MM[:SS]' or ISO 8601 with a trailing Z"""
+    return datetime.fromisoformat(value.rstrip('Z').replace('T', ' '))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Online backups and point-in-time restore of the SQLite database')
+    parser.add_argument('command', choices=['backup', 'list', 'restore'])
+    parser.add_argument('db', help='SQLite database file (DATABASE_PATH; shard files beside it are included)')
+    parser.add_argument('backup_dir', help='Snapshot directory (BACKUP_DIR)')
+    parser.add_argument('--keep', type=int, default=7, help='backup: snapshots to keep, 0 keeps all (default: 7)')
+    parser.add_argument('--compress', action='store_true', help='backup: gzip the copied files')
+    parser.add_argument('--step-pages', type=int, default=256, help='backup: pages copied per step (default: 256)')
+    parser.add_argument('--step-sleep-ms', type=float, default=10, help='backup: pause between steps (default: 10)')
+    parser.add_argument('--snapshot', help='restore: snapshot name (default: the newest)')
+    parser.add_argument('--at', type=parse_at, help='restore: newest snapshot taken at or before this UTC time')
+    parser.add_argument('--to', help='restore: database path to write (default: db)')
+    parser.add_argument('--force', action='store_true', help='restore: overwrite existing database files')
+    args = parser.parse_args()
+
+    manager = BackupManager(args.db, args.backup_dir, keep=args.keep, compress=args.compress,
+                            step_pages=args.step_pages, step_sleep=args.step_sleep_ms / 1000.0)
+
+    if args.command == 'backup':
+        manifest = manager.backup()
+        print('Snapshot %s: %d files, %.1f MB in %.1fs (copy %.1fs), longest writer stall %.1fms' %
+              (manifest['name'], len(manifest['files']), manifest['bytes'] / 1e6, manifest['duration_seconds'],
+               manifest['copy_seconds'], manifest['writer_stall_max_ms']))
+        for name in manifest['rotated']:
+            print('Removed %s' % name)
+    elif args.command == 'list':
+        snapshots = manager.snapshots()
+        for manifest in snapshots:
+            print('%-40s %s %9.1f MB %3d files %s' % (manifest['name'], manifest['created'], manifest['bytes'] / 1e6,
+                                                      len(manifest['files']), 'gz' if manifest['compressed'] else ''))
+        print('%d snapshots in %s' % (len(snapshots), args.backup_dir))
+    else:
+        if args.snapshot:
+            manifest = next((m for m in manager.snapshots() if m['name'] == args.snapshot), None)
+        else:
+            manifest = manager.find(args.at)
+        if manifest is None:
+            print('No matching snapshot in %s' % args.backup_dir)
+            sys.exit(1)
+        try:
+            restored = manager.restore(manifest, args.to, force=args.force)
+        except FileExistsError as e:
+            print('Refusing to overwrite: %s' % e)
+            sys.exit(1)
+        print('Restored %s (taken %s) to %s' % (manifest['name'], manifest['created'], ', '.join(restored)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Bulk import of historical readings from CSV, JSONL or another SQLite database
+Loads exports (/api/export/csv of the simple server), JSON-lines dumps or a
+database of either layout into sensor_data (docker/api apps, Celsius) or
+sensor_readings (simple server, Fahrenheit) without the one-row-per-POST
+API. Columns are matched by name, so either layout's column names or the
+canonical field names work; temperatures are converted when the units
+differ and timestamps are normalized to the canonical form.
+
+The load runs --chunk-size rows per transaction through executemany (a
+foreign database is copied with INSERT ... SELECT over rowid ranges, without
+a round trip through Python), with synchronous=OFF and a large cache, and
+the table's indexes are dropped before the load and rebuilt once at the end.
+Rows without a node id or a readable timestamp, rows the target can't hold
+(sensor_readings needs temperature, humidity and pressure) and readings the
+table already held before the import (same node and timestamp; see
+--duplicates) are skipped and counted. Stop the app first; take a backup with
+tools/backup_db.py when importing into a database you care about.
+
+Examples:
+    python tools/bulk_import.py lora_sensor_data_20261001.csv docker/data/lora_sensors.db
+    python tools/bulk_import.py /opt/lora_sensors/sensor_data.db docker/data/lora_sensors.db
+    python tools/bulk_import.py docker/data/lora_sensors.db /opt/lora_sensors/sensor_data.db --schema sensor_readings
+    python tools/bulk_import.py readings.jsonl.gz docker/data/lora_sensors.db --defer-indexes never
+    python tools/bulk_import.py second_gateway.csv docker/data/lora_sensors.db --duplicates keep
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import time
+from itertools import islice
+from operator import itemgetter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker', 'app'))
+from storage import FIELDS, SCHEMAS, migrate, parse_timestamp
+
+CHUNK_SIZE = 50000
+FORMATS = ('csv', 'jsonl', 'sqlite')
+DUPLICATES = ('skip', 'keep')
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+PROGRESS_ROWS = 1000000
+
+# Any column name of either layout, or a canonical field name, -> canonical field
+ALIASES = {}
+for _schema in SCHEMAS.values():
+    for _field, _column in _schema.columns.items():
+        ALIASES.setdefault(_column, _field)
+for _field in FIELDS:
+    ALIASES.setdefault(_field, _field)
+FAHRENHEIT_COLUMNS = {'temperature_f'}
+
+
+def detect_format(path):
+    """csv, jsonl or sqlite from the file's extension (a trailing .gz is ignored) or header"""
+    with open(path, 'rb') as f:
+        if f.read(16) == b'SQLite format 3\x00':
+            return 'sqlite'
+    name = path[:-3] if path.endswith('.gz') else path
+    ext = os.path.splitext(name)[1].lower()
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    if ext == '.csv':
+        return 'csv'
+    raise ValueError(f"Can't tell the format of {path}; pass --format")
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def match_columns(names):
+    """(field, source index, Fahrenheit) for the first source column naming each field"""
+    matched, seen = [], set()
+    for index, name in enumerate(names):
+        field = ALIASES.get(name.strip().lower())
+        if field and field not in seen:
+            seen.add(field)
+            matched.append((field, index, name.strip().lower() in FAHRENHEIT_COLUMNS))
+    missing = {'node_id', 'timestamp'} - seen
+    if missing:
+        raise ValueError(f"Source has no column for {', '.join(sorted(missing))} (columns: {', '.join(names)})")
+    return matched
+
+
+def import_timestamp(value):
+    """Canonical form of a timestamp datetime() can't read (gateway format, epoch seconds); None if unreadable"""
+    if isinstance(value, str):
+        try:
+            value = float(value)  # epoch seconds, as text in a CSV
+        except ValueError:
+            pass
+    try:
+        dt = parse_timestamp(value)
+    except (OverflowError, OSError, ValueError):
+        return None
+    return dt.strftime(TIMESTAMP_FORMAT) if dt else None
+
+
+def sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def value_sql(ref, field, fahrenheit, schema, blank_is_null):
+    """SQL turning one source value into the target column's value"""
+    # An empty node id or timestamp is a missing one, in any format
+    sql = f"NULLIF({ref}, '')" if blank_is_null or field in ('node_id', 'timestamp') else ref
+    if field == 'timestamp':
+        # datetime() settles the usual spellings in C; the rest (gateway format, epoch seconds) in Python
+        sql = f'COALESCE(datetime({sql}), import_timestamp({sql}))'
+    elif field == 'temperature_c':
+        target_f = schema.columns[field] in FAHRENHEIT_COLUMNS
+        if fahrenheit and not target_f:
+            sql = f'ROUND(({sql} - 32.0) * 5.0 / 9.0, 6)'
+        elif target_f and not fahrenheit:
+            sql = f'ROUND({sql} * 9.0 / 5.0 + 32.0, 6)'
+    if field in schema.defaults:
+        sql = f'COALESCE({sql}, {sql_literal(schema.defaults[field])})'
+    return sql
+
+
+def insert_sql(schema, columns, values, source='', existing=0):
+    """INSERT ... SELECT of a plan's values, leaving out rows without a node id or timestamp and,
+    with existing (the table's highest rowid before the load), readings the table already held"""
+    table, node, ts = schema.table, schema.columns['node_id'], schema.time_column
+    where = [f'r.{node} IS NOT NULL', f'r.{ts} IS NOT NULL']
+    if existing:
+        # A probe of the (node_id, time) index per row
+        where.append(f'NOT EXISTS (SELECT 1 FROM main.{table} AS t WHERE t.{node} = r.{node} '
+                     f'AND t.{ts} = r.{ts} AND t.rowid <= {int(existing)})')
+    select = ', '.join(f'{value} AS {column}' for column, value in zip(columns, values))
+    # LIMIT -1 keeps SQLite from flattening the subquery, which would convert each value twice
+    return (f'INSERT OR IGNORE INTO main.{table} ({", ".join(columns)}) '
+            f'SELECT * FROM (SELECT {select} {source} LIMIT -1) AS r WHERE {" AND ".join(where)}')
+
+
+def import_plan(matched, schema, ref, blank_is_null=False):
+    """(target columns, value SQL, source indexes used in ?1..?n order)"""
+    by_field = {field: (index, fahrenheit) for field, index, fahrenheit in matched}
+    columns, values, used = [], [], []
+    for field in schema.insert_fields:
+        if field in by_field:
+            index, fahrenheit = by_field[field]
+            used.append(index)
+            values.append(value_sql(ref(index, len(used)), field, fahrenheit, schema, blank_is_null))
+        elif field in schema.defaults:
+            values.append(sql_literal(schema.defaults[field]))
+        else:
+            continue
+        columns.append(schema.columns[field])
+    return columns, values, used
+
+
+def index_sidecar(db_path):
+    """Indexes dropped by a load that hasn't finished yet, so a re-run can put them back"""
+    return db_path + '.import-indexes.json'
+
+
+def node_time_index(conn, schema):
+    """Name of the table's (node_id, time) index, or None"""
+    wanted = [schema.columns['node_id'], schema.time_column]
+    for row in conn.execute(f'PRAGMA index_list("{schema.table}")').fetchall():
+        name = row[1]
+        if [info[2] for info in conn.execute(f'PRAGMA index_info("{name}")')] == wanted:
+            return name
+    return None
+
+
+def drop_indexes(conn, db_path, table, keep=()):
+    indexes = [(name, sql) for name, sql in conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))
+        if name not in keep]
+    statements = [sql for _, sql in indexes]
+    with open(index_sidecar(db_path), 'w') as f:
+        json.dump(statements, f, indent=2)
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return statements
+
+
+def rebuild_indexes(conn, db_path):
+    """Create the indexes a load dropped (this run's or an interrupted one's)"""
+    path = index_sidecar(db_path)
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        statements = json.load(f)
+    for sql in statements:
+        # sqlite_master keeps the statement without IF NOT EXISTS
+        conn.execute(sql.replace(' INDEX ', ' INDEX IF NOT EXISTS ', 1))
+    os.remove(path)
+    return len(statements)
+
+
+def refresh_node_status(conn, schema):
+    """Rebuild the node_status summary from the readings (sensor_readings layout)"""
+    table, ts = schema.table, schema.time_column
+    conn.execute(f'''
+        INSERT INTO node_status
+        (node_id, last_seen, total_readings, last_temperature, last_humidity, last_pressure, last_rssi, is_active)
+        SELECT node_id, MAX({ts}), COUNT(*), temperature_f, humidity, pressure_hpa, rssi, 1
+        FROM {table} WHERE true GROUP BY node_id
+        ON CONFLICT(node_id) DO UPDATE SET
+            last_seen = excluded.last_seen,
+            total_readings = excluded.total_readings,
+            last_temperature = excluded.last_temperature,
+            last_humidity = excluded.last_humidity,
+            last_pressure = excluded.last_pressure,
+            last_rssi = excluded.last_rssi
+    ''')
+
+
+def chunks(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_rows(conn, schema, names, rows, chunk_size, blank_is_null, existing, progress):
+    """executemany one chunk per transaction; returns (rows read, rows inserted, target columns)"""
+    columns, values, used = import_plan(match_columns(names), schema, lambda index, n: f'?{n}', blank_is_null)
+    sql = insert_sql(schema, columns, values, existing=existing)
+    # One C-level call per row picks the used values out of the source row, in ?1..?n order
+    pick = itemgetter(*used) if len(used) > 1 else (lambda row: (row[used[0]],))
+    read = inserted = 0
+    for chunk in chunks(map(pick, rows), chunk_size):
+        before = conn.total_changes
+        conn.execute('BEGIN')
+        conn.executemany(sql, chunk)
+        conn.execute('COMMIT')
+        read += len(chunk)
+        inserted += conn.total_changes - before
+        if progress:
+            progress(read, inserted)
+    return read, inserted, columns
+
+
+def import_csv(conn, schema, path, chunk_size, existing=0, progress=None):
+    with open_text(path) as f:
+        reader = csv.reader(f)
+        names = next(reader)
+        # CSV has no NULL: an empty cell is a missing value
+        return load_rows(conn, schema, names, reader, chunk_size, True, existing, progress)
+
+
+def import_jsonl(conn, schema, path, chunk_size, existing=0, progress=None):
+    """Keys come from the first object; a key missing from a later one is NULL"""
+    with open_text(path) as f:
+        lines = (line for line in f if line.strip())
+        first = next(lines, None)
+        if first is None:
+            return 0, 0, []
+        names = list(json.loads(first))
+        rows = (tuple(map(obj.get, names)) for obj in map(json.loads, _prepend(first, lines)))
+        return load_rows(conn, schema, names, rows, chunk_size, False, existing, progress)
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def import_sqlite(conn, schema, path, chunk_size, source_table=None, existing=0, progress=None):
+    """INSERT ... SELECT from the attached database, chunk_size rowids per transaction"""
+    conn.execute('ATTACH DATABASE ? AS src', (path,))
+    try:
+        tables = [name for (name,) in conn.execute("SELECT name FROM src.sqlite_master WHERE type = 'table'")]
+        table = source_table or next((t for t in ('sensor_data', 'sensor_readings') if t in tables), None)
+        if table not in tables:
+            raise ValueError(f"{path} has no readings table (tables: {', '.join(tables)}); pass --source-table")
+        names = [row[1] for row in conn.execute(f'PRAGMA src.table_info("{table}")') if row[1] != 'id']
+        columns, values, _ = import_plan(match_columns(names), schema, lambda index, n: f's."{names[index]}"')
+        sql = insert_sql(schema, columns, values, f'FROM src."{table}" AS s WHERE s.rowid > ? AND s.rowid <= ?',
+                         existing)
+        low, high = conn.execute(f'SELECT MIN(rowid), MAX(rowid) FROM src."{table}"').fetchone()
+        read = inserted = 0
+        if low is None:
+            return 0, 0, []
+        after = low - 1
+        while after < high:
+            until = after + chunk_size
+            before = conn.total_changes
+            conn.execute('BEGIN')
+            conn.execute(sql, (after, until))
+            read += conn.execute(f'SELECT COUNT(*) FROM src."{table}" WHERE rowid > ? AND rowid <= ?',
+                                 (after, until)).fetchone()[0]
+            conn.execute('COMMIT')
+            inserted += conn.total_changes - before
+            after = until
+            if progress:
+                progress(read, inserted)
+        return read, inserted, columns
+    finally:
+        conn.execute('DETACH DATABASE src')
+
+
+def estimated_rows(path, fmt):
+    """Rough source size, for deciding whether rebuilding the target's indexes pays"""
+    if fmt == 'sqlite':
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            table = next((t for t in ('sensor_data', 'sensor_readings') if t in tables), None)
+            if table is None:
+                return 0
+            return conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+        finally:
+            conn.close()
+    # An exported reading is ~80-120 bytes of text, gzip shrinks that ~4x
+    return os.path.getsize(path) * (4 if path.endswith('.gz') else 1) // 100
+
+
+def bulk_import(source, db_path, schema_name='sensor_data', fmt=None, chunk_size=CHUNK_SIZE,
+                defer_indexes='auto', source_table=None, duplicates='skip', progress=None):
+    """Load one source into db_path; returns a dict of counts and timings"""
+    schema = SCHEMAS[schema_name]
+    fmt = fmt or detect_format(source)
+    if os.path.abspath(source) == os.path.abspath(db_path):
+        raise ValueError('Source and target are the same file')
+    new_file = not os.path.exists(db_path)
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.create_function('import_timestamp', 1, import_timestamp, deterministic=True)
+    try:
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        other = next((name for name in SCHEMAS if name != schema.name and SCHEMAS[name].table in tables), None)
+        if other and schema.table not in tables:
+            raise ValueError(f"{db_path} holds the {other} layout; pass --schema {other}")
+        migrate(conn, schema.name)
+        # Put back what an interrupted load dropped before judging the table
+        rebuild_indexes(conn, db_path)
+        if new_file:
+            # Nothing to protect until the file is complete
+            conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+        conn.execute('PRAGMA temp_store = MEMORY')
+
+        existing = conn.execute(f'SELECT MAX(rowid) FROM {schema.table}').fetchone()[0] or 0
+        defer = defer_indexes == 'always' or (defer_indexes == 'auto' and
+                                              existing < estimated_rows(source, fmt))
+        # Readings the table already holds are looked up by node and time, so that index stays
+        check_existing = existing if duplicates == 'skip' else 0
+        keep = set()
+        if check_existing:
+            index = node_time_index(conn, schema)
+            if index is None:
+                index = f'idx_{schema.table}_node_time'
+                conn.execute(f'CREATE INDEX {index} ON {schema.table} '
+                             f'({schema.columns["node_id"]}, {schema.time_column})')
+            keep.add(index)
+        if defer:
+            drop_indexes(conn, db_path, schema.table, keep)
+
+        started = time.perf_counter()
+        if fmt == 'csv':
+            read, inserted, columns = import_csv(conn, schema, source, chunk_size, check_existing, progress)
+        elif fmt == 'jsonl':
+            read, inserted, columns = import_jsonl(conn, schema, source, chunk_size, check_existing, progress)
+        else:
+            read, inserted, columns = import_sqlite(conn, schema, source, chunk_size, source_table, check_existing,
+                                                    progress)
+        load_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        indexes = rebuild_indexes(conn, db_path)
+        if schema.node_table:
+            refresh_node_status(conn, schema)
+        conn.execute('PRAGMA optimize')
+        index_seconds = time.perf_counter() - started
+        if new_file:
+            conn.execute('PRAGMA journal_mode = WAL')
+    finally:
+        conn.close()
+
+    total = load_seconds + index_seconds
+    return {
+        'format': fmt, 'read': read, 'inserted': inserted, 'skipped': read - inserted, 'columns': columns,
+        'deferred_indexes': indexes, 'load_seconds': round(load_seconds, 2),
+        'index_seconds': round(index_seconds, 2),
+        'rows_per_s': round(read / total) if total else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import readings from CSV, JSONL or another SQLite database')
+    parser.add_argument('source', help='CSV, JSONL (optionally .gz) or SQLite file')
+    parser.add_argument('db', help='Target database (created if missing)')
+    parser.add_argument('--schema', choices=sorted(SCHEMAS), default='sensor_data',
+                        help='Target layout: sensor_data (docker/api apps) or sensor_readings (simple server)')
+    parser.add_argument('--format', choices=FORMATS, help='Source format (default: from the file)')
+    parser.add_argument('--source-table', help='Readings table of a SQLite source (default: sensor_data or sensor_readings)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='Rows per transaction (default: %d)' % CHUNK_SIZE)
+    parser.add_argument('--defer-indexes', choices=['auto', 'always', 'never'], default='auto',
+                        help='Drop and rebuild the indexes around the load; auto when the import '
+                             'is larger than the table (default: auto)')
+    parser.add_argument('--duplicates', choices=DUPLICATES, default='skip',
+                        help='Readings whose node and timestamp the table already holds: skip them, so a '
+                             're-run adds nothing, or keep them (default: skip)')
+    args = parser.parse_args()
+
+    next_report = [PROGRESS_ROWS]
+
+    def progress(read, inserted):
+        if read >= next_report[0]:
+            print('  %d rows read, %d inserted' % (read, inserted))
+            next_report[0] += PROGRESS_ROWS
+
+    try:
+        result = bulk_import(args.source, args.db, args.schema, args.format, args.chunk_size,
+                             args.defer_indexes, args.source_table, args.duplicates, progress)
+    except ValueError as e:
+        print('Import failed: %s' % e)
+        sys.exit(1)
+    print('Imported %d of %d %s rows into %s in %.1fs + %.1fs indexes (%d rows/s); %d skipped' %
+          (result['inserted'], result['read'], result['format'], args.db, result['load_seconds'],
+           result['index_seconds'], result['rows_per_s'], result['skipped']))
+    if result['read'] and 'heat_index' not in result['columns']:
+        print('No heat index / dew point in the source; fill them in with')
+        print('  python tools/backfill_derived.py %s --schema %s' % (args.db, args.schema))
+
+
+if __name__ == '__main__':
+    main()
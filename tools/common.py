@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the LoRa Sensor Network command-line tools and benchmarks
+Loads the Flask apps in-process against a scratch database so they can be
+driven without Docker or a running server.
+"""
+
+import importlib.util
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Server variants that can be driven in-process
+APP_PATHS = {
+    'docker': os.path.join(REPO_ROOT, 'docker', 'app', 'app.py'),
+    'api': os.path.join(REPO_ROOT, 'api', 'app.py'),
+    'experimental': os.path.join(REPO_ROOT, 'docker', 'Experimental', 'app.py'),
+    'simple': os.path.join(REPO_ROOT, 'server', 'Simple Flask server.py'),
+}
+
+
+def resolve_app_path(name_or_path):
+    """Map a short app name (docker, api, experimental, simple) to its file"""
+    return APP_PATHS.get(name_or_path, name_or_path)
+
+
+def app_env(db_path, extra_env=None):
+    """Environment pointing any app variant at db_path, with its config and logs beside it"""
+    work_dir = os.path.dirname(os.path.abspath(db_path))
+    # Every variant reads its paths from the environment at import time
+    env = {
+        'DATABASE_PATH': db_path,
+        'DB_PATH': db_path,
+        'DATABASE_FILE': db_path,
+        'CONFIG_PATH': os.path.join(work_dir, 'settings.json'),
+        'DEBUG_LOG_PATH': os.path.join(work_dir, 'debug.log'),
+        'LOG_FILE': os.path.join(work_dir, 'sensor_api.log'),
+        # Caches are warm when load_app() returns, so measurements don't race the warm-up thread
+        'STARTUP_WARMUP': 'blocking',
+    }
+    env.update(extra_env or {})
+    return env
+
+
+def load_app(name_or_path, db_path, extra_env=None):
+    """Import a Flask app module pointed at db_path and initialize its database"""
+    app_path = resolve_app_path(name_or_path)
+    os.environ.update(app_env(db_path, extra_env))
+
+    app_dir = os.path.dirname(app_path)
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+
+    module_name = 'lora_app_%d' % len([m for m in sys.modules if m.startswith('lora_app_')])
+    spec = importlib.util.spec_from_file_location(module_name, app_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+
+    module.init_database()
+    return module
+
+
+def app_database_path(module):
+    """Return the database file a loaded app module writes to"""
+    return getattr(module, 'DATABASE_PATH', None) or getattr(module, 'DATABASE_FILE', None)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(latencies_ms):
+    """Summarize a list of latencies in milliseconds"""
+    values = sorted(latencies_ms)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'min_ms': round(values[0], 3),
+        'p50_ms': round(percentile(values, 50), 3),
+        'p90_ms': round(percentile(values, 90), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'max_ms': round(values[-1], 3),
+        'mean_ms': round(sum(values) / len(values), 3),
+    }
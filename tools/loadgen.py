@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Synthetic gateway fleet load generator for the LoRa Sensor API
+Emulates N gateways x M nodes posting the same JSON document that
+EoRa_Pi_LoRa_Gateway.ino builds in uploadToAPI(), one POST per node,
+back to back, at every 15-minute collection boundary.
+
+Examples:
+    # Drive the docker app in-process against a scratch database
+    python tools/loadgen.py --app docker --gateways 20 --nodes 10 --cycles 4
+
+    # Drive a running server over HTTP
+    python tools/loadgen.py --url http://localhost:5001/api/sensor-data --db data/lora_sensors.db
+
+    # Every packet is also heard by the next 2 gateways (rows should grow by packets, not requests)
+    python tools/loadgen.py --app docker --gateways 6 --overlap 2
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import random
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import app_database_path, latency_summary, load_app
+
+CYCLE_MINUTES = 15  # Gateway collects when MINUTE % 15 == 0
+
+
+class HttpTransport:
+    """POST payloads to a running server, one TCP connection per request like the ESP32"""
+
+    def __init__(self, url, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def post(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        req = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                resp.read()
+                return resp.status, dict(resp.headers)
+        except urllib.error.HTTPError as e:
+            return e.code, dict(e.headers or {})
+        except Exception:
+            return 0, {}
+
+
+class InProcessTransport:
+    """POST payloads through Flask's test client, one client per gateway thread"""
+
+    def __init__(self, module, path='/api/sensor-data'):
+        self.module = module
+        self.path = path
+        self.local = threading.local()
+
+    def post(self, payload):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.module.app.test_client()
+        try:
+            resp = client.post(self.path, json=payload)
+            return resp.status_code, dict(resp.headers)
+        except Exception:
+            return 0, {}
+
+
+class UdpTransport:
+    """Send each reading as a signed datagram to the UDP ingest listener and wait for its ack"""
+
+    def __init__(self, host, port, key, timeout=2.0):
+        from udp_ingest import ACK_DUPLICATE, ACK_OK, ACK_BUSY, decode_ack, encode_datagram
+        self.encode_datagram = encode_datagram
+        self.decode_ack = decode_ack
+        self.status_map = {ACK_OK: 200, ACK_DUPLICATE: 200, ACK_BUSY: 429}
+        self.address = (host, port)
+        self.key = key.encode('utf-8')
+        self.timeout = timeout
+        # Every run is a gateway restart: a new boot number, so the listener doesn't take its
+        # sequence numbers for replays of the last run's
+        self.boot = int(time.time())
+        self.local = threading.local()
+
+    def post(self, payload):
+        if getattr(self.local, 'sock', None) is None:
+            self.local.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.local.sock.settimeout(self.timeout)
+            self.local.seq = 0
+        self.local.seq += 1
+        reading = dict(payload, epoch=datetime.strptime(payload['timestamp'], '%Y-%m-%dT%H:%M:%S')
+                       .replace(tzinfo=timezone.utc).timestamp())
+        gateway_id = zlib.crc32(payload['gateway_ip'].encode('utf-8'))
+        try:
+            datagram = self.encode_datagram(self.key, gateway_id, self.boot, self.local.seq, [reading])
+            self.local.sock.sendto(datagram, self.address)
+            status, _, _ = self.decode_ack(self.local.sock.recv(64))
+            return self.status_map.get(status, 400), {}
+        except Exception:
+            return 0, {}
+
+
+def build_payload(gateway_index, node_index, sim_time, rng):
+    """Build one reading exactly as uploadToAPI() serializes it"""
+    node_id = 0x1001 + gateway_index * 0x100 + node_index
+    temp_c = 20.0 + 5.0 * rng.random() + (node_index % 5)
+    return {
+        'node_id': format(node_id, 'x'),
+        'node_name': 'Node-%d-%d' % (gateway_index + 1, node_index + 1),
+        'temperature_f': (temp_c * 9.0 / 5.0) + 32.0,
+        'humidity': round(35.0 + 30.0 * rng.random(), 2),
+        'pressure_hpa': round(1000.0 + 25.0 * rng.random(), 2),
+        'battery_voltage': round(3.3 + 0.9 * rng.random(), 2),
+        'rssi': -40 - int(80 * rng.random()),
+        'timestamp': sim_time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'collected_by_gateway': True,
+        'gateway_ip': '192.168.%d.%d' % (gateway_index // 250, gateway_index % 250 + 2),
+    }
+
+
+class Recorder:
+    """Thread-safe collector of per-request results"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = []  # (finished_at, latency_ms, status)
+        self.dropped = 0
+        self.retries = 0
+        self.packets = set()  # (owner gateway, node, cycle) that at least one gateway delivered
+
+    def add(self, finished_at, latency_ms, status):
+        with self.lock:
+            self.results.append((finished_at, latency_ms, status))
+
+    def count(self, attr):
+        with self.lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def delivered(self, packet):
+        with self.lock:
+            self.packets.add(packet)
+
+
+def send_with_retries(transport, payload, recorder, max_retries, rng):
+    """Send one payload, retrying failures up to max_retries and honoring Retry-After"""
+    for attempt in range(max_retries + 1):
+        started = time.perf_counter()
+        status, headers = transport.post(payload)
+        finished = time.perf_counter()
+        recorder.add(finished, (finished - started) * 1000.0, status)
+        if status == 200:
+            return True
+        if attempt < max_retries:
+            recorder.count('retries')
+            retry_after = headers.get('Retry-After') or headers.get('retry-after')
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = 0.05 * (2 ** attempt) * (0.5 + rng.random())
+            time.sleep(min(delay, 5.0))
+    return False
+
+
+def run_gateway(gateway_index, opts, transport, recorder, start_at, sim_start, barrier):
+    """Emulate one gateway: at each cycle boundary, upload every node back to back"""
+    rng = random.Random(opts.seed * 1000 + gateway_index)
+    skew = timedelta(seconds=rng.uniform(-opts.clock_skew, opts.clock_skew))
+    aligned = rng.random() < opts.burst_align
+    offset = 0.0 if aligned else rng.uniform(0, opts.cycle_seconds)
+    barrier.wait()
+
+    for cycle in range(opts.cycles):
+        fire_at = start_at + cycle * opts.cycle_seconds + offset + rng.uniform(0, opts.jitter)
+        delay = fire_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        sim_time = sim_start + timedelta(minutes=CYCLE_MINUTES * cycle) + skew
+        # Own nodes first, then the packets of the neighbours this gateway overlaps with
+        heard = [(gateway_index, n) for n in range(opts.nodes)]
+        for step in range(1, min(opts.overlap, opts.gateways - 1) + 1):
+            heard += [((gateway_index - step) % opts.gateways, n) for n in range(opts.nodes)]
+        for owner, node_index in heard:
+            if rng.random() < opts.drop_rate:
+                recorder.count('dropped')
+                continue
+            # What the node measured is the same for every gateway that hears it; the signal isn't
+            packet_rng = random.Random('%d-%d-%d-%d' % (opts.seed, owner, node_index, cycle))
+            payload = build_payload(owner, node_index, sim_time, packet_rng)
+            payload['rssi'] = -40 - int(80 * rng.random())
+            payload['gateway_ip'] = '192.168.%d.%d' % (gateway_index // 250, gateway_index % 250 + 2)
+            ok = send_with_retries(transport, payload, recorder, opts.max_retries, rng)
+            if ok:
+                recorder.delivered((owner, node_index, cycle))
+            if ok and rng.random() < opts.retry_rate:
+                # ESP32 timed out waiting for the response and posts the same reading again
+                recorder.count('retries')
+                send_with_retries(transport, payload, recorder, 0, rng)
+            if opts.node_gap_ms:
+                time.sleep(opts.node_gap_ms / 1000.0)
+
+
+def database_files(db_path):
+    """The database file plus any shard files next to it (STORAGE_ENGINE=sharded)"""
+    root, ext = os.path.splitext(db_path)
+    shards = glob.glob(glob.escape(root) + '.shard*' + (ext or '.db'))
+    return [p for p in [db_path] + sorted(shards) if os.path.exists(p)]
+
+
+def database_snapshot(db_path):
+    """Return (bytes on disk, row count) for the readings table, if the DB is reachable"""
+    if not db_path:
+        return 0, 0
+    size, rows = 0, 0
+    for path in database_files(db_path):
+        size += sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+        try:
+            conn = sqlite3.connect(path, timeout=30)
+            tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            for table in ('sensor_data', 'sensor_readings'):
+                if table in tables:
+                    rows += conn.execute('SELECT COUNT(*) FROM %s' % table).fetchone()[0]
+                    break
+            conn.close()
+        except sqlite3.Error:
+            pass
+    return size, rows
+
+
+def summarize(recorder, elapsed, window, db_before, db_after):
+    """Turn raw results into throughput, latency and error-rate figures"""
+    results = sorted(recorder.results)
+    ok = [r for r in results if r[2] == 200]
+    errors = {}
+    for _, _, status in results:
+        if status != 200:
+            key = str(status) if status else 'connection_error'
+            errors[key] = errors.get(key, 0) + 1
+
+    # Burst throughput: most successful requests completed inside any sliding window
+    peak = 0
+    left = 0
+    ok_times = [r[0] for r in ok]
+    for right in range(len(ok_times)):
+        while ok_times[right] - ok_times[left] > window:
+            left += 1
+        peak = max(peak, right - left + 1)
+
+    total = len(results)
+    return {
+        'requests': total,
+        'successful': len(ok),
+        'dropped_before_send': recorder.dropped,
+        'retries': recorder.retries,
+        'unique_packets': len(recorder.packets),
+        'elapsed_s': round(elapsed, 3),
+        'sustained_rps': round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        'burst_rps': round(peak / window, 2),
+        'burst_window_s': window,
+        'error_rate': round((total - len(ok)) / total, 4) if total else 0.0,
+        'errors': errors,
+        'latency': latency_summary([r[1] for r in ok]),
+        'db': {
+            'bytes_before': db_before[0],
+            'bytes_after': db_after[0],
+            'bytes_growth': db_after[0] - db_before[0],
+            'rows_before': db_before[1],
+            'rows_after': db_after[1],
+            'rows_growth': db_after[1] - db_before[1],
+            'bytes_per_row': round((db_after[0] - db_before[0]) / (db_after[1] - db_before[1]), 1)
+            if db_after[1] > db_before[1] else None,
+        },
+    }
+
+
+def print_report(report, opts):
+    """Human-readable summary"""
+    lat = report['latency']
+    print('\n=== LoRa ingest load test ===')
+    print('Fleet: %d gateways x %d nodes, %d cycles (%.1fs each)' %
+          (opts.gateways, opts.nodes, opts.cycles, opts.cycle_seconds))
+    print('Requests: %d sent, %d ok, %d dropped on air, %d retries' %
+          (report['requests'], report['successful'], report['dropped_before_send'], report['retries']))
+    print('Throughput: sustained %.1f req/s, burst %.1f req/s' % (report['sustained_rps'], report['burst_rps']))
+    if lat.get('count'):
+        print('Latency: p50 %.1fms  p90 %.1fms  p99 %.1fms  max %.1fms' %
+              (lat['p50_ms'], lat['p90_ms'], lat['p99_ms'], lat['max_ms']))
+    print('Error rate: %.2f%% %s' % (report['error_rate'] * 100, report['errors'] or ''))
+    db = report['db']
+    print('DB growth: %+d rows, %+d bytes (%s bytes/row)' %
+          (db['rows_growth'], db['bytes_growth'], db['bytes_per_row']))
+    if opts.overlap:
+        print('Unique packets delivered: %d (%d overlapping gateways each)' % (report['unique_packets'], opts.overlap))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Emulate a fleet of LoRa gateways against the sensor API')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', help='POST to a running server, e.g. http://localhost:5001/api/sensor-data')
+    target.add_argument('--app', default='docker',
+                        help='Drive an app in-process: docker, api, experimental, simple or a path (default: docker)')
+    parser.add_argument('--db', help='Database file to measure (HTTP mode) or use (in-process mode)')
+    parser.add_argument('--udp', metavar='HOST:PORT',
+                        help='Send datagrams to a UDP ingest listener instead of POSTing; with --app, '
+                             'use "local" to start one in-process')
+    parser.add_argument('--udp-key', default=os.environ.get('UDP_INGEST_KEY', 'loadgen-key'),
+                        help='Shared HMAC key for --udp (default: $UDP_INGEST_KEY)')
+    parser.add_argument('--gateways', type=int, default=5, help='Number of gateways (default: 5)')
+    parser.add_argument('--nodes', type=int, default=10, help='Nodes per gateway (default: 10)')
+    parser.add_argument('--cycles', type=int, default=4, help='Collection cycles to emulate (default: 4)')
+    parser.add_argument('--cycle-seconds', type=float, default=5.0,
+                        help='Wall-clock seconds standing in for one 15-minute cycle (default: 5)')
+    parser.add_argument('--burst-align', type=float, default=1.0,
+                        help='Fraction of gateways firing exactly on the boundary; others start at a random offset (default: 1.0)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform start jitter per cycle in seconds (default: 0)')
+    parser.add_argument('--node-gap-ms', type=float, default=0.0, help='Pause between back-to-back node uploads (default: 0)')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Probability a LoRa reading never reaches the gateway')
+    parser.add_argument('--retry-rate', type=float, default=0.0,
+                        help='Probability a gateway re-posts an accepted reading (response timeout)')
+    parser.add_argument('--max-retries', type=int, default=0,
+                        help='Retries for failed uploads; the stock firmware does not retry (default: 0)')
+    parser.add_argument('--overlap', type=int, default=0,
+                        help='Neighbouring gateways that also hear each node, posting their own copy (default: 0)')
+    parser.add_argument('--clock-skew', type=float, default=0.0, help='Max +/- gateway clock skew in seconds')
+    parser.add_argument('--window', type=float, default=1.0, help='Sliding window for burst throughput (default: 1s)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    parser.add_argument('--json', help='Also write the report to this JSON file')
+    parser.add_argument('--show-app-output', action='store_true', help="Don't silence the app's debug prints")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+
+    if opts.url:
+        transport = HttpTransport(opts.url)
+        db_path = opts.db
+    else:
+        db_path = opts.db or os.path.join(tempfile.mkdtemp(prefix='lora_loadgen_'), 'lora_sensors.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            module = load_app(opts.app, db_path)
+        module.app.logger.disabled = True
+        transport = InProcessTransport(module)
+        db_path = app_database_path(module)
+        if opts.udp == 'local':
+            listener = module.UDPIngestListener(module.store_gateway_payloads, opts.udp_key, host='127.0.0.1', port=0)
+            module.udp_listener = listener.start()
+            opts.udp = '127.0.0.1:%d' % listener.port
+
+    if opts.udp:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker', 'app'))
+        host, port = opts.udp.rsplit(':', 1)
+        transport = UdpTransport(host, int(port), opts.udp_key)
+
+    db_before = database_snapshot(db_path)
+    recorder = Recorder()
+    barrier = threading.Barrier(opts.gateways + 1)
+    sim_start = datetime.utcnow().replace(second=0, microsecond=0)
+    sim_start -= timedelta(minutes=sim_start.minute % CYCLE_MINUTES)
+
+    start_at = time.perf_counter() + 0.2
+    threads = [
+        threading.Thread(target=run_gateway, daemon=True,
+                         args=(i, opts, transport, recorder, start_at, sim_start, barrier))
+        for i in range(opts.gateways)
+    ]
+    for t in threads:
+        t.start()
+
+    quiet = contextlib.nullcontext() if (opts.url or opts.show_app_output) else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        barrier.wait()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - start_at
+    if not opts.url and getattr(module, 'gateway_merge', None):
+        # Packets still inside the merge window belong to this run
+        module.gateway_merge.flush()
+
+    report = summarize(recorder, elapsed, opts.window, db_before, database_snapshot(db_path))
+    report['config'] = {k: v for k, v in vars(opts).items() if k != 'json'}
+    print_report(report, opts)
+
+    if opts.json:
+        with open(opts.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('Report written to %s' % opts.json)
+    return report
+
+
+if __name__ == '__main__':
+    main()
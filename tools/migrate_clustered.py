@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Convert a database to the clustered layout (STORAGE_ENGINE=clustered) online
+The app keeps running on the rowid table while this runs:
+
+1. creates {table}_clustered (WITHOUT ROWID, keyed on node_id and time,
+   fixed-point measurements) and three triggers on the rowid table that
+   mirror every insert, update and delete into it
+2. copies the existing rows over in id order, one short transaction per
+   chunk with a pause between chunks, so the app's writes get the lock
+   in between (INSERT OR IGNORE: rows the triggers already mirrored stay)
+3. checks both tables hold the same readings and stops. The triggers stay
+   in place and keep the new table current until the app is restarted
+   with STORAGE_ENGINE=clustered, whose startup verifies every row is
+   there, drops the triggers and empties the rowid table
+
+Safe to stop and re-run at any point. --pause trades run time for less
+writer stall; the longest wait for the write lock is reported.
+
+Examples:
+    python tools/migrate_clustered.py docker/data/lora_sensors.db
+    python tools/migrate_clustered.py /opt/lora_sensors/sensor_data.db --schema sensor_readings --chunk-size 2000
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker', 'app'))
+from storage import SCHEMAS, SQLiteStorage
+from storage.clustered import backfill_sql, clustered_schema, create_table_sql, mirror_sql
+
+
+def prepare(store):
+    """Create the clustered table and the mirror triggers; returns the highest id to backfill"""
+    with store.transaction() as conn:
+        for statement in create_table_sql(store.schema) + mirror_sql(store.schema):
+            conn.execute(statement)
+        # Rows after this id were inserted with the triggers in place
+        return conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {store.schema.table}').fetchone()[0]
+
+
+def backfill(store, top, chunk_size=5000, pause=0.02, progress=None):
+    """Copy rows with id <= top chunk by chunk; returns (rows copied, longest lock wait in seconds)"""
+    sql = backfill_sql(store.schema)
+    table = store.schema.table
+    after_id, copied, longest = 0, 0, 0.0
+    while after_id < top:
+        waited = time.perf_counter()
+        with store.transaction() as conn:
+            longest = max(longest, time.perf_counter() - waited)
+            last = conn.execute(f'SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?)',
+                                (after_id, chunk_size)).fetchone()[0]
+            if last is None:
+                break
+            copied += conn.execute(sql, (after_id, chunk_size)).rowcount
+        after_id = last
+        if progress:
+            progress(copied, after_id)
+        time.sleep(pause)
+    return copied, longest
+
+
+def differences(store):
+    """Readings of the rowid table missing from (or extra in) the clustered table"""
+    t, c = store.schema.table, clustered_schema(store.schema.name).table
+    with store.connection() as conn:
+        missing = conn.execute(f'SELECT COUNT(*) FROM {t} b WHERE NOT EXISTS (SELECT 1 FROM {c} WHERE id = b.id)').fetchone()[0]
+        extra = conn.execute(f'SELECT COUNT(*) FROM {c} x WHERE NOT EXISTS (SELECT 1 FROM {t} WHERE id = x.id)').fetchone()[0]
+    return missing, extra
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert readings to the clustered WITHOUT ROWID layout, online')
+    parser.add_argument('db', help='SQLite database file')
+    parser.add_argument('--schema', choices=sorted(SCHEMAS), default='sensor_data',
+                        help='sensor_data (docker/api apps) or sensor_readings (simple server)')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per copy transaction (default: 5000)')
+    parser.add_argument('--pause', type=float, default=0.02, help='Seconds between chunks (default: 0.02)')
+    args = parser.parse_args()
+
+    store = SQLiteStorage(args.db, schema=args.schema)
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.initialize()
+    top = prepare(store)
+    print('Mirroring %s into %s; copying ids up to %d' % (store.schema.table, clustered_schema(args.schema).table, top))
+
+    started = time.time()
+
+    def progress(copied, after_id):
+        if after_id % (args.chunk_size * 20) < args.chunk_size:
+            print('  %d rows (up to id %d), %.0f rows/s' % (copied, after_id, copied / max(time.time() - started, 1e-9)))
+
+    copied, longest = backfill(store, top, args.chunk_size, args.pause, progress)
+    elapsed = time.time() - started
+    print('Copied %d readings in %.1fs (%.0f rows/s); longest wait for the write lock %.1fms' %
+          (copied, elapsed, copied / max(elapsed, 1e-9), longest * 1000.0))
+
+    missing, extra = differences(store)
+    store.close()
+    if missing or extra:
+        print('Tables differ: %d readings missing, %d extra; run again' % (missing, extra))
+        sys.exit(1)
+    print('Tables match. Restart the app with STORAGE_ENGINE=clustered to switch over; '
+          'until then the triggers keep the new table current')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Move readings between shard files when the shard count changes
+STORAGE_ENGINE=sharded routes each node to crc32(node_id) % STORAGE_SHARDS,
+so changing the count (or switching a single-file database over) leaves
+nodes in the wrong file. This walks every file that exists for the
+database path - the single file and any shardN files - and moves each
+misplaced node to its new shard, keeping row ids. Node_status rows move
+with their node; alerts from a single-file database go to shard 0. Shard
+files beyond the new count are removed once empty.
+
+Each chunk is copied (INSERT OR IGNORE) before it is deleted from its old
+file, so an interrupted run is finished by running the tool again. Stop
+the app first: it hands out ids and routes writes by the old count.
+
+Examples:
+    python tools/rebalance_shards.py docker/data/lora_sensors.db --to 4 --dry-run
+    python tools/rebalance_shards.py docker/data/lora_sensors.db --to 8
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker', 'app'))
+from storage import SCHEMAS, SQLiteStorage
+from storage.sharded import existing_shards, high_water, shard_index, shard_path
+
+
+def open_file(path, schema):
+    store = SQLiteStorage(path, schema=schema)
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.initialize()
+    return store
+
+
+def nodes_in(store):
+    nodes = {r['node_id'] for r in store.latest(fields=('id',))}
+    if store.schema.node_table:
+        nodes.update(row['node_id'] for row in store.node_status())
+    return sorted(nodes, key=str)
+
+
+def columns_of(store, table):
+    with store.connection() as conn:
+        return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def move_node(source, target, node_id, chunk_size):
+    """Copy a node's rows to target chunk by chunk, deleting each chunk from source after; returns rows moved"""
+    table = source.schema.table
+    columns = columns_of(source, table)
+    names = ', '.join(columns)
+    marks = ', '.join('?' for _ in columns)
+    moved = 0
+    while True:
+        with source.connection() as conn:
+            rows = conn.execute(f'SELECT {names} FROM {table} WHERE node_id = ? ORDER BY id LIMIT ?',
+                                (node_id, chunk_size)).fetchall()
+        if not rows:
+            break
+        top = max(row[columns.index('id')] for row in rows)
+        with target.transaction() as conn:
+            conn.executemany(f'INSERT OR IGNORE INTO {table} ({names}) VALUES ({marks})', rows)
+        with source.transaction() as conn:
+            conn.execute(f'DELETE FROM {table} WHERE node_id = ? AND id <= ?', (node_id, top))
+        moved += len(rows)
+    if source.schema.node_table:
+        move_rows(source, target, source.schema.node_table, 'node_id = ?', (node_id,), replace=True)
+    return moved
+
+
+def move_rows(source, target, table, where, params, replace=False):
+    """Move the rows of a small table matching `where` from source to target; returns rows moved"""
+    columns = columns_of(source, table)
+    names = ', '.join(columns)
+    with source.connection() as conn:
+        rows = conn.execute(f'SELECT {names} FROM {table} WHERE {where}', params).fetchall()
+    if rows:
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        with target.transaction() as conn:
+            conn.executemany(f'{verb} INTO {table} ({names}) VALUES ({", ".join("?" for _ in columns)})', rows)
+        with source.transaction() as conn:
+            conn.execute(f'DELETE FROM {table} WHERE {where}', params)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebalance sharded storage to a new shard count')
+    parser.add_argument('db', help='DATABASE_PATH of the app (shard files sit next to it)')
+    parser.add_argument('--to', type=int, required=True, help='New shard count (STORAGE_SHARDS)')
+    parser.add_argument('--schema', choices=sorted(SCHEMAS), default='sensor_data',
+                        help='sensor_data (docker/api apps) or sensor_readings (simple server)')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per copy/delete step (default: 5000)')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would move')
+    args = parser.parse_args()
+    if args.to < 1:
+        parser.error('--to must be at least 1')
+
+    # (label, path, shard index or None for the single file)
+    sources = [('%d' % i, shard_path(args.db, i), i) for i in existing_shards(args.db)]
+    if os.path.exists(args.db):
+        sources.insert(0, ('single file', args.db, None))
+    if not sources:
+        print('Nothing to rebalance: no database at %s' % args.db)
+        return
+
+    targets = {}
+
+    def target(index):
+        if index not in targets:
+            targets[index] = open_file(shard_path(args.db, index), args.schema)
+        return targets[index]
+
+    started = time.time()
+    total_moved, nodes_moved, top_id = 0, 0, 0
+    for label, path, index in sources:
+        source = open_file(path, args.schema)
+        top_id = max(top_id, high_water(source))
+        plan = {}
+        for node_id in nodes_in(source):
+            dest = shard_index(node_id, args.to)
+            if dest != index:
+                plan.setdefault(dest, []).append(node_id)
+        count = source.count()
+        print('%-12s %9d readings, %d nodes to move' % (label, count, sum(len(n) for n in plan.values())))
+        if args.dry_run:
+            source.close()
+            continue
+        for dest, nodes in sorted(plan.items()):
+            for node_id in nodes:
+                total_moved += move_node(source, target(dest), node_id, args.chunk_size)
+                nodes_moved += 1
+        if index is None:
+            move_rows(source, target(0), 'alerts', '1 = 1', ())
+        source.close()
+        if index is None:
+            if count:
+                print('  %s is empty now; delete it once the app runs sharded' % path)
+        elif index >= args.to:
+            drained = open_file(path, args.schema)
+            left = drained.count()
+            drained.close()
+            if left:
+                print('  %s still holds %d readings; not removed' % (path, left))
+                continue
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            targets.pop(index, None)
+
+    if args.dry_run:
+        print('Dry run: nothing moved')
+        return
+
+    # Ids stay unique across the new layout even if the highest ones were deleted before the move
+    shard0 = target(0)
+    with shard0.transaction() as conn:
+        table = shard0.schema.table
+        if not conn.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (top_id, table)).rowcount:
+            conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, top_id))
+    for index in range(args.to):
+        target(index)
+
+    elapsed = time.time() - started
+    print('Moved %d readings of %d nodes in %.1fs (%.0f readings/s)' %
+          (total_moved, nodes_moved, elapsed, total_moved / max(elapsed, 1e-9)))
+    for index in range(args.to):
+        print('  shard %-4d %9d readings  %s' % (index, targets[index].count(), shard_path(args.db, index)))
+        targets[index].close()
+    print('Start the app with STORAGE_ENGINE=sharded STORAGE_SHARDS=%d' % args.to)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Move old readings from SQLite into the Parquet cold tier
+Same job the docker app and simple server run on a timer when
+COLD_STORAGE_PATH is set, for one-off runs, cron or a first migration of a
+large database. Needs pyarrow.
+
+Examples:
+    python tools/tier_cold.py docker/data/lora_sensors.db docker/data/cold --older-than-days 90
+    python tools/tier_cold.py /opt/lora_sensors/sensor_data.db /opt/lora_sensors/cold \\
+        --schema sensor_readings --older-than-days 30 --vacuum
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker', 'app'))
+from storage import SCHEMAS, hours_ago, open_storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old readings into the Parquet cold tier')
+    parser.add_argument('db', help='SQLite database file')
+    parser.add_argument('cold_path', help='Cold tier directory (COLD_STORAGE_PATH)')
+    parser.add_argument('--schema', choices=sorted(SCHEMAS), default='sensor_data',
+                        help='sensor_data (docker/api apps) or sensor_readings (simple server)')
+    parser.add_argument('--older-than-days', type=float, default=90,
+                        help='Move readings older than this many days (default: 90)')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='VACUUM the SQLite file afterwards to give the space back to the OS')
+    args = parser.parse_args()
+
+    storage = open_storage(args.db, schema=args.schema, cold_path=args.cold_path)
+    storage.initialize()
+    size_before = os.path.getsize(args.db)
+
+    started = time.time()
+    moved = storage.tier_out(hours_ago(args.older_than_days * 24))
+    elapsed = time.time() - started
+    print('Moved %d readings to %s in %.1fs (watermark %s)' %
+          (moved, args.cold_path, elapsed, storage.cold.watermark))
+
+    if args.vacuum and moved:
+        with storage.connection() as conn:
+            conn.execute('VACUUM')
+    print('SQLite: %.1f MB -> %.1f MB, %d readings hot' %
+          (size_before / 1e6, os.path.getsize(args.db) / 1e6, storage.hot.count()))
+    print('Parquet: %.1f MB, %d readings cold' % (storage.cold.size_bytes() / 1e6, storage.cold.count()))
+    storage.close()
+
+
+if __name__ == '__main__':
+    main()